@@ -28,6 +28,16 @@ API_SERVICE_OPTS = [
                default=1000,
                help=_('The maximum number of items returned in a single '
                       'response from a collection resource.')),
+    cfg.BoolOpt('stream_collections',
+                default=False,
+                help=_('Stream the JSON responses of the node and port '
+                       'collections to the client as the items are read '
+                       'from the database, instead of building them in '
+                       'memory first. This keeps the memory of the API '
+                       'workers flat for large pages, but a database '
+                       'connection is held while the response is sent, and '
+                       'an error in the middle of the response can only '
+                       'truncate it.')),
 ]
 
 CONF = cfg.CONF
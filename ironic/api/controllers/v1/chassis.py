@@ -137,7 +137,12 @@ class ChassisCollection(collection.Collection):
         collection.chassis = [Chassis.convert_with_links(ch, fields=fields)
                               for ch in chassis]
         url = url or None
-        collection.next = collection.get_next(limit, url=url, **kwargs)
+        marker = None
+        if chassis:
+            marker = api_utils.encode_marker(
+                chassis[-1], kwargs.get('sort_key') or 'id')
+        collection.next = collection.get_next(limit, url=url,
+                                              marker=marker, **kwargs)
         return collection
 
     @classmethod
@@ -167,10 +172,7 @@ class ChassisController(rest.RestController):
                                 resource_url=None, fields=None):
         limit = api_utils.validate_limit(limit)
         sort_dir = api_utils.validate_sort_dir(sort_dir)
-        marker_obj = None
-        if marker:
-            marker_obj = objects.Chassis.get_by_uuid(pecan.request.context,
-                                                     marker)
+        marker_obj = api_utils.get_marker(objects.Chassis, marker, sort_key)
 
         if sort_key in self.invalid_sort_key_list:
             raise exception.InvalidParameterValue(
@@ -186,7 +188,7 @@ class ChassisController(rest.RestController):
                                                     sort_key=sort_key,
                                                     sort_dir=sort_dir)
 
-    @expose.expose(ChassisCollection, types.uuid, int,
+    @expose.expose(ChassisCollection, wtypes.text, int,
                    wtypes.text, wtypes.text, types.listtype)
     def get_all(self, marker=None, limit=None, sort_key='id', sort_dir='asc',
                 fields=None):
@@ -205,7 +207,7 @@ class ChassisController(rest.RestController):
         return self._get_chassis_collection(marker, limit, sort_key, sort_dir,
                                             fields=fields)
 
-    @expose.expose(ChassisCollection, types.uuid, int,
+    @expose.expose(ChassisCollection, wtypes.text, int,
                    wtypes.text, wtypes.text)
     def detail(self, marker=None, limit=None, sort_key='id', sort_dir='asc'):
         """Retrieve a list of chassis with detail.
@@ -14,10 +14,13 @@
 #    under the License.
 
 import pecan
+import wsme.rest.json
 from wsme import types as wtypes
 
 from ironic.api.controllers import base
 from ironic.api.controllers import link
+from ironic.api.controllers.v1 import utils as api_utils
+from ironic.api import expose
 
 
 class Collection(base.APIBase):
@@ -33,16 +36,63 @@ class Collection(base.APIBase):
         """Return whether collection has more items."""
         return len(self.collection) and len(self.collection) == limit
 
-    def get_next(self, limit, url=None, **kwargs):
-        """Return a link to the next subset of the collection."""
+    def get_next(self, limit, url=None, marker=None, **kwargs):
+        """Return a link to the next subset of the collection.
+
+        :param marker: the marker of the next subset. Defaults to the uuid
+                       of the last item of the collection.
+        """
         if not self.has_next(limit):
             return wtypes.Unset
+        return self._make_next(limit, url, marker or self.collection[-1].uuid,
+                               **kwargs)
 
+    def _make_next(self, limit, url, marker, **kwargs):
         resource_url = url or self._type
         q_args = ''.join(['%s=%s&' % (key, kwargs[key]) for key in kwargs])
         next_args = '?%(args)slimit=%(limit)d&marker=%(marker)s' % {
-            'args': q_args, 'limit': limit,
-            'marker': self.collection[-1].uuid}
+            'args': q_args, 'limit': limit, 'marker': marker}
 
         return link.Link.make_link('next', pecan.request.host_url,
                                    resource_url, next_args).href
+
+    @classmethod
+    def stream_with_links(cls, items, datatype, convert, limit, url=None,
+                          **kwargs):
+        """Stream the JSON representation of a collection.
+
+        The items are converted and encoded one at a time while the
+        response is sent, so only one of them is in memory at once.
+
+        :param items: an iterable over the objects of the collection,
+                      e.g. Node objects.
+        :param datatype: the API type of the items, e.g. the API Node.
+        :param convert: a function converting an object to ``datatype``.
+        :param limit: the maximum number of items in the collection.
+        :param url: the URL of the collection, used in the next link.
+        :param kwargs: the query parameters of the next link.
+        :returns: a :class:`ironic.api.expose.JSONStream`.
+        """
+        collection = cls()
+
+        def encode():
+            yield '{"%s": [' % collection._type
+            count = 0
+            last = None
+            for item in items:
+                if count:
+                    yield ', '
+                yield wsme.rest.json.encode_result(convert(item), datatype)
+                count += 1
+                last = item
+            yield ']'
+            if count and count == limit:
+                marker = api_utils.encode_marker(
+                    last, kwargs.get('sort_key') or 'id')
+                next_link = collection._make_next(limit, url, marker,
+                                                  **kwargs)
+                yield ', "next": %s' % wsme.rest.json.encode_result(
+                    next_link, wtypes.text)
+            yield '}'
+
+        return expose.JSONStream(encode())
@@ -69,6 +69,27 @@ MIN_VERB_VERSIONS = {
 }
 
 
+def _get_fields_to_load(fields, sort_key):
+    """Get the fields of the nodes to load from the database.
+
+    :param fields: the fields requested by the user, or None for all of
+                   them.
+    :param sort_key: the field the nodes are sorted by.
+    :returns: None to load all the fields, or the set of the fields
+              needed to render the requested ones and the links.
+    """
+    if fields is None:
+        return None
+    to_load = set(fields) & set(objects.Node.fields)
+    # The uuid is needed by the links, the sort key by the next marker
+    to_load.add('uuid')
+    if sort_key in objects.Node.fields:
+        to_load.add(sort_key)
+    if 'chassis_uuid' in fields:
+        to_load.add('chassis_id')
+    return to_load
+
+
 def hide_fields_in_newer_versions(obj):
     # if requested version is < 1.3, hide driver_internal_info
     if pecan.request.version.minor < 3:
@@ -676,7 +697,12 @@ class NodeCollection(collection.Collection):
         collection = NodeCollection()
         collection.nodes = [Node.convert_with_links(n, fields=fields)
                             for n in nodes]
-        collection.next = collection.get_next(limit, url=url, **kwargs)
+        marker = None
+        if nodes:
+            marker = api_utils.encode_marker(
+                nodes[-1], kwargs.get('sort_key') or 'id')
+        collection.next = collection.get_next(limit, url=url,
+                                              marker=marker, **kwargs)
         return collection
 
     @classmethod
@@ -818,10 +844,7 @@ class NodesController(rest.RestController):
         limit = api_utils.validate_limit(limit)
         sort_dir = api_utils.validate_sort_dir(sort_dir)
 
-        marker_obj = None
-        if marker:
-            marker_obj = objects.Node.get_by_uuid(pecan.request.context,
-                                                  marker)
+        marker_obj = api_utils.get_marker(objects.Node, marker, sort_key)
 
         if sort_key in self.invalid_sort_key_list:
             raise exception.InvalidParameterValue(
@@ -841,15 +864,25 @@ class NodesController(rest.RestController):
             if provision_state:
                 filters['provision_state'] = provision_state
 
-            nodes = objects.Node.list(pecan.request.context, limit, marker_obj,
-                                      sort_key=sort_key, sort_dir=sort_dir,
-                                      filters=filters)
+            if CONF.api.stream_collections:
+                list_nodes = objects.Node.iter_list
+            else:
+                list_nodes = objects.Node.list
+            nodes = list_nodes(pecan.request.context, limit, marker_obj,
+                               sort_key=sort_key, sort_dir=sort_dir,
+                               filters=filters,
+                               fields=_get_fields_to_load(fields, sort_key))
 
         parameters = {'sort_key': sort_key, 'sort_dir': sort_dir}
         if associated:
             parameters['associated'] = associated
         if maintenance:
             parameters['maintenance'] = maintenance
+        if CONF.api.stream_collections:
+            return NodeCollection.stream_with_links(
+                nodes, Node,
+                lambda node: Node.convert_with_links(node, fields=fields),
+                limit, url=resource_url, **parameters)
         return NodeCollection.convert_with_links(nodes, limit,
                                                  url=resource_url,
                                                  fields=fields,
@@ -917,7 +950,7 @@ class NodesController(rest.RestController):
                 status_code=http_client.CONFLICT)
 
     @expose.expose(NodeCollection, types.uuid, types.uuid, types.boolean,
-                   types.boolean, wtypes.text, types.uuid, int, wtypes.text,
+                   types.boolean, wtypes.text, wtypes.text, int, wtypes.text,
                    wtypes.text, types.listtype)
     def get_all(self, chassis_uuid=None, instance_uuid=None, associated=None,
                 maintenance=None, provision_state=None, marker=None,
@@ -954,7 +987,7 @@ class NodesController(rest.RestController):
                                           fields=fields)
 
     @expose.expose(NodeCollection, types.uuid, types.uuid, types.boolean,
-                   types.boolean, wtypes.text, types.uuid, int, wtypes.text,
+                   types.boolean, wtypes.text, wtypes.text, int, wtypes.text,
                    wtypes.text)
     def detail(self, chassis_uuid=None, instance_uuid=None, associated=None,
                maintenance=None, provision_state=None, marker=None,
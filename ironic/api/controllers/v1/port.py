@@ -15,6 +15,7 @@
 
 import datetime
 
+from oslo_config import cfg
 from oslo_utils import uuidutils
 import pecan
 from pecan import rest
@@ -32,6 +33,8 @@ from ironic.common import exception
 from ironic.common.i18n import _
 from ironic import objects
 
+CONF = cfg.CONF
+
 
 _DEFAULT_RETURN_FIELDS = ('uuid', 'address')
 
@@ -169,7 +172,12 @@ class PortCollection(collection.Collection):
         collection = PortCollection()
         collection.ports = [Port.convert_with_links(p, fields=fields)
                             for p in rpc_ports]
-        collection.next = collection.get_next(limit, url=url, **kwargs)
+        marker = None
+        if rpc_ports:
+            marker = api_utils.encode_marker(
+                rpc_ports[-1], kwargs.get('sort_key') or 'id')
+        collection.next = collection.get_next(limit, url=url,
+                                              marker=marker, **kwargs)
         return collection
 
     @classmethod
@@ -202,10 +210,7 @@ class PortsController(rest.RestController):
         limit = api_utils.validate_limit(limit)
         sort_dir = api_utils.validate_sort_dir(sort_dir)
 
-        marker_obj = None
-        if marker:
-            marker_obj = objects.Port.get_by_uuid(pecan.request.context,
-                                                  marker)
+        marker_obj = api_utils.get_marker(objects.Port, marker, sort_key)
 
         if sort_key in self.invalid_sort_key_list:
             raise exception.InvalidParameterValue(
@@ -224,11 +229,21 @@ class PortsController(rest.RestController):
                                                  sort_dir=sort_dir)
         elif address:
             ports = self._get_ports_by_address(address)
+        elif CONF.api.stream_collections:
+            ports = objects.Port.iter_list(pecan.request.context, limit,
+                                           marker_obj, sort_key=sort_key,
+                                           sort_dir=sort_dir)
         else:
             ports = objects.Port.list(pecan.request.context, limit,
                                       marker_obj, sort_key=sort_key,
                                       sort_dir=sort_dir)
 
+        if CONF.api.stream_collections:
+            return PortCollection.stream_with_links(
+                ports, Port,
+                lambda port: Port.convert_with_links(port, fields=fields),
+                limit, url=resource_url, sort_key=sort_key,
+                sort_dir=sort_dir)
         return PortCollection.convert_with_links(ports, limit,
                                                  url=resource_url,
                                                  fields=fields,
@@ -250,7 +265,7 @@ class PortsController(rest.RestController):
             return []
 
     @expose.expose(PortCollection, types.uuid_or_name, types.uuid,
-                   types.macaddress, types.uuid, int, wtypes.text,
+                   types.macaddress, wtypes.text, int, wtypes.text,
                    wtypes.text, types.listtype)
     def get_all(self, node=None, node_uuid=None, address=None, marker=None,
                 limit=None, sort_key='id', sort_dir='asc', fields=None):
@@ -289,7 +304,7 @@ class PortsController(rest.RestController):
                                           fields=fields)
 
     @expose.expose(PortCollection, types.uuid_or_name, types.uuid,
-                   types.macaddress, types.uuid, int, wtypes.text,
+                   types.macaddress, wtypes.text, int, wtypes.text,
                    wtypes.text)
     def detail(self, node=None, node_uuid=None, address=None, marker=None,
                limit=None, sort_key='id', sort_dir='asc'):
@@ -13,8 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import datetime
+
 import jsonpatch
 from oslo_config import cfg
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 import pecan
 import six
@@ -36,6 +41,23 @@ JSONPATCH_EXCEPTIONS = (jsonpatch.JsonPatchException,
                         jsonpatch.JsonPointerException,
                         KeyError)
 
+_MARKER_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class KeysetMarker(object):
+    """The position after which the next page of a collection starts.
+
+    It holds the sort key and id values of the last resource of the
+    previous page, which is all the database needs to seek to the next
+    page.
+    """
+
+    def __init__(self, sort_key, value, resource_id):
+        setattr(self, sort_key, value)
+        # the id is the tie-breaker of the sort, set it last so that it
+        # wins when sorting by id.
+        self.id = resource_id
+
 
 def validate_limit(limit):
     if limit is None:
@@ -55,6 +77,73 @@ def validate_sort_dir(sort_dir):
     return sort_dir
 
 
+def encode_marker(resource, sort_key):
+    """Encode the marker of the page following a resource.
+
+    :param resource: the last resource of a page, e.g. a Node object.
+    :param sort_key: the field the resources are sorted by.
+    :returns: an opaque marker holding the sort key and id values of the
+              resource, or the uuid of the resource if the sort key is
+              not a field of the resource.
+    """
+    if sort_key not in resource.fields:
+        return resource.uuid
+    value = getattr(resource, sort_key)
+    if isinstance(value, datetime.datetime):
+        value = {'datetime': timeutils.normalize_time(value).strftime(
+            _MARKER_TIME_FORMAT)}
+    data = jsonutils.dumps([sort_key, value, resource.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+# Types of the sort key values allowed in a marker
+_MARKER_VALUE_TYPES = (six.string_types + six.integer_types +
+                       (float, datetime.datetime, type(None)))
+
+
+def get_marker(resource_cls, marker, sort_key):
+    """Get the marker to pass to the list() method of an object.
+
+    :param resource_cls: the object class of the resources, e.g.
+                         objects.Node.
+    :param marker: a marker built by :func:`encode_marker`, or for
+                   backward compatibility the uuid of the last resource
+                   of the previous page.
+    :param sort_key: the field the resources are sorted by.
+    :returns: None if there is no marker, a :class:`KeysetMarker` for an
+              opaque marker, the resource for a uuid.
+    :raises: InvalidParameterValue if the marker is invalid, or does not
+             match the sort key.
+    """
+    if not marker:
+        return None
+    if uuidutils.is_uuid_like(marker):
+        return resource_cls.get_by_uuid(pecan.request.context, marker)
+
+    try:
+        data = base64.urlsafe_b64decode(
+            str(marker + '=' * (-len(marker) % 4)))
+        marker_key, value, resource_id = jsonutils.loads(
+            data.decode('utf-8'))
+        if isinstance(value, dict):
+            value = datetime.datetime.strptime(value['datetime'],
+                                               _MARKER_TIME_FORMAT)
+        # NOTE: the values are passed to the database query as they are
+        if (not isinstance(resource_id, six.integer_types) or
+                isinstance(resource_id, bool) or
+                not isinstance(value, _MARKER_VALUE_TYPES)):
+            raise ValueError()
+    except (TypeError, ValueError, KeyError):
+        raise exception.InvalidParameterValue(
+            _("Invalid marker: %s") % marker)
+
+    if marker_key != sort_key:
+        raise exception.InvalidParameterValue(
+            _("The marker %(marker)s is not valid for the sort key "
+              "%(key)s") % {'marker': marker, 'key': sort_key})
+    return KeysetMarker(sort_key, value, resource_id)
+
+
 def apply_jsonpatch(doc, patch):
     for p in patch:
         if p['op'] == 'add' and p['path'].count('/') == 1:
@@ -14,11 +14,92 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
+
+from oslo_log import log
+import pecan
 import wsmeext.pecan as wsme_pecan
 
+from ironic.common.i18n import _LE
+
+LOG = log.getLogger(__name__)
+
+
+class JSONStream(object):
+    """A JSON response body written to the client while it is encoded.
+
+    An exposed function may return a JSONStream instead of its declared
+    return type. The chunks of text produced by the iterable are then sent
+    to the client one by one, after the function returned, rather than
+    being rendered all at once. The iterable still runs in the context of
+    the request, so that it can use ``pecan.request``.
+
+    :param iterable: an iterable over the text chunks of the body.
+    """
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        request_locals = pecan.request.environ['pecan.locals']
+        self._request = request_locals['request']
+        self._response = request_locals['response']
+
+    def _bind(self):
+        """Bind the request to pecan if it is not bound anymore."""
+        if hasattr(pecan.core.state, 'request'):
+            return False
+        pecan.core.state.request = self._request
+        pecan.core.state.response = self._response
+        return True
+
+    def _unbind(self):
+        del pecan.core.state.request
+        del pecan.core.state.response
+
+    def __iter__(self):
+        iterator = iter(self.iterable)
+        while True:
+            bound = self._bind()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            except Exception:
+                # The status has already been sent, all we can do is to
+                # stop there and let the client fail to parse the body.
+                LOG.exception(_LE('Error while streaming the response to '
+                                  '%s'), self._request.path)
+                return
+            finally:
+                if bound:
+                    self._unbind()
+            yield chunk.encode('utf-8')
+
 
 def expose(*args, **kwargs):
-    """Ensure that only JSON, and not XML, is supported."""
+    """Ensure that only JSON, and not XML, is supported.
+
+    The exposed function may return a :class:`JSONStream` to stream its
+    response body.
+    """
     if 'rest_content_types' not in kwargs:
         kwargs['rest_content_types'] = ('json',)
-    return wsme_pecan.wsexpose(*args, **kwargs)
+    wsexpose = wsme_pecan.wsexpose(*args, **kwargs)
+
+    def decorate(f):
+        callfunction = wsexpose(f)
+
+        @functools.wraps(callfunction)
+        def stream_or_render(self, *args, **kwargs):
+            result = callfunction(self, *args, **kwargs)
+            if (isinstance(result, dict) and
+                    isinstance(result.get('result'), JSONStream)):
+                # Skip the rendering of the result by WSME, the body is
+                # the generator below.
+                pecan.override_template(None)
+                pecan.response.app_iter = iter(result['result'])
+                return None
+            return result
+
+        return stream_or_render
+
+    return decorate
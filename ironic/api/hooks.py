@@ -130,17 +130,18 @@ class NoExceptionTracebackHook(hooks.PecanHook):
     # catches and handles all the errors, so 'on_error' dedicated for unhandled
     # exceptions never fired.
     def after(self, state):
-        # Omit empty body. Some errors may not have body at this level yet.
-        if not state.response.body:
-            return
-
         # Do nothing if there is no error.
         # Status codes in the range 200 (OK) to 399 (400 = BAD_REQUEST) are not
-        # an error.
+        # an error. This is checked first so that a streamed body is not
+        # read here.
         if (http_client.OK <= state.response.status_int <
                 http_client.BAD_REQUEST):
             return
 
+        # Omit empty body. Some errors may not have body at this level yet.
+        if not state.response.body:
+            return
+
         json_body = state.response.json
         # Do not remove traceback when server in debug mode (except 'Server'
         # errors when 'debuginfo' will be used for traces).
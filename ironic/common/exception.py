@@ -440,6 +440,10 @@ class NodeNotLocked(Invalid):
     message = _("Node %(node)s found not to be locked on release")
 
 
+class NodeFiltersNotMatched(Conflict):
+    message = _("Node %(node)s does not match the filters %(filters)s.")
+
+
 class NoFreeConductorWorker(TemporaryFailure):
     message = _('Requested action cannot be performed due to lack of free '
                 'conductor workers.')
@@ -31,6 +31,7 @@ import six.moves.urllib.parse as urlparse
 from ironic.common import exception
 from ironic.common.glance_service import service_utils
 from ironic.common.i18n import _LE
+from ironic.common import image_service
 
 
 LOG = log.getLogger(__name__)
@@ -176,12 +177,17 @@ class BaseImageService(object):
 
         :raises: ImageNotFound
         """
-        LOG.debug("Getting image metadata from glance. Image: %s"
-                  % image_href)
         (image_id, self.glance_host,
          self.glance_port, use_ssl) = service_utils.parse_image_ref(image_href)
 
-        image = self.call(method, image_id)
+        # NOTE: the image is cached as returned by glance, so that its
+        # availability is still checked in the context of every request
+        image = image_service.METADATA_CACHE.get(image_href)
+        if image is None:
+            LOG.debug("Getting image metadata from glance. Image: %s"
+                      % image_href)
+            image = self.call(method, image_id)
+            image_service.METADATA_CACHE.set(image_href, image)
 
         if not service_utils.is_image_available(self.context, image):
             raise exception.ImageNotFound(image_id=image_id)
@@ -248,8 +254,11 @@ class BaseImageService(object):
         :param purge_props: (Optional=False) Purge existing properties.
         :returns: dict -- New created image metadata
         """
+        image_href = image_id
         (image_id, self.glance_host,
          self.glance_port, use_ssl) = service_utils.parse_image_ref(image_id)
+        image_service.METADATA_CACHE.invalidate(image_href)
+        image_service.METADATA_CACHE.invalidate(image_id)
         if image_meta:
             image_meta = service_utils.translate_to_glance(image_meta)
         else:
@@ -282,7 +291,10 @@ class BaseImageService(object):
         :raises: ImageNotAuthorized if the user is not authorized.
 
         """
+        image_href = image_id
         (image_id, glance_host,
          glance_port, use_ssl) = service_utils.parse_image_ref(image_id)
+        image_service.METADATA_CACHE.invalidate(image_href)
+        image_service.METADATA_CACHE.invalidate(image_id)
 
         self.call(method, image_id)
@@ -13,9 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import array
 import bisect
 import hashlib
+import struct
 import threading
+import time
 
 from oslo_config import cfg
 import six
@@ -47,11 +50,42 @@ hash_opts = [
                       'conductor services to prepare deployment environments '
                       'and potentially allow the Ironic cluster to recover '
                       'more quickly if a conductor instance is terminated.')),
+    cfg.IntOpt('hash_ring_reset_interval',
+               default=15,
+               help=_('Interval (in seconds) after which the hash rings are '
+                      'refreshed from the list of active conductors. Only '
+                      'the rings of drivers whose set of conductors changed '
+                      'are rebuilt.')),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(hash_opts)
 
+# Bounds of the exponent of the lookup table size, see HashRing.
+_MIN_LOOKUP_EXPONENT = 8
+_MAX_LOOKUP_EXPONENT = 20
+# Reads the first 32 bits of a digest, used to index the lookup table.
+_HASH_PREFIX = struct.Struct('>I')
+# Number of leading bits of the hash of a node UUID stored in the database,
+# so that it fits in a signed 32 bits integer column.
+UUID_HASH_BITS = 31
+
+
+def get_uuid_hash(uuid):
+    """Get the leading bits of the ring hash of a node UUID.
+
+    The returned value is stored with the node, which lets the database
+    select the nodes within the hash ranges served by a conductor, see
+    :meth:`HashRing.get_hash_ranges`.
+
+    :param uuid: the UUID of a node.
+    :returns: an integer between 0 and 2^UUID_HASH_BITS - 1.
+    """
+    if six.PY3:
+        uuid = uuid.encode('utf-8')
+    prefix = _HASH_PREFIX.unpack_from(hashlib.md5(uuid).digest())[0]
+    return prefix >> (32 - UUID_HASH_BITS)
+
 
 class HashRing(object):
     """A stable hash ring.
@@ -64,15 +98,25 @@ class HashRing(object):
     - we hash each host many times to spread load more finely
       as otherwise adding a host gets (on average) 50% of the load of
       just one other host assigned to it.
+
+    To make lookups cheap, the ring also precomputes:
+
+    - a lookup table indexed by the first bits of hash(item), giving the
+      range of dividers which fall within each bucket. Most buckets contain
+      no divider, so the partition is found without bisecting the ring.
+    - the tuple of replica hosts serving each partition.
     """
 
-    def __init__(self, hosts, replicas=None):
+    def __init__(self, hosts, replicas=None, previous_ring=None):
         """Create a new hash ring across the specified hosts.
 
         :param hosts: an iterable of hosts which will be mapped.
         :param replicas: number of hosts to map to each hash partition,
                          or len(hosts), which ever is lesser.
                          Default: CONF.hash_distribution_replicas
+        :param previous_ring: a `HashRing` this ring replaces. The dividers
+                              of the hosts present in both rings are reused
+                              rather than hashed again. Default: None.
 
         """
         if replicas is None:
@@ -85,17 +129,79 @@ class HashRing(object):
             raise exception.Invalid(
                 _("Invalid hosts supplied when building HashRing."))
 
+        self._requested_replicas = replicas
+        self._partition_exponent = CONF.hash_partition_exponent
+        if (previous_ring is not None and
+                previous_ring._partition_exponent !=
+                self._partition_exponent):
+            previous_ring = None
+
+        self._host_dividers = {}
         self._host_hashes = {}
         for host in hosts:
-            key = str(host).encode('utf8')
-            key_hash = hashlib.md5(key)
-            for p in range(2 ** CONF.hash_partition_exponent):
-                key_hash.update(key)
-                hashed_key = self._hash2int(key_hash)
+            if previous_ring is not None and host in previous_ring.hosts:
+                dividers = previous_ring._host_dividers[host]
+            else:
+                dividers = self._hash_host(host)
+            self._host_dividers[host] = dividers
+            for hashed_key in dividers:
                 self._host_hashes[hashed_key] = host
         # Gather the (possibly colliding) resulting hashes into a bisectable
         # list.
         self._partitions = sorted(self._host_hashes.keys())
+        self._build_lookup_table()
+        self._replica_hosts = [self._probe_hosts(partition, set())
+                               for partition in range(len(self._partitions))]
+
+    def _hash_host(self, host):
+        """Compute the dividers of a host.
+
+        :param host: a host of this ring.
+        :returns: a list of the hashes of the host on the ring.
+        """
+        key = str(host).encode('utf8')
+        key_hash = hashlib.md5(key)
+        dividers = []
+        for p in range(2 ** self._partition_exponent):
+            key_hash.update(key)
+            dividers.append(self._hash2int(key_hash))
+        return dividers
+
+    def _is_built_for(self, hosts):
+        """Check whether this ring is what would be built for these hosts.
+
+        :param hosts: an iterable of hosts.
+        :returns: True if the ring maps onto the same hosts with the current
+                  configuration, False otherwise.
+        """
+        return (self.hosts == set(hosts) and
+                self._partition_exponent == CONF.hash_partition_exponent and
+                self._requested_replicas == CONF.hash_distribution_replicas)
+
+    def _build_lookup_table(self):
+        """Build the table mapping hash prefixes to ranges of dividers.
+
+        The hash space is split into 2^N buckets, with 2^N at least four
+        times the number of dividers. Entry B of the table is the number of
+        dividers lower than the first hash of bucket B, so the dividers
+        within bucket B are the ones between entries B and B+1.
+        """
+        exponent = len(self._partitions).bit_length() + 2
+        exponent = min(max(exponent, _MIN_LOOKUP_EXPONENT),
+                       _MAX_LOOKUP_EXPONENT)
+        shift = 128 - exponent
+        counts = [0] * (2 ** exponent)
+        for divider in self._partitions:
+            counts[divider >> shift] += 1
+
+        table = array.array('L', [0]) * (len(counts) + 1)
+        total = 0
+        for bucket, count in enumerate(counts):
+            total += count
+            table[bucket + 1] = total
+
+        self._lookup_shift = 32 - exponent
+        self._lookup_table = table
 
     def _hash2int(self, key_hash):
         """Convert the given hash's digest to a numerical value for the ring.
@@ -109,12 +215,21 @@ class HashRing(object):
             if six.PY3 and data is not None:
                 data = data.encode('utf-8')
             key_hash = hashlib.md5(data)
-            hashed_key = self._hash2int(key_hash)
-            position = bisect.bisect(self._partitions, hashed_key)
-            return position if position < len(self._partitions) else 0
         except TypeError:
             raise exception.Invalid(
                 _("Invalid data supplied to HashRing.get_hosts."))
+        bucket = (_HASH_PREFIX.unpack_from(key_hash.digest())[0] >>
+                  self._lookup_shift)
+        low = self._lookup_table[bucket]
+        high = self._lookup_table[bucket + 1]
+        if low == high:
+            # No divider within this bucket, so all hashes in it belong
+            # to the same partition.
+            position = low
+        else:
+            position = bisect.bisect(self._partitions,
+                                     self._hash2int(key_hash), low, high)
+        return position if position < len(self._partitions) else 0
 
     def get_hosts(self, data, ignore_hosts=None):
         """Get the list of hosts which the supplied data maps onto.
@@ -129,13 +244,76 @@ class HashRing(object):
                   this `HashRing` was created with. It may be less than this
                   if ignore_hosts is not None.
         """
-        hosts = []
-        if ignore_hosts is None:
-            ignore_hosts = set()
-        else:
+        if ignore_hosts:
             ignore_hosts = set(ignore_hosts)
             ignore_hosts.intersection_update(self.hosts)
         partition = self._get_partition(data)
+        if not self._partitions:
+            return []
+        if not ignore_hosts:
+            return list(self._replica_hosts[partition])
+        return list(self._probe_hosts(partition, ignore_hosts))
+
+    def get_hosts_many(self, data_list, ignore_hosts=None):
+        """Get the lists of hosts which each of the supplied data maps onto.
+
+        :param data_list: An iterable of string identifiers to be mapped
+                          across the ring.
+        :param ignore_hosts: A list of hosts to skip when performing the hash.
+                             See :meth:`get_hosts`. Default: None.
+        :returns: a list with the list of hosts for each item of data_list,
+                  in the same order.
+        """
+        return [self.get_hosts(data, ignore_hosts=ignore_hosts)
+                for data in data_list]
+
+    def get_hash_ranges(self, host):
+        """Get the ranges of hashes of the data mapped onto a host.
+
+        The ranges are expressed in the leading UUID_HASH_BITS bits of the
+        hashes, as returned by :func:`get_uuid_hash`. As the ranges are
+        rounded outwards, they may include some hashes mapped onto other
+        hosts only; they never miss a hash mapped onto this host.
+
+        :param host: a host of this ring.
+        :returns: a sorted list of non-overlapping (low, high) tuples of
+                  inclusive bounds. Empty if the host is not in the ring.
+        """
+        shift = 128 - UUID_HASH_BITS
+        max_hash = 2 ** UUID_HASH_BITS - 1
+        ranges = []
+        for position, hosts in enumerate(self._replica_hosts):
+            if host not in hosts:
+                continue
+            # Partition N serves the hashes from divider N-1 included to
+            # divider N excluded, the first one also serves the hashes
+            # above the last divider.
+            high = self._partitions[position] - 1
+            if position:
+                ranges.append((self._partitions[position - 1] >> shift,
+                               high >> shift))
+            else:
+                if high >= 0:
+                    ranges.append((0, high >> shift))
+                ranges.append((self._partitions[-1] >> shift, max_hash))
+
+        merged = []
+        for low, high in sorted(ranges):
+            if merged and low <= merged[-1][1] + 1:
+                if high > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], high)
+            else:
+                merged.append((low, high))
+        return merged
+
+    def _probe_hosts(self, partition, ignore_hosts):
+        """Find the replica hosts serving a partition.
+
+        :param partition: The index of the partition in the partition map.
+        :param ignore_hosts: A set of hosts of this ring to skip.
+        :returns: a tuple of hosts.
+        """
+        hosts = []
         for replica in range(0, self.replicas):
             if len(hosts) + len(ignore_hosts) == len(self.hosts):
                 # prevent infinite loop - cannot allocate more fallbacks.
@@ -148,7 +326,7 @@ class HashRing(object):
                     partition = 0
                 host = self._get_host(partition)
             hosts.append(host)
-        return hosts
+        return tuple(hosts)
 
     def _get_host(self, partition):
         """Find what host is serving a partition.
@@ -161,36 +339,55 @@ class HashRing(object):
 
 
 class HashRingManager(object):
+    """Cache of the hash rings of all drivers.
+
+    The rings are loaded on first use and refreshed once they are older
+    than CONF.hash_ring_reset_interval, or after :meth:`reset` was called.
+    A refresh reads the active conductors, and only rebuilds the rings of
+    the drivers whose set of conductors changed; the other rings are kept.
+    """
     _hash_rings = None
+    _updated_at = 0
     _lock = threading.Lock()
 
     def __init__(self):
         self.dbapi = dbapi.get_instance()
 
+    def _is_fresh(self):
+        return (self._hash_rings is not None and
+                time.time() - self._updated_at <
+                CONF.hash_ring_reset_interval)
+
     @property
     def ring(self):
         # Hot path, no lock
-        if self._hash_rings is not None:
+        if self._is_fresh():
             return self._hash_rings
 
         with self._lock:
-            if self._hash_rings is None:
+            if not self._is_fresh():
                 rings = self._load_hash_rings()
                 self.__class__._hash_rings = rings
+                self.__class__._updated_at = time.time()
             return self._hash_rings
 
     def _load_hash_rings(self):
         rings = {}
+        previous_rings = self._hash_rings or {}
         d2c = self.dbapi.get_active_driver_dict()
 
         for driver_name, hosts in d2c.items():
-            rings[driver_name] = HashRing(hosts)
+            ring = previous_rings.get(driver_name)
+            if ring is None or not ring._is_built_for(hosts):
+                ring = HashRing(hosts, previous_ring=ring)
+            rings[driver_name] = ring
         return rings
 
     @classmethod
     def reset(cls):
+        """Force the rings to be refreshed on their next use."""
         with cls._lock:
-            cls._hash_rings = None
+            cls._updated_at = 0
 
     def __getitem__(self, driver_name):
         try:
@@ -16,9 +16,13 @@
 
 
 import abc
+import collections
+import copy
 import datetime
 import os
 import shutil
+import threading
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -76,6 +80,77 @@ glance_opts = [
 
 CONF.register_opts(glance_opts, group='glance')
 
+image_service_opts = [
+    cfg.IntOpt('image_metadata_cache_ttl',
+               default=60,
+               help=_('Time in seconds during which the metadata of an '
+                      'image, as returned by Glance or by a HEAD request '
+                      'for HTTP images, is cached and reused instead of '
+                      'being requested again. Set to 0 to disable the '
+                      'cache.')),
+]
+
+CONF.register_opts(image_service_opts)
+
+# Maximum number of images whose metadata is cached
+MAX_CACHED_METADATA = 1024
+
+
+class ImageMetadataCache(object):
+    """Cache of the metadata of images, keyed by href.
+
+    The metadata expires after [DEFAULT]image_metadata_cache_ttl seconds,
+    and is invalidated when an image is found to have changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # href -> (time of the request, metadata), oldest first
+        self._entries = collections.OrderedDict()
+
+    def get(self, href):
+        """Get the metadata of an image.
+
+        :param href: image UUID or href.
+        :returns: the metadata, or None if it is not cached or expired.
+        """
+        ttl = CONF.image_metadata_cache_ttl
+        if ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(href)
+            if entry is None:
+                return None
+            if entry[0] + ttl < time.time():
+                del self._entries[href]
+                return None
+            return entry[1]
+
+    def set(self, href, metadata):
+        """Cache the metadata of an image.
+
+        :param href: image UUID or href.
+        :param metadata: the metadata of the image.
+        """
+        if CONF.image_metadata_cache_ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(href, None)
+            self._entries[href] = (time.time(), metadata)
+            while len(self._entries) > MAX_CACHED_METADATA:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, href):
+        """Forget the metadata of an image.
+
+        :param href: image UUID or href.
+        """
+        with self._lock:
+            self._entries.pop(href, None)
+
+
+METADATA_CACHE = ImageMetadataCache()
+
 
 def import_versioned_module(version, submodule=None):
     module = 'ironic.common.glance_service.v%s' % version
@@ -185,8 +260,13 @@ class HttpImageService(BaseImageService):
             * Content-Length header not found in response to HEAD request.
         :returns: dictionary of image properties. It has three of them: 'size',
             'updated_at' and 'properties'. 'updated_at' attribute is a naive
-            UTC datetime object.
+            UTC datetime object. The result of the HEAD request is cached,
+            see :class:`ImageMetadataCache`.
         """
+        image_meta = METADATA_CACHE.get(image_href)
+        if image_meta is not None:
+            return copy.deepcopy(image_meta)
+
         response = self.validate_href(image_href)
         image_size = response.headers.get('Content-Length')
         if image_size is None:
@@ -212,11 +292,13 @@ class HttpImageService(BaseImageService):
                 except ValueError:
                     continue
 
-        return {
+        image_meta = {
             'size': int(image_size),
             'updated_at': date,
             'properties': {}
         }
+        METADATA_CACHE.set(image_href, copy.deepcopy(image_meta))
+        return image_meta
 
 
 class FileImageService(BaseImageService):
@@ -328,7 +328,33 @@ def convert_image(source, dest, out_format, run_as_root=False):
     utils.execute(*cmd, run_as_root=run_as_root)
 
 
-def fetch(context, image_href, path, force_raw=False):
+class _ProgressFile(object):
+    """File object reporting the size of every chunk written to it."""
+
+    def __init__(self, image_file, progress):
+        self._image_file = image_file
+        self._progress = progress
+
+    def write(self, data):
+        self._progress(len(data))
+        self._image_file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._image_file, name)
+
+
+def fetch(context, image_href, path, force_raw=False, progress=None):
+    """Download an image to a path.
+
+    :param context: context
+    :param image_href: image UUID or href to fetch
+    :param path: destination file path
+    :param force_raw: boolean value, whether to convert the image to raw
+                      format
+    :param progress: if not None, a callable called with the size of every
+                     chunk of the image before it is written. It may block
+                     to slow the download down.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -341,6 +367,8 @@ def fetch(context, image_href, path, force_raw=False):
 
     with fileutils.remove_path_on_error(path):
         with open(path, "wb") as image_file:
+            if progress is not None:
+                image_file = _ProgressFile(image_file, progress)
             image_service.download(image_href, image_file)
 
     if force_raw:
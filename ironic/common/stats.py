@@ -0,0 +1,48 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Registry of the statistics collected in a process.
+
+The modules collecting statistics, e.g. the drivers, register a function
+returning them, which the conductor calls to report them without depending
+on these modules.
+"""
+
+import threading
+
+_providers = {}
+_lock = threading.Lock()
+
+
+def register(name, provider):
+    """Register a provider of statistics.
+
+    :param name: the name of the statistics, e.g. 'image_downloads'. A
+                 provider registered again under the same name replaces
+                 the previous one.
+    :param provider: a function without arguments returning the
+                     statistics.
+    """
+    with _lock:
+        _providers[name] = provider
+
+
+def get_stats():
+    """Get the statistics of all the registered providers.
+
+    :returns: a list of tuples of the name of the statistics and of the
+              statistics, sorted by name.
+    """
+    with _lock:
+        providers = sorted(_providers.items())
+    return [(name, provider()) for name, provider in providers]
@@ -43,9 +43,12 @@ a change, etc.
 
 import collections
 import datetime
+import functools
+import hashlib
 import inspect
 import tempfile
 import threading
+import time
 
 import eventlet
 from eventlet import greenpool
@@ -55,6 +58,7 @@ from oslo_context import context as ironic_context
 from oslo_db import exception as db_exception
 from oslo_log import log
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
 from oslo_service import periodic_task
 from oslo_utils import excutils
 from oslo_utils import uuidutils
@@ -72,6 +76,7 @@ from ironic.common.i18n import _LW
 from ironic.common import images
 from ironic.common import rpc
 from ironic.common import states
+from ironic.common import stats
 from ironic.common import swift
 from ironic.conductor import task_manager
 from ironic.conductor import utils
@@ -120,6 +125,25 @@ conductor_opts = [
                       'number of times Ironic should try syncing the '
                       'hardware node power state with the node power state '
                       'in DB')),
+    cfg.IntOpt('sync_power_state_workers',
+               default=1,
+               help=_('Number of green threads used to query the power '
+                      'state of nodes concurrently during a power state '
+                      'sync. These threads come from a dedicated pool, '
+                      'separate from the conductor workers pool. The default '
+                      'of 1 syncs nodes one at a time.')),
+    cfg.IntOpt('sync_power_state_batch_size',
+               default=0,
+               help=_('Number of nodes whose power state is queried at once '
+                      'during a power state sync, for the drivers able to '
+                      'query the power state of many nodes at once. 0 - the '
+                      'power state of every node is queried on its own.')),
+    cfg.IntOpt('sync_power_state_timeout',
+               default=0,
+               help=_('Maximum time (in seconds) a single power state sync '
+                      'may spend starting node syncs. Nodes that were not '
+                      'started when this time is exceeded are left for the '
+                      'next sync. 0 - unlimited.')),
     cfg.IntOpt('periodic_max_workers',
                default=8,
                help=_('Maximum number of worker threads that can be started '
@@ -147,6 +171,29 @@ conductor_opts = [
                 help=_('List of comma separated meter types which need to be'
                        ' sent to Ceilometer. The default value, "ALL", is a '
                        'special value meaning send all the sensor data.')),
+    cfg.IntOpt('send_sensor_data_workers',
+               default=1,
+               help=_('Number of green threads used to get the sensor data '
+                      'of nodes concurrently. These threads come from a '
+                      'dedicated pool, separate from the conductor workers '
+                      'pool. The default of 1 gets the sensor data of one '
+                      'node at a time.')),
+    cfg.IntOpt('send_sensor_data_wait_timeout',
+               default=0,
+               help=_('Maximum time (in seconds) to wait for the sensor data '
+                      'of a single node. The sensor data of a node which '
+                      'takes longer is not sent. 0 - unlimited.')),
+    cfg.IntOpt('send_sensor_data_batch_size',
+               default=1,
+               help=_('Maximum number of nodes whose sensor data is sent in '
+                      'a single message. When greater than 1, the payload '
+                      'of the message is the list of the sensor data '
+                      'messages of the nodes, instead of the sensor data of '
+                      'a single node.')),
+    cfg.BoolOpt('send_sensor_data_skip_unchanged',
+                default=False,
+                help=_('Do not send the sensor data of a node again if it did '
+                       'not change since it was last sent.')),
     cfg.IntOpt('sync_local_state_interval',
                default=180,
                help=_('When conductors join or leave the cluster, existing '
@@ -184,6 +231,13 @@ conductor_opts = [
                        'longer. In an environment where all tenants are '
                        'trusted (eg, because there is only one tenant), '
                        'this option could be safely disabled.')),
+    cfg.IntOpt('log_stats_interval',
+               default=0,
+               help=_('Seconds between conductor logging, at debug level, '
+                      'statistics of the image downloads, of the '
+                      'scheduling of the ipmitool commands and of the '
+                      'latencies of the power state transitions. '
+                      '0 - disabled.')),
 ]
 CONF = cfg.CONF
 CONF.register_opts(conductor_opts, 'conductor')
@@ -198,6 +252,11 @@ CLEANING_INTERFACE_PRIORITY = {
     'deploy': 1
 }
 SYNC_EXCLUDED_STATES = (states.DEPLOYWAIT, states.CLEANWAIT, states.ENROLL)
+# Filters a node has to match for its power state to be synced. They are
+# evaluated by the database when the node is locked.
+SYNC_POWER_STATE_FILTERS = {'maintenance': False,
+                            'provision_state_not_in': SYNC_EXCLUDED_STATES,
+                            'in_power_transition': False}
 
 
 class ConductorManager(periodic_task.PeriodicTasks):
@@ -215,6 +274,8 @@ class ConductorManager(periodic_task.PeriodicTasks):
         self.host = host
         self.topic = topic
         self.power_state_sync_count = collections.defaultdict(int)
+        # digest of the sensor data last sent for each node
+        self.sensor_data_sent = {}
         self.notifier = rpc.get_notifier()
 
     def _get_driver(self, driver_name):
@@ -1101,8 +1162,9 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         1) Node is mapped to this conductor.
         2) Node is not in maintenance mode.
-        3) Node is not in DEPLOYWAIT/CLEANWAIT provision state.
-        4) Node doesn't have a reservation
+        3) Node is not in DEPLOYWAIT/CLEANWAIT/ENROLL provision state.
+        4) Node doesn't have a reservation.
+        5) Node is not in the middle of a power state transition.
 
         NOTE: Grabbing a lock here can cause other methods to fail to
         grab it. We want to avoid trying to grab a lock while a node
@@ -1110,55 +1172,218 @@ class ConductorManager(periodic_task.PeriodicTasks):
         cause a deploy/cleaning callback to fail. There's not much we
         can do here to avoid failing a brand new deploy to a node that
         we've locked here, though.
-        """
-        # FIXME(comstud): Since our initial state checks are outside
-        # of the lock (to try to avoid the lock), some checks are
-        # repeated after grabbing the lock so we can unlock quickly.
-        # The node mapping is not re-checked because it doesn't much
-        # matter if things happened to re-balance.
-        #
-        # This is inefficient and racey. We end up with calling DB API's
-        # get_node() twice (once here, and once in acquire(). Ideally we
-        # add a way to pass constraints to task_manager.acquire()
-        # (through to its DB API call) so that we can eliminate our call
-        # and first set of checks below.
 
+        Conditions 2, 3 and 5 are passed as filters to the lock, so they
+        are checked by the database in the same query that loads (or
+        reserves) the node. The node mapping is not re-checked because it
+        doesn't much matter if things happened to re-balance.
+        """
         filters = {'reserved': False, 'maintenance': False}
         node_iter = self.iter_nodes(fields=['id'], filters=filters)
-        for (node_uuid, driver, node_id) in node_iter:
+
+        workers = CONF.conductor.sync_power_state_workers
+        timeout = CONF.conductor.sync_power_state_timeout
+        deadline = time.time() + timeout if timeout > 0 else None
+        stats = collections.Counter()
+
+        # BMC queries are fanned out across a pool dedicated to this
+        # periodic task, so a slow power sync can neither starve nor be
+        # starved by the conductor workers pool.
+        pool = greenpool.GreenPool(size=workers) if workers > 1 else None
+
+        def _sync_node(node_uuid):
             try:
-                # NOTE(dtantsur): start with a shared lock, upgrade if needed
-                with task_manager.acquire(context, node_uuid,
-                                          purpose='power state sync',
-                                          shared=True) as task:
-                    # NOTE(deva): we should not acquire a lock on a node in
-                    #             DEPLOYWAIT/CLEANWAIT, as this could cause
-                    #             an error within a deploy ramdisk POSTing back
-                    #             at the same time.
-                    # NOTE(dtantsur): it's also pointless (and dangerous) to
-                    # sync power state when a power action is in progress
-                    if (task.node.provision_state in SYNC_EXCLUDED_STATES or
-                            task.node.maintenance or
-                            task.node.target_power_state):
+                stats[self._sync_power_state_for_node(context,
+                                                      node_uuid)] += 1
+            except Exception:
+                stats['failed'] += 1
+                LOG.exception(_LE("During sync_power_state, unexpected "
+                                  "error while syncing node %s."), node_uuid)
+
+        batch_size = CONF.conductor.sync_power_state_batch_size
+        batches = collections.defaultdict(list)
+
+        def _sync_nodes(node_uuids):
+            try:
+                stats.update(self._sync_power_state_for_nodes(context,
+                                                              node_uuids))
+            except Exception:
+                stats['failed'] += len(node_uuids)
+                LOG.exception(_LE("During sync_power_state, unexpected "
+                                  "error while syncing nodes %s."),
+                              ', '.join(node_uuids))
+
+        def _start_batch(node_uuids):
+            if pool is not None:
+                pool.spawn_n(_sync_nodes, node_uuids)
+            else:
+                _sync_nodes(node_uuids)
+                eventlet.sleep(0)
+
+        for (node_uuid, driver, node_id) in node_iter:
+            if deadline is not None and time.time() > deadline:
+                stats['timed_out'] += 1
+                continue
+
+            if batch_size > 1 and self._has_bulk_power_state(driver):
+                batches[driver].append(node_uuid)
+                if len(batches[driver]) >= batch_size:
+                    _start_batch(batches.pop(driver))
+                continue
+
+            if pool is not None:
+                pool.spawn_n(_sync_node, node_uuid)
+                continue
+
+            _sync_node(node_uuid)
+            # Yield on every iteration
+            eventlet.sleep(0)
+
+        for node_uuids in batches.values():
+            if deadline is not None and time.time() > deadline:
+                stats['timed_out'] += len(node_uuids)
+                continue
+            _start_batch(node_uuids)
+
+        if pool is not None:
+            pool.waitall()
+
+        if stats['timed_out']:
+            LOG.warning(_LW("sync_power_state did not finish within "
+                            "%(timeout)s seconds, %(count)s nodes were left "
+                            "for the next run."),
+                        {'timeout': timeout, 'count': stats['timed_out']})
+        LOG.debug('Power state sync finished: %(synced)d nodes synced, '
+                  '%(skipped)d skipped, %(timed_out)d timed out, '
+                  '%(failed)d failed.',
+                  {'synced': stats['synced'], 'skipped': stats['skipped'],
+                   'timed_out': stats['timed_out'],
+                   'failed': stats['failed']})
+
+    def _sync_power_state_for_node(self, context, node_uuid):
+        """Sync the power state of a single node.
+
+        :param context: request context.
+        :param node_uuid: the UUID of the node to sync.
+        :returns: 'synced' if the power state of the node was checked,
+                  'skipped' if the node could not or should not be synced.
+        """
+        try:
+            # NOTE(dtantsur): start with a shared lock, upgrade if needed
+            # NOTE(deva): we should not acquire a lock on a node in
+            #             DEPLOYWAIT/CLEANWAIT, as this could cause
+            #             an error within a deploy ramdisk POSTing back
+            #             at the same time.
+            # NOTE(dtantsur): it's also pointless (and dangerous) to
+            # sync power state when a power action is in progress
+            with task_manager.acquire(context, node_uuid,
+                                      purpose='power state sync',
+                                      shared=True,
+                                      filters=SYNC_POWER_STATE_FILTERS
+                                      ) as task:
+                count = do_sync_power_state(
+                    task, self.power_state_sync_count[node_uuid])
+                if count:
+                    self.power_state_sync_count[node_uuid] = count
+                else:
+                    # don't bloat the dict with non-failing nodes
+                    del self.power_state_sync_count[node_uuid]
+                return 'synced'
+        except exception.NodeNotFound:
+            LOG.info(_LI("During sync_power_state, node %(node)s was not "
+                         "found and presumed deleted by another process."),
+                     {'node': node_uuid})
+        except exception.NodeLocked:
+            LOG.info(_LI("During sync_power_state, node %(node)s was "
+                         "already locked by another process. Skip."),
+                     {'node': node_uuid})
+        except exception.NodeFiltersNotMatched:
+            LOG.debug("During sync_power_state, node %(node)s is in a "
+                      "state that does not allow syncing. Skip.",
+                      {'node': node_uuid})
+        return 'skipped'
+
+    def _has_bulk_power_state(self, driver_name):
+        """Whether a driver can query the power state of many nodes at once.
+
+        :param driver_name: the name of the driver.
+        """
+        try:
+            driver = self._get_driver(driver_name)
+        except exception.DriverNotFound:
+            return False
+        return getattr(driver.power, 'get_power_state_many', None) is not None
+
+    def _sync_power_state_for_nodes(self, context, node_uuids):
+        """Sync the power state of several nodes of the same driver.
+
+        The power state of the nodes is queried at once with the
+        get_power_state_many() method of the power interface of the driver.
+
+        :param context: request context.
+        :param node_uuids: the UUIDs of the nodes to sync.
+        :returns: a Counter of the nodes 'synced', 'skipped' and 'failed'.
+        """
+        stats = collections.Counter()
+        with task_manager.acquire_many(context, node_uuids,
+                                       purpose='power state sync',
+                                       shared=True,
+                                       filters=SYNC_POWER_STATE_FILTERS
+                                       ) as tasks:
+            # Nodes deleted, locked or in a state that does not allow
+            # syncing are left out of the tasks.
+            stats['skipped'] += len(node_uuids) - len(tasks)
+            if not len(tasks):
+                return stats
+
+            # NOTE: do_sync_power_state() does not sync the nodes with no
+            # prior power state whose power info is invalid, do not query
+            # their power state either.
+            to_query = []
+            for task in tasks:
+                if task.node.power_state is None:
+                    try:
+                        task.driver.power.validate(task)
+                    except (exception.InvalidParameterValue,
+                            exception.MissingParameterValue):
                         continue
+                to_query.append(task)
+            power_states = {}
+            if to_query:
+                power = to_query[0].driver.power
+                try:
+                    power_states = power.get_power_state_many(to_query)
+                except Exception as e:
+                    # Handled like a failure to get the power state of
+                    # every node, so that their retries are counted.
+                    power_states = dict((task.node.uuid, e)
+                                        for task in to_query)
+
+            for task in tasks:
+                node_uuid = task.node.uuid
+                try:
                     count = do_sync_power_state(
-                        task, self.power_state_sync_count[node_uuid])
-                    if count:
-                        self.power_state_sync_count[node_uuid] = count
-                    else:
-                        # don't bloat the dict with non-failing nodes
-                        del self.power_state_sync_count[node_uuid]
-            except exception.NodeNotFound:
-                LOG.info(_LI("During sync_power_state, node %(node)s was not "
-                             "found and presumed deleted by another process."),
-                         {'node': node_uuid})
-            except exception.NodeLocked:
-                LOG.info(_LI("During sync_power_state, node %(node)s was "
-                             "already locked by another process. Skip."),
-                         {'node': node_uuid})
-            finally:
-                # Yield on every iteration
-                eventlet.sleep(0)
+                        task, self.power_state_sync_count.get(node_uuid, 0),
+                        queried_state=power_states.get(node_uuid))
+                except exception.NodeLocked:
+                    LOG.info(_LI("During sync_power_state, node %(node)s "
+                                 "was already locked by another process. "
+                                 "Skip."), {'node': node_uuid})
+                    stats['skipped'] += 1
+                    continue
+                except Exception:
+                    LOG.exception(_LE("During sync_power_state, unexpected "
+                                      "error while syncing node %s."),
+                                  node_uuid)
+                    stats['failed'] += 1
+                    continue
+                if count:
+                    self.power_state_sync_count[node_uuid] = count
+                else:
+                    # don't bloat the dict with non-failing nodes
+                    self.power_state_sync_count.pop(node_uuid, None)
+                stats['synced'] += 1
+        return stats
 
     @periodic_task.periodic_task(
         spacing=CONF.conductor.check_provision_state_interval)
@@ -1314,11 +1539,26 @@ class ConductorManager(periodic_task.PeriodicTasks):
 
         return self.host in ring.get_hosts(node_uuid)
 
+    def _get_uuid_hash_ranges(self):
+        """Get the ranges of node uuid hashes mapped to this conductor.
+
+        :returns: a dict mapping the names of the drivers this conductor
+                  serves to lists of (low, high) ranges of uuid hashes,
+                  suitable for the uuid_hash_ranges node filter.
+        """
+        hash_ranges = {}
+        for driver, ring in self.ring_manager.ring.items():
+            ranges = ring.get_hash_ranges(self.host)
+            if ranges:
+                hash_ranges[driver] = ranges
+        return hash_ranges
+
     def iter_nodes(self, fields=None, **kwargs):
         """Iterate over nodes mapped to this conductor.
 
-        Requests node set from and filters out nodes that are not
-        mapped to this conductor.
+        Requests from the database the nodes whose uuid hash falls within
+        the hash ranges served by this conductor, and filters out the
+        remaining nodes that are not mapped to this conductor.
 
         Yields tuples (node_uuid, driver, ...) where ... is derived from
         fields argument, e.g.: fields=None means yielding ('uuid', 'driver'),
@@ -1330,7 +1570,10 @@ class ConductorManager(periodic_task.PeriodicTasks):
         :return: generator yielding tuples of requested fields
         """
         columns = ['uuid', 'driver'] + list(fields or ())
-        node_list = self.dbapi.get_nodeinfo_list(columns=columns, **kwargs)
+        filters = dict(kwargs.pop('filters', None) or {})
+        filters['uuid_hash_ranges'] = self._get_uuid_hash_ranges()
+        node_list = self.dbapi.get_nodeinfo_list(columns=columns,
+                                                 filters=filters, **kwargs)
         for result in node_list:
             if self._mapped_to_this_conductor(*result[:2]):
                 yield result
@@ -1616,6 +1859,18 @@ class ConductorManager(periodic_task.PeriodicTasks):
         driver = self._get_driver(driver_name)
         return driver.get_properties()
 
+    @periodic_task.periodic_task(
+        spacing=CONF.conductor.log_stats_interval)
+    def _log_stats(self, context):
+        """Periodically logs statistics for troubleshooting."""
+        # do nothing if log_stats_interval is 0
+        if CONF.conductor.log_stats_interval <= 0:
+            return
+
+        for name, value in stats.get_stats():
+            LOG.debug('Statistics of %(name)s: %(stats)s',
+                      {'name': name, 'stats': value})
+
     @periodic_task.periodic_task(
         spacing=CONF.conductor.send_sensor_data_interval)
     def _send_sensor_data(self, context):
@@ -1628,58 +1883,129 @@ class ConductorManager(periodic_task.PeriodicTasks):
         node_iter = self.iter_nodes(fields=['instance_uuid'],
                                     filters=filters)
 
-        for (node_uuid, driver, instance_uuid) in node_iter:
-            # populate the message which will be sent to ceilometer
-            message = {'message_id': uuidutils.generate_uuid(),
-                       'instance_uuid': instance_uuid,
-                       'node_uuid': node_uuid,
-                       'timestamp': datetime.datetime.utcnow(),
-                       'event_type': 'hardware.ipmi.metrics.update'}
+        workers = max(CONF.conductor.send_sensor_data_workers, 1)
+        batch_size = max(CONF.conductor.send_sensor_data_batch_size, 1)
+        skip_unchanged = CONF.conductor.send_sensor_data_skip_unchanged
+
+        # Sensor data is fetched concurrently from a pool dedicated to this
+        # periodic task, so a slow BMC doesn't hold up the fetching for the
+        # other nodes, and is sent in batches in the order of the nodes.
+        pool = greenpool.GreenPool(size=workers)
+        get_message = functools.partial(self._get_sensor_data_message,
+                                        context)
+        sent = {}
+        batch = []
+        for message in pool.starmap(get_message, node_iter):
+            if message is None:
+                continue
 
-            try:
-                lock_purpose = 'getting sensors data'
-                with task_manager.acquire(context,
-                                          node_uuid,
-                                          shared=True,
-                                          purpose=lock_purpose) as task:
-                    if not getattr(task.driver, 'management', None):
-                        continue
-                    task.driver.management.validate(task)
-                    sensors_data = task.driver.management.get_sensors_data(
-                        task)
-            except NotImplementedError:
-                LOG.warn(_LW(
-                    'get_sensors_data is not implemented for driver'
-                    ' %(driver)s, node_uuid is %(node)s'),
-                    {'node': node_uuid, 'driver': driver})
-            except exception.FailedToParseSensorData as fps:
-                LOG.warn(_LW(
-                    "During get_sensors_data, could not parse "
-                    "sensor data for node %(node)s. Error: %(err)s."),
-                    {'node': node_uuid, 'err': str(fps)})
-            except exception.FailedToGetSensorData as fgs:
-                LOG.warn(_LW(
-                    "During get_sensors_data, could not get "
-                    "sensor data for node %(node)s. Error: %(err)s."),
-                    {'node': node_uuid, 'err': str(fgs)})
-            except exception.NodeNotFound:
-                LOG.warn(_LW(
-                    "During send_sensor_data, node %(node)s was not "
-                    "found and presumed deleted by another process."),
-                    {'node': node_uuid})
-            except Exception as e:
-                LOG.warn(_LW(
-                    "Failed to get sensor data for node %(node)s. "
-                    "Error: %(error)s"), {'node': node_uuid, 'error': str(e)})
-            else:
-                message['payload'] = (
-                    self._filter_out_unsupported_types(sensors_data))
-                if message['payload']:
-                    self.notifier.info(context, "hardware.ipmi.metrics",
-                                       message)
-            finally:
-                # Yield on every iteration
-                eventlet.sleep(0)
+            if skip_unchanged:
+                node_uuid = message['node_uuid']
+                digest = hashlib.sha1(jsonutils.dumps(
+                    message['payload'], sort_keys=True).encode(
+                        'utf-8')).hexdigest()
+                sent[node_uuid] = digest
+                if self.sensor_data_sent.get(node_uuid) == digest:
+                    continue
+
+            batch.append(message)
+            if len(batch) >= batch_size:
+                self._emit_sensor_data(context, batch)
+                batch = []
+
+        if batch:
+            self._emit_sensor_data(context, batch)
+        if skip_unchanged:
+            # only keep the nodes which are still ours
+            self.sensor_data_sent = sent
+
+    def _get_sensor_data_message(self, context, node_uuid, driver,
+                                 instance_uuid):
+        """Get the sensor data message of a node.
+
+        :param context: request context.
+        :param node_uuid: the UUID of the node.
+        :param driver: the name of the driver of the node.
+        :param instance_uuid: the UUID of the instance on the node.
+        :returns: the message to send to ceilometer, or None if there is
+                  no sensor data to send for the node.
+        """
+        # populate the message which will be sent to ceilometer
+        message = {'message_id': uuidutils.generate_uuid(),
+                   'instance_uuid': instance_uuid,
+                   'node_uuid': node_uuid,
+                   'timestamp': datetime.datetime.utcnow(),
+                   'event_type': 'hardware.ipmi.metrics.update'}
+
+        timeout = CONF.conductor.send_sensor_data_wait_timeout
+        timer = eventlet.Timeout(timeout) if timeout > 0 else None
+        try:
+            lock_purpose = 'getting sensors data'
+            with task_manager.acquire(context,
+                                      node_uuid,
+                                      shared=True,
+                                      purpose=lock_purpose) as task:
+                if not getattr(task.driver, 'management', None):
+                    return
+                task.driver.management.validate(task)
+                sensors_data = task.driver.management.get_sensors_data(
+                    task)
+        except eventlet.Timeout as t:
+            if t is not timer:
+                raise
+            LOG.warn(_LW(
+                "During send_sensor_data, could not get sensor data for "
+                "node %(node)s within %(timeout)s seconds."),
+                {'node': node_uuid, 'timeout': timeout})
+        except NotImplementedError:
+            LOG.warn(_LW(
+                'get_sensors_data is not implemented for driver'
+                ' %(driver)s, node_uuid is %(node)s'),
+                {'node': node_uuid, 'driver': driver})
+        except exception.FailedToParseSensorData as fps:
+            LOG.warn(_LW(
+                "During get_sensors_data, could not parse "
+                "sensor data for node %(node)s. Error: %(err)s."),
+                {'node': node_uuid, 'err': str(fps)})
+        except exception.FailedToGetSensorData as fgs:
+            LOG.warn(_LW(
+                "During get_sensors_data, could not get "
+                "sensor data for node %(node)s. Error: %(err)s."),
+                {'node': node_uuid, 'err': str(fgs)})
+        except exception.NodeNotFound:
+            LOG.warn(_LW(
+                "During send_sensor_data, node %(node)s was not "
+                "found and presumed deleted by another process."),
+                {'node': node_uuid})
+        except Exception as e:
+            LOG.warn(_LW(
+                "Failed to get sensor data for node %(node)s. "
+                "Error: %(error)s"), {'node': node_uuid, 'error': str(e)})
+        else:
+            message['payload'] = (
+                self._filter_out_unsupported_types(sensors_data))
+            if message['payload']:
+                return message
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def _emit_sensor_data(self, context, messages):
+        """Send the sensor data messages of nodes to ceilometer.
+
+        :param context: request context.
+        :param messages: the sensor data messages of the nodes.
+        """
+        if CONF.conductor.send_sensor_data_batch_size <= 1:
+            for message in messages:
+                self.notifier.info(context, "hardware.ipmi.metrics", message)
+            return
+
+        batch = {'message_id': uuidutils.generate_uuid(),
+                 'timestamp': datetime.datetime.utcnow(),
+                 'event_type': 'hardware.ipmi.metrics.update',
+                 'payload': messages}
+        self.notifier.info(context, "hardware.ipmi.metrics", batch)
 
     def _filter_out_unsupported_types(self, sensors_data):
         """Filters out sensor data types that aren't specified in the config.
@@ -2134,7 +2460,24 @@ def handle_sync_power_state_max_retries_exceeded(task,
     LOG.error(msg)
 
 
-def do_sync_power_state(task, count):
+def _get_queried_power_state(task, queried_state):
+    """Get the power state of a node, unless it was already queried.
+
+    :param task: a TaskManager instance
+    :param queried_state: the power state of the node if it was already
+                          queried, or the exception raised querying it,
+                          or None.
+    :raises: the exception raised querying the power state.
+    :returns: the power state of the node.
+    """
+    if queried_state is None:
+        return task.driver.power.get_power_state(task)
+    if isinstance(queried_state, Exception):
+        raise queried_state
+    return queried_state
+
+
+def do_sync_power_state(task, count, queried_state=None):
     """Sync the power state for this node, incrementing the counter on failure.
 
     When the limit of power_state_sync_max_retries is reached, the node is put
@@ -2142,6 +2485,9 @@ def do_sync_power_state(task, count):
 
     :param task: a TaskManager instance
     :param count: number of times this node has previously failed a sync
+    :param queried_state: the power state of the node if it was already
+                          queried, or the exception raised querying it.
+                          Default: None, the power state is queried here.
     :raises: NodeLocked if unable to upgrade task lock to an exclusive one
     :returns: Count of failed attempts.
               On success, the counter is set to 0.
@@ -2164,7 +2510,7 @@ def do_sync_power_state(task, count):
     try:
         # The driver may raise an exception, or may return ERROR.
         # Handle both the same way.
-        power_state = task.driver.power.get_power_state(task)
+        power_state = _get_queried_power_state(task, queried_state)
         if power_state == states.ERROR:
             raise exception.PowerStateFailure(
                 _("Power driver returned ERROR state "
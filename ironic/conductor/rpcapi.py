@@ -102,10 +102,8 @@ class ConductorAPI(object):
         :raises: NoValidHost
 
         """
-        self.ring_manager.reset()
-
         try:
-            ring = self.ring_manager[node.driver]
+            ring = self._get_ring(node.driver)
             dest = ring.get_hosts(node.uuid)
             return self.topic + "." + dest[0]
         except exception.DriverNotFound:
@@ -125,12 +123,28 @@ class ConductorAPI(object):
         :raises: DriverNotFound
 
         """
-        self.ring_manager.reset()
-
-        hash_ring = self.ring_manager[driver_name]
+        hash_ring = self._get_ring(driver_name)
         host = random.choice(list(hash_ring.hosts))
         return self.topic + "." + host
 
+    def _get_ring(self, driver_name):
+        """Get the hash ring of a driver.
+
+        The rings are cached by the ring manager. If the driver is not
+        found, the rings are refreshed once, in case a conductor supporting
+        it has registered since they were loaded.
+
+        :param driver_name: the name of the driver.
+        :returns: a :class:`ironic.common.hash_ring.HashRing`.
+        :raises: DriverNotFound
+
+        """
+        try:
+            return self.ring_manager[driver_name]
+        except exception.DriverNotFound:
+            self.ring_manager.reset()
+            return self.ring_manager[driver_name]
+
     def update_node(self, context, node_obj, topic=None):
         """Synchronously, have a conductor update the node's information.
 
@@ -92,6 +92,17 @@ raised in the background thread.):
         task.spawn_after(self._spawn_worker,
                          utils.node_power_action, task, new_state)
 
+Several nodes can be locked at once with :func:`acquire_many`, which
+reserves all the free nodes in a single database transaction rather than
+one at a time. The nodes which cannot be acquired are skipped:
+
+::
+
+    with task_manager.acquire_many(context, node_ids,
+                                   purpose='some work') as tasks:
+        for task in tasks:
+            <do some work>
+
 """
 
 import functools
@@ -137,7 +148,7 @@ def require_exclusive_lock(f):
 
 
 def acquire(context, node_id, shared=False, driver_name=None,
-            purpose='unspecified action'):
+            purpose='unspecified action', filters=None):
     """Shortcut for acquiring a lock on a Node.
 
     :param context: Request context.
@@ -146,11 +157,46 @@ def acquire(context, node_id, shared=False, driver_name=None,
                    lock. Default: False.
     :param driver_name: Name of Driver. Default: None.
     :param purpose: human-readable purpose to put to debug logs.
+    :param filters: Filters the node must match for the lock to be
+                    acquired. Default: None.
     :returns: An instance of :class:`TaskManager`.
 
     """
     return TaskManager(context, node_id, shared=shared,
-                       driver_name=driver_name, purpose=purpose)
+                       driver_name=driver_name, purpose=purpose,
+                       filters=filters)
+
+
+def acquire_many(context, node_ids, shared=False,
+                 purpose='unspecified action', filters=None):
+    """Shortcut for acquiring locks on several Nodes.
+
+    :param context: Request context.
+    :param node_ids: list of IDs or UUIDs of nodes to lock.
+    :param shared: Boolean indicating whether to take shared or exclusive
+                   locks. Default: False.
+    :param purpose: human-readable purpose to put to debug logs.
+    :param filters: Filters the nodes must match for their lock to be
+                    acquired. Default: None.
+    :returns: An instance of :class:`MultiNodeTaskManager`.
+
+    """
+    return MultiNodeTaskManager(context, node_ids, shared=shared,
+                                purpose=purpose, filters=filters)
+
+
+def _clear_resources(task):
+    """Reset the resources of a task once the lock on its node is released."""
+    if task.node:
+        LOG.debug("Successfully released %(type)s lock for %(purpose)s "
+                  "on node %(node)s (lock was held %(time).2f sec)",
+                  {'type': 'shared' if task.shared else 'exclusive',
+                   'purpose': task._purpose, 'node': task.node.uuid,
+                   'time': task._debug_timer.elapsed()})
+    task.node = None
+    task.driver = None
+    task.ports = None
+    task.fsm = None
 
 
 class TaskManager(object):
@@ -162,7 +208,8 @@ class TaskManager(object):
     """
 
     def __init__(self, context, node_id, shared=False, driver_name=None,
-                 purpose='unspecified action'):
+                 purpose='unspecified action', filters=None, node=None,
+                 ports=None):
         """Create a new TaskManager.
 
         Acquire a lock on a node. The lock can be either shared or
@@ -177,9 +224,22 @@ class TaskManager(object):
         :param driver_name: The name of the driver to load, if different
                             from the Node's current driver.
         :param purpose: human-readable purpose to put to debug logs.
+        :param filters: Filters the node must match, in the format accepted
+                        by the DB API's get_node_list(). They are checked by
+                        the database together with the lock, so a node that
+                        does not match them fails without being locked.
+                        They are checked again when a shared lock is
+                        upgraded to an exclusive one.
+        :param node: The Node object, if it was already loaded, or already
+                     reserved by this conductor when shared is False.
+                     The reservation is then handed over to this
+                     TaskManager. Default: None.
+        :param ports: The list of the Port objects of the node, if they were
+                      already loaded. Default: None.
         :raises: DriverNotFound
         :raises: NodeNotFound
         :raises: NodeLocked
+        :raises: NodeFiltersNotMatched
 
         """
 
@@ -190,6 +250,7 @@ class TaskManager(object):
         self.node = None
         self.node_id = node_id
         self.shared = shared
+        self._filters = filters
 
         self.fsm = states.machine.copy()
         self._purpose = purpose
@@ -200,12 +261,21 @@ class TaskManager(object):
                       "%(purpose)s)",
                       {'type': 'shared' if shared else 'exclusive',
                        'node': node_id, 'purpose': purpose})
-            if not self.shared:
+            if node is not None:
+                self._debug_timer.restart()
+                self.node = node
+            elif not self.shared:
                 self._lock()
             else:
                 self._debug_timer.restart()
-                self.node = objects.Node.get(context, node_id)
-            self.ports = objects.Port.list_by_node_id(context, self.node.id)
+                if self._filters:
+                    self.node = objects.Node.get(context, node_id,
+                                                 filters=self._filters)
+                else:
+                    self.node = objects.Node.get(context, node_id)
+            if ports is None:
+                ports = objects.Port.list_by_node_id(context, self.node.id)
+            self.ports = ports
             self.driver = driver_factory.get_driver(driver_name or
                                                     self.node.driver)
 
@@ -232,8 +302,13 @@ class TaskManager(object):
             stop_max_attempt_number=CONF.conductor.node_locked_retry_attempts,
             wait_fixed=CONF.conductor.node_locked_retry_interval * 1000)
         def reserve_node():
-            self.node = objects.Node.reserve(self.context, CONF.host,
-                                             self.node_id)
+            if self._filters:
+                self.node = objects.Node.reserve(self.context, CONF.host,
+                                                 self.node_id,
+                                                 filters=self._filters)
+            else:
+                self.node = objects.Node.reserve(self.context, CONF.host,
+                                                 self.node_id)
             LOG.debug("Node %(node)s successfully reserved for %(purpose)s "
                       "(took %(time).2f seconds)",
                       {'node': self.node_id, 'purpose': self._purpose,
@@ -304,16 +379,7 @@ class TaskManager(object):
                 # squelch the exception if the node was deleted
                 # within the task's context.
                 pass
-        if self.node:
-            LOG.debug("Successfully released %(type)s lock for %(purpose)s "
-                      "on node %(node)s (lock was held %(time).2f sec)",
-                      {'type': 'shared' if self.shared else 'exclusive',
-                       'purpose': self._purpose, 'node': self.node.uuid,
-                       'time': self._debug_timer.elapsed()})
-        self.node = None
-        self.driver = None
-        self.ports = None
-        self.fsm = None
+        _clear_resources(self)
 
     def _thread_release_resources(self, t):
         """Thread.link() callback to release resources."""
@@ -408,3 +474,123 @@ class TaskManager(object):
                         thread.cancel()
                     self.release_resources()
         self.release_resources()
+
+
+class MultiNodeTaskManager(object):
+    """Context manager for tasks on several nodes.
+
+    The exclusive locks on all the nodes are taken in a single database
+    transaction, and released together on exit. Unlike :class:`TaskManager`,
+    a node which cannot be acquired is skipped rather than retried or
+    reported with an exception: the :class:`TaskManager` instances of the
+    acquired nodes are available by iterating over this object, and the
+    nodes which were locked by someone else are listed in `locked`.
+
+    """
+
+    def __init__(self, context, node_ids, shared=False,
+                 purpose='unspecified action', filters=None):
+        """Create a new MultiNodeTaskManager.
+
+        :param context: request context
+        :param node_ids: list of IDs or UUIDs of nodes to lock.
+        :param shared: Boolean indicating whether to take shared or
+                       exclusive locks. Default: False.
+        :param purpose: human-readable purpose to put to debug logs.
+        :param filters: Filters the nodes must match, in the format accepted
+                        by the DB API's get_node_list(). Default: None.
+        :raises: InvalidIdentity
+
+        """
+        self.context = context
+        self.shared = shared
+        self.tasks = []
+        self.locked = set()
+        self._spawned = []
+
+        LOG.debug("Attempting to get %(type)s locks on %(count)d nodes (for "
+                  "%(purpose)s)",
+                  {'type': 'shared' if shared else 'exclusive',
+                   'count': len(node_ids), 'purpose': purpose})
+        if shared:
+            nodes = objects.Node.get_many(context, node_ids, filters=filters)
+        else:
+            nodes, self.locked = objects.Node.reserve_many(
+                context, CONF.host, node_ids, filters=filters)
+
+        # The ports of all the nodes are loaded at once too
+        ids = [node.id for node in nodes]
+        ports = dict((node_id, []) for node_id in ids)
+        try:
+            if ids:
+                for port in objects.Port.list_by_node_ids(context, ids):
+                    ports[port.node_id].append(port)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if not shared:
+                    objects.Node.release_many(context, CONF.host, ids)
+
+        for node in nodes:
+            # TaskManager releases the node itself if it fails.
+            try:
+                self.tasks.append(TaskManager(context, node.id,
+                                              shared=shared,
+                                              purpose=purpose,
+                                              filters=filters, node=node,
+                                              ports=ports[node.id]))
+            except Exception as e:
+                LOG.warning(_LW("Failed to acquire node %(node)s for "
+                                "%(purpose)s: %(error)s"),
+                            {'node': node.uuid, 'purpose': purpose,
+                             'error': e})
+
+        LOG.debug("Acquired %(type)s locks on %(acquired)d nodes for "
+                  "%(purpose)s, %(locked)d nodes were already locked",
+                  {'type': 'shared' if shared else 'exclusive',
+                   'acquired': len(self.tasks), 'purpose': purpose,
+                   'locked': len(self.locked)})
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def release_resources(self):
+        """Unlock the nodes and release the resources of all the tasks.
+
+        The nodes of the tasks which spawned a worker thread are left
+        alone, they are released when their thread finishes.
+        """
+        tasks = [task for task in self.tasks
+                 if task.node is not None and task not in self._spawned]
+        # Shared locks may have been upgraded to exclusive ones
+        exclusive = [task.node.id for task in tasks if not task.shared]
+        try:
+            if exclusive:
+                objects.Node.release_many(self.context, CONF.host, exclusive)
+        finally:
+            for task in tasks:
+                _clear_resources(task)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        spawn_error = None
+        if exc_type is None:
+            for task in self.tasks:
+                if task._spawn_method is None:
+                    continue
+                try:
+                    task.__exit__(None, None, None)
+                except Exception as e:
+                    # The task released its own node, carry on with the
+                    # other ones and raise the first error afterwards.
+                    if spawn_error is None:
+                        spawn_error = e
+                else:
+                    self._spawned.append(task)
+        self.release_resources()
+        if spawn_error is not None:
+            raise spawn_error
@@ -61,6 +61,15 @@ class Connection(object):
                         :chassis_uuid: uuid of chassis
                         :driver: driver's name
                         :provision_state: provision state of node
+                        :provision_state_not_in:
+                            list of provision states the node must not be in
+                        :in_power_transition: True | False
+                        :uuid_hash_ranges:
+                            dict mapping driver names to lists of
+                            (low, high) ranges of uuid hashes, see
+                            ironic.common.hash_ring.get_uuid_hash. Nodes
+                            with no uuid hash match any range of their
+                            driver.
                         :provisioned_before:
                             nodes with provision_updated_at field before this
                             interval in seconds
@@ -75,7 +84,8 @@ class Connection(object):
 
     @abc.abstractmethod
     def get_node_list(self, filters=None, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, fields=None,
+                      stream=False):
         """Return a list of nodes.
 
         :param filters: Filters to apply. Defaults to None.
@@ -86,6 +96,15 @@ class Connection(object):
                         :chassis_uuid: uuid of chassis
                         :driver: driver's name
                         :provision_state: provision state of node
+                        :provision_state_not_in:
+                            list of provision states the node must not be in
+                        :in_power_transition: True | False
+                        :uuid_hash_ranges:
+                            dict mapping driver names to lists of
+                            (low, high) ranges of uuid hashes, see
+                            ironic.common.hash_ring.get_uuid_hash. Nodes
+                            with no uuid hash match any range of their
+                            driver.
                         :provisioned_before:
                             nodes with provision_updated_at field before this
                             interval in seconds
@@ -95,10 +114,18 @@ class Connection(object):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param fields: List of the names of the columns to load. The other
+                       columns of the returned nodes are not loaded and
+                       must not be accessed. Defaults to None, loading
+                       all the columns.
+        :param stream: If True, return an iterator fetching the nodes from
+                       the database in chunks, with a server-side cursor
+                       when the database driver supports it, rather than
+                       a list. Defaults to False.
         """
 
     @abc.abstractmethod
-    def reserve_node(self, tag, node_id):
+    def reserve_node(self, tag, node_id, filters=None):
         """Reserve a node.
 
         To prevent other ManagerServices from manipulating the given
@@ -106,9 +133,15 @@ class Connection(object):
 
         :param tag: A string uniquely identifying the reservation holder.
         :param node_id: A node id or uuid.
+        :param filters: Filters the node must match to be reserved, in the
+                        format accepted by :meth:`get_node_list`. They are
+                        evaluated in the same statement that takes the
+                        reservation. Defaults to None.
         :returns: A Node object.
         :raises: NodeNotFound if the node is not found.
         :raises: NodeLocked if the node is already reserved.
+        :raises: NodeFiltersNotMatched if the node does not match the
+                 filters.
         """
 
     @abc.abstractmethod
@@ -123,6 +156,38 @@ class Connection(object):
                  reservation at all.
         """
 
+    @abc.abstractmethod
+    def reserve_nodes(self, tag, node_ids, filters=None):
+        """Reserve several nodes at once.
+
+        Reserve, in a single transaction, all the given nodes which are
+        not reserved yet and match the filters. Unlike
+        :meth:`reserve_node`, no exception is raised for the nodes which
+        could not be reserved.
+
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids or uuids.
+        :param filters: Filters the nodes must match to be reserved, in the
+                        format accepted by :meth:`get_node_list`.
+                        Defaults to None.
+        :returns: A tuple of the list of reserved Node objects, and of the
+                  set of node ids or uuids, as given in node_ids, of the
+                  nodes which were already reserved. Nodes which are not
+                  found or do not match the filters are in neither.
+        :raises: InvalidIdentity if a node id is neither an id nor a uuid.
+        """
+
+    @abc.abstractmethod
+    def release_nodes(self, tag, node_ids):
+        """Release the reservations on several nodes at once.
+
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids or uuids.
+        :returns: The number of nodes released. The nodes which are not
+                  found or not reserved by tag are left untouched.
+        :raises: InvalidIdentity if a node id is neither an id nor a uuid.
+        """
+
     @abc.abstractmethod
     def create_node(self, values):
         """Create a new node.
@@ -146,6 +211,31 @@ class Connection(object):
         :returns: A node.
         """
 
+    @abc.abstractmethod
+    def get_node(self, node_id, filters=None):
+        """Return a node if it matches the given filters.
+
+        :param node_id: A node id or uuid.
+        :param filters: Filters the node must match, in the format accepted
+                        by :meth:`get_node_list`. Defaults to None.
+        :returns: A node.
+        :raises: NodeNotFound if the node is not found.
+        :raises: NodeFiltersNotMatched if the node does not match the
+                 filters.
+        """
+
+    @abc.abstractmethod
+    def get_nodes(self, node_ids, filters=None):
+        """Return several nodes which match the given filters.
+
+        :param node_ids: A list of node ids or uuids.
+        :param filters: Filters the nodes must match, in the format accepted
+                        by :meth:`get_node_list`. Defaults to None.
+        :returns: A list of nodes. The nodes which are not found or do not
+                  match the filters are skipped.
+        :raises: InvalidIdentity if a node id is neither an id nor a uuid.
+        """
+
     @abc.abstractmethod
     def get_node_by_id(self, node_id):
         """Return a node.
@@ -234,7 +324,7 @@ class Connection(object):
 
     @abc.abstractmethod
     def get_port_list(self, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, stream=False):
         """Return a list of ports.
 
         :param limit: Maximum number of ports to return.
@@ -243,6 +333,9 @@ class Connection(object):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param stream: If True, return an iterator fetching the ports from
+                       the database in chunks rather than a list. Defaults
+                       to False.
         """
 
     @abc.abstractmethod
@@ -260,6 +353,14 @@ class Connection(object):
         :returns: A list of ports.
         """
 
+    @abc.abstractmethod
+    def get_ports_by_node_ids(self, node_ids):
+        """List all the ports of several nodes.
+
+        :param node_ids: A list of integer node IDs.
+        :returns: A list of ports.
+        """
+
     @abc.abstractmethod
     def create_port(self, values):
         """Create a new port.
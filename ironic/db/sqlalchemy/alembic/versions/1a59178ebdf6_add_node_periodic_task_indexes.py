@@ -0,0 +1,47 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add node periodic task indexes
+
+Revision ID: 1a59178ebdf6
+Revises: 3d86a077a3f2
+Create Date: 2015-08-24 15:12:03.631287
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1a59178ebdf6'
+down_revision = '3d86a077a3f2'
+
+from alembic import op
+
+
+INDEXES = (
+    ('nodes_driver_reservation_idx',
+     ['driver', 'reservation', 'maintenance']),
+    ('nodes_provision_state_idx',
+     ['provision_state', 'reservation', 'maintenance',
+      'provision_updated_at']),
+    ('nodes_inspection_started_at_idx',
+     ['provision_state', 'reservation', 'inspection_started_at']),
+    ('nodes_reservation_idx', ['reservation']),
+)
+
+
+def upgrade():
+    for name, columns in INDEXES:
+        op.create_index(name, 'nodes', columns, unique=False)
+
+
+def downgrade():
+    for name, columns in INDEXES:
+        op.drop_index(name, 'nodes')
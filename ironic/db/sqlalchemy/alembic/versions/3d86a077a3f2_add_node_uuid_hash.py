@@ -0,0 +1,66 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add node uuid_hash
+
+Revision ID: 3d86a077a3f2
+Revises: 516faf1bb9b1
+Create Date: 2015-08-20 10:42:17.284763
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3d86a077a3f2'
+down_revision = '516faf1bb9b1'
+
+import hashlib
+import struct
+
+from alembic import op
+import six
+import sqlalchemy as sa
+from sqlalchemy.sql import table, column
+
+node = table('nodes',
+             column('id', sa.Integer),
+             column('uuid', sa.String(36)),
+             column('uuid_hash', sa.Integer))
+
+
+# We must compute the hashes in this migration file, rather than call
+# ironic.common.hash_ring.get_uuid_hash, because that file may change in
+# the future. They are the leading 31 bits of the md5 digest of the uuid.
+def _uuid_hash(uuid):
+    if six.PY3:
+        uuid = uuid.encode('utf-8')
+    return struct.unpack_from('>I', hashlib.md5(uuid).digest())[0] >> 1
+
+
+def upgrade():
+    op.add_column('nodes', sa.Column('uuid_hash', sa.Integer(),
+                                     nullable=True))
+    op.create_index('nodes_driver_uuid_hash_idx', 'nodes',
+                    ['driver', 'uuid_hash'], unique=False)
+
+    connection = op.get_bind()
+    nodes = connection.execute(sa.select([node.c.id, node.c.uuid]))
+    for node_id, uuid in nodes.fetchall():
+        if uuid is None:
+            continue
+        op.execute(
+            node.update().where(node.c.id == node_id).values(
+                {'uuid_hash': _uuid_hash(uuid)}))
+
+
+def downgrade():
+    op.drop_index('nodes_driver_uuid_hash_idx', 'nodes')
+    op.drop_column('nodes', 'uuid_hash')
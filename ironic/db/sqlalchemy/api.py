@@ -28,10 +28,12 @@ from oslo_log import log
 from oslo_utils import strutils
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
+from sqlalchemy import orm
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy import sql
 
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common.i18n import _
 from ironic.common.i18n import _LW
 from ironic.common import states
@@ -49,6 +51,9 @@ LOG = log.getLogger(__name__)
 
 _CONTEXT = threading.local()
 
+# The number of rows fetched at once when streaming the results of a query
+_STREAM_CHUNK_SIZE = 100
+
 
 def get_backend():
     """The backend is this module itself."""
@@ -92,6 +97,45 @@ def add_identity_filter(query, value):
         raise exception.InvalidIdentity(identity=value)
 
 
+def _map_identities(values):
+    """Map node IDs and UUIDs to the identities they were given as.
+
+    :param values: An iterable of IDs or UUIDs.
+    :returns: A tuple of two dicts, mapping the integer IDs and the UUIDs
+              to the values they were given as.
+    :raises: InvalidIdentity if a value is neither an ID nor a UUID.
+    """
+    ids = {}
+    uuids = {}
+    for value in values:
+        if strutils.is_int_like(value):
+            ids[int(value)] = value
+        elif uuidutils.is_uuid_like(value):
+            uuids[value] = value
+        else:
+            raise exception.InvalidIdentity(identity=value)
+    return ids, uuids
+
+
+def add_identities_filter(query, model, ids, uuids):
+    """Adds a filter on several identities to a query.
+
+    :param query: Initial query to add filter to.
+    :param model: The model the query is about.
+    :param ids: An iterable of IDs to match.
+    :param uuids: An iterable of UUIDs to match.
+    :return: Modified query.
+    """
+    clauses = []
+    if ids:
+        clauses.append(model.id.in_(list(ids)))
+    if uuids:
+        clauses.append(model.uuid.in_(list(uuids)))
+    if not clauses:
+        return query.filter(sql.false())
+    return query.filter(sql.or_(*clauses))
+
+
 def add_port_filter(query, value):
     """Adds a port-specific filter to a query.
 
@@ -127,7 +171,7 @@ def add_node_filter_by_chassis(query, value):
 
 
 def _paginate_query(model, limit=None, marker=None, sort_key=None,
-                    sort_dir=None, query=None):
+                    sort_dir=None, query=None, stream=False):
     if not query:
         query = model_query(model)
     sort_keys = ['id']
@@ -140,9 +184,36 @@ def _paginate_query(model, limit=None, marker=None, sort_key=None,
         raise exception.InvalidParameterValue(
             _('The sort_key value "%(key)s" is an invalid field for sorting')
             % {'key': sort_key})
+    if stream:
+        # Use a server-side cursor where the database driver supports it,
+        # so that the rows are not all buffered by the driver either.
+        return query.execution_options(stream_results=True).yield_per(
+            _STREAM_CHUNK_SIZE)
     return query.all()
 
 
+def _uuid_hash_ranges_clause(hash_ranges):
+    """Build the clause matching the nodes within ranges of uuid hashes.
+
+    :param hash_ranges: a dict mapping driver names to lists of (low, high)
+                        ranges of uuid hashes.
+    :returns: a clause matching the nodes of these drivers whose uuid hash
+              is unknown or within one of the ranges of their driver.
+    """
+    driver_clauses = []
+    for driver, ranges in hash_ranges.items():
+        hash_clauses = [models.Node.uuid_hash.between(low, high)
+                        for low, high in ranges]
+        if not hash_clauses:
+            continue
+        hash_clauses.append(models.Node.uuid_hash == sql.null())
+        driver_clauses.append(sql.and_(models.Node.driver == driver,
+                                       sql.or_(*hash_clauses)))
+    if not driver_clauses:
+        return sql.false()
+    return sql.or_(*driver_clauses)
+
+
 class Connection(api.Connection):
     """SqlAlchemy connection."""
 
@@ -177,6 +248,23 @@ class Connection(api.Connection):
             query = query.filter_by(driver=filters['driver'])
         if 'provision_state' in filters:
             query = query.filter_by(provision_state=filters['provision_state'])
+        if 'provision_state_not_in' in filters:
+            # NOT IN never matches NULL, so nodes without a provision
+            # state have to be matched explicitly.
+            query = query.filter(sql.or_(
+                models.Node.provision_state == sql.null(),
+                ~models.Node.provision_state.in_(
+                    filters['provision_state_not_in'])))
+        if 'in_power_transition' in filters:
+            if filters['in_power_transition']:
+                query = query.filter(
+                    models.Node.target_power_state != sql.null())
+            else:
+                query = query.filter(
+                    models.Node.target_power_state == sql.null())
+        if 'uuid_hash_ranges' in filters:
+            query = query.filter(
+                _uuid_hash_ranges_clause(filters['uuid_hash_ranges']))
         if 'provisioned_before' in filters:
             limit = (timeutils.utcnow() -
                      datetime.timedelta(seconds=filters['provisioned_before']))
@@ -204,22 +292,52 @@ class Connection(api.Connection):
                                sort_key, sort_dir, query)
 
     def get_node_list(self, filters=None, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, fields=None,
+                      stream=False):
         query = model_query(models.Node)
+        if fields is not None:
+            query = query.options(orm.load_only(*fields))
         query = self._add_nodes_filters(query, filters)
         return _paginate_query(models.Node, limit, marker,
-                               sort_key, sort_dir, query)
+                               sort_key, sort_dir, query, stream=stream)
+
+    def get_node(self, node_id, filters=None):
+        query = model_query(models.Node)
+        query = add_identity_filter(query, node_id)
+        try:
+            return self._add_nodes_filters(query, filters).one()
+        except NoResultFound:
+            pass
+        # Only look the node up again to report why it was not returned
+        try:
+            query.one()
+        except NoResultFound:
+            raise exception.NodeNotFound(node=node_id)
+        raise exception.NodeFiltersNotMatched(node=node_id, filters=filters)
 
-    def reserve_node(self, tag, node_id):
+    def get_nodes(self, node_ids, filters=None):
+        ids, uuids = _map_identities(node_ids)
+        query = add_identities_filter(model_query(models.Node),
+                                      models.Node, ids, uuids)
+        return self._add_nodes_filters(query, filters).all()
+
+    def reserve_node(self, tag, node_id, filters=None):
         with _session_for_write():
             query = model_query(models.Node)
             query = add_identity_filter(query, node_id)
             # be optimistic and assume we usually create a reservation
-            count = query.filter_by(reservation=None).update(
+            update_query = self._add_nodes_filters(
+                query.filter_by(reservation=None), filters)
+            count = update_query.update(
                 {'reservation': tag}, synchronize_session=False)
             try:
                 node = query.one()
                 if count != 1:
+                    if filters and node['reservation'] is None:
+                        # Nothing updated, but the node is not locked, so
+                        # it must have failed the filters.
+                        raise exception.NodeFiltersNotMatched(
+                            node=node_id, filters=filters)
                     # Nothing updated and node exists. Must already be
                     # locked.
                     raise exception.NodeLocked(node=node_id,
@@ -246,6 +364,46 @@ class Connection(api.Connection):
             except NoResultFound:
                 raise exception.NodeNotFound(node_id)
 
+    def reserve_nodes(self, tag, node_ids, filters=None):
+        ids, uuids = _map_identities(node_ids)
+        with _session_for_write():
+            query = add_identities_filter(model_query(models.Node),
+                                          models.Node, ids, uuids)
+            # lock the rows, so the free nodes found here can not be
+            # reserved by someone else before the update below.
+            rows = query.with_entities(
+                models.Node.id, models.Node.uuid,
+                models.Node.reservation).with_for_update().all()
+
+            locked = set()
+            free_ids = []
+            for node_id, node_uuid, reservation in rows:
+                if reservation is None:
+                    free_ids.append(node_id)
+                elif node_id in ids:
+                    locked.add(ids[node_id])
+                else:
+                    locked.add(uuids[node_uuid])
+            if not free_ids:
+                return [], locked
+
+            query = model_query(models.Node).filter(
+                models.Node.id.in_(free_ids))
+            update_query = self._add_nodes_filters(
+                query.filter_by(reservation=None), filters)
+            update_query.update({'reservation': tag},
+                                synchronize_session=False)
+            nodes = query.filter_by(reservation=tag).all()
+            return nodes, locked
+
+    def release_nodes(self, tag, node_ids):
+        ids, uuids = _map_identities(node_ids)
+        with _session_for_write():
+            query = add_identities_filter(model_query(models.Node),
+                                          models.Node, ids, uuids)
+            return query.filter_by(reservation=tag).update(
+                {'reservation': None}, synchronize_session=False)
+
     def create_node(self, values):
         # ensure defaults are present for new nodes
         if 'uuid' not in values:
@@ -254,6 +412,7 @@ class Connection(api.Connection):
             values['power_state'] = states.NOSTATE
         if 'provision_state' not in values:
             values['provision_state'] = states.ENROLL
+        values['uuid_hash'] = hash_ring.get_uuid_hash(values['uuid'])
 
         node = models.Node()
         node.update(values)
@@ -399,9 +558,9 @@ class Connection(api.Connection):
             raise exception.PortNotFound(port=address)
 
     def get_port_list(self, limit=None, marker=None,
-                      sort_key=None, sort_dir=None):
+                      sort_key=None, sort_dir=None, stream=False):
         return _paginate_query(models.Port, limit, marker,
-                               sort_key, sort_dir)
+                               sort_key, sort_dir, stream=stream)
 
     def get_ports_by_node_id(self, node_id, limit=None, marker=None,
                              sort_key=None, sort_dir=None):
@@ -410,6 +569,12 @@ class Connection(api.Connection):
         return _paginate_query(models.Port, limit, marker,
                                sort_key, sort_dir, query)
 
+    def get_ports_by_node_ids(self, node_ids):
+        if not node_ids:
+            return []
+        query = model_query(models.Port)
+        return query.filter(models.Port.node_id.in_(list(node_ids))).all()
+
     def create_port(self, values):
         if not values.get('uuid'):
             values['uuid'] = uuidutils.generate_uuid()
@@ -25,7 +25,7 @@ from oslo_db import options as db_options
 from oslo_db.sqlalchemy import models
 import six.moves.urllib.parse as urlparse
 from sqlalchemy import Boolean, Column, DateTime
-from sqlalchemy import ForeignKey, Integer
+from sqlalchemy import ForeignKey, Index, Integer
 from sqlalchemy import schema, String, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.types import TypeDecorator, TEXT
@@ -141,9 +141,21 @@ class Node(Base):
         schema.UniqueConstraint('instance_uuid',
                                 name='uniq_nodes0instance_uuid'),
         schema.UniqueConstraint('name', name='uniq_nodes0name'),
+        Index('nodes_driver_uuid_hash_idx', 'driver', 'uuid_hash'),
+        # Indexes matching the filters of the conductor periodic tasks.
+        Index('nodes_driver_reservation_idx',
+              'driver', 'reservation', 'maintenance'),
+        Index('nodes_provision_state_idx', 'provision_state',
+              'reservation', 'maintenance', 'provision_updated_at'),
+        Index('nodes_inspection_started_at_idx', 'provision_state',
+              'reservation', 'inspection_started_at'),
+        Index('nodes_reservation_idx', 'reservation'),
         table_args())
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36))
+    # The leading bits of the hash ring hash of the uuid, which let the
+    # conductors select the nodes mapped to them within the query.
+    uuid_hash = Column(Integer, nullable=True)
     # NOTE(deva): we store instance_uuid directly on the node so that we can
     #             filter on it more efficiently, even though it is
     #             user-settable, and would otherwise be in node.properties.
@@ -430,7 +430,15 @@ class BootInterface(object):
 
 @six.add_metaclass(abc.ABCMeta)
 class PowerInterface(BaseInterface):
-    """Interface for power-related actions."""
+    """Interface for power-related actions.
+
+    A power interface able to get the power state of many nodes at once,
+    faster than one node at a time, may also implement a
+    ``get_power_state_many(tasks)`` method. It takes a list of TaskManager
+    instances and returns a dictionary of the power state of each node, or
+    of the exception raised getting it, by node UUID. The periodic power
+    state sync uses it when [conductor]sync_power_state_batch_size is set.
+    """
     interface_type = 'power'
 
     @abc.abstractmethod
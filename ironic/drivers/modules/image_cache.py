@@ -18,15 +18,24 @@
 Utility for caching master images.
 """
 
+import collections
+import contextlib
+import datetime
+import errno
+import functools
+import itertools
 import os
 import tempfile
+import threading
 import time
 import uuid
 
 from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import fileutils
+from oslo_utils import units
 import six
 
 from ironic.common import exception
@@ -36,6 +45,7 @@ from ironic.common.i18n import _LI
 from ironic.common.i18n import _LW
 from ironic.common import image_service
 from ironic.common import images
+from ironic.common import stats
 from ironic.common import utils
 
 
@@ -46,6 +56,16 @@ img_cache_opts = [
                 default=False,
                 help=_('Run image downloads and raw format conversions in '
                        'parallel.')),
+    cfg.IntOpt('max_parallel_image_downloads',
+               default=0,
+               help=_('Maximum number of image downloads and raw format '
+                      'conversions run at once when parallel_image_downloads '
+                      'is True. Set to 0 for no limit.')),
+    cfg.IntOpt('image_download_rate_limit',
+               default=0,
+               help=_('Maximum bandwidth used by all the image downloads '
+                      'together, in MiB per second. Set to 0 for no '
+                      'limit.')),
 ]
 
 CONF = cfg.CONF
@@ -56,6 +76,446 @@ CONF.register_opts(img_cache_opts)
 # order of priority.
 _cache_cleanup_list = []
 
+# Name of the file of the index of the master images in a master directory
+INDEX_FILE_NAME = 'index.json'
+
+
+class _MasterIndex(object):
+    """Persistent index of the master images of a cache directory.
+
+    Master images are named after a digest of their content, so that an
+    image published under several hrefs is downloaded and stored once. The
+    index maps the master file name derived from every href to the digest
+    of its content and to the checksum of its source image when the image
+    service provides one, and records the size, last access time and
+    reference count (number of hrefs) of every master image.
+
+    The last access times are only saved along with the other changes.
+    """
+
+    def __init__(self, master_dir):
+        self.path = os.path.join(master_dir, INDEX_FILE_NAME)
+        self._lock = threading.Lock()
+        self._hrefs = {}
+        self._masters = {}
+        try:
+            with open(self.path) as index_file:
+                data = jsonutils.loads(index_file.read())
+            self._hrefs = data['hrefs']
+            self._masters = data['masters']
+        except (EnvironmentError, ValueError, KeyError, TypeError) as exc:
+            if os.path.exists(self.path):
+                LOG.warn(_LW("Unable to load the index of master image "
+                             "cache %(dir)s, starting a new one: %(exc)s"),
+                         {'dir': master_dir, 'exc': exc})
+
+    def _save(self):
+        """Save the index, must be called with the lock held."""
+        tmp_path = '%s.tmp' % self.path
+        try:
+            with open(tmp_path, 'w') as index_file:
+                index_file.write(jsonutils.dumps({'hrefs': self._hrefs,
+                                                  'masters': self._masters}))
+            os.rename(tmp_path, self.path)
+        except EnvironmentError as exc:
+            LOG.warn(_LW("Unable to save the index of master image cache "
+                         "%(path)s: %(exc)s"), {'path': self.path, 'exc': exc})
+
+    def get_digest(self, name):
+        """Get the digest of the master image of an href.
+
+        :param name: the master file name derived from the href
+        :returns: the digest, or None if it is not known
+        """
+        with self._lock:
+            return self._hrefs.get(name, {}).get('digest')
+
+    def get_fetched_at(self, name):
+        """Get when the master image of an href was last fetched.
+
+        :param name: the master file name derived from the href
+        :returns: the UNIX time of the fetch, or None if it is not known
+        """
+        with self._lock:
+            return self._hrefs.get(name, {}).get('fetched_at')
+
+    def get_refcount(self, digest):
+        """Get the number of hrefs referencing a master image."""
+        with self._lock:
+            return self._masters.get(digest, {}).get('refcount', 0)
+
+    def find_source(self, source):
+        """Find the digest of the master image of a source image.
+
+        :param source: the checksum of the source image
+        :returns: the digest, or None if no master image has this source
+        """
+        with self._lock:
+            for entry in self._hrefs.values():
+                if entry.get('source') == source and entry.get('digest'):
+                    return entry['digest']
+
+    def set_source(self, name, source):
+        """Record the checksum of the source image of an href."""
+        with self._lock:
+            entry = self._hrefs.setdefault(name, {'digest': None})
+            if entry.get('source') != source:
+                entry['source'] = source
+                self._save()
+
+    def _unref(self, digest):
+        master = self._masters.get(digest)
+        if master is not None:
+            master['refcount'] = max(master['refcount'] - 1, 0)
+
+    def add(self, name, digest, size=None):
+        """Record the master image of an href.
+
+        :param name: the master file name derived from the href
+        :param digest: the digest of the content of the master image
+        :param size: the size of the master image in bytes, if known
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._hrefs.setdefault(name, {'digest': None})
+            master = self._masters.setdefault(
+                digest, {'size': size, 'last_access': now, 'refcount': 0})
+            if entry['digest'] != digest:
+                self._unref(entry['digest'])
+                entry['digest'] = digest
+                master['refcount'] += 1
+            entry['fetched_at'] = now
+            master['last_access'] = now
+            if size is not None:
+                master['size'] = size
+            self._save()
+
+    def touch(self, digest):
+        """Record an access to a master image."""
+        with self._lock:
+            if digest in self._masters:
+                self._masters[digest]['last_access'] = time.time()
+
+    def forget(self, name):
+        """Forget the master image of an href."""
+        with self._lock:
+            entry = self._hrefs.pop(name, None)
+            if entry is not None:
+                self._unref(entry.get('digest'))
+                self._save()
+
+    def prune(self, names):
+        """Forget the master images which were deleted from the directory.
+
+        :param names: the file names of the deleted files
+        """
+        with self._lock:
+            gone = set(names).intersection(self._masters)
+            if not gone:
+                return
+            for digest in gone:
+                del self._masters[digest]
+            for entry in self._hrefs.values():
+                if entry.get('digest') in gone:
+                    entry['digest'] = None
+            self._save()
+
+
+class _DownloadCoordinator(object):
+    """Coordination of the image downloads.
+
+    Concurrent requests for the same image wait for the download of the
+    image in progress instead of downloading it again, and all the downloads
+    share a budget of downloads run at once and of bandwidth.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> [lock, number of requests]
+        self._flights = {}
+        self._slots = None
+        self._slots_size = None
+        self._queued = 0
+        self._downloads = []
+        self._rate_clock = 0
+        self._completed = 0
+        self._total_bytes = 0
+
+    @contextlib.contextmanager
+    def single_flight(self, key):
+        """Run a block for one request of a key at a time.
+
+        The other requests for the key wait for the block to complete, after
+        which they find the image it downloaded in the cache.
+
+        :param key: the key of the requests, e.g. the master path of an image
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = [threading.Lock(), 0]
+            flight[1] += 1
+        try:
+            with flight[0]:
+                yield
+        finally:
+            with self._lock:
+                flight[1] -= 1
+                if not flight[1]:
+                    del self._flights[key]
+
+    def _get_slots(self):
+        if CONF.parallel_image_downloads:
+            size = CONF.max_parallel_image_downloads
+        else:
+            size = 1
+        if size <= 0:
+            return None
+        with self._lock:
+            if self._slots_size != size:
+                self._slots = threading.Semaphore(size)
+                self._slots_size = size
+            return self._slots
+
+    @contextlib.contextmanager
+    def download(self, href):
+        """Run a download within the budget, waiting for a free slot.
+
+        :param href: image UUID or href to download
+        :returns: a context manager returning the progress callback of the
+                  download, see :func:`ironic.common.images.fetch`.
+        """
+        slots = self._get_slots()
+        if slots is not None and not slots.acquire(False):
+            with self._lock:
+                self._queued += 1
+                queued = self._queued
+            LOG.debug("Image %(href)s waits for %(queued)d download(s) to "
+                      "complete", {'href': href, 'queued': queued})
+            try:
+                slots.acquire()
+            finally:
+                with self._lock:
+                    self._queued -= 1
+
+        download = {'href': href, 'bytes': 0, 'started_at': time.time()}
+        with self._lock:
+            self._downloads.append(download)
+        try:
+            yield functools.partial(self._progress, download)
+        finally:
+            with self._lock:
+                self._downloads.remove(download)
+                self._completed += 1
+            if slots is not None:
+                slots.release()
+        elapsed = max(time.time() - download['started_at'], 0.001)
+        LOG.debug("Downloaded %(size).1f MiB of image %(href)s in "
+                  "%(elapsed).1f seconds (%(rate).1f MiB/s)",
+                  {'href': href, 'elapsed': elapsed,
+                   'size': float(download['bytes']) / units.Mi,
+                   'rate': download['bytes'] / elapsed / units.Mi})
+
+    def _progress(self, download, size):
+        """Account for a chunk of a download, sleeping to limit the rate."""
+        rate = CONF.image_download_rate_limit * units.Mi
+        with self._lock:
+            download['bytes'] += size
+            self._total_bytes += size
+            if rate <= 0:
+                return
+            now = time.time()
+            self._rate_clock = max(self._rate_clock, now) + float(size) / rate
+            delay = self._rate_clock - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def get_stats(self):
+        """Get the statistics of the image downloads.
+
+        :returns: a dictionary with the number of downloads 'queued' for a
+                  free slot, of requests 'waiting' for the download of the
+                  same image, of downloads 'completed', the 'total_bytes'
+                  downloaded, and the 'downloads' in progress, a list of
+                  dictionaries with their 'href', 'bytes' downloaded and
+                  'elapsed' time in seconds.
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                'queued': self._queued,
+                'waiting': sum(flight[1] - 1
+                               for flight in self._flights.values()),
+                'completed': self._completed,
+                'total_bytes': self._total_bytes,
+                'downloads': [{'href': download['href'],
+                               'bytes': download['bytes'],
+                               'elapsed': now - download['started_at']}
+                              for download in self._downloads],
+            }
+
+
+_downloads = _DownloadCoordinator()
+
+
+def get_download_stats():
+    """Get the statistics of the image downloads.
+
+    See :meth:`_DownloadCoordinator.get_stats`.
+    """
+    return _downloads.get_stats()
+
+
+stats.register('image_downloads', get_download_stats)
+
+
+def _last_used_time(stat):
+    # NOTE(dtantsur): Detect most recently accessed files,
+    # seeing atime can be disabled by the mount option
+    # Also include ctime as it changes when image is linked to
+    return max(stat.st_mtime, stat.st_atime, stat.st_ctime)
+
+
+class _MasterLRU(object):
+    """In-memory accounting of the files of a master directory.
+
+    The files are listed once, then the accounting is updated as images are
+    stored in and linked from the cache, so that the clean up finds the
+    least recently used files and the size of the cache without scanning
+    the directory.
+    """
+
+    def __init__(self, master_dir):
+        self.master_dir = master_dir
+        self.total_size = 0
+        self._lock = threading.Lock()
+        # file name -> (size, last used time), least recently used first
+        self._entries = collections.OrderedDict()
+        self._removed = set()
+        self._loaded = False
+
+    def load(self):
+        """List the files of the directory, unless it was already done."""
+        if self._loaded:
+            return
+        listing = []
+        for file_name in os.listdir(self.master_dir):
+            path = os.path.join(self.master_dir, file_name)
+            if (file_name.startswith(INDEX_FILE_NAME) or
+                    not os.path.isfile(path)):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Deleted in the meantime
+                continue
+            listing.append((_last_used_time(stat), file_name, stat.st_size))
+        listing.sort()
+        with self._lock:
+            if self._loaded:
+                return
+            entries = collections.OrderedDict(
+                (file_name, (size, last_used))
+                for last_used, file_name, size in listing)
+            # NOTE: the files recorded while listing are the most recent
+            for file_name, entry in self._entries.items():
+                entries.pop(file_name, None)
+                entries[file_name] = entry
+            self._entries = entries
+            self.total_size = sum(size for size, _ in entries.values())
+            self._loaded = True
+
+    def add(self, file_name, size):
+        """Record that a file was stored in the directory."""
+        with self._lock:
+            entry = self._entries.pop(file_name, None)
+            if entry is not None:
+                self.total_size -= entry[0]
+            self._entries[file_name] = (size, time.time())
+            self.total_size += size
+            self._removed.discard(file_name)
+
+    def touch(self, file_name):
+        """Record that a file of the directory was linked to."""
+        with self._lock:
+            entry = self._entries.pop(file_name, None)
+            if entry is not None:
+                self._entries[file_name] = (entry[0], time.time())
+                return
+        try:
+            size = os.path.getsize(os.path.join(self.master_dir, file_name))
+        except OSError:
+            return
+        self.add(file_name, size)
+
+    def remove(self, file_name):
+        """Record that a file was deleted from the directory."""
+        with self._lock:
+            entry = self._entries.pop(file_name, None)
+            if entry is not None:
+                self.total_size -= entry[0]
+                self._removed.add(file_name)
+
+    def pop_removed(self):
+        """Get the files deleted since the last call."""
+        with self._lock:
+            removed, self._removed = self._removed, set()
+            return removed
+
+    def candidates(self):
+        """Find files eligible for deletion i.e. with link count ==1.
+
+        The files are found least recently used first. Files with link count
+        >1 are in use and are recorded as used now.
+
+        :returns: iterator yielding tuples (file name, last used time, stat)
+        """
+        with self._lock:
+            file_names = list(self._entries)
+        for file_name in file_names:
+            path = os.path.join(self.master_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.remove(file_name)
+                continue
+            if stat.st_nlink > 1:
+                self.touch(file_name)
+                continue
+            with self._lock:
+                entry = self._entries.get(file_name)
+            if entry is not None:
+                yield path, max(entry[1], _last_used_time(stat)), stat
+
+
+_indexes = {}
+_lrus = {}
+_master_dirs_lock = threading.Lock()
+
+
+def _get_index(master_dir):
+    """Get the index of the master images of a directory.
+
+    The index is loaded once and shared by all the caches of the directory.
+    """
+    with _master_dirs_lock:
+        index = _indexes.get(master_dir)
+        if index is None:
+            index = _indexes[master_dir] = _MasterIndex(master_dir)
+        return index
+
+
+def _get_lru(master_dir):
+    """Get the accounting of the files of a master directory.
+
+    The accounting is shared by all the caches of the directory.
+    """
+    with _master_dirs_lock:
+        lru = _lrus.get(master_dir)
+        if lru is None:
+            lru = _lrus[master_dir] = _MasterLRU(master_dir)
+        return lru
+
 
 class ImageCache(object):
     """Class handling access to cache for master images."""
@@ -73,6 +533,56 @@ class ImageCache(object):
         if master_dir is not None:
             fileutils.ensure_tree(master_dir)
 
+    @property
+    def _index(self):
+        return _get_index(self.master_dir)
+
+    @property
+    def _lru(self):
+        return _get_lru(self.master_dir)
+
+    def _find_master_content(self, master_file_name, href, ctx, force_raw):
+        """Find the content-addressed master image of an href.
+
+        The master image is found in the index from the href, or for a new
+        Glance image, from the checksum of the image.
+
+        :param master_file_name: the master file name derived from the href
+        :param href: image UUID or href to fetch
+        :param ctx: context
+        :param force_raw: boolean value, whether the image is converted to
+                          raw format
+        :returns: the path of the master image, or None if it is not known
+        """
+        index = self._index
+        digest = index.get_digest(master_file_name)
+        if digest is None and service_utils.is_glance_image(href):
+            try:
+                img_service = image_service.get_image_service(href,
+                                                              context=ctx)
+                checksum = img_service.show(href).get('checksum')
+            except exception.IronicException as exc:
+                LOG.debug("Unable to get the checksum of image %(href)s: "
+                          "%(exc)s", {'href': href, 'exc': exc})
+                checksum = None
+            if checksum:
+                # NOTE: the conversion to raw format changes the content
+                source = '%s%s' % (checksum, '.raw' if force_raw else '')
+                index.set_source(master_file_name, source)
+                digest = index.find_source(source)
+        if digest is None:
+            return None
+
+        content_path = os.path.join(self.master_dir, digest)
+        if not os.path.exists(content_path):
+            return None
+        if index.get_digest(master_file_name) != digest:
+            LOG.info(_LI("Image %(href)s has the same content as master "
+                         "image %(digest)s"), {'href': href, 'digest': digest})
+            index.add(master_file_name, digest)
+        index.touch(digest)
+        return content_path
+
     def fetch_image(self, href, dest_path, ctx=None, force_raw=True):
         """Fetch image by given href to the destination path.
 
@@ -89,14 +599,9 @@ class ImageCache(object):
         :param force_raw: boolean value, whether to convert the image to raw
                           format
         """
-        img_download_lock_name = 'download-image'
         if self.master_dir is None:
             # NOTE(ghe): We don't share images between instances/hosts
-            if not CONF.parallel_image_downloads:
-                with lockutils.lock(img_download_lock_name, 'ironic-'):
-                    _fetch(ctx, href, dest_path, force_raw)
-            else:
-                _fetch(ctx, href, dest_path, force_raw)
+            _fetch(ctx, href, dest_path, force_raw)
             return
 
         # TODO(ghe): have hard links and counts the same behaviour in all fs
@@ -113,16 +618,34 @@ class ImageCache(object):
                                               href_encoded))
         master_path = os.path.join(self.master_dir, master_file_name)
 
-        if CONF.parallel_image_downloads:
-            img_download_lock_name = 'download-image:%s' % master_file_name
+        # NOTE: the concurrent requests for the image wait for its download
+        with _downloads.single_flight(master_path):
+            content_path = self._find_master_content(master_file_name, href,
+                                                     ctx, force_raw)
+            download_path = master_path
+            fetched_at = None
+            shared = False
+            if content_path is not None:
+                master_path = content_path
+                # NOTE: the master image may be shared with other hrefs, so
+                # its modification time is not the one of this href
+                fetched_at = self._index.get_fetched_at(master_file_name)
+                shared = self._index.get_refcount(
+                    os.path.basename(content_path)) > 1
 
-        # TODO(dtantsur): lock expiration time
-        with lockutils.lock(img_download_lock_name, 'ironic-'):
             # NOTE(vdrok): After rebuild requested image can change, so we
             # should ensure that dest_path and master_path (if exists) are
             # pointing to the same file and their content is up to date
-            cache_up_to_date = _delete_master_path_if_stale(master_path, href,
-                                                            ctx)
+            cache_up_to_date = _delete_master_path_if_stale(
+                master_path, href, ctx, fetched_at=fetched_at, shared=shared)
+            if not cache_up_to_date:
+                if not shared:
+                    self._lru.remove(os.path.basename(master_path))
+                if content_path is not None:
+                    self._index.forget(master_file_name)
+                    # The master image, if still used by other hrefs, is no
+                    # longer the one of this href
+                    master_path = download_path
             dest_up_to_date = _delete_dest_path_if_stale(master_path,
                                                          dest_path)
 
@@ -136,6 +659,7 @@ class ImageCache(object):
                 # NOTE(dtantsur): ensure we're not in the middle of clean up
                 with lockutils.lock('master_image', 'ironic-'):
                     os.link(master_path, dest_path)
+                self._lru.touch(os.path.basename(master_path))
                 LOG.debug("Master cache hit for image %(href)s",
                           {'href': href})
                 return
@@ -144,19 +668,23 @@ class ImageCache(object):
                          "starting download"),
                      {'href': href})
             self._download_image(
-                href, master_path, dest_path, ctx=ctx, force_raw=force_raw)
+                href, download_path, dest_path, ctx=ctx, force_raw=force_raw)
 
         # NOTE(dtantsur): we increased cache size - time to clean up
         self.clean_up()
 
     def _download_image(self, href, master_path, dest_path, ctx=None,
                         force_raw=True):
-        """Download image by href and store at a given path.
+        """Download image by href and store it in the cache.
+
+        The image is stored under the digest of its content, unless an
+        image with the same content is already in the cache, and the
+        index records it as the master image of master_path.
 
         This method should be called with uuid-specific lock taken.
 
         :param href: image UUID or href to fetch
-        :param master_path: destination master path
+        :param master_path: master path derived from the href
         :param dest_path: destination file path
         :param ctx: context
         :param force_raw: boolean value, whether to convert the image to raw
@@ -169,20 +697,40 @@ class ImageCache(object):
 
         try:
             _fetch(ctx, href, tmp_path, force_raw)
-            # NOTE(dtantsur): no need for global lock here - master_path
-            # will have link count >1 at any moment, so won't be cleaned up
-            os.link(tmp_path, master_path)
-            os.link(master_path, dest_path)
+            with open(tmp_path, 'rb') as tmp_file:
+                digest = utils.hash_file(tmp_file)
+            content_path = os.path.join(self.master_dir, digest)
+            try:
+                # NOTE(dtantsur): no need for global lock here - master_path
+                # will have link count >1 at any moment, so won't be cleaned
+                # up
+                os.link(tmp_path, content_path)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+                LOG.info(_LI("Image %(href)s has the same content as master "
+                             "image %(digest)s, reusing it"),
+                         {'href': href, 'digest': digest})
+                # NOTE: ensure we're not in the middle of clean up
+                with lockutils.lock('master_image', 'ironic-'):
+                    if not os.path.exists(content_path):
+                        os.link(tmp_path, content_path)
+                    os.link(content_path, dest_path)
+            else:
+                os.link(content_path, dest_path)
+            size = os.path.getsize(content_path)
+            self._lru.add(digest, size)
+            self._index.add(os.path.basename(master_path), digest, size)
         finally:
             utils.rmtree_without_raise(tmp_dir)
 
-    @lockutils.synchronized('master_image', 'ironic-')
     def clean_up(self, amount=None):
         """Clean up directory with images, keeping cache of the latest images.
 
         Files with link count >1 are never deleted.
-        Protected by global lock, so that no one messes with master images
-        after we get listing and before we actually delete files.
+        The directory is listed once, without the global lock, and its files
+        are then tracked in memory. The deletion is protected by global lock,
+        so that no one links to master images while we delete them.
 
         :param amount: if present, amount of space to reclaim in bytes,
                        cleaning will stop, if this goal was reached,
@@ -195,11 +743,17 @@ class ImageCache(object):
                   {'dir': self.master_dir})
 
         amount_copy = amount
-        listing = _find_candidates_for_deletion(self.master_dir)
-        survived, amount = self._clean_up_too_old(listing, amount)
-        if amount is not None and amount <= 0:
-            return
-        amount = self._clean_up_ensure_cache_size(survived, amount)
+        lru = self._lru
+        lru.load()
+        with lockutils.lock('master_image', 'ironic-'):
+            listing = lru.candidates()
+            try:
+                survived, amount = self._clean_up_too_old(listing, amount)
+                if amount is not None and amount <= 0:
+                    return
+                amount = self._clean_up_ensure_cache_size(survived, amount)
+            finally:
+                self._index.prune(lru.pop_removed())
         if amount is not None and amount > 0:
             LOG.warn(_LW("Cache clean up was unable to reclaim %(required)d "
                          "MiB of disk space, still %(left)d MiB required"),
@@ -214,32 +768,40 @@ class ImageCache(object):
         it starts removing files older than TTL seconds,
         oldest first, until the required 'amount' of space is reclaimed.
 
-        :param listing: list of tuples (file name, last used time)
+        :param listing: iterator over tuples (file name, last used time,
+                        stat), least recently used first
         :param amount: if not None, amount of space to reclaim in bytes,
                        cleaning will stop, if this goal was reached,
                        even if it is possible to clean up more files
-        :returns: tuple (list of files left after clean up,
+        :returns: tuple (iterator over files left after clean up,
                          amount still to reclaim)
         """
         threshold = time.time() - self._cache_ttl
+        listing = iter(listing)
+        # NOTE: the files are ordered by the last use recorded in memory,
+        # but their last used time also accounts for the file times, so a
+        # file used recently may be followed by files older than the TTL
         survived = []
-        for file_name, last_used, stat in listing:
-            if last_used < threshold:
-                try:
-                    os.unlink(file_name)
-                except EnvironmentError as exc:
-                    LOG.warn(_LW("Unable to delete file %(name)s from "
-                                 "master image cache: %(exc)s"),
-                             {'name': file_name, 'exc': exc})
-                else:
-                    if amount is not None:
-                        amount -= stat.st_size
-                        if amount <= 0:
-                            amount = 0
-                            break
+        for entry in listing:
+            file_name, last_used, stat = entry
+            if last_used >= threshold:
+                survived.append(entry)
+                continue
+            try:
+                os.unlink(file_name)
+            except EnvironmentError as exc:
+                LOG.warn(_LW("Unable to delete file %(name)s from "
+                             "master image cache: %(exc)s"),
+                         {'name': file_name, 'exc': exc})
             else:
-                survived.append((file_name, last_used, stat))
-        return survived, amount
+                self._lru.remove(os.path.basename(file_name))
+                if amount is not None:
+                    amount -= stat.st_size
+                    if amount <= 0:
+                        amount = 0
+                        break
+        survived.sort(key=lambda entry: entry[1])
+        return itertools.chain(survived, listing), amount
 
     def _clean_up_ensure_cache_size(self, listing, amount):
         """Clean up stage 2: try to ensure cache size < threshold.
@@ -247,23 +809,21 @@ class ImageCache(object):
         Try to delete the oldest files until conditions is satisfied
         or no more files are eligible for deletion.
 
-        :param listing: list of tuples (file name, last used time)
+        :param listing: iterator over tuples (file name, last used time,
+                        stat), least recently used first
         :param amount: amount of space to reclaim, if possible.
                        if amount is not None, it has higher priority than
                        cache size in settings
         :returns: amount of space still required after clean up
         """
-        # NOTE(dtantsur): Sort listing to delete the oldest files first
-        listing = sorted(listing,
-                         key=lambda entry: entry[1],
-                         reverse=True)
-        total_listing = (os.path.join(self.master_dir, f)
-                         for f in os.listdir(self.master_dir))
-        total_size = sum(os.path.getsize(f)
-                         for f in total_listing)
-        while listing and (total_size > self._cache_size or
-                           (amount is not None and amount > 0)):
-            file_name, last_used, stat = listing.pop()
+        listing = iter(listing)
+        total_size = self._lru.total_size
+        while (total_size > self._cache_size or
+               (amount is not None and amount > 0)):
+            entry = next(listing, None)
+            if entry is None:
+                break
+            file_name, last_used, stat = entry
             try:
                 os.unlink(file_name)
             except EnvironmentError as exc:
@@ -271,6 +831,7 @@ class ImageCache(object):
                              "master image cache: %(exc)s"),
                          {'name': file_name, 'exc': exc})
             else:
+                self._lru.remove(os.path.basename(file_name))
                 total_size -= stat.st_size
                 if amount is not None:
                     amount -= stat.st_size
@@ -284,24 +845,6 @@ class ImageCache(object):
         return max(amount, 0) if amount is not None else 0
 
 
-def _find_candidates_for_deletion(master_dir):
-    """Find files eligible for deletion i.e. with link count ==1.
-
-    :param master_dir: directory to operate on
-    :returns: iterator yielding tuples (file name, last used time, stat)
-    """
-    for filename in os.listdir(master_dir):
-        filename = os.path.join(master_dir, filename)
-        stat = os.stat(filename)
-        if not os.path.isfile(filename) or stat.st_nlink > 1:
-            continue
-        # NOTE(dtantsur): Detect most recently accessed files,
-        # seeing atime can be disabled by the mount option
-        # Also include ctime as it changes when image is linked to
-        last_used_time = max(stat.st_mtime, stat.st_atime, stat.st_ctime)
-        yield filename, last_used_time, stat
-
-
 def _free_disk_space_for(path):
     """Get free disk space on a drive where path is located."""
     stat = os.statvfs(path)
@@ -311,16 +854,18 @@ def _free_disk_space_for(path):
 def _fetch(context, image_href, path, force_raw=False):
     """Fetch image and convert to raw format if needed."""
     path_tmp = "%s.part" % path
-    images.fetch(context, image_href, path_tmp, force_raw=False)
-    # Notes(yjiang5): If glance can provide the virtual size information,
-    # then we can firstly clean cache and then invoke images.fetch().
-    if force_raw:
-        required_space = images.converted_size(path_tmp)
-        directory = os.path.dirname(path_tmp)
-        _clean_up_caches(directory, required_space)
-        images.image_to_raw(image_href, path, path_tmp)
-    else:
-        os.rename(path_tmp, path)
+    with _downloads.download(image_href) as progress:
+        images.fetch(context, image_href, path_tmp, force_raw=False,
+                     progress=progress)
+        # Notes(yjiang5): If glance can provide the virtual size information,
+        # then we can firstly clean cache and then invoke images.fetch().
+        if force_raw:
+            required_space = images.converted_size(path_tmp)
+            directory = os.path.dirname(path_tmp)
+            _clean_up_caches(directory, required_space)
+            images.image_to_raw(image_href, path, path_tmp)
+        else:
+            os.rename(path_tmp, path)
 
 
 def _clean_up_caches(directory, amount):
@@ -384,14 +929,20 @@ def cleanup(priority):
     return _add_property_to_class_func
 
 
-def _delete_master_path_if_stale(master_path, href, ctx):
+def _delete_master_path_if_stale(master_path, href, ctx, fetched_at=None,
+                                 shared=False):
     """Delete image from cache if it is not up to date with href contents.
 
     :param master_path: path to an image in master cache
     :param href: image href
     :param ctx: context to use
+    :param fetched_at: the UNIX time when href was last fetched to
+        master_path. Defaults to the modification time of master_path.
+    :param shared: whether master_path is also the image of other hrefs, in
+        which case it is not deleted when stale
     :returns: True if master_path is up to date with href contents,
-        False if master_path was stale and was deleted or it didn't exist
+        False if master_path was stale and was deleted, or it was shared,
+        or it didn't exist
     """
     if service_utils.is_glance_image(href):
         # Glance image contents cannot be updated without changing image's UUID
@@ -406,7 +957,10 @@ def _delete_master_path_if_stale(master_path, href, ctx):
                          "modification time of %(href)s, considering "
                          "cached image up to date."), {'href': href})
             return True
-        master_mtime = utils.unix_file_modification_datetime(master_path)
+        if fetched_at is not None:
+            master_mtime = datetime.datetime.utcfromtimestamp(fetched_at)
+        else:
+            master_mtime = utils.unix_file_modification_datetime(master_path)
         if img_mtime < master_mtime:
             return True
         # Delete image from cache as it is outdated
@@ -415,7 +969,9 @@ def _delete_master_path_if_stale(master_path, href, ctx):
                      '%(local_time)s and may be outdated.'),
                  {'href': href, 'remote_time': img_mtime,
                   'local_time': master_mtime})
-        os.unlink(master_path)
+        if not shared:
+            os.unlink(master_path)
+        image_service.METADATA_CACHE.invalidate(href)
     return False
 
 
@@ -19,12 +19,16 @@
 Ironic Native IPMI power manager.
 """
 
+import hashlib
 import os
+import threading
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import excutils
 from oslo_utils import importutils
+import six
 
 from ironic.common import boot_devices
 from ironic.common import exception
@@ -36,6 +40,8 @@ from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.drivers import base
 from ironic.drivers.modules import console_utils
+from ironic.drivers.modules import power_wait
+from ironic.drivers import utils as driver_utils
 
 pyghmi = importutils.try_import('pyghmi')
 if pyghmi:
@@ -57,6 +63,20 @@ opts = [
                       'sent to a server. There is a risk with some hardware '
                       'that setting this too low may cause the BMC to crash. '
                       'Recommended setting is 5 seconds.')),
+    cfg.IntOpt('power_state_workers',
+               default=32,
+               help=_('Maximum number of BMCs queried concurrently by the '
+                      'ipmitool and ipminative drivers when the power state '
+                      'of many nodes is requested at once, see '
+                      '[conductor]sync_power_state_batch_size.')),
+    cfg.IntOpt('native_session_idle_timeout',
+               default=30,
+               help=_('Time in seconds during which the IPMI session of the '
+                      'ipminative drivers to a BMC is kept open after its '
+                      'last use, to be reused by the next operations on the '
+                      'node. It should be lower than the session timeout of '
+                      'the BMCs, which is 60 seconds on most of them. Set to '
+                      '0 to open a new session for every operation.')),
 ]
 
 CONF = cfg.CONF
@@ -80,6 +100,148 @@ _BOOT_DEVICES_MAP = {
     boot_devices.BIOS: 'setup',
 }
 
+# The pyghmi methods which only read from the BMC, and so may be run again
+# when they fail
+_READ_METHODS = frozenset(['get_bootdev', 'get_power', 'get_sensor_data'])
+
+
+class _CachedCommand(object):
+    """A pyghmi command object and its IPMI session to a BMC."""
+
+    def __init__(self, ipmicmd):
+        self.ipmicmd = ipmicmd
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def is_healthy(self):
+        """Whether the IPMI session is still logged in."""
+        session = getattr(self.ipmicmd, 'ipmi_session', None)
+        return (not self.closed and
+                not getattr(session, 'broken', False) and
+                bool(getattr(session, 'logged', True)))
+
+    def close(self):
+        self.closed = True
+        session = getattr(self.ipmicmd, 'ipmi_session', None)
+        try:
+            if session is not None:
+                session.logout()
+        except Exception as e:
+            LOG.debug('Failed to log out of an idle IPMI session: %s', e)
+
+
+class _SessionCache(object):
+    """The pyghmi sessions to the BMCs, one per set of credentials."""
+
+    def __init__(self):
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(driver_info):
+        password = six.text_type(driver_info['password']).encode('utf-8')
+        return (driver_info['address'], driver_info['username'],
+                hashlib.sha1(password).hexdigest())
+
+    def _evict_idle(self):
+        """Close the sessions which are idle or no longer logged in."""
+        limit = time.time() - CONF.ipmi.native_session_idle_timeout
+        evicted = []
+        with self._lock:
+            for key, cached in list(self._commands.items()):
+                if ((cached.last_used < limit or not cached.is_healthy()) and
+                        cached.lock.acquire(False)):
+                    del self._commands[key]
+                    evicted.append(cached)
+        for cached in evicted:
+            try:
+                cached.close()
+            finally:
+                cached.lock.release()
+
+    def _get(self, key, driver_info):
+        """Get the session of a key, opening it if needed.
+
+        :returns: a tuple of the cached command and whether it was reused.
+        """
+        self._evict_idle()
+        with self._lock:
+            cached = self._commands.get(key)
+            if cached is not None:
+                cached.last_used = time.time()
+                return cached, True
+        cached = _CachedCommand(ipmi_command.Command(
+            bmc=driver_info['address'], userid=driver_info['username'],
+            password=driver_info['password']))
+        if CONF.ipmi.native_session_idle_timeout > 0:
+            with self._lock:
+                existing = self._commands.setdefault(key, cached)
+            if existing is not cached:
+                # Another thread opened a session to the BMC meanwhile
+                cached.close()
+                cached = existing
+        return cached, False
+
+    def _discard(self, key, cached):
+        with self._lock:
+            if self._commands.get(key) is cached:
+                del self._commands[key]
+        cached.close()
+
+    def run(self, driver_info, method, *args, **kwargs):
+        """Run a pyghmi command with the session of a BMC.
+
+        A command reading from the BMC which fails on a reused session, for
+        instance because the BMC closed it, is run again once with a new
+        session. Other commands, like set_power, are not, as the BMC may
+        have acted on them already; the reused session is checked with a
+        get_power before sending them instead, and replaced with a new one
+        if the check fails.
+
+        :param driver_info: the bmc access info for a node.
+        :param method: the name of the method of the pyghmi command object,
+                       e.g. 'get_power'.
+        :returns: the result of the method.
+        :raises: IpmiException when the native ipmi call fails.
+        """
+        key = self._key(driver_info)
+        while True:
+            cached, reused = self._get(key, driver_info)
+            with cached.lock:
+                if cached.closed:
+                    # Evicted while we were waiting for it, get a new one
+                    continue
+                # Whether the reused session is still being checked before
+                # running a command which is not run again
+                checking = reused and method not in _READ_METHODS
+                try:
+                    if checking:
+                        cached.ipmicmd.get_power()
+                        checking = False
+                    return getattr(cached.ipmicmd, method)(*args, **kwargs)
+                except pyghmi_exception.IpmiException as e:
+                    self._discard(key, cached)
+                    if not (checking or
+                            (reused and method in _READ_METHODS)):
+                        raise
+                    error = e
+            LOG.warning(_LW('The IPMI session to %(address)s failed, running '
+                            '%(method)s with a new one. Error: %(error)s'),
+                        {'address': driver_info['address'], 'method': method,
+                         'error': error})
+
+
+_SESSIONS = _SessionCache()
+
+
+def _run_command(driver_info, method, *args, **kwargs):
+    """Run a pyghmi command with the cached session of a BMC.
+
+    See :meth:`_SessionCache.run`.
+    """
+    return _SESSIONS.run(driver_info, method, *args, **kwargs)
+
 
 def _parse_driver_info(node):
     """Gets the bmc access info for the given node.
@@ -124,35 +286,77 @@ def _console_pwfile_path(uuid):
     return os.path.join(CONF.tempdir, file_name)
 
 
-def _power_on(driver_info):
-    """Turn the power on for this node.
+_POWER_STATES = {'on': states.POWER_ON, 'off': states.POWER_OFF}
+
+
+def _set_and_wait(driver_info, powerstate, target_state, msg):
+    """Change the power state and wait for the BMC to report it.
+
+    The power state is polled until target_state is reached, or
+    CONF.ipmi.retry_timeout is exceeded. See
+    :func:`ironic.drivers.modules.power_wait.wait_for_power_state`.
 
     :param driver_info: the bmc access info for a node.
-    :returns: power state POWER_ON, one of :class:`ironic.common.states`.
+    :param powerstate: the power state to set, as known by pyghmi.
+    :param target_state: the power state to wait for, one of
+                         :class:`ironic.common.states`.
+    :param msg: the message logged when the power state was not set.
+    :returns: target_state.
     :raises: IPMIFailure when the native ipmi call fails.
     :raises: PowerStateFailure when invalid power state is returned
              from ipmi.
     """
-
-    msg = _LW("IPMI power on failed for node %(node_id)s with the "
-              "following error: %(error)s")
     try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                                       userid=driver_info['username'],
-                                       password=driver_info['password'])
-        wait = CONF.ipmi.retry_timeout
-        ret = ipmicmd.set_power('on', wait)
+        ret = _run_command(driver_info, 'set_power', powerstate)
     except pyghmi_exception.IpmiException as e:
         LOG.warning(msg, {'node_id': driver_info['uuid'], 'error': str(e)})
         raise exception.IPMIFailure(cmd=str(e))
 
-    state = ret.get('powerstate')
-    if state == 'on':
-        return states.POWER_ON
-    else:
+    # NOTE: the BMC reports the power state right away when it did not
+    # need to change, otherwise the change is pending.
+    if 'powerstate' in ret:
+        state = ret['powerstate']
+        if _POWER_STATES.get(state) == target_state:
+            return target_state
         LOG.warning(msg, {'node_id': driver_info['uuid'], 'error': ret})
         raise exception.PowerStateFailure(pstate=state)
 
+    def _get_power_state():
+        try:
+            ret = _run_command(driver_info, 'get_power')
+            return _POWER_STATES.get(ret.get('powerstate'))
+        except pyghmi_exception.IpmiException as e:
+            LOG.warning(_LW("IPMI get power state failed for node "
+                            "%(node_id)s with the following error: "
+                            "%(error)s"),
+                        {'node_id': driver_info['uuid'], 'error': str(e)})
+            return None
+
+    state = power_wait.wait_for_power_state(driver_info['address'],
+                                            target_state, _get_power_state,
+                                            CONF.ipmi.retry_timeout)
+    if state != target_state:
+        LOG.warning(msg, {'node_id': driver_info['uuid'],
+                          'error': _('timed out after %s seconds') %
+                          CONF.ipmi.retry_timeout})
+        raise exception.PowerStateFailure(pstate=state)
+    return state
+
+
+def _power_on(driver_info):
+    """Turn the power on for this node.
+
+    :param driver_info: the bmc access info for a node.
+    :returns: power state POWER_ON, one of :class:`ironic.common.states`.
+    :raises: IPMIFailure when the native ipmi call fails.
+    :raises: PowerStateFailure when invalid power state is returned
+             from ipmi.
+    """
+
+    msg = _LW("IPMI power on failed for node %(node_id)s with the "
+              "following error: %(error)s")
+    return _set_and_wait(driver_info, 'on', states.POWER_ON, msg)
+
 
 def _power_off(driver_info):
     """Turn the power off for this node.
@@ -166,22 +370,7 @@ def _power_off(driver_info):
 
     msg = _LW("IPMI power off failed for node %(node_id)s with the "
               "following error: %(error)s")
-    try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                                       userid=driver_info['username'],
-                                       password=driver_info['password'])
-        wait = CONF.ipmi.retry_timeout
-        ret = ipmicmd.set_power('off', wait)
-    except pyghmi_exception.IpmiException as e:
-        LOG.warning(msg, {'node_id': driver_info['uuid'], 'error': str(e)})
-        raise exception.IPMIFailure(cmd=str(e))
-
-    state = ret.get('powerstate')
-    if state == 'off':
-        return states.POWER_OFF
-    else:
-        LOG.warning(msg % {'node_id': driver_info['uuid'], 'error': ret})
-        raise exception.PowerStateFailure(pstate=state)
+    return _set_and_wait(driver_info, 'off', states.POWER_OFF, msg)
 
 
 def _reboot(driver_info):
@@ -198,22 +387,7 @@ def _reboot(driver_info):
 
     msg = _LW("IPMI power reboot failed for node %(node_id)s with the "
               "following error: %(error)s")
-    try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                                       userid=driver_info['username'],
-                                       password=driver_info['password'])
-        wait = CONF.ipmi.retry_timeout
-        ret = ipmicmd.set_power('boot', wait)
-    except pyghmi_exception.IpmiException as e:
-        LOG.warning(msg % {'node_id': driver_info['uuid'], 'error': str(e)})
-        raise exception.IPMIFailure(cmd=str(e))
-
-    state = ret.get('powerstate')
-    if state == 'on':
-        return states.POWER_ON
-    else:
-        LOG.warning(msg % {'node_id': driver_info['uuid'], 'error': ret})
-        raise exception.PowerStateFailure(pstate=state)
+    return _set_and_wait(driver_info, 'boot', states.POWER_ON, msg)
 
 
 def _power_status(driver_info):
@@ -226,10 +400,7 @@ def _power_status(driver_info):
     """
 
     try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                                       userid=driver_info['username'],
-                                       password=driver_info['password'])
-        ret = ipmicmd.get_power()
+        ret = _run_command(driver_info, 'get_power')
     except pyghmi_exception.IpmiException as e:
         LOG.warning(_LW("IPMI get power state failed for node %(node_id)s "
                         "with the following error: %(error)s"),
@@ -259,10 +430,7 @@ def _get_sensors_data(driver_info):
     :returns: returns a dict of sensor data group by sensor type.
     """
     try:
-        ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                                       userid=driver_info['username'],
-                                       password=driver_info['password'])
-        ret = ipmicmd.get_sensor_data()
+        ret = _run_command(driver_info, 'get_sensor_data')
     except Exception as e:
         LOG.error(_LE("IPMI get sensor data failed for node %(node_id)s "
                   "with the following error: %(error)s"),
@@ -318,6 +486,19 @@ class NativeIPMIPower(base.PowerInterface):
         driver_info = _parse_driver_info(task.node)
         return _power_status(driver_info)
 
+    def get_power_state_many(self, tasks):
+        """Get the current power state of the nodes of several tasks.
+
+        The BMCs are queried concurrently, up to
+        CONF.ipmi.power_state_workers at a time.
+
+        :param tasks: a list of TaskManager instances.
+        :returns: a dictionary of the power state of each node, or of the
+                  exception raised getting it, by node UUID.
+        """
+        return driver_utils.get_power_state_many(
+            tasks, self.get_power_state, CONF.ipmi.power_state_workers)
+
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
         """Turn the power on or off.
@@ -411,11 +592,9 @@ class NativeIPMIManagement(base.ManagementInterface):
                 "Invalid boot device %s specified.") % device)
         driver_info = _parse_driver_info(task.node)
         try:
-            ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                                           userid=driver_info['username'],
-                                           password=driver_info['password'])
             bootdev = _BOOT_DEVICES_MAP[device]
-            ipmicmd.set_bootdev(bootdev, persist=persistent)
+            _run_command(driver_info, 'set_bootdev', bootdev,
+                         persist=persistent)
         except pyghmi_exception.IpmiException as e:
             LOG.error(_LE("IPMI set boot device failed for node %(node_id)s "
                           "with the following error: %(error)s"),
@@ -442,10 +621,7 @@ class NativeIPMIManagement(base.ManagementInterface):
         driver_info = _parse_driver_info(task.node)
         response = {'boot_device': None}
         try:
-            ipmicmd = ipmi_command.Command(bmc=driver_info['address'],
-                                           userid=driver_info['username'],
-                                           password=driver_info['password'])
-            ret = ipmicmd.get_bootdev()
+            ret = _run_command(driver_info, 'get_bootdev')
             # FIXME(lucasagomes): pyghmi doesn't seem to handle errors
             # consistently, for some errors it raises an exception
             # others it just returns a dictionary with the error.
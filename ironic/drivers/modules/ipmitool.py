@@ -30,6 +30,7 @@ DRIVER.
 """
 
 import contextlib
+import hashlib
 import os
 import re
 import subprocess
@@ -39,8 +40,8 @@ import time
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
-from oslo_service import loopingcall
 from oslo_utils import excutils
+from oslo_utils import fileutils
 
 from ironic.common import boot_devices
 from ironic.common import exception
@@ -48,20 +49,47 @@ from ironic.common.i18n import _
 from ironic.common.i18n import _LE
 from ironic.common.i18n import _LI
 from ironic.common.i18n import _LW
+from ironic.common import paths
 from ironic.common import states
+from ironic.common import stats
 from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.drivers import base
 from ironic.drivers.modules import console_utils
-
+from ironic.drivers.modules import ipmitool_scheduler
+from ironic.drivers.modules import ipmitool_sessions
+from ironic.drivers.modules import power_wait
+from ironic.drivers import utils as driver_utils
+
+opts = [
+    cfg.BoolOpt('sdr_cache',
+                default=False,
+                help=_('Keep a copy of the Sensor Data Record (SDR) '
+                       'repository of the BMCs on disk, so that only the '
+                       'sensor readings are fetched when getting the sensors '
+                       'data of a node.')),
+    cfg.StrOpt('sdr_cache_dir',
+               default=paths.state_path_def('ipmi_sdr_cache'),
+               help=_('On ironic-conductor node, directory where the SDR '
+                      'repositories of the BMCs are cached.')),
+    cfg.IntOpt('sdr_cache_check_interval',
+               default=600,
+               help=_('Time in seconds after which the SDR repository of a '
+                      'BMC is checked again for changes. The cached copy is '
+                      'used without checking it in the meantime.')),
+]
 
 CONF = cfg.CONF
+CONF.register_opts(opts, group='ipmi')
 CONF.import_opt('retry_timeout',
                 'ironic.drivers.modules.ipminative',
                 group='ipmi')
 CONF.import_opt('min_command_interval',
                 'ironic.drivers.modules.ipminative',
                 group='ipmi')
+CONF.import_opt('power_state_workers',
+                'ironic.drivers.modules.ipminative',
+                group='ipmi')
 
 LOG = logging.getLogger(__name__)
 
@@ -105,7 +133,10 @@ BRIDGING_OPTIONS = [('local_address', '-m'),
                     ('transit_channel', '-B'), ('transit_address', '-T'),
                     ('target_channel', '-b'), ('target_address', '-t')]
 
-LAST_CMD_TIME = {}
+# The commands to a BMC are run one at a time, in order
+SCHEDULER = ipmitool_scheduler.CommandScheduler()
+# The SDR cache file of every node, and when it was last checked
+SDR_CACHE_CHECKED = {}
 TIMING_SUPPORT = None
 SINGLE_BRIDGE_SUPPORT = None
 DUAL_BRIDGE_SUPPORT = None
@@ -124,6 +155,31 @@ ipmitool_command_options = {
 # form regardless of locale.
 IPMITOOL_RETRYABLE_FAILURES = ['insufficient resources for session']
 
+# The fields of 'sdr info' which change with the content of the SDR
+# repository.
+SDR_CHANGE_FIELDS = ('Record Count', 'Most recent Addition',
+                     'Most recent Erase')
+
+# A 'key : value' line of the output of 'sdr -v'. Lines with more than one
+# colon are not fields.
+SENSOR_FIELD_RE = re.compile(r'^([^:\n]*):([^:\n]*)$', re.MULTILINE)
+# The type of a sensor, used to skip the sensors of the types which are not
+# sent without parsing them.
+SENSOR_TYPE_RE = re.compile(r'^\s*Sensor Type \((?:Analog|Discrete|'
+                            r'Threshold)\)\s*:\s*([^\s:]*)[^:\n]*$',
+                            re.MULTILINE)
+
+
+def get_scheduler_stats():
+    """Get the statistics of the commands scheduled to the BMCs.
+
+    See :meth:`ipmitool_scheduler.CommandScheduler.get_stats`.
+    """
+    return SCHEDULER.get_stats()
+
+
+stats.register('ipmitool_scheduler', get_scheduler_stats)
+
 
 def _check_option_support(options):
     """Checks if the specific ipmitool options are supported on host.
@@ -334,11 +390,42 @@ def _parse_driver_info(node):
     }
 
 
-def _exec_ipmitool(driver_info, command):
+def _run_ipmitool(driver_info, args, command):
+    """Run an ipmitool command once.
+
+    The command is run in a new ipmitool process, or in the pooled session
+    of the BMC if [ipmi]session_pool is enabled.
+
+    :param driver_info: the ipmitool parameters for accessing a node.
+    :param args: the ipmitool command line, without the password file and
+                 the command.
+    :param command: the ipmitool command to be executed.
+    :returns: (stdout, stderr) from executing the command.
+    :raises: PasswordFileFailedToCreate from creating or writing to the
+             temporary file.
+    :raises: processutils.ProcessExecutionError from executing the command.
+    """
+    # 'ipmitool' command will prompt password if there is no '-f'
+    # option, we set it to '\0' to write a password file to support
+    # empty password
+    password = driver_info['password'] or '\0'
+    if CONF.ipmi.session_pool:
+        return ipmitool_sessions.execute(driver_info['address'], args,
+                                         password, command)
+
+    with _make_password_file(password) as pw_file:
+        cmd_args = args + ['-f', pw_file]
+        cmd_args.extend(command.split(" "))
+        return utils.execute(*cmd_args)
+
+
+def _exec_ipmitool(driver_info, command, sdr_cache_file=None):
     """Execute the ipmitool command.
 
     :param driver_info: the ipmitool parameters for accessing a node.
     :param command: the ipmitool command to be executed.
+    :param sdr_cache_file: the file the SDR repository of the BMC was
+                           dumped to, if any.
     :returns: (stdout, stderr) from executing the command.
     :raises: PasswordFileFailedToCreate from creating or writing to the
              temporary file.
@@ -364,6 +451,10 @@ def _exec_ipmitool(driver_info, command):
             args.append(option)
             args.append(driver_info[name])
 
+    if sdr_cache_file:
+        args.append('-S')
+        args.append(sdr_cache_file)
+
     # specify retry timing more precisely, if supported
     num_tries = max(
         (CONF.ipmi.retry_timeout // CONF.ipmi.min_command_interval), 1)
@@ -379,69 +470,38 @@ def _exec_ipmitool(driver_info, command):
 
     while True:
         num_tries = num_tries - 1
-        # NOTE(deva): ensure that no communications are sent to a BMC more
-        #             often than once every min_command_interval seconds.
-        time_till_next_poll = CONF.ipmi.min_command_interval - (
-            time.time() - LAST_CMD_TIME.get(driver_info['address'], 0))
-        if time_till_next_poll > 0:
-            time.sleep(time_till_next_poll)
-        # Resetting the list that will be utilized so the password arguments
-        # from any previous execution are preserved.
-        cmd_args = args[:]
-        # 'ipmitool' command will prompt password if there is no '-f'
-        # option, we set it to '\0' to write a password file to support
-        # empty password
-        with _make_password_file(driver_info['password'] or '\0') as pw_file:
-            cmd_args.append('-f')
-            cmd_args.append(pw_file)
-            cmd_args.extend(command.split(" "))
-            try:
-                out, err = utils.execute(*cmd_args)
-                return out, err
-            except processutils.ProcessExecutionError as e:
-                with excutils.save_and_reraise_exception() as ctxt:
-                    err_list = [x for x in IPMITOOL_RETRYABLE_FAILURES
-                                if x in e.args[0]]
-                    if ((time.time() > end_time) or
-                        (num_tries == 0) or
-                        not err_list):
-                        LOG.error(_LE('IPMI Error while attempting "%(cmd)s"'
-                                      'for node %(node)s. Error: %(error)s'), {
-                                  'node': driver_info['uuid'],
-                                  'cmd': e.cmd, 'error': e
-                                  })
-                    else:
-                        ctxt.reraise = False
-                        LOG.warning(_LW('IPMI Error encountered, retrying '
-                                        '"%(cmd)s" for node %(node)s. '
-                                        'Error: %(error)s'), {
-                                    'node': driver_info['uuid'],
-                                    'cmd': e.cmd, 'error': e
-                                    })
-            finally:
-                LAST_CMD_TIME[driver_info['address']] = time.time()
-
-
-def _sleep_time(iter):
-    """Return the time-to-sleep for the n'th iteration of a retry loop.
-
-    This implementation increases exponentially.
-
-    :param iter: iteration number
-    :returns: number of seconds to sleep
-
-    """
-    if iter <= 1:
-        return 1
-    return iter ** 2
+        try:
+            with SCHEDULER.command_slot(driver_info['address']):
+                out, err = _run_ipmitool(driver_info, args, command)
+            return out, err
+        except processutils.ProcessExecutionError as e:
+            with excutils.save_and_reraise_exception() as ctxt:
+                err_list = [x for x in IPMITOOL_RETRYABLE_FAILURES
+                            if x in e.args[0]]
+                if ((time.time() > end_time) or
+                    (num_tries == 0) or
+                    not err_list):
+                    LOG.error(_LE('IPMI Error while attempting "%(cmd)s"'
+                                  'for node %(node)s. Error: %(error)s'), {
+                              'node': driver_info['uuid'],
+                              'cmd': e.cmd, 'error': e
+                              })
+                else:
+                    ctxt.reraise = False
+                    LOG.warning(_LW('IPMI Error encountered, retrying '
+                                    '"%(cmd)s" for node %(node)s. '
+                                    'Error: %(error)s'), {
+                                'node': driver_info['uuid'],
+                                'cmd': e.cmd, 'error': e
+                                })
 
 
 def _set_and_wait(target_state, driver_info):
-    """Helper function for DynamicLoopingCall.
+    """Change the power state and wait for the BMC to report it.
 
-    This method changes the power state and polls the BMCuntil the desired
-    power state is reached, or CONF.ipmi.retry_timeout would be exceeded by the
-    next iteration.
+    The power state is polled until the desired power state is reached, or
+    CONF.ipmi.retry_timeout is exceeded. See
+    :func:`ironic.drivers.modules.power_wait.wait_for_power_state`.
 
     This method assumes the caller knows the current power state and does not
     check it prior to changing the power state. Most BMCs should be fine, but
@@ -458,45 +518,30 @@ def _set_and_wait(target_state, driver_info):
     elif target_state == states.POWER_OFF:
         state_name = "off"
 
-    def _wait(mutable):
-        try:
-            # Only issue power change command once
-            if mutable['iter'] < 0:
-                _exec_ipmitool(driver_info, "power %s" % state_name)
-            else:
-                mutable['power'] = _power_status(driver_info)
-        except (exception.PasswordFileFailedToCreate,
-                processutils.ProcessExecutionError,
-                exception.IPMIFailure):
-            # Log failures but keep trying
-            LOG.warning(_LW("IPMI power %(state)s failed for node %(node)s."),
-                        {'state': state_name, 'node': driver_info['uuid']})
-        finally:
-            mutable['iter'] += 1
-
-        if mutable['power'] == target_state:
-            raise loopingcall.LoopingCallDone()
-
-        sleep_time = _sleep_time(mutable['iter'])
-        if (sleep_time + mutable['total_time']) > CONF.ipmi.retry_timeout:
-            # Stop if the next loop would exceed maximum retry_timeout
-            LOG.error(_LE('IPMI power %(state)s timed out after '
-                          '%(tries)s retries on node %(node_id)s.'),
-                      {'state': state_name, 'tries': mutable['iter'],
-                       'node_id': driver_info['uuid']})
-            mutable['power'] = states.ERROR
-            raise loopingcall.LoopingCallDone()
-        else:
-            mutable['total_time'] += sleep_time
-            return sleep_time
-
-    # Use mutable objects so the looped method can change them.
-    # Start 'iter' from -1 so that the first two checks are one second apart.
-    status = {'power': None, 'iter': -1, 'total_time': 0}
+    try:
+        _exec_ipmitool(driver_info, "power %s" % state_name)
+    except (exception.PasswordFileFailedToCreate,
+            processutils.ProcessExecutionError):
+        # Log failures but keep checking, the command may have gone through
+        LOG.warning(_LW("IPMI power %(state)s failed for node %(node)s."),
+                    {'state': state_name, 'node': driver_info['uuid']})
 
-    timer = loopingcall.DynamicLoopingCall(_wait, status)
-    timer.start().wait()
-    return status['power']
+    def _get_power_state():
+        try:
+            return _power_status(driver_info)
+        except exception.IPMIFailure:
+            # Already logged, keep trying
+            return None
+
+    state = power_wait.wait_for_power_state(driver_info['address'],
+                                            target_state, _get_power_state,
+                                            CONF.ipmi.retry_timeout)
+    if state != target_state:
+        LOG.error(_LE('IPMI power %(state)s timed out after %(timeout)s '
+                      'seconds on node %(node_id)s.'),
+                  {'state': state_name, 'timeout': CONF.ipmi.retry_timeout,
+                   'node_id': driver_info['uuid']})
+    return state
 
 
 def _power_on(driver_info):
@@ -548,17 +593,8 @@ def _power_status(driver_info):
 
 
 def _process_sensor(sensor_data):
-    sensor_data_fields = sensor_data.split('\n')
-    sensor_data_dict = {}
-    for field in sensor_data_fields:
-        if not field:
-            continue
-        kv_value = field.split(':')
-        if len(kv_value) != 2:
-            continue
-        sensor_data_dict[kv_value[0].strip()] = kv_value[1].strip()
-
-    return sensor_data_dict
+    return dict((key.strip(), value.strip())
+                for key, value in SENSOR_FIELD_RE.findall(sensor_data))
 
 
 def _get_sensor_type(node, sensor_data_dict):
@@ -579,7 +615,25 @@ def _get_sensor_type(node, sensor_data_dict):
                {'sensors_data': sensor_data_dict}))
 
 
-def _parse_ipmi_sensors_data(node, sensors_data):
+def _get_sensor_types():
+    """Get the lower-cased sensor types sent by the conductor.
+
+    The option is read lazily, it belongs to the conductor running the
+    driver and is not registered elsewhere.
+
+    :returns: the sensor types, or None for all of them.
+    """
+    try:
+        configured = CONF.conductor.send_sensor_data_types
+    except cfg.NoSuchOptError:
+        return None
+    sensor_types = set(x.lower() for x in configured)
+    if 'all' in sensor_types:
+        return None
+    return sensor_types
+
+
+def _parse_ipmi_sensors_data(node, sensors_data, sensor_types=None):
     """Parse the IPMI sensors data and format to the dict grouping by type.
 
     We run 'ipmitool' command with 'sdr -v' options, which can return sensor
@@ -588,6 +642,9 @@ def _parse_ipmi_sensors_data(node, sensors_data):
     out via notification bus and consumed by Ceilometer Collector.
 
     :param sensors_data: the sensor data returned by ipmitool command.
+    :param sensor_types: the lower-cased sensor types to return, or None to
+                         return all of them. The sensors of the other types
+                         are skipped without being parsed.
     :returns: the sensor data with JSON format, grouped by sensor type.
     :raises: FailedToParseSensorData when error encountered during parsing.
 
@@ -596,8 +653,15 @@ def _parse_ipmi_sensors_data(node, sensors_data):
     if not sensors_data:
         return sensors_data_dict
 
-    sensors_data_array = sensors_data.split('\n\n')
-    for sensor_data in sensors_data_array:
+    # whether sensors were skipped because of their type
+    skipped = False
+    for sensor_data in sensors_data.split('\n\n'):
+        if sensor_types is not None:
+            match = SENSOR_TYPE_RE.search(sensor_data)
+            if match and match.group(1).lower() not in sensor_types:
+                skipped = True
+                continue
+
         sensor_data_dict = _process_sensor(sensor_data)
         if not sensor_data_dict:
             continue
@@ -611,7 +675,7 @@ def _parse_ipmi_sensors_data(node, sensors_data):
                 {})[sensor_data_dict['Sensor ID']] = sensor_data_dict
 
     # get nothing, no valid sensor data
-    if not sensors_data_dict:
+    if not sensors_data_dict and not skipped:
         raise exception.FailedToParseSensorData(
             node=node.uuid,
             error=(_("parse ipmi sensor data failed, get nothing with input"
@@ -649,6 +713,91 @@ def send_raw(task, raw_bytes):
         raise exception.IPMIFailure(cmd=cmd)
 
 
+def _sdr_cache_files(node_uuid):
+    """Return the paths of the SDR cache files of a node."""
+    prefix = '%s-' % node_uuid
+    try:
+        names = os.listdir(CONF.ipmi.sdr_cache_dir)
+    except OSError:
+        return []
+    return [os.path.join(CONF.ipmi.sdr_cache_dir, name) for name in names
+            if name.startswith(prefix) and name.endswith('.sdr')]
+
+
+def _clear_sdr_cache(node_uuid):
+    """Remove the cached SDR repository of a node."""
+    SDR_CACHE_CHECKED.pop(node_uuid, None)
+    for path in _sdr_cache_files(node_uuid):
+        utils.unlink_without_raise(path)
+
+
+def _sdr_change_key(driver_info):
+    """Get a key identifying the content of the SDR repository of a BMC.
+
+    :param driver_info: the ipmitool parameters for accessing a node.
+    :returns: the key, or None if the BMC does not tell when its SDR
+              repository changed.
+    :raises: PasswordFileFailedToCreate from creating or writing to the
+             temporary file.
+    :raises: processutils.ProcessExecutionError from executing the command.
+    """
+    out, err = _exec_ipmitool(driver_info, 'sdr info')
+    fields = [line.strip() for line in out.split('\n')
+              if line.split(':', 1)[0].strip() in SDR_CHANGE_FIELDS]
+    if not fields:
+        return None
+    fields.insert(0, driver_info['address'])
+    return hashlib.sha1('\n'.join(fields).encode('utf-8')).hexdigest()
+
+
+def _get_sdr_cache_file(driver_info):
+    """Get the file caching the SDR repository of a node's BMC.
+
+    The SDR repository is dumped again when the BMC reports that it
+    changed, which is checked at most once every
+    [ipmi]sdr_cache_check_interval seconds.
+
+    :param driver_info: the ipmitool parameters for accessing a node.
+    :returns: the path of the file, or None if the SDR repository of the
+              BMC cannot be cached.
+    :raises: PasswordFileFailedToCreate from creating or writing to the
+             temporary file.
+    :raises: processutils.ProcessExecutionError from executing the command.
+    :raises: OSError if the file cannot be written.
+    """
+    node_uuid = driver_info['uuid']
+    checked = SDR_CACHE_CHECKED.get(node_uuid)
+    if (checked is not None and
+            time.time() - checked[0] < CONF.ipmi.sdr_cache_check_interval and
+            os.path.exists(checked[1])):
+        return checked[1]
+
+    key = _sdr_change_key(driver_info)
+    if key is None:
+        return None
+
+    path = os.path.join(CONF.ipmi.sdr_cache_dir,
+                        '%(uuid)s-%(key)s.sdr' % {'uuid': node_uuid,
+                                                  'key': key})
+    if not os.path.exists(path):
+        fileutils.ensure_tree(CONF.ipmi.sdr_cache_dir)
+        for old_path in _sdr_cache_files(node_uuid):
+            utils.unlink_without_raise(old_path)
+        # Dump to another file first so that a partial dump is never used
+        tmp_path = '%s.part' % path
+        try:
+            _exec_ipmitool(driver_info, 'sdr dump %s' % tmp_path)
+            os.rename(tmp_path, path)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                utils.unlink_without_raise(tmp_path)
+        LOG.debug('Cached the SDR repository of node %(node)s in %(path)s',
+                  {'node': node_uuid, 'path': path})
+
+    SDR_CACHE_CHECKED[node_uuid] = (time.time(), path)
+    return path
+
+
 def _check_temp_dir():
     """Check for Valid temp directory."""
     global TMP_DIR_CHECKED
@@ -716,6 +865,19 @@ class IPMIPower(base.PowerInterface):
         driver_info = _parse_driver_info(task.node)
         return _power_status(driver_info)
 
+    def get_power_state_many(self, tasks):
+        """Get the current power state of the nodes of several tasks.
+
+        The BMCs are queried concurrently, up to
+        CONF.ipmi.power_state_workers at a time.
+
+        :param tasks: a list of TaskManager instances.
+        :returns: a dictionary of the power state of each node, or of the
+                  exception raised getting it, by node UUID.
+        """
+        return driver_utils.get_power_state_many(
+            tasks, self.get_power_state, CONF.ipmi.power_state_workers)
+
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
         """Turn the power on or off.
@@ -905,17 +1067,32 @@ class IPMIManagement(base.ManagementInterface):
 
         """
         driver_info = _parse_driver_info(task.node)
+        sdr_cache_file = None
+        if CONF.ipmi.sdr_cache:
+            try:
+                sdr_cache_file = _get_sdr_cache_file(driver_info)
+            except (exception.PasswordFileFailedToCreate,
+                    processutils.ProcessExecutionError, OSError) as e:
+                LOG.warning(_LW('Failed to cache the SDR repository of node '
+                                '%(node)s, reading its sensors without it. '
+                                'Error: %(error)s'),
+                            {'node': task.node.uuid, 'error': e})
+
         # with '-v' option, we can get the entire sensor data including the
         # extended sensor informations
         cmd = "sdr -v"
         try:
-            out, err = _exec_ipmitool(driver_info, cmd)
+            out, err = _exec_ipmitool(driver_info, cmd,
+                                      sdr_cache_file=sdr_cache_file)
         except (exception.PasswordFileFailedToCreate,
                 processutils.ProcessExecutionError) as e:
+            if sdr_cache_file:
+                # The cached copy may be the cause, dump it again next time
+                _clear_sdr_cache(task.node.uuid)
             raise exception.FailedToGetSensorData(node=task.node.uuid,
                                                   error=e)
 
-        return _parse_ipmi_sensors_data(task.node, out)
+        return _parse_ipmi_sensors_data(task.node, out, _get_sensor_types())
 
 
 class VendorPassthru(base.VendorInterface):
@@ -980,6 +1157,13 @@ class VendorPassthru(base.VendorInterface):
                           'with error: %(error)s.'),
                           {'node_id': node_uuid, 'error': e})
             raise exception.IPMIFailure(cmd=cmd)
+        finally:
+            # The sessions to the BMC did not survive its reset, and its SDR
+            # repository may have changed
+            if CONF.ipmi.session_pool:
+                ipmitool_sessions.close_sessions(driver_info['address'])
+            if CONF.ipmi.sdr_cache:
+                _clear_sdr_cache(node_uuid)
 
     def get_properties(self):
         return COMMON_PROPERTIES
@@ -1082,9 +1266,10 @@ class IPMIShellinaboxConsole(base.ConsoleInterface):
             ipmi_cmd += " -v"
         ipmi_cmd += " sol activate"
         try:
-            console_utils.start_shellinabox_console(driver_info['uuid'],
-                                                    driver_info['port'],
-                                                    ipmi_cmd)
+            with SCHEDULER.command_slot(driver_info['address']):
+                console_utils.start_shellinabox_console(driver_info['uuid'],
+                                                        driver_info['port'],
+                                                        ipmi_cmd)
         except (exception.ConsoleError, exception.ConsoleSubprocessFailed):
             with excutils.save_and_reraise_exception():
                 utils.unlink_without_raise(path)
@@ -0,0 +1,190 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Scheduling of the ipmitool commands sent to the BMCs.
+
+The commands sent to a BMC are run one at a time, in the order they were
+requested, and no more often than once every [ipmi]min_command_interval
+seconds. Callers waiting for their turn only block their own green thread,
+and the state of a BMC is dropped as soon as it no longer constrains the
+next command, so the memory used is bounded by the number of BMCs being
+talked to.
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+from oslo_concurrency import processutils
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from ironic.common.i18n import _
+
+CONF = cfg.CONF
+CONF.import_opt('min_command_interval',
+                'ironic.drivers.modules.ipminative',
+                group='ipmi')
+CONF.import_opt('retry_timeout',
+                'ironic.drivers.modules.ipminative',
+                group='ipmi')
+
+LOG = logging.getLogger(__name__)
+
+
+class _BMCState(object):
+    """The commands running and waiting for a BMC."""
+
+    def __init__(self):
+        self.busy = False
+        self.waiters = collections.deque()
+        self.last_end = 0
+
+
+class CommandScheduler(object):
+    """FIFO queue of the commands of every BMC."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+        self._commands = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._max_queue_depth = 0
+
+    def _prune(self, now):
+        """Drop the states which no longer delay any command.
+
+        Must be called with the lock held.
+        """
+        limit = now - CONF.ipmi.min_command_interval
+        for address, state in list(self._states.items()):
+            if (not state.busy and not state.waiters and
+                    state.last_end <= limit):
+                del self._states[address]
+
+    def _acquire(self, address):
+        """Wait for the turn of a new command to a BMC.
+
+        :returns: the state of the BMC, owned by the caller until released.
+        :raises: ProcessExecutionError if the commands ahead did not release
+            the BMC in time.
+        """
+        start = time.time()
+        with self._lock:
+            self._prune(start)
+            state = self._states.setdefault(address, _BMCState())
+            if state.busy:
+                turn = threading.Event()
+                state.waiters.append(turn)
+                ahead = len(state.waiters)
+                self._max_queue_depth = max(self._max_queue_depth, ahead)
+            else:
+                state.busy = True
+                turn = None
+
+        if turn is not None:
+            # The releasing command hands the BMC over to us. Each command
+            # ahead of us should be done within retry_timeout, so do not
+            # wait forever for one which never releases it.
+            timeout = ahead * (CONF.ipmi.retry_timeout +
+                               CONF.ipmi.min_command_interval)
+            try:
+                turn.wait(timeout)
+            except BaseException:
+                if self._withdraw(state, turn):
+                    self._release(state)
+                raise
+            if not self._withdraw(state, turn):
+                raise processutils.ProcessExecutionError(
+                    description=_('Timed out after %(timeout)s seconds '
+                                  'waiting for the turn of a command to BMC '
+                                  '%(address)s.') % {'timeout': timeout,
+                                                     'address': address})
+        try:
+            # NOTE(deva): ensure that no communications are sent to a BMC
+            #             more often than once every min_command_interval
+            #             seconds.
+            delay = (state.last_end + CONF.ipmi.min_command_interval -
+                     time.time())
+            if delay > 0:
+                time.sleep(delay)
+        except BaseException:
+            self._release(state)
+            raise
+
+        waited = time.time() - start
+        with self._lock:
+            self._commands += 1
+            self._wait_time += waited
+            self._max_wait_time = max(self._max_wait_time, waited)
+        if waited >= CONF.ipmi.min_command_interval:
+            LOG.debug('Waited %(time).2f seconds to send a command to '
+                      'BMC %(address)s.',
+                      {'time': waited, 'address': address})
+        return state
+
+    def _withdraw(self, state, turn):
+        """Leave the queue of a BMC, unless it was already our turn.
+
+        :returns: True if the BMC was handed over, and so must be released.
+        """
+        with self._lock:
+            if turn.is_set():
+                return True
+            state.waiters.remove(turn)
+            return False
+
+    def _release(self, state):
+        with self._lock:
+            state.last_end = time.time()
+            if state.waiters:
+                state.waiters.popleft().set()
+            else:
+                state.busy = False
+
+    @contextlib.contextmanager
+    def command_slot(self, address):
+        """Run a command to a BMC once it is its turn.
+
+        :param address: the address of the BMC.
+        """
+        state = self._acquire(address)
+        try:
+            yield
+        finally:
+            self._release(state)
+
+    def get_stats(self):
+        """Get statistics about the commands scheduled so far.
+
+        :returns: a dictionary with the number of commands waiting per BMC
+                  ('queue_depth'), the largest number of commands which
+                  waited for a BMC ('max_queue_depth'), the number of
+                  commands run ('commands') and the total and largest time
+                  in seconds they waited for their turn ('wait_time' and
+                  'max_wait_time').
+        """
+        with self._lock:
+            return {
+                'queue_depth': dict((address, len(state.waiters))
+                                    for address, state in self._states.items()
+                                    if state.waiters),
+                'max_queue_depth': self._max_queue_depth,
+                'commands': self._commands,
+                'wait_time': self._wait_time,
+                'max_wait_time': self._max_wait_time,
+            }
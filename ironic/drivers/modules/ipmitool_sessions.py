@@ -0,0 +1,366 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Pool of long-lived ipmitool sessions.
+
+Instead of starting a new ipmitool process, and a new IPMI session with the
+BMC, for every command, the commands sent to a BMC are written to an
+``ipmitool shell`` process kept running for that BMC. The output of a
+command is everything the shell prints before its next prompt.
+
+Sessions left idle for [ipmi]session_idle_timeout seconds are closed, and a
+session which died or lost its IPMI session is replaced by a new one.
+"""
+
+import errno
+import fcntl
+import os
+import select
+import subprocess
+import tempfile
+import threading
+import time
+
+from oslo_concurrency import processutils
+from oslo_config import cfg
+from oslo_log import log as logging
+import six
+
+from ironic.common import exception
+from ironic.common.i18n import _
+from ironic.common.i18n import _LW
+
+opts = [
+    cfg.BoolOpt('session_pool',
+                default=False,
+                help=_('Send the commands of the ipmitool drivers through '
+                       'a long-lived "ipmitool shell" process per BMC, '
+                       'instead of starting a new ipmitool process, and '
+                       'establishing a new IPMI session, for every '
+                       'command.')),
+    cfg.IntOpt('session_idle_timeout',
+               default=30,
+               help=_('Time in seconds after which an idle ipmitool shell '
+                      'process of the session pool is closed. It should be '
+                      'lower than the session timeout of the BMCs, which is '
+                      '60 seconds on most of them.')),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group='ipmi')
+CONF.import_opt('retry_timeout',
+                'ironic.drivers.modules.ipminative',
+                group='ipmi')
+CONF.import_opt('tempdir', 'ironic.common.utils')
+
+LOG = logging.getLogger(__name__)
+
+PROMPT = b'ipmitool> '
+
+# Extra time given to a command over [ipmi]retry_timeout, which bounds the
+# retries done by ipmitool itself, before its session is considered hung.
+COMMAND_TIMEOUT_MARGIN = 10
+
+# Time given to a shell to close its IPMI session and exit.
+CLOSE_TIMEOUT = 5
+
+# The commands which only read from the BMC, and so may be run again when
+# the session was lost after they were sent
+READ_COMMANDS = ('power status', 'chassis bootparam get', 'sdr')
+
+
+class SessionError(Exception):
+    """The ipmitool shell process died or did not answer in time."""
+
+
+class CommandNotSent(SessionError):
+    """The command could not be written to the ipmitool shell process."""
+
+
+class SessionTimeout(SessionError):
+    """The ipmitool shell process did not answer in time."""
+
+
+def _is_read_command(command):
+    return any(command == prefix or command.startswith(prefix + ' ')
+               for prefix in READ_COMMANDS)
+
+
+class Session(object):
+    """A long-lived ipmitool shell process.
+
+    :param args: the ipmitool command line, without the password file and
+                 the command.
+    :param password: the password of the BMC.
+    """
+
+    def __init__(self, args, password):
+        self.args = args
+        self.password = password
+        self.process = None
+        self.closed = False
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+        self._pw_file = None
+
+    def start(self):
+        """Start the shell and wait for its first prompt.
+
+        :raises: PasswordFileFailedToCreate if the password file cannot be
+                 written.
+        :raises: SessionError if the shell does not start.
+        """
+        try:
+            self._pw_file = tempfile.NamedTemporaryFile(mode='w',
+                                                        dir=CONF.tempdir)
+            self._pw_file.write(str(self.password))
+            self._pw_file.flush()
+        except (IOError, OSError) as exc:
+            self.close()
+            raise exception.PasswordFileFailedToCreate(error=exc)
+
+        env = dict(os.environ, TERM='dumb')
+        try:
+            self.process = subprocess.Popen(
+                self.args + ['-f', self._pw_file.name, 'shell'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, close_fds=True, env=env)
+            # stderr is only drained once the prompt is back on stdout, it
+            # must not block when there is nothing to read.
+            err_fd = self.process.stderr.fileno()
+            flags = fcntl.fcntl(err_fd, fcntl.F_GETFL)
+            fcntl.fcntl(err_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+            self._read_until_prompt()
+        except (OSError, SessionError) as exc:
+            self.close()
+            raise SessionError(exc)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _read_until_prompt(self):
+        timeout = CONF.ipmi.retry_timeout + COMMAND_TIMEOUT_MARGIN
+        fd = self.process.stdout.fileno()
+        deadline = time.time() + timeout
+        output = b''
+        while not output.endswith(PROMPT):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise SessionTimeout(_('timed out after %s seconds') %
+                                     timeout)
+            if not select.select([fd], [], [], remaining)[0]:
+                continue
+            data = os.read(fd, 4096)
+            if not data:
+                raise SessionError(_('ipmitool exited with code %s') %
+                                   self.process.wait())
+            output += data
+        return output[:-len(PROMPT)]
+
+    def _read_errors(self):
+        fd = self.process.stderr.fileno()
+        errors = b''
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except OSError as exc:
+                if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return errors
+                raise
+            if not data:
+                return errors
+            errors += data
+
+    def execute(self, command):
+        """Run a command in the shell.
+
+        :param command: the ipmitool command, e.g. "power status".
+        :returns: (stdout, stderr) of the command.
+        :raises: CommandNotSent if the command could not be written to the
+                 shell.
+        :raises: SessionError if the shell died or did not answer in time.
+        :raises: processutils.ProcessExecutionError if the command failed,
+                 that is it printed errors but no output.
+        """
+        line = command + '\n'
+        try:
+            self.process.stdin.write(line.encode('utf-8'))
+            self.process.stdin.flush()
+        except (IOError, OSError) as exc:
+            raise CommandNotSent(exc)
+        out = self._read_until_prompt().decode('utf-8', 'replace')
+        err = self._read_errors().decode('utf-8', 'replace')
+        self.last_used = time.time()
+
+        # Some builds of ipmitool echo the command after the prompt
+        if out.startswith(line):
+            out = out[len(line):]
+        # The shell has no exit code, a command failed if it only printed
+        # errors, as ipmitool prints nothing on stdout in that case.
+        if err.strip() and not out.strip():
+            raise processutils.ProcessExecutionError(
+                stdout=out, stderr=err, exit_code=1,
+                cmd=' '.join(self.args + [command]))
+        return out, err
+
+    def close(self):
+        """Close the IPMI session and stop the shell."""
+        self.closed = True
+        try:
+            if self.is_alive():
+                try:
+                    self.process.stdin.write(b'exit\n')
+                    self.process.stdin.flush()
+                except (IOError, OSError):
+                    pass
+                deadline = time.time() + CLOSE_TIMEOUT
+                while self.is_alive() and time.time() < deadline:
+                    time.sleep(0.1)
+                if self.is_alive():
+                    self.process.kill()
+                    self.process.wait()
+        finally:
+            if self._pw_file is not None:
+                self._pw_file.close()
+
+
+class SessionPool(object):
+    """The ipmitool shell processes, one per BMC and set of credentials."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _evict_idle(self):
+        """Close the idle sessions which are not in use."""
+        limit = time.time() - CONF.ipmi.session_idle_timeout
+        evicted = []
+        with self._lock:
+            for key, session in list(self._sessions.items()):
+                if session.last_used < limit and session.lock.acquire(False):
+                    del self._sessions[key]
+                    evicted.append(session)
+        for session in evicted:
+            try:
+                session.close()
+            finally:
+                session.lock.release()
+
+    def _get(self, key, args, password):
+        """Get the session of a key, creating it if needed.
+
+        The session is started by the first user which locks it.
+        """
+        self._evict_idle()
+        with self._lock:
+            session = self._sessions.get(key)
+            if (session is None or session.closed or
+                    (session.process is not None and
+                     not session.is_alive())):
+                session = Session(args, password)
+                self._sessions[key] = session
+            session.last_used = time.time()
+            return session
+
+    def _discard(self, key, session):
+        with self._lock:
+            if self._sessions.get(key) is session:
+                del self._sessions[key]
+        session.close()
+
+    def execute(self, address, args, password, command):
+        """Run an ipmitool command in the session of a BMC.
+
+        A command which could not be sent because the session was lost is
+        run again once in a new session. So is a command reading from the
+        BMC (see READ_COMMANDS) which failed because the session was lost,
+        for instance because the BMC closed it, but not one which timed
+        out. The other commands may have reached the BMC already, and are
+        not run again.
+
+        :param address: the address of the BMC.
+        :param args: the ipmitool command line, without the password file
+                     and the command.
+        :param password: the password of the BMC.
+        :param command: the ipmitool command, e.g. "power status".
+        :returns: (stdout, stderr) of the command.
+        :raises: PasswordFileFailedToCreate if the password file of a new
+                 session cannot be written.
+        :raises: processutils.ProcessExecutionError if the command failed.
+        """
+        key = (address, tuple(args), password)
+        while True:
+            session = self._get(key, args, password)
+            with session.lock:
+                if session.closed:
+                    # Closed while we were waiting for it, get a new one
+                    continue
+                started = session.process is None
+                try:
+                    if started:
+                        session.start()
+                    return session.execute(command)
+                except SessionError as exc:
+                    self._discard(key, session)
+                    if (started or isinstance(exc, SessionTimeout) or
+                            not (isinstance(exc, CommandNotSent) or
+                                 _is_read_command(command))):
+                        raise processutils.ProcessExecutionError(
+                            description=six.text_type(exc),
+                            cmd=' '.join(args + [command]))
+                    error = exc
+                except processutils.ProcessExecutionError as exc:
+                    if started or 'session' not in exc.stderr.lower():
+                        raise
+                    self._discard(key, session)
+                    if not _is_read_command(command):
+                        raise
+                    error = exc
+                except BaseException:
+                    # NOTE: interrupted, e.g. by a timeout, the output of the
+                    # command may still be unread and must not be read by
+                    # the next command
+                    self._discard(key, session)
+                    raise
+            LOG.warning(_LW('The ipmitool session to %(address)s was lost, '
+                            'running "%(cmd)s" in a new one. Error: '
+                            '%(error)s'),
+                        {'address': address, 'cmd': command, 'error': error})
+
+    def close_sessions(self, address):
+        """Close the sessions to a BMC, e.g. after it was reset."""
+        with self._lock:
+            sessions = [(key, session)
+                        for key, session in self._sessions.items()
+                        if key[0] == address]
+        for key, session in sessions:
+            with session.lock:
+                self._discard(key, session)
+
+
+_POOL = SessionPool()
+
+
+def execute(address, args, password, command):
+    """Run an ipmitool command in the pooled session of a BMC.
+
+    See :meth:`SessionPool.execute`.
+    """
+    return _POOL.execute(address, args, password, command)
+
+
+def close_sessions(address):
+    """Close the pooled sessions to a BMC."""
+    _POOL.close_sessions(address)
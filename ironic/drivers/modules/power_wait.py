@@ -0,0 +1,192 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Waiting for the power state of nodes to change.
+
+The time taken by the power controller of a node (a BMC, a PDU...) to
+complete a power transition is learned, so that the power state is polled
+at short intervals around the time the transition is expected to complete,
+instead of at intervals growing with every poll. Transitions taking longer
+than expected are polled less and less often, without oversleeping by more
+than a fraction of the time already waited.
+"""
+
+import collections
+import threading
+import time
+
+from oslo_log import log as logging
+from oslo_service import loopingcall
+
+from ironic.common import states
+from ironic.common import stats
+
+LOG = logging.getLogger(__name__)
+
+# Interval in seconds between the polls around the expected completion time
+POLL_INTERVAL = 1
+# Longest interval in seconds between two polls
+MAX_POLL_INTERVAL = 10
+# Share of the time already waited that the next poll may be delayed by,
+# once the transition took longer than expected
+BACKOFF_RATIO = 0.25
+# Weight of the last transition in the learned latency
+LATENCY_WEIGHT = 0.3
+# Number of power controllers whose latency is remembered
+MAX_LATENCIES = 4096
+# Upper bounds in seconds of the buckets of the latency histogram
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120)
+
+
+class TransitionLatencies(object):
+    """The latency of the power transitions of every power controller."""
+
+    def __init__(self):
+        self._latencies = collections.OrderedDict()
+        self._histogram = {}
+        self._lock = threading.Lock()
+
+    def expected(self, key, target_state):
+        """Get the time a power transition is expected to take.
+
+        :param key: the power controller.
+        :param target_state: the power state of the transition.
+        :returns: the latency in seconds, or None if it is not known.
+        """
+        with self._lock:
+            return self._latencies.get((key, target_state))
+
+    def record(self, key, target_state, latency):
+        """Record the time a power transition took.
+
+        :param key: the power controller.
+        :param target_state: the power state of the transition.
+        :param latency: the time in seconds the transition took.
+        """
+        with self._lock:
+            expected = self._latencies.pop((key, target_state), None)
+            if expected is None:
+                expected = latency
+            else:
+                expected = (LATENCY_WEIGHT * latency +
+                            (1 - LATENCY_WEIGHT) * expected)
+            self._latencies[(key, target_state)] = expected
+            while len(self._latencies) > MAX_LATENCIES:
+                self._latencies.popitem(last=False)
+
+            buckets = self._histogram.setdefault(
+                target_state, [0] * (len(HISTOGRAM_BUCKETS) + 1))
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if latency <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+
+    def get_histogram(self):
+        """Get the histogram of the latencies recorded.
+
+        :returns: a dictionary of the number of transitions per upper bound
+                  of their latency in seconds (None for the last bucket),
+                  per target power state.
+        """
+        bounds = HISTOGRAM_BUCKETS + (None,)
+        with self._lock:
+            return dict((target_state, dict(zip(bounds, buckets)))
+                        for target_state, buckets in self._histogram.items())
+
+
+LATENCIES = TransitionLatencies()
+
+
+def get_latency_histogram():
+    """Get the histogram of the power state transition latencies.
+
+    See :meth:`TransitionLatencies.get_histogram`.
+    """
+    return LATENCIES.get_histogram()
+
+
+stats.register('power_transition_latencies', get_latency_histogram)
+
+
+def next_poll_delay(elapsed, expected=None):
+    """Get the time to wait before polling the power state again.
+
+    :param elapsed: the time in seconds waited so far.
+    :param expected: the time in seconds the transition is expected to
+                     take, or None if it is not known.
+    :returns: the time to wait in seconds.
+    """
+    expected = expected or 0
+    if elapsed + POLL_INTERVAL < expected:
+        # Wake up just before the transition is expected to complete
+        return expected - POLL_INTERVAL - elapsed
+    if elapsed < expected + max(4 * POLL_INTERVAL, expected / 2.0):
+        return POLL_INTERVAL
+    return min(max(POLL_INTERVAL, elapsed * BACKOFF_RATIO), MAX_POLL_INTERVAL)
+
+
+def wait_for_power_state(key, target_state, get_power_state, timeout,
+                         default_latency=None):
+    """Wait for the power state of a node to reach a target state.
+
+    :param key: the power controller of the node, e.g. the address of its
+                BMC, whose transition latency is learned.
+    :param target_state: the power state to wait for, one of
+                         :class:`ironic.common.states`.
+    :param get_power_state: a callable returning the current power state of
+                            the node. It may return None if the power state
+                            could not be read.
+    :param timeout: the maximum time in seconds to wait.
+    :param default_latency: the time in seconds a transition is expected to
+                            take until one was recorded for the power
+                            controller, or None if it is not known.
+    :returns: target_state, or ERROR if it was not reached in time.
+    """
+    expected = LATENCIES.expected(key, target_state)
+    if expected is None:
+        expected = default_latency
+    start = time.time()
+
+    def _poll(mutable):
+        mutable['state'] = get_power_state()
+        # NOTE: the sum of the delays slept is a lower bound of the time
+        # elapsed, which keeps the number of polls bounded by the timeout.
+        elapsed = max(time.time() - start, mutable['slept'])
+        if mutable['state'] == target_state:
+            LATENCIES.record(key, target_state, elapsed)
+            raise loopingcall.LoopingCallDone()
+        if elapsed >= timeout:
+            mutable['state'] = states.ERROR
+            LOG.debug('Power state of %(key)s did not reach %(state)s '
+                      'within %(timeout)s seconds.',
+                      {'key': key, 'state': target_state,
+                       'timeout': timeout})
+            raise loopingcall.LoopingCallDone()
+
+        delay = min(next_poll_delay(elapsed, expected), timeout - elapsed)
+        mutable['slept'] += delay
+        return delay
+
+    if expected is not None:
+        delay = max(expected - POLL_INTERVAL, 0)
+    else:
+        delay = POLL_INTERVAL
+    delay = min(delay, timeout)
+    status = {'state': None, 'slept': delay}
+    timer = loopingcall.DynamicLoopingCall(_poll, status)
+    timer.start(initial_delay=delay).wait()
+    return status['state']
@@ -23,7 +23,6 @@ import re
 
 from oslo_config import cfg
 from oslo_log import log as logging
-from oslo_service import loopingcall
 from oslo_utils import importutils
 from six.moves.urllib import parse as urlparse
 
@@ -36,6 +35,7 @@ from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.drivers import base
 from ironic.drivers.modules import console_utils
+from ironic.drivers.modules import power_wait
 
 seamicroclient = importutils.try_import('seamicroclient')
 if seamicroclient:
@@ -199,6 +199,39 @@ def _get_power_status(node):
         raise exception.ServiceUnavailable(message=ex.message)
 
 
+def _set_and_wait(node, action, target_state, timeout, state=None):
+    """Run a power action until the node reaches a power state.
+
+    The action is retried up to CONF.seamicro.max_retry times, waiting up to
+    timeout seconds after each of them for the power state to change.
+
+    :param node: Ironic node one of :class:`ironic.db.models.Node`
+    :param action: the method of the server running the power action.
+    :param target_state: the power state the action should lead to.
+    :param timeout: Time in seconds to wait after each action.
+    :param state: the current power state of the node, if known.
+    :returns: Power state of the given node
+    """
+    seamicro_info = _parse_driver_info(node)
+    retries = 0
+    if state is None:
+        state = _get_power_status(node)
+    while state != target_state:
+        if retries > CONF.seamicro.max_retry:
+            return states.ERROR
+        try:
+            retries += 1
+            action()
+        except seamicro_client_exception.ClientException:
+            LOG.warning(_LW("Setting the power state of node %(node)s to "
+                            "%(state)s failed."),
+                        {'node': node.uuid, 'state': target_state})
+        state = power_wait.wait_for_power_state(
+            seamicro_info['api_endpoint'], target_state,
+            lambda: _get_power_status(node), timeout)
+    return state
+
+
 def _power_on(node, timeout=None):
     """Power ON this node
 
@@ -211,32 +244,9 @@ def _power_on(node, timeout=None):
     """
     if timeout is None:
         timeout = CONF.seamicro.action_timeout
-    state = [None]
-    retries = [0]
     seamicro_info = _parse_driver_info(node)
     server = _get_server(seamicro_info)
-
-    def _wait_for_power_on(state, retries):
-        """Called at an interval until the node is powered on."""
-
-        state[0] = _get_power_status(node)
-        if state[0] == states.POWER_ON:
-            raise loopingcall.LoopingCallDone()
-
-        if retries[0] > CONF.seamicro.max_retry:
-            state[0] = states.ERROR
-            raise loopingcall.LoopingCallDone()
-        try:
-            retries[0] += 1
-            server.power_on()
-        except seamicro_client_exception.ClientException:
-            LOG.warning(_LW("Power-on failed for node %s."),
-                        node.uuid)
-
-    timer = loopingcall.FixedIntervalLoopingCall(_wait_for_power_on,
-                                                 state, retries)
-    timer.start(interval=timeout).wait()
-    return state[0]
+    return _set_and_wait(node, server.power_on, states.POWER_ON, timeout)
 
 
 def _power_off(node, timeout=None):
@@ -251,32 +261,9 @@ def _power_off(node, timeout=None):
     """
     if timeout is None:
         timeout = CONF.seamicro.action_timeout
-    state = [None]
-    retries = [0]
     seamicro_info = _parse_driver_info(node)
     server = _get_server(seamicro_info)
-
-    def _wait_for_power_off(state, retries):
-        """Called at an interval until the node is powered off."""
-
-        state[0] = _get_power_status(node)
-        if state[0] == states.POWER_OFF:
-            raise loopingcall.LoopingCallDone()
-
-        if retries[0] > CONF.seamicro.max_retry:
-            state[0] = states.ERROR
-            raise loopingcall.LoopingCallDone()
-        try:
-            retries[0] += 1
-            server.power_off()
-        except seamicro_client_exception.ClientException:
-            LOG.warning(_LW("Power-off failed for node %s."),
-                        node.uuid)
-
-    timer = loopingcall.FixedIntervalLoopingCall(_wait_for_power_off,
-                                                 state, retries)
-    timer.start(interval=timeout).wait()
-    return state[0]
+    return _set_and_wait(node, server.power_off, states.POWER_OFF, timeout)
 
 
 def _reboot(node, timeout=None):
@@ -291,34 +278,14 @@ def _reboot(node, timeout=None):
     """
     if timeout is None:
         timeout = CONF.seamicro.action_timeout
-    state = [None]
-    retries = [0]
     seamicro_info = _parse_driver_info(node)
     server = _get_server(seamicro_info)
-
-    def _wait_for_reboot(state, retries):
-        """Called at an interval until the node is rebooted successfully."""
-
-        state[0] = _get_power_status(node)
-        if state[0] == states.POWER_ON:
-            raise loopingcall.LoopingCallDone()
-
-        if retries[0] > CONF.seamicro.max_retry:
-            state[0] = states.ERROR
-            raise loopingcall.LoopingCallDone()
-
-        try:
-            retries[0] += 1
-            server.reset()
-        except seamicro_client_exception.ClientException:
-            LOG.warning(_LW("Reboot failed for node %s."),
-                        node.uuid)
-
-    timer = loopingcall.FixedIntervalLoopingCall(_wait_for_reboot,
-                                                 state, retries)
     server.reset()
-    timer.start(interval=timeout).wait()
-    return state[0]
+    state = power_wait.wait_for_power_state(
+        seamicro_info['api_endpoint'], states.POWER_ON,
+        lambda: _get_power_status(node), timeout)
+    return _set_and_wait(node, server.reset, states.POWER_ON, timeout,
+                         state=state)
 
 
 def _validate_volume(driver_info, volume_id):
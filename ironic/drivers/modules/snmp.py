@@ -28,10 +28,11 @@ models.
 """
 
 import abc
+import threading
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
-from oslo_service import loopingcall
 from oslo_utils import importutils
 import six
 
@@ -41,6 +42,7 @@ from ironic.common.i18n import _LW
 from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.drivers import base
+from ironic.drivers.modules import power_wait
 
 pysnmp = importutils.try_import('pysnmp')
 if pysnmp:
@@ -55,7 +57,14 @@ else:
 opts = [
     cfg.IntOpt('power_timeout',
                default=10,
-               help=_('Seconds to wait for power action to be completed'))
+               help=_('Seconds to wait for power action to be completed')),
+    cfg.IntOpt('outlet_states_ttl',
+               default=1,
+               help=_('Seconds during which the power state of all the '
+                      'outlets of a PDU, read at once, is shared by its '
+                      'nodes while waiting for power actions to complete '
+                      'and while syncing power states. Set to 0 to read '
+                      'the power state of every outlet separately.')),
 ]
 
 LOG = logging.getLogger(__name__)
@@ -69,6 +78,9 @@ SNMP_V2C = '2c'
 SNMP_V3 = '3'
 SNMP_PORT = 161
 
+# Maximum number of objects returned by a GETBULK request
+SNMP_BULK_REPETITIONS = 50
+
 REQUIRED_PROPERTIES = {
     'snmp_driver': _("PDU manufacturer driver.  Required."),
     'snmp_address': _("PDU IPv4 address or hostname.  Required."),
@@ -108,6 +120,11 @@ class SNMPClient(object):
         else:
             self.community = community
         self.cmd_gen = cmdgen.CommandGenerator()
+        self._target = None
+        self._tables = {}
+        # NOTE: the requests to a PDU share its SNMP engine and are sent
+        # one at a time.
+        self._lock = threading.Lock()
 
     def _get_auth(self):
         """Return the authorization data for an SNMP request.
@@ -136,6 +153,18 @@ class SNMPClient(object):
         # enough to allow for an unreliable network or slow device.
         return cmdgen.UdpTransportTarget((self.address, self.port))
 
+    def _get_target(self):
+        """Return the authorization data and transport target of requests.
+
+        They are created once and reused by all the requests to the PDU.
+
+        :returns: A tuple of the authorization data and transport target.
+        :raises: snmp_error.PySnmpError if the transport address is bad.
+        """
+        if self._target is None:
+            self._target = (self._get_auth(), self._get_transport())
+        return self._target
+
     def get(self, oid):
         """Use PySNMP to perform an SNMP GET operation on a single object.
 
@@ -144,9 +173,9 @@ class SNMPClient(object):
         :returns: The value of the requested object.
         """
         try:
-            results = self.cmd_gen.getCmd(self._get_auth(),
-                                          self._get_transport(),
-                                          oid)
+            with self._lock:
+                auth, transport = self._get_target()
+                results = self.cmd_gen.getCmd(auth, transport, oid)
         except snmp_error.PySnmpError as e:
             raise exception.SNMPFailure(operation="GET", error=e)
 
@@ -166,6 +195,56 @@ class SNMPClient(object):
         name, val = var_binds[0]
         return val
 
+    def get_table(self, oid, max_age=0):
+        """Use PySNMP to read all the objects of a table column at once.
+
+        The objects are read with GETBULK requests, or GETNEXT requests with
+        SNMPv1. They are reused for max_age seconds, or until the next SET.
+
+        :param oid: The OID of the table column.
+        :param max_age: Seconds during which the objects read may be reused.
+        :raises: SNMPFailure if an SNMP request fails.
+        :returns: A dictionary of the value of each object by OID, as a
+            tuple of integers.
+        """
+        oid = tuple(oid)
+        with self._lock:
+            read_at, table = self._tables.get(oid, (0, None))
+            if table is not None and time.time() - read_at < max_age:
+                return table
+
+            try:
+                auth, transport = self._get_target()
+                if self.version == SNMP_V1:
+                    results = self.cmd_gen.nextCmd(auth, transport, oid)
+                else:
+                    results = self.cmd_gen.bulkCmd(auth, transport, 0,
+                                                   SNMP_BULK_REPETITIONS,
+                                                   oid)
+            except snmp_error.PySnmpError as e:
+                raise exception.SNMPFailure(operation="GETBULK", error=e)
+
+            error_indication, error_status, error_index, var_binds = results
+
+            if error_indication:
+                # SNMP engine-level error.
+                raise exception.SNMPFailure(operation="GETBULK",
+                                            error=error_indication)
+
+            if error_status:
+                # SNMP PDU error.
+                raise exception.SNMPFailure(
+                    operation="GETBULK", error=error_status.prettyPrint())
+
+            table = {}
+            for row in var_binds:
+                for name, val in row:
+                    name = tuple(name)
+                    if name[:len(oid)] == oid:
+                        table[name] = val
+            self._tables[oid] = (time.time(), table)
+            return table
+
     def set(self, oid, value):
         """Use PySNMP to perform an SNMP SET operation on a single object.
 
@@ -174,9 +253,11 @@ class SNMPClient(object):
         :raises: SNMPFailure if an SNMP request fails.
         """
         try:
-            results = self.cmd_gen.setCmd(self._get_auth(),
-                                          self._get_transport(),
-                                          (oid, value))
+            with self._lock:
+                # The objects read before the SET may have changed.
+                self._tables.clear()
+                auth, transport = self._get_target()
+                results = self.cmd_gen.setCmd(auth, transport, (oid, value))
         except snmp_error.PySnmpError as e:
             raise exception.SNMPFailure(operation="SET", error=e)
 
@@ -193,17 +274,29 @@ class SNMPClient(object):
                                         error=error_status.prettyPrint())
 
 
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
 def _get_client(snmp_info):
-    """Create and return an SNMP client object.
+    """Return the SNMP client object of a PDU.
+
+    The client is created once per PDU and shared by all its nodes.
 
     :param snmp_info: SNMP driver info.
     :returns: A :class:`SNMPClient` object.
     """
-    return SNMPClient(snmp_info["address"],
-                      snmp_info["port"],
-                      snmp_info["version"],
-                      snmp_info.get("community"),
-                      snmp_info.get("security"))
+    key = (snmp_info["address"], snmp_info["port"], snmp_info["version"],
+           snmp_info.get("community"), snmp_info.get("security"))
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _CLIENTS[key] = SNMPClient(snmp_info["address"],
+                                                snmp_info["port"],
+                                                snmp_info["version"],
+                                                snmp_info.get("community"),
+                                                snmp_info.get("security"))
+    return client
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -215,7 +308,6 @@ class SNMPDriverBase(object):
     """
 
     oid_enterprise = (1, 3, 6, 1, 4, 1)
-    retry_interval = 1
 
     def __init__(self, snmp_info):
         self.snmp_info = snmp_info
@@ -243,6 +335,46 @@ class SNMPDriverBase(object):
         :raises: SNMPFailure if an SNMP request fails.
         """
 
+    def _snmp_power_state_oids(self):
+        """Return the OIDs to read the power state of all the outlets at once.
+
+        :returns: None if the power state of the outlets cannot be read at
+            once, or a tuple of the OID of the table column of the power
+            state of all the outlets and of the OID of the power state of
+            the outlet of the node, as tuples of integers.
+        """
+        return None
+
+    @abc.abstractmethod
+    def _snmp_translate_power_state(self, state):
+        """Translate the value of the power state object of an outlet.
+
+        :param state: The value of the power state object.
+        :returns: power state. One of :class:`ironic.common.states`.
+        """
+
+    def _snmp_shared_power_state(self):
+        """Get the current power state from a reading of all the outlets.
+
+        The power state of all the outlets of the PDU is read at once, and
+        shared by its nodes for CONF.snmp.outlet_states_ttl seconds.
+
+        :raises: SNMPFailure if an SNMP request fails.
+        :returns: power state. One of :class:`ironic.common.states`.
+        """
+        oids = self._snmp_power_state_oids()
+        if oids is None or CONF.snmp.outlet_states_ttl <= 0:
+            return self._snmp_power_state()
+
+        table_oid, oid = oids
+        table = self.client.get_table(table_oid,
+                                      max_age=CONF.snmp.outlet_states_ttl)
+        if oid not in table:
+            # NOTE: the PDU did not return the outlet in the table, fall back
+            # to reading the outlet alone.
+            return self._snmp_power_state()
+        return self._snmp_translate_power_state(table[oid])
+
     def _snmp_wait_for_state(self, goal_state):
         """Wait for the power state of the PDU outlet to change.
 
@@ -251,36 +383,27 @@ class SNMPDriverBase(object):
         :raises: SNMPFailure if an SNMP request fails.
         :returns: power state. One of :class:`ironic.common.states`.
         """
-
-        def _poll_for_state(mutable):
-            """Called at an interval until the node's power is consistent.
-
-            :param mutable: dict object containing "state" and "next_time"
-            :raises: SNMPFailure if an SNMP request fails.
-            """
-            mutable["state"] = self._snmp_power_state()
-            if mutable["state"] == goal_state:
-                raise loopingcall.LoopingCallDone()
-
-            mutable["next_time"] += self.retry_interval
-            if mutable["next_time"] >= CONF.snmp.power_timeout:
-                mutable["state"] = states.ERROR
-                raise loopingcall.LoopingCallDone()
-
-        # Pass state to the looped function call in a mutable form.
-        state = {"state": None, "next_time": 0}
-        timer = loopingcall.FixedIntervalLoopingCall(_poll_for_state,
-                                                     state)
-        timer.start(interval=self.retry_interval).wait()
-        LOG.debug("power state '%s'", state["state"])
-        return state["state"]
-
-    def power_state(self):
+        # NOTE: the outlets of a PDU usually switch at once, poll right away
+        # until the time the outlets of this PDU take has been learned.
+        state = power_wait.wait_for_power_state(self.snmp_info['address'],
+                                                goal_state,
+                                                self._snmp_shared_power_state,
+                                                CONF.snmp.power_timeout,
+                                                default_latency=0)
+        LOG.debug("power state '%s'", state)
+        return state
+
+    def power_state(self, shared=False):
         """Returns a node's current power state.
 
+        :param shared: Whether the power state may be read along with the
+            power state of all the outlets of the PDU, and shared with its
+            other nodes.
         :raises: SNMPFailure if an SNMP request fails.
         :returns: power state. One of :class:`ironic.common.states`.
         """
+        if shared:
+            return self._snmp_shared_power_state()
         return self._snmp_power_state()
 
     def power_on(self):
@@ -351,9 +474,14 @@ class SNMPDriverSimple(SNMPDriverBase):
         outlet = int(self.snmp_info['outlet'])
         return self.oid_enterprise + self.oid_device + (outlet,)
 
+    def _snmp_power_state_oids(self):
+        return self.oid_enterprise + self.oid_device, self.oid
+
     def _snmp_power_state(self):
         state = self.client.get(self.oid)
+        return self._snmp_translate_power_state(state)
 
+    def _snmp_translate_power_state(self, state):
         # Translate the state to an Ironic power state.
         if state == self.value_power_on:
             power_state = states.POWER_ON
@@ -516,10 +644,15 @@ class SNMPDriverEatonPower(SNMPDriverBase):
         outlet = int(self.snmp_info['outlet'])
         return self.oid_base + oid + (outlet,)
 
+    def _snmp_power_state_oids(self):
+        return self.oid_base + self.oid_status, self._snmp_oid(self.oid_status)
+
     def _snmp_power_state(self):
         oid = self._snmp_oid(self.oid_status)
         state = self.client.get(oid)
+        return self._snmp_translate_power_state(state)
 
+    def _snmp_translate_power_state(self, state):
         # Translate the state to an Ironic power state.
         if state in (self.status_on, self.status_pending_off):
             power_state = states.POWER_ON
@@ -675,6 +808,25 @@ class SNMPPower(base.PowerInterface):
         power_state = driver.power_state()
         return power_state
 
+    def get_power_state_many(self, tasks):
+        """Get the current power state of the nodes of several tasks.
+
+        The power state of all the outlets of a PDU is read at once, and
+        serves all its nodes.
+
+        :param tasks: a list of TaskManager instances.
+        :returns: a dictionary of the power state of each node, or of the
+                  exception raised getting it, by node UUID.
+        """
+        result = {}
+        for task in tasks:
+            try:
+                driver = _get_driver(task.node)
+                result[task.node.uuid] = driver.power_state(shared=True)
+            except exception.IronicException as e:
+                result[task.node.uuid] = e
+        return result
+
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
         """Turn the power on or off.
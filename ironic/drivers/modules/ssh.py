@@ -26,9 +26,11 @@ Currently supported environments are:
     Parallels   (parallels)
 """
 
+import collections
 import os
+import threading
+import time
 
-from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import excutils
@@ -39,9 +41,9 @@ from ironic.common.i18n import _
 from ironic.common.i18n import _LE
 from ironic.common.i18n import _LW
 from ironic.common import states
-from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.drivers import base
+from ironic.drivers.modules import ssh_pool
 from ironic.drivers import utils as driver_utils
 
 libvirt_opts = [
@@ -50,8 +52,19 @@ libvirt_opts = [
                help=_('libvirt URI'))
 ]
 
+vm_index_opts = [
+    cfg.IntOpt('vm_index_ttl',
+               default=60,
+               help=_('Time in seconds during which the names of the '
+                      'virtual machines of a host, by MAC address, are '
+                      'reused to find the virtual machine of a node. The '
+                      'names are listed again when a node is not found in '
+                      'them. Set to 0 to list them for every operation.')),
+]
+
 CONF = cfg.CONF
 CONF.register_opts(libvirt_opts, group='ssh')
+CONF.register_opts(vm_index_opts, group='ssh')
 
 LOG = logging.getLogger(__name__)
 
@@ -213,6 +226,148 @@ def _normalize_mac(mac):
     return mac.replace('-', '').replace(':', '').lower()
 
 
+# Prefix of the lines of the VM names in the output of the listing of the
+# VMs and of their MAC addresses
+_VM_NAME_PREFIX = 'vm-name: '
+
+
+def _get_list_macs_cmd(driver_info):
+    """Get the command listing the MAC addresses of every VM of a host.
+
+    Every VM is printed on a line starting with _VM_NAME_PREFIX, followed
+    by its MAC addresses one per line.
+
+    :param driver_info: information for accessing the node.
+    :returns: the command.
+    """
+    cmd_set = driver_info['cmd_set']
+    # NOTE: some templates quote the name already (parallels)
+    get_node_macs = cmd_set['get_node_macs'].replace('"{_NodeName_}"',
+                                                     '{_NodeName_}')
+    get_node_macs = get_node_macs.replace('{_NodeName_}', '"$name"')
+    # NOTE: stdin is closed for the commands run for every VM, so that
+    # they do not consume the list of the VMs.
+    return ('%(base_cmd)s %(list_all)s | while read -r name; do '
+            '[ -n "$name" ] || continue; '
+            'echo "%(prefix)s$name"; '
+            '{ %(base_cmd)s %(get_node_macs)s; } < /dev/null || true; '
+            'done' % {'base_cmd': cmd_set['base_cmd'],
+                      'list_all': cmd_set['list_all'],
+                      'prefix': _VM_NAME_PREFIX,
+                      'get_node_macs': get_node_macs})
+
+
+class _VMIndex(object):
+    """The names of the VMs of every host, by MAC address.
+
+    The VMs of a host and their MAC addresses are listed with a single
+    command, instead of one command per VM. The listing is reused for
+    [ssh]vm_index_ttl seconds, and done again when a node is not found in it.
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(driver_info):
+        return (driver_info['host'], driver_info['port'],
+                driver_info['cmd_set']['base_cmd'])
+
+    @staticmethod
+    def _match(index, driver_info):
+        for mac in driver_info['macs']:
+            if not mac:
+                continue
+            name = index.get(_normalize_mac(mac))
+            if name is not None:
+                return name
+
+    def _get(self, key):
+        with self._lock:
+            listed_at, index = self._hosts.get(key, (0, None))
+        if time.time() - listed_at < CONF.ssh.vm_index_ttl:
+            return index
+
+    def refresh(self, ssh_obj, driver_info):
+        """List the VMs of the host of a node and their MAC addresses.
+
+        :param ssh_obj: an ssh connection to the host.
+        :param driver_info: information for accessing the node.
+        :returns: a dictionary of the VM names by normalized MAC address.
+        :raises: SSHCommandFailed on an error from ssh.
+        """
+        output = _ssh_execute(ssh_obj, _get_list_macs_cmd(driver_info))
+        index = {}
+        name = None
+        for line in output:
+            if line.startswith(_VM_NAME_PREFIX):
+                name = line[len(_VM_NAME_PREFIX):]
+            elif line and name is not None:
+                index.setdefault(_normalize_mac(line.strip()), name)
+        LOG.debug("Listed %(vms)d VMs with %(macs)d MAC addresses on "
+                  "%(host)s.", {'vms': len(set(index.values())),
+                                'macs': len(index),
+                                'host': driver_info['host']})
+        with self._lock:
+            self._hosts[self._key(driver_info)] = (time.time(), index)
+        return index
+
+    def forget(self, driver_info):
+        """Drop the listing of the VMs of the host of a node.
+
+        :param driver_info: information for accessing the node.
+        """
+        with self._lock:
+            self._hosts.pop(self._key(driver_info), None)
+
+    def lookup_many(self, ssh_obj, driver_infos):
+        """Find the names of the VMs of several nodes of a host.
+
+        The VMs of the host are listed at most once.
+
+        :param ssh_obj: an ssh connection to the host.
+        :param driver_infos: a list of the information for accessing the
+                             nodes, all on the same host.
+        :returns: a dictionary of the VM name of each node, or None if it
+                  was not found, by node UUID.
+        :raises: SSHCommandFailed on an error from ssh.
+        """
+        names = {}
+        index = self._get(self._key(driver_infos[0]))
+        if index is not None:
+            names = dict((info['uuid'], self._match(index, info))
+                         for info in driver_infos)
+        if index is None or None in names.values():
+            index = self.refresh(ssh_obj, driver_infos[0])
+            names = dict((info['uuid'], self._match(index, info))
+                         for info in driver_infos)
+        return names
+
+
+_VM_INDEX = _VMIndex()
+
+
+def _ssh_execute_for_vm(ssh_obj, driver_info, cmd_to_exec):
+    """Executes a command via ssh against the VM of a node.
+
+    The VM may have been renamed or removed since the VMs of its host were
+    listed, so the listing is dropped when the command fails.
+
+    :param ssh_obj: an ssh connection, see :func:`_get_connection`.
+    :param driver_info: information for accessing the node.
+    :param cmd_to_exec: command to execute.
+    :returns: list of the lines of output from the command.
+    :raises: SSHCommandFailed on an error from ssh.
+
+    """
+    try:
+        return _ssh_execute(ssh_obj, cmd_to_exec)
+    except exception.SSHCommandFailed:
+        _VM_INDEX.forget(driver_info)
+        raise
+
+
 def _get_boot_device(ssh_obj, driver_info):
     """Get the current boot device.
 
@@ -230,7 +385,8 @@ def _get_boot_device(ssh_obj, driver_info):
         base_cmd = driver_info['cmd_set']['base_cmd']
         cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', node_name)
         cmd_to_exec = cmd_to_exec.replace('{_BaseCmd_}', base_cmd)
-        stdout, stderr = _ssh_execute(ssh_obj, cmd_to_exec)
+        stdout, stderr = _ssh_execute_for_vm(ssh_obj, driver_info,
+                                             cmd_to_exec)
         return next((dev for dev, hdev in boot_device_map.items()
                      if hdev == stdout), None)
     else:
@@ -255,7 +411,7 @@ def _set_boot_device(ssh_obj, driver_info, device):
         cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', node_name)
         cmd_to_exec = cmd_to_exec.replace('{_BootDevice_}', device)
         cmd_to_exec = cmd_to_exec.replace('{_BaseCmd_}', base_cmd)
-        _ssh_execute(ssh_obj, cmd_to_exec)
+        _ssh_execute_for_vm(ssh_obj, driver_info, cmd_to_exec)
     else:
         raise NotImplementedError()
 
@@ -266,15 +422,15 @@ def _ssh_execute(ssh_obj, cmd_to_exec):
     Executes a command via ssh and returns a list of the lines of the
     output from the command.
 
-    :param ssh_obj: paramiko.SSHClient, an active ssh connection.
+    :param ssh_obj: an ssh connection, see :func:`_get_connection`.
     :param cmd_to_exec: command to execute.
     :returns: list of the lines of output from the command.
     :raises: SSHCommandFailed on an error from ssh.
 
     """
     try:
-        output_list = processutils.ssh_execute(ssh_obj,
-                                               cmd_to_exec)[0].split('\n')
+        output_list = ssh_pool.execute(ssh_obj,
+                                       cmd_to_exec)[0].split('\n')
     except Exception as e:
         LOG.error(_LE("Cannot execute SSH cmd %(cmd)s. Reason: %(err)s."),
                   {'cmd': cmd_to_exec, 'err': e})
@@ -342,6 +498,29 @@ def _parse_driver_info(node):
     return res
 
 
+def _get_listed_power_state(node_name, running_list):
+    """Returns the power state of a VM from the list of the running VMs.
+
+    :param node_name: the name the host uses to reference the node.
+    :param running_list: the lines of output of the list_running command.
+    :returns: one of ironic.common.states POWER_OFF, POWER_ON.
+
+    """
+    # Command should return a list of running vms. If the current node is
+    # not listed then we can assume it is not powered on.
+    quoted_node_name = '"%s"' % node_name
+    for node in running_list:
+        if not node:
+            continue
+        # 'node' here is an formatted output from the virt cli's. The
+        # node name is always quoted but can contain other information.
+        # vbox returns '"NodeName" {b43c4982-110c-4c29-9325-d5f41b053513}'
+        # so we must use the 'in' comparison here and not '=='
+        if quoted_node_name in node:
+            return states.POWER_ON
+    return states.POWER_OFF
+
+
 def _get_power_status(ssh_obj, driver_info):
     """Returns a node's current power state.
 
@@ -351,7 +530,6 @@ def _get_power_status(ssh_obj, driver_info):
     :raises: NodeNotFound
 
     """
-    power_state = None
     node_name = _get_hosts_name_for_node(ssh_obj, driver_info)
     if node_name:
         # Get a list of vms running on the host. If the command supports
@@ -359,23 +537,9 @@ def _get_power_status(ssh_obj, driver_info):
         cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
                                  driver_info['cmd_set']['list_running'])
         cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', node_name)
-        running_list = _ssh_execute(ssh_obj, cmd_to_exec)
-
-        # Command should return a list of running vms. If the current node is
-        # not listed then we can assume it is not powered on.
-        quoted_node_name = '"%s"' % node_name
-        for node in running_list:
-            if not node:
-                continue
-            # 'node' here is an formatted output from the virt cli's. The
-            # node name is always quoted but can contain other information.
-            # vbox returns '"NodeName" {b43c4982-110c-4c29-9325-d5f41b053513}'
-            # so we must use the 'in' comparison here and not '=='
-            if quoted_node_name in node:
-                power_state = states.POWER_ON
-                break
-        if not power_state:
-            power_state = states.POWER_OFF
+        running_list = _ssh_execute_for_vm(ssh_obj, driver_info,
+                                           cmd_to_exec)
+        power_state = _get_listed_power_state(node_name, running_list)
     else:
         err_msg = _LE('Node "%(host)s" with MAC address %(mac)s not found.')
         LOG.error(err_msg, {'host': driver_info['host'],
@@ -386,56 +550,76 @@ def _get_power_status(ssh_obj, driver_info):
     return power_state
 
 
+def _get_power_statuses(ssh_obj, driver_infos):
+    """Returns the current power state of several nodes of a host.
+
+    The VMs of the nodes are found with at most one listing of the VMs of
+    the host, and their power state is read from a single listing of the
+    running VMs when the virt_type can list them all at once.
+
+    :param ssh_obj: paramiko.SSHClient, an active ssh connection.
+    :param driver_infos: a list of the information for accessing the nodes,
+                         all on the same host.
+    :returns: a dictionary of the power state of each node, or of the
+              exception raised getting it, by node UUID.
+    :raises: SSHCommandFailed on an error from ssh.
+
+    """
+    names = _VM_INDEX.lookup_many(ssh_obj, driver_infos)
+    cmd_set = driver_infos[0]['cmd_set']
+    if '{_NodeName_}' in cmd_set['list_running']:
+        # NOTE: the running VMs are listed one at a time (vmware)
+        running_list = None
+    else:
+        cmd_to_exec = "%s %s" % (cmd_set['base_cmd'],
+                                 cmd_set['list_running'])
+        running_list = _ssh_execute(ssh_obj, cmd_to_exec)
+    result = {}
+    for info in driver_infos:
+        node_name = names[info['uuid']]
+        if not node_name:
+            LOG.error(_LE('Node "%(host)s" with MAC address %(mac)s not '
+                          'found.'),
+                      {'host': info['host'], 'mac': info['macs']})
+            result[info['uuid']] = exception.NodeNotFound(node=info['host'])
+        elif running_list is None:
+            try:
+                result[info['uuid']] = _get_power_status(ssh_obj, info)
+            except exception.IronicException as e:
+                result[info['uuid']] = e
+        else:
+            result[info['uuid']] = _get_listed_power_state(node_name,
+                                                           running_list)
+    return result
+
+
 def _get_connection(node):
-    """Returns an SSH client connected to a node.
+    """Returns an SSH connection to the host of a node.
+
+    The connection is taken from the pool of the connections to the hosts,
+    see :mod:`ironic.drivers.modules.ssh_pool`.
 
     :param node: the Node.
-    :returns: paramiko.SSHClient, an active ssh connection.
+    :returns: an active ssh connection, usable like a paramiko.SSHClient.
+    :raises: SSHConnectFailed if the connection could not be opened.
 
     """
-    return utils.ssh_connect(_parse_driver_info(node))
+    return ssh_pool.get_connection(_parse_driver_info(node))
 
 
 def _get_hosts_name_for_node(ssh_obj, driver_info):
     """Get the name the host uses to reference the node.
 
+    The name is looked up by MAC address in the index of the VMs of the
+    host, see :class:`_VMIndex`.
+
     :param ssh_obj: paramiko.SSHClient, an active ssh connection.
     :param driver_info: information for accessing the node.
     :returns: the name or None if not found.
+    :raises: SSHCommandFailed on an error from ssh.
 
     """
-    matched_name = None
-    cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
-                             driver_info['cmd_set']['list_all'])
-    full_node_list = _ssh_execute(ssh_obj, cmd_to_exec)
-    LOG.debug("Retrieved Node List: %s" % repr(full_node_list))
-    # for each node check Mac Addresses
-    for node in full_node_list:
-        if not node:
-            continue
-        LOG.debug("Checking Node: %s's Mac address." % node)
-        cmd_to_exec = "%s %s" % (driver_info['cmd_set']['base_cmd'],
-                                 driver_info['cmd_set']['get_node_macs'])
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', node)
-        hosts_node_mac_list = _ssh_execute(ssh_obj, cmd_to_exec)
-
-        for host_mac in hosts_node_mac_list:
-            if not host_mac:
-                continue
-            for node_mac in driver_info['macs']:
-                if not node_mac:
-                    continue
-                if _normalize_mac(host_mac) in _normalize_mac(node_mac):
-                    LOG.debug("Found Mac address: %s" % node_mac)
-                    matched_name = node
-                    break
-
-            if matched_name:
-                break
-        if matched_name:
-            break
-
-    return matched_name
+    return _VM_INDEX.lookup_many(ssh_obj, [driver_info])[driver_info['uuid']]
 
 
 def _power_on(ssh_obj, driver_info):
@@ -455,7 +639,7 @@ def _power_on(ssh_obj, driver_info):
                                  driver_info['cmd_set']['start_cmd'])
     cmd_to_power_on = cmd_to_power_on.replace('{_NodeName_}', node_name)
 
-    _ssh_execute(ssh_obj, cmd_to_power_on)
+    _ssh_execute_for_vm(ssh_obj, driver_info, cmd_to_power_on)
 
     current_pstate = _get_power_status(ssh_obj, driver_info)
     if current_pstate == states.POWER_ON:
@@ -481,7 +665,7 @@ def _power_off(ssh_obj, driver_info):
                                   driver_info['cmd_set']['stop_cmd'])
     cmd_to_power_off = cmd_to_power_off.replace('{_NodeName_}', node_name)
 
-    _ssh_execute(ssh_obj, cmd_to_power_off)
+    _ssh_execute_for_vm(ssh_obj, driver_info, cmd_to_power_off)
 
     current_pstate = _get_power_status(ssh_obj, driver_info)
     if current_pstate == states.POWER_OFF:
@@ -544,6 +728,41 @@ class SSHPower(base.PowerInterface):
         ssh_obj = _get_connection(task.node)
         return _get_power_status(ssh_obj, driver_info)
 
+    def get_power_state_many(self, tasks):
+        """Get the current power state of the nodes of several tasks.
+
+        The nodes are grouped by host, and the power state of all the
+        nodes of a host is read with a couple of SSH commands.
+
+        :param tasks: a list of TaskManager instances.
+        :returns: a dictionary of the power state of each node, or of the
+                  exception raised getting it, by node UUID.
+        """
+        result = {}
+        hosts = collections.OrderedDict()
+        for task in tasks:
+            try:
+                driver_info = _parse_driver_info(task.node)
+            except exception.IronicException as e:
+                result[task.node.uuid] = e
+                continue
+            driver_info['macs'] = driver_utils.get_node_mac_addresses(task)
+            host = tuple(driver_info.get(key) for key in
+                         ('host', 'port', 'username', 'password',
+                          'key_contents', 'key_filename'))
+            host += (driver_info['cmd_set']['base_cmd'],)
+            hosts.setdefault(host, []).append((task, driver_info))
+
+        for host_tasks in hosts.values():
+            driver_infos = [info for task, info in host_tasks]
+            try:
+                ssh_obj = _get_connection(host_tasks[0][0].node)
+                result.update(_get_power_statuses(ssh_obj, driver_infos))
+            except exception.IronicException as e:
+                for info in driver_infos:
+                    result[info['uuid']] = e
+        return result
+
     @task_manager.require_exclusive_lock
     def set_power_state(self, task, pstate):
         """Turn the power on or off.
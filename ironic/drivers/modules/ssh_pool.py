@@ -0,0 +1,225 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Pool of the SSH connections of the SSH driver.
+
+Instead of opening a new SSH connection to the host of the virtual machines
+for every operation, the connection to a host is kept open and shared by all
+the operations on its nodes, each command running in its own channel of the
+connection. The number of commands run at once on a host is bounded by
+[ssh]max_sessions_per_host, as SSH servers limit the number of sessions per
+connection (MaxSessions is 10 by default in OpenSSH).
+
+A connection left idle for [ssh]connection_idle_timeout seconds is closed,
+and a connection which was lost is opened again.
+"""
+
+import hashlib
+import socket
+import threading
+import time
+
+from oslo_concurrency import processutils
+from oslo_config import cfg
+from oslo_log import log as logging
+import paramiko
+import six
+
+from ironic.common.i18n import _
+from ironic.common.i18n import _LW
+from ironic.common import utils
+
+opts = [
+    cfg.IntOpt('connection_idle_timeout',
+               default=60,
+               help=_('Time in seconds during which the SSH connection of '
+                      'the SSH driver to a host is kept open after its last '
+                      'use, to be reused by the next operations on its '
+                      'nodes. Set to 0 to open a new connection for every '
+                      'operation.')),
+    cfg.IntOpt('max_sessions_per_host',
+               default=10,
+               help=_('Maximum number of commands run at once by the SSH '
+                      'driver on a host. It should not exceed the '
+                      'MaxSessions setting of the SSH server of the '
+                      'hosts.')),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group='ssh')
+
+LOG = logging.getLogger(__name__)
+
+
+def _is_active(client):
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+
+class Connection(object):
+    """A pooled SSH connection to a host.
+
+    It can be used in place of a paramiko.SSHClient to run commands with
+    processutils.ssh_execute().
+
+    :param connection: a dict of connection parameters, see
+                       :func:`ironic.common.utils.ssh_connect`.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_used = time.time()
+        self.busy = 0
+        self._client = None
+        self._lock = threading.Lock()
+        self._sessions = threading.BoundedSemaphore(
+            max(CONF.ssh.max_sessions_per_host, 1))
+
+    def get_client(self):
+        """Get the SSH client of the connection, connecting it if needed.
+
+        :returns: paramiko.SSHClient -- an active ssh connection.
+        :raises: SSHConnectFailed
+        """
+        with self._lock:
+            if self._client is not None and not _is_active(self._client):
+                LOG.debug('The SSH connection to %s was lost, opening it '
+                          'again.', self.connection.get('host'))
+                self._client.close()
+                self._client = None
+            if self._client is None:
+                self._client = utils.ssh_connect(self.connection)
+            return self._client
+
+    def _reset(self, client):
+        with self._lock:
+            if self._client is client:
+                self._client = None
+        client.close()
+
+    def exec_command(self, *args, **kwargs):
+        """Start a command on the host.
+
+        See paramiko.SSHClient.exec_command(). A command which could not be
+        started because the connection was lost is started again once on a
+        new connection.
+        """
+        client = self.get_client()
+        try:
+            return client.exec_command(*args, **kwargs)
+        except (paramiko.SSHException, socket.error, EOFError) as e:
+            LOG.warning(_LW('Failed to start a command on %(host)s, '
+                            'opening the SSH connection again. Error: '
+                            '%(error)s'),
+                        {'host': self.connection.get('host'), 'error': e})
+            self._reset(client)
+            return self.get_client().exec_command(*args, **kwargs)
+
+    def execute(self, cmd):
+        """Run a command on the host once a session is available.
+
+        :param cmd: the command to run.
+        :returns: (stdout, stderr) of the command.
+        :raises: processutils.ProcessExecutionError if the command failed.
+        """
+        with self._sessions:
+            self.busy += 1
+            try:
+                return processutils.ssh_execute(self, cmd)
+            finally:
+                self.busy -= 1
+                self.last_used = time.time()
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+
+class ConnectionPool(object):
+    """The SSH connections, one per host and set of credentials."""
+
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(connection):
+        credentials = (connection.get('password') or
+                       connection.get('key_contents') or
+                       connection.get('key_filename') or '')
+        digest = hashlib.sha1(
+            six.text_type(credentials).encode('utf-8')).hexdigest()
+        return (connection.get('host'), connection.get('port', 22),
+                connection.get('username'), digest)
+
+    def _evict_idle(self):
+        """Close the idle connections which are not in use."""
+        limit = time.time() - CONF.ssh.connection_idle_timeout
+        with self._lock:
+            evicted = [key for key, conn in self._connections.items()
+                       if not conn.busy and conn.last_used < limit]
+            evicted = [self._connections.pop(key) for key in evicted]
+        for conn in evicted:
+            conn.close()
+
+    def get(self, connection):
+        """Get the connection to a host, connecting it if needed.
+
+        :param connection: a dict of connection parameters, see
+                           :func:`ironic.common.utils.ssh_connect`.
+        :returns: a :class:`Connection`.
+        :raises: SSHConnectFailed
+        """
+        self._evict_idle()
+        key = self._key(connection)
+        with self._lock:
+            conn = self._connections.get(key)
+            if conn is None:
+                conn = self._connections[key] = Connection(connection)
+            conn.last_used = time.time()
+        conn.get_client()
+        return conn
+
+
+_POOL = ConnectionPool()
+
+
+def get_connection(connection):
+    """Get an SSH connection to a host.
+
+    :param connection: a dict of connection parameters, see
+                       :func:`ironic.common.utils.ssh_connect`.
+    :returns: a pooled :class:`Connection`, or a paramiko.SSHClient if
+              [ssh]connection_idle_timeout is 0.
+    :raises: SSHConnectFailed
+    """
+    if CONF.ssh.connection_idle_timeout <= 0:
+        return utils.ssh_connect(connection)
+    return _POOL.get(connection)
+
+
+def execute(ssh_obj, cmd):
+    """Run a command over an SSH connection.
+
+    :param ssh_obj: a :class:`Connection` or a paramiko.SSHClient.
+    :param cmd: the command to run.
+    :returns: (stdout, stderr) of the command.
+    :raises: processutils.ProcessExecutionError if the command failed.
+    """
+    if isinstance(ssh_obj, Connection):
+        return ssh_obj.execute(cmd)
+    return processutils.ssh_execute(ssh_obj, cmd)
@@ -12,6 +12,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from eventlet import greenpool
 from oslo_log import log as logging
 
 from ironic.common import exception
@@ -170,3 +171,23 @@ def add_node_capability(task, capability, value):
     properties['capabilities'] = capabilities
     node.properties = properties
     node.save()
+
+
+def get_power_state_many(tasks, get_power_state, workers):
+    """Get the power state of the nodes of several tasks concurrently.
+
+    :param tasks: a list of TaskManager instances.
+    :param get_power_state: a callable taking a task and returning the power
+                            state of its node.
+    :param workers: the maximum number of nodes queried at once.
+    :returns: a dictionary of the power state of each node, or of the
+              exception raised getting it, by node UUID.
+    """
+    def _get_power_state(task):
+        try:
+            return task.node.uuid, get_power_state(task)
+        except Exception as e:
+            return task.node.uuid, e
+
+    pool = greenpool.GreenPool(size=max(workers, 1))
+    return dict(pool.imap(_get_power_state, tasks))
@@ -397,7 +397,7 @@ class IronicObject(object_base.VersionedObjectDictCompat):
     def as_dict(self):
         return dict((k, getattr(self, k))
                     for k in self.fields
-                    if hasattr(self, k))
+                    if self.obj_attr_is_set(k))
 
     def obj_refresh(self, loaded_object):
         """Applies updates for objects that inherit from base.IronicObject.
@@ -38,7 +38,12 @@ class Node(base.IronicObject):
     # Version 1.11: Add clean_step
     # Version 1.12: Add raid_config and target_raid_config
     # Version 1.13: Add touch_provisioning()
-    VERSION = '1.13'
+    # Version 1.14: Add filters to get() and reserve()
+    # Version 1.15: Add reserve_many() and release_many()
+    # Version 1.16: Add fields to list()
+    # Version 1.17: Add iter_list()
+    # Version 1.18: Add get_many()
+    VERSION = '1.18'
 
     dbapi = db_api.get_instance()
 
@@ -97,20 +102,47 @@ class Node(base.IronicObject):
     }
 
     @staticmethod
-    def _from_db_object(node, db_node):
-        """Converts a database entity to a formal object."""
-        for field in node.fields:
+    def _from_db_object(node, db_node, fields=None):
+        """Converts a database entity to a formal object.
+
+        :param fields: the fields to set, the other ones are loaded on
+                       first access. Defaults to None, setting all the
+                       fields.
+        """
+        for field in fields or node.fields:
             node[field] = db_node[field]
         node.obj_reset_changes()
         return node
 
+    def obj_load_attr(self, attrname):
+        """Load the fields which were not loaded by list().
+
+        All the fields which are not set are loaded at once, with a
+        single database query.
+        """
+        if attrname not in self.fields or not self.obj_attr_is_set('id'):
+            return super(Node, self).obj_load_attr(attrname)
+        db_node = self.dbapi.get_node_by_id(self.id)
+        missing = [field for field in self.fields
+                   if not self.obj_attr_is_set(field)]
+        for field in missing:
+            self[field] = db_node[field]
+        self.obj_reset_changes(missing)
+
     @base.remotable_classmethod
-    def get(cls, context, node_id):
+    def get(cls, context, node_id, filters=None):
         """Find a node based on its id or uuid and return a Node object.
 
         :param node_id: the id *or* uuid of a node.
+        :param filters: filters the node must match, evaluated by the
+                        database. Defaults to None.
+        :raises: NodeFiltersNotMatched if the node does not match the
+                 filters.
         :returns: a :class:`Node` object.
         """
+        if filters:
+            db_node = cls.dbapi.get_node(node_id, filters=filters)
+            return Node._from_db_object(cls(context), db_node)
         if strutils.is_int_like(node_id):
             return cls.get_by_id(context, node_id)
         elif uuidutils.is_uuid_like(node_id):
@@ -118,6 +150,22 @@ class Node(base.IronicObject):
         else:
             raise exception.InvalidIdentity(identity=node_id)
 
+    @base.remotable_classmethod
+    def get_many(cls, context, node_ids, filters=None):
+        """Find several nodes based on their ids or uuids.
+
+        The nodes are loaded with a single database query.
+
+        :param node_ids: a list of ids or uuids of nodes.
+        :param filters: filters the nodes must match, evaluated by the
+                        database. Defaults to None.
+        :raises: InvalidIdentity if a node id is neither an id nor a uuid.
+        :returns: a list of :class:`Node` objects. The nodes which are not
+                  found or do not match the filters are skipped.
+        """
+        db_nodes = cls.dbapi.get_nodes(node_ids, filters=filters)
+        return [Node._from_db_object(cls(context), obj) for obj in db_nodes]
+
     @base.remotable_classmethod
     def get_by_id(cls, context, node_id):
         """Find a node based on its integer id and return a Node object.
@@ -164,7 +212,7 @@ class Node(base.IronicObject):
 
     @base.remotable_classmethod
     def list(cls, context, limit=None, marker=None, sort_key=None,
-             sort_dir=None, filters=None):
+             sort_dir=None, filters=None, fields=None):
         """Return a list of Node objects.
 
         :param context: Security context.
@@ -173,16 +221,53 @@ class Node(base.IronicObject):
         :param sort_key: column to sort results by.
         :param sort_dir: direction to sort. "asc" or "desc".
         :param filters: Filters to apply.
+        :param fields: the fields to load from the database, the other
+                       fields are loaded on first access. The "id" field
+                       is always loaded. Defaults to None, loading all
+                       the fields.
         :returns: a list of :class:`Node` object.
 
         """
+        if fields is not None:
+            fields = set(fields) | {'id'}
         db_nodes = cls.dbapi.get_node_list(filters=filters, limit=limit,
                                            marker=marker, sort_key=sort_key,
-                                           sort_dir=sort_dir)
-        return [Node._from_db_object(cls(context), obj) for obj in db_nodes]
+                                           sort_dir=sort_dir, fields=fields)
+        return [Node._from_db_object(cls(context), obj, fields=fields)
+                for obj in db_nodes]
+
+    @classmethod
+    def iter_list(cls, context, limit=None, marker=None, sort_key=None,
+                  sort_dir=None, filters=None, fields=None):
+        """Return an iterator over Node objects.
+
+        Like :meth:`list`, but the nodes are fetched from the database in
+        chunks as the iterator is consumed. This is not remotable, the
+        iterator has to run where the database is reachable.
+
+        :param context: Security context.
+        :param limit: maximum number of resources to return in a single result.
+        :param marker: pagination marker for large data sets.
+        :param sort_key: column to sort results by.
+        :param sort_dir: direction to sort. "asc" or "desc".
+        :param filters: Filters to apply.
+        :param fields: the fields to load from the database, the other
+                       fields are loaded on first access. Defaults to None,
+                       loading all the fields.
+        :returns: an iterator over :class:`Node` objects.
+
+        """
+        if fields is not None:
+            fields = set(fields) | {'id'}
+        db_nodes = cls.dbapi.get_node_list(filters=filters, limit=limit,
+                                           marker=marker, sort_key=sort_key,
+                                           sort_dir=sort_dir, fields=fields,
+                                           stream=True)
+        return (Node._from_db_object(cls(context), obj, fields=fields)
+                for obj in db_nodes)
 
     @base.remotable_classmethod
-    def reserve(cls, context, tag, node_id):
+    def reserve(cls, context, tag, node_id, filters=None):
         """Get and reserve a node.
 
         To prevent other ManagerServices from manipulating the given
@@ -191,11 +276,16 @@ class Node(base.IronicObject):
         :param context: Security context.
         :param tag: A string uniquely identifying the reservation holder.
         :param node_id: A node id or uuid.
+        :param filters: filters the node must match to be reserved, evaluated
+                        in the same database statement as the reservation.
+                        Defaults to None.
         :raises: NodeNotFound if the node is not found.
+        :raises: NodeFiltersNotMatched if the node does not match the
+                 filters.
         :returns: a :class:`Node` object.
 
         """
-        db_node = cls.dbapi.reserve_node(tag, node_id)
+        db_node = cls.dbapi.reserve_node(tag, node_id, filters=filters)
         node = Node._from_db_object(cls(context), db_node)
         return node
 
@@ -211,6 +301,42 @@ class Node(base.IronicObject):
         """
         cls.dbapi.release_node(tag, node_id)
 
+    @base.remotable_classmethod
+    def reserve_many(cls, context, tag, node_ids, filters=None):
+        """Get and reserve several nodes in a single transaction.
+
+        :param context: Security context.
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids or uuids.
+        :param filters: filters the nodes must match to be reserved,
+                        evaluated in the same database statement as the
+                        reservation. Defaults to None.
+        :raises: InvalidIdentity if a node id is neither an id nor a uuid.
+        :returns: a tuple of the list of reserved :class:`Node` objects,
+                  and of the set of node ids or uuids of the nodes which
+                  were already reserved. Nodes which are not found or do
+                  not match the filters are in neither.
+
+        """
+        db_nodes, locked = cls.dbapi.reserve_nodes(tag, node_ids,
+                                                   filters=filters)
+        nodes = [Node._from_db_object(cls(context), obj) for obj in db_nodes]
+        return nodes, locked
+
+    @base.remotable_classmethod
+    def release_many(cls, context, tag, node_ids):
+        """Release the reservations on several nodes.
+
+        :param context: Security context.
+        :param tag: A string uniquely identifying the reservation holder.
+        :param node_ids: A list of node ids or uuids.
+        :raises: InvalidIdentity if a node id is neither an id nor a uuid.
+        :returns: the number of released nodes; the nodes which are not
+                  found or not reserved by tag are skipped.
+
+        """
+        return cls.dbapi.release_nodes(tag, node_ids)
+
     @base.remotable
     def create(self, context=None):
         """Create a Node record in the DB.
@@ -30,7 +30,9 @@ class Port(base.IronicObject):
     # Version 1.2: Add create() and destroy()
     # Version 1.3: Add list()
     # Version 1.4: Add list_by_node_id()
-    VERSION = '1.4'
+    # Version 1.5: Add iter_list()
+    # Version 1.6: Add list_by_node_ids()
+    VERSION = '1.6'
 
     dbapi = dbapi.get_instance()
 
@@ -135,6 +137,31 @@ class Port(base.IronicObject):
                                            sort_dir=sort_dir)
         return Port._from_db_object_list(db_ports, cls, context)
 
+    @classmethod
+    def iter_list(cls, context, limit=None, marker=None,
+                  sort_key=None, sort_dir=None):
+        """Return an iterator over Port objects.
+
+        Like :meth:`list`, but the ports are fetched from the database in
+        chunks as the iterator is consumed. This is not remotable, the
+        iterator has to run where the database is reachable.
+
+        :param context: Security context.
+        :param limit: maximum number of resources to return in a single result.
+        :param marker: pagination marker for large data sets.
+        :param sort_key: column to sort results by.
+        :param sort_dir: direction to sort. "asc" or "desc".
+        :returns: an iterator over :class:`Port` objects.
+        :raises: InvalidParameterValue
+
+        """
+        db_ports = cls.dbapi.get_port_list(limit=limit,
+                                           marker=marker,
+                                           sort_key=sort_key,
+                                           sort_dir=sort_dir,
+                                           stream=True)
+        return (Port._from_db_object(cls(context), obj) for obj in db_ports)
+
     @base.remotable_classmethod
     def list_by_node_id(cls, context, node_id, limit=None, marker=None,
                         sort_key=None, sort_dir=None):
@@ -155,6 +182,20 @@ class Port(base.IronicObject):
                                                   sort_dir=sort_dir)
         return Port._from_db_object_list(db_ports, cls, context)
 
+    @base.remotable_classmethod
+    def list_by_node_ids(cls, context, node_ids):
+        """Return a list of the Port objects of several nodes.
+
+        The ports are loaded with a single database query.
+
+        :param context: Security context.
+        :param node_ids: a list of the IDs of the nodes.
+        :returns: a list of :class:`Port` object.
+
+        """
+        db_ports = cls.dbapi.get_ports_by_node_ids(node_ids)
+        return Port._from_db_object_list(db_ports, cls, context)
+
     @base.remotable
     def create(self, context=None):
         """Create a Port record in the DB.
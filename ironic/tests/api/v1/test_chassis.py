@@ -29,6 +29,7 @@ from wsme import types as wtypes
 from ironic.api.controllers import base as api_base
 from ironic.api.controllers import v1 as api_v1
 from ironic.api.controllers.v1 import chassis as api_chassis
+from ironic.api.controllers.v1 import utils as api_utils
 from ironic.tests.api import base as test_api_base
 from ironic.tests.api import utils as apiutils
 from ironic.tests import base
@@ -144,24 +145,29 @@ class TestListChassis(test_api_base.FunctionalTest):
             self.assertTrue(self.validate_link(l['href'], bookmark=bookmark))
 
     def test_collection_links(self):
+        chassis = []
         for id in range(5):
-            obj_utils.create_test_chassis(self.context,
-                                          uuid=uuidutils.generate_uuid())
+            chassis.append(obj_utils.create_test_chassis(
+                self.context, uuid=uuidutils.generate_uuid()))
         data = self.get_json('/chassis/?limit=3')
         self.assertEqual(3, len(data['chassis']))
 
-        next_marker = data['chassis'][-1]['uuid']
+        next_marker = api_utils.encode_marker(chassis[2], 'id')
         self.assertIn(next_marker, data['next'])
+        data = self.get_json('/chassis/?limit=3&marker=%s' % next_marker)
+        self.assertEqual([ch.uuid for ch in chassis[3:]],
+                         [ch['uuid'] for ch in data['chassis']])
 
     def test_collection_links_default_limit(self):
         cfg.CONF.set_override('max_limit', 3, 'api')
+        chassis = []
         for id_ in range(5):
-            obj_utils.create_test_chassis(self.context,
-                                          uuid=uuidutils.generate_uuid())
+            chassis.append(obj_utils.create_test_chassis(
+                self.context, uuid=uuidutils.generate_uuid()))
         data = self.get_json('/chassis')
         self.assertEqual(3, len(data['chassis']))
 
-        next_marker = data['chassis'][-1]['uuid']
+        next_marker = api_utils.encode_marker(chassis[2], 'id')
         self.assertIn(next_marker, data['next'])
 
     def test_sort_key(self):
@@ -161,6 +161,22 @@ class TestListNodes(test_api_base.FunctionalTest):
             # We always append "links"
             self.assertItemsEqual(['uuid', 'instance_info', 'links'], node)
 
+    @mock.patch.object(objects.Node, 'list')
+    def test_get_collection_custom_fields_loaded(self, mock_list):
+        mock_list.return_value = []
+        self.get_json(
+            '/nodes?fields=instance_info,chassis_uuid&sort_key=created_at',
+            headers={api_base.Version.string: str(api_v1.MAX_VER)})
+        self.assertEqual({'uuid', 'instance_info', 'chassis_id',
+                          'created_at'},
+                         mock_list.call_args[1]['fields'])
+
+    @mock.patch.object(objects.Node, 'list')
+    def test_detail_loads_all_fields(self, mock_list):
+        mock_list.return_value = []
+        self.get_json('/nodes/detail')
+        self.assertIsNone(mock_list.call_args[1]['fields'])
+
     def test_get_custom_fields_invalid_fields(self):
         node = obj_utils.create_test_node(self.context,
                                           chassis_id=self.chassis.id)
@@ -338,8 +354,45 @@ class TestListNodes(test_api_base.FunctionalTest):
         data = self.get_json('/nodes/?limit=3')
         self.assertEqual(3, len(data['nodes']))
 
-        next_marker = data['nodes'][-1]['uuid']
+        next_marker = api_utils.encode_marker(
+            objects.Node.get_by_uuid(self.context, nodes[2]), 'id')
+        self.assertIn(next_marker, data['next'])
+        data = self.get_json('/nodes/?limit=3&marker=%s' % next_marker)
+        self.assertEqual(nodes[3:], [n['uuid'] for n in data['nodes']])
+        self.assertNotIn('next', data)
+
+    def test_collection_streamed(self):
+        cfg.CONF.set_override('stream_collections', True, 'api')
+        nodes = []
+        for id in range(5):
+            node = obj_utils.create_test_node(self.context,
+                                              uuid=uuidutils.generate_uuid(),
+                                              chassis_id=self.chassis.id)
+            nodes.append(node.uuid)
+        data = self.get_json('/nodes/?limit=3')
+        self.assertEqual(nodes[:3], [n['uuid'] for n in data['nodes']])
+        self.assertNotIn('driver_info', data['nodes'][0])
+        self.assertIn('links', data['nodes'][0])
+
+        next_marker = api_utils.encode_marker(
+            objects.Node.get_by_uuid(self.context, nodes[2]), 'id')
         self.assertIn(next_marker, data['next'])
+        data = self.get_json('/nodes/detail?limit=3&marker=%s' % next_marker)
+        self.assertEqual(nodes[3:], [n['uuid'] for n in data['nodes']])
+        self.assertEqual(self.chassis.uuid, data['nodes'][0]['chassis_uuid'])
+        self.assertEqual('******',
+                         data['nodes'][0]['driver_info']['fake_password'])
+        self.assertNotIn('next', data)
+
+    def test_collection_streamed_empty(self):
+        cfg.CONF.set_override('stream_collections', True, 'api')
+        data = self.get_json('/nodes/detail')
+        self.assertEqual({'nodes': []}, data)
+
+    def test_collection_streamed_invalid_sort_key(self):
+        cfg.CONF.set_override('stream_collections', True, 'api')
+        response = self.get_json('/nodes?sort_key=foo', expect_errors=True)
+        self.assertEqual(http_client.BAD_REQUEST, response.status_int)
 
     def test_collection_links_default_limit(self):
         cfg.CONF.set_override('max_limit', 3, 'api')
@@ -351,9 +404,49 @@ class TestListNodes(test_api_base.FunctionalTest):
         data = self.get_json('/nodes')
         self.assertEqual(3, len(data['nodes']))
 
-        next_marker = data['nodes'][-1]['uuid']
+        next_marker = api_utils.encode_marker(
+            objects.Node.get_by_uuid(self.context, nodes[2]), 'id')
         self.assertIn(next_marker, data['next'])
 
+    def test_collection_links_sort_key(self):
+        nodes = []
+        for id in range(5):
+            node = obj_utils.create_test_node(self.context,
+                                              uuid=uuidutils.generate_uuid())
+            nodes.append(node.uuid)
+        nodes.sort()
+        data = self.get_json('/nodes/?limit=3&sort_key=uuid')
+        self.assertEqual(nodes[:3], [n['uuid'] for n in data['nodes']])
+
+        next_query = urlparse.urlparse(data['next']).query
+        next_marker = urlparse.parse_qs(next_query)['marker'][0]
+        data = self.get_json('/nodes/?limit=3&sort_key=uuid&marker=%s'
+                             % next_marker)
+        self.assertEqual(nodes[3:], [n['uuid'] for n in data['nodes']])
+
+    def test_collection_uuid_marker(self):
+        nodes = []
+        for id in range(5):
+            node = obj_utils.create_test_node(self.context,
+                                              uuid=uuidutils.generate_uuid())
+            nodes.append(node.uuid)
+        data = self.get_json('/nodes/?limit=3&marker=%s' % nodes[1])
+        self.assertEqual(nodes[2:], [n['uuid'] for n in data['nodes']])
+
+    def test_collection_invalid_marker(self):
+        response = self.get_json('/nodes/?marker=foo', expect_errors=True)
+        self.assertEqual(http_client.BAD_REQUEST, response.status_int)
+        self.assertEqual('application/json', response.content_type)
+        self.assertTrue(response.json['error_message'])
+
+    def test_collection_marker_of_other_sort_key(self):
+        node = obj_utils.create_test_node(self.context)
+        marker = api_utils.encode_marker(node, 'id')
+        response = self.get_json('/nodes/?sort_key=uuid&marker=%s' % marker,
+                                 expect_errors=True)
+        self.assertEqual(http_client.BAD_REQUEST, response.status_int)
+        self.assertEqual('application/json', response.content_type)
+
     def test_sort_key(self):
         nodes = []
         for id in range(3):
@@ -33,6 +33,7 @@ from ironic.api.controllers.v1 import port as api_port
 from ironic.api.controllers.v1 import utils as api_utils
 from ironic.common import exception
 from ironic.conductor import rpcapi
+from ironic import objects
 from ironic.tests.api import base as test_api_base
 from ironic.tests.api import utils as apiutils
 from ironic.tests import base
@@ -187,8 +188,32 @@ class TestListPorts(test_api_base.FunctionalTest):
         data = self.get_json('/ports/?limit=3')
         self.assertEqual(3, len(data['ports']))
 
-        next_marker = data['ports'][-1]['uuid']
+        next_marker = api_utils.encode_marker(
+            objects.Port.get_by_uuid(self.context, ports[2]), 'id')
         self.assertIn(next_marker, data['next'])
+        data = self.get_json('/ports/?limit=3&marker=%s' % next_marker)
+        self.assertEqual(ports[3:], [p['uuid'] for p in data['ports']])
+
+    def test_collection_streamed(self):
+        cfg.CONF.set_override('stream_collections', True, 'api')
+        ports = []
+        for id_ in range(5):
+            port = obj_utils.create_test_port(
+                self.context,
+                node_id=self.node.id,
+                uuid=uuidutils.generate_uuid(),
+                address='52:54:00:cf:2d:3%s' % id_)
+            ports.append(port.uuid)
+        data = self.get_json('/ports/detail?limit=3')
+        self.assertEqual(ports[:3], [p['uuid'] for p in data['ports']])
+        self.assertEqual(self.node.uuid, data['ports'][0]['node_uuid'])
+
+        next_marker = api_utils.encode_marker(
+            objects.Port.get_by_uuid(self.context, ports[2]), 'id')
+        self.assertIn(next_marker, data['next'])
+        data = self.get_json('/ports/?limit=3&marker=%s' % next_marker)
+        self.assertEqual(ports[3:], [p['uuid'] for p in data['ports']])
+        self.assertNotIn('next', data)
 
     def test_collection_links_default_limit(self):
         cfg.CONF.set_override('max_limit', 3, 'api')
@@ -203,7 +228,8 @@ class TestListPorts(test_api_base.FunctionalTest):
         data = self.get_json('/ports')
         self.assertEqual(3, len(data['ports']))
 
-        next_marker = data['ports'][-1]['uuid']
+        next_marker = api_utils.encode_marker(
+            objects.Port.get_by_uuid(self.context, ports[2]), 'id')
         self.assertIn(next_marker, data['next'])
 
     def test_port_by_address(self):
@@ -14,8 +14,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import datetime
+
 import mock
 from oslo_config import cfg
+from oslo_serialization import jsonutils
 from oslo_utils import uuidutils
 import pecan
 from six.moves import http_client
@@ -80,6 +84,79 @@ class TestApiUtils(base.TestCase):
                           utils.check_allow_specify_fields, ['foo'])
 
 
+class TestMarker(base.TestCase):
+
+    def setUp(self):
+        super(TestMarker, self).setUp()
+        self.node = objects.Node(self.context, id=42,
+                                 uuid=uuidutils.generate_uuid(),
+                                 name='node-42',
+                                 provision_updated_at=datetime.datetime(
+                                     2015, 8, 1, 12, 30, 15, 123))
+
+    def test_encode_marker_round_trip(self):
+        marker = utils.encode_marker(self.node, 'name')
+        self.assertNotIn(self.node.uuid, marker)
+        result = utils.get_marker(objects.Node, marker, 'name')
+        self.assertIsInstance(result, utils.KeysetMarker)
+        self.assertEqual(42, result.id)
+        self.assertEqual('node-42', result.name)
+
+    def test_encode_marker_datetime(self):
+        marker = utils.encode_marker(self.node, 'provision_updated_at')
+        result = utils.get_marker(objects.Node, marker,
+                                  'provision_updated_at')
+        self.assertEqual(datetime.datetime(2015, 8, 1, 12, 30, 15, 123),
+                         result.provision_updated_at)
+        self.assertIsNone(result.provision_updated_at.tzinfo)
+
+    def test_encode_marker_id(self):
+        marker = utils.encode_marker(self.node, 'id')
+        result = utils.get_marker(objects.Node, marker, 'id')
+        self.assertEqual(42, result.id)
+
+    def test_encode_marker_unknown_sort_key(self):
+        self.assertEqual(self.node.uuid,
+                         utils.encode_marker(self.node, 'uuid_hash'))
+
+    def test_get_marker_none(self):
+        self.assertIsNone(utils.get_marker(objects.Node, None, 'id'))
+
+    @mock.patch.object(pecan, 'request')
+    @mock.patch.object(objects.Node, 'get_by_uuid')
+    def test_get_marker_uuid(self, mock_gbu, mock_pr):
+        result = utils.get_marker(objects.Node, self.node.uuid, 'id')
+        self.assertEqual(mock_gbu.return_value, result)
+        mock_gbu.assert_called_once_with(mock_pr.context, self.node.uuid)
+
+    def test_get_marker_invalid(self):
+        for marker in ('foo', 'WyJpZCIsIDFd', '!!!'):
+            self.assertRaises(exception.InvalidParameterValue,
+                              utils.get_marker, objects.Node, marker, 'id')
+
+    def test_get_marker_invalid_types(self):
+        for data in (['name', {'a': 1}, 1], ['name', ['x'], 1],
+                     ['name', 'node-42', 'x'], ['name', 'node-42', None],
+                     ['name', 'node-42', True]):
+            marker = base64.urlsafe_b64encode(
+                jsonutils.dumps(data).encode('utf-8')).decode('ascii')
+            self.assertRaises(exception.InvalidParameterValue,
+                              utils.get_marker, objects.Node, marker, 'name')
+
+    def test_get_marker_null_value(self):
+        marker = base64.urlsafe_b64encode(
+            jsonutils.dumps(['name', None, 42]).encode('utf-8'))
+        result = utils.get_marker(objects.Node, marker.decode('ascii'),
+                                  'name')
+        self.assertIsNone(result.name)
+        self.assertEqual(42, result.id)
+
+    def test_get_marker_other_sort_key(self):
+        marker = utils.encode_marker(self.node, 'name')
+        self.assertRaises(exception.InvalidParameterValue,
+                          utils.get_marker, objects.Node, marker, 'id')
+
+
 class TestNodeIdent(base.TestCase):
 
     def setUp(self):
@@ -404,6 +404,34 @@ class TestGlanceImageService(base.TestCase):
         }
         self.assertEqual(expected, image_meta)
 
+    def test_show_cached(self):
+        self.config(image_metadata_cache_ttl=60)
+        fixture = self._make_fixture(name='image1', is_public=True)
+        image_id = self.service.create(fixture)['id']
+        get_mock = mock.Mock(wraps=self.service.client.images.get)
+        self.service.client.images.get = get_mock
+        with mock.patch.object(service, 'METADATA_CACHE',
+                               service.ImageMetadataCache()):
+            self.service.show(image_id)
+            self.assertEqual('image1', self.service.show(image_id)['name'])
+            get_mock.assert_called_once_with(image_id)
+
+            fixture['name'] = 'image2'
+            self.service.update(image_id, fixture)
+            self.assertEqual('image2', self.service.show(image_id)['name'])
+            self.assertEqual(2, get_mock.call_count)
+
+    def test_show_cached_checks_availability(self):
+        self.config(image_metadata_cache_ttl=60)
+        fixture = self._make_fixture(name='image1', is_public=False)
+        image_id = self.service.create(fixture)['id']
+        with mock.patch.object(service, 'METADATA_CACHE',
+                               service.ImageMetadataCache()):
+            self.service.show(image_id)
+            self.context.auth_token = False
+            self.assertRaises(exception.ImageNotFound,
+                              self.service.show, image_id)
+
     def test_show_raises_when_no_authtoken_in_the_context(self):
         fixture = self._make_fixture(name='image1',
                                      is_public=False,
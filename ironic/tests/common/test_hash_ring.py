@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
 import hashlib
 
 import mock
@@ -197,6 +198,78 @@ class HashRingTestCase(base.TestCase):
         self.assertEqual(['foo'], ring.get_hosts('fake',
                                                  ignore_hosts=['baz']))
 
+    def test_lookup_table_matches_bisect(self):
+        hosts = [str(x) for x in range(10)]
+        ring = hash_ring.HashRing(hosts)
+        for x in range(10000):
+            data = str(x)
+            hashed_key = ring._hash2int(hashlib.md5(data.encode('utf-8')))
+            position = bisect.bisect(ring._partitions, hashed_key)
+            if position == len(ring._partitions):
+                position = 0
+            self.assertEqual(position, ring._get_partition(data))
+
+    def test_get_hosts_many(self):
+        hosts = ['foo', 'bar', 'baz']
+        ring = hash_ring.HashRing(hosts, replicas=2)
+        expected = [ring.get_hosts('fake'), ring.get_hosts('fake-again')]
+        self.assertEqual(expected,
+                         ring.get_hosts_many(['fake', 'fake-again']))
+        self.assertEqual(
+            [ring.get_hosts('fake', ignore_hosts=['foo'])],
+            ring.get_hosts_many(['fake'], ignore_hosts=['foo']))
+
+    def test_get_hosts_empty_ring(self):
+        ring = hash_ring.HashRing([])
+        self.assertEqual([], ring.get_hosts('fake'))
+
+    def test_get_uuid_hash(self):
+        uuid = '1be26c0b-03f2-4d2e-ae87-c02d7f33c123'
+        digest = hashlib.md5(uuid.encode('utf-8')).hexdigest()
+        self.assertEqual(int(digest[:8], 16) >> 1,
+                         hash_ring.get_uuid_hash(uuid))
+
+    def test_get_hash_ranges(self):
+        hosts = ['foo', 'bar', 'baz']
+        self.config(hash_distribution_replicas=2)
+        ring = hash_ring.HashRing(hosts)
+        ranges = dict((host, ring.get_hash_ranges(host)) for host in hosts)
+        for host in hosts:
+            bounds = [bound for r in ranges[host] for bound in r]
+            # sorted and non-overlapping
+            self.assertEqual(sorted(bounds), bounds)
+            self.assertTrue(all(0 <= b < 2 ** 31 for b in bounds))
+        for i in range(1000):
+            data = 'node-%d' % i
+            uuid_hash = hash_ring.get_uuid_hash(data)
+            for host in ring.get_hosts(data):
+                self.assertTrue(any(low <= uuid_hash <= high
+                                    for low, high in ranges[host]))
+
+    def test_get_hash_ranges_single_host(self):
+        ring = hash_ring.HashRing(['foo'])
+        self.assertEqual([(0, 2 ** 31 - 1)], ring.get_hash_ranges('foo'))
+        self.assertEqual([], ring.get_hash_ranges('bar'))
+
+    def test_previous_ring_dividers_reused(self):
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        with mock.patch.object(hash_ring.HashRing, '_hash_host',
+                               autospec=True,
+                               side_effect=hash_ring.HashRing._hash_host
+                               ) as mock_hash_host:
+            new_ring = hash_ring.HashRing(['foo', 'bar', 'baz'],
+                                          previous_ring=ring)
+            mock_hash_host.assert_called_once_with(new_ring, 'baz')
+        fresh_ring = hash_ring.HashRing(['foo', 'bar', 'baz'])
+        self.assertEqual(fresh_ring._partitions, new_ring._partitions)
+        self.assertEqual(fresh_ring._host_hashes, new_ring._host_hashes)
+
+    def test_previous_ring_ignored_if_exponent_changed(self):
+        ring = hash_ring.HashRing(['foo', 'bar'])
+        CONF.set_override('hash_partition_exponent', 2)
+        new_ring = hash_ring.HashRing(['foo', 'bar'], previous_ring=ring)
+        self.assertEqual(2 ** 2 * 2, len(new_ring._partitions))
+
     def test_create_ring_invalid_data(self):
         hosts = None
         self.assertRaises(exception.Invalid,
@@ -249,3 +322,47 @@ class HashRingManagerTestCase(db_base.DbTestCase):
         self.assertRaises(exception.DriverNotFound,
                           self.ring_manager.__getitem__,
                           'driver1')
+
+    def test_hash_ring_manager_reset(self):
+        self.assertRaises(exception.DriverNotFound,
+                          self.ring_manager.__getitem__,
+                          'driver1')
+        self.register_conductors()
+        self.ring_manager.reset()
+        ring = self.ring_manager['driver1']
+        self.assertEqual(sorted(['host1', 'host2']), sorted(ring.hosts))
+
+    @mock.patch.object(hash_ring.time, 'time', autospec=True)
+    def test_hash_ring_manager_refresh_after_interval(self, mock_time):
+        CONF.set_override('hash_ring_reset_interval', 30)
+        mock_time.return_value = 1000
+        self.assertRaises(exception.DriverNotFound,
+                          self.ring_manager.__getitem__,
+                          'driver1')
+        self.register_conductors()
+
+        mock_time.return_value = 1029
+        self.assertRaises(exception.DriverNotFound,
+                          self.ring_manager.__getitem__,
+                          'driver1')
+
+        mock_time.return_value = 1030
+        ring = self.ring_manager['driver1']
+        self.assertEqual(sorted(['host1', 'host2']), sorted(ring.hosts))
+
+    def test_hash_ring_manager_unchanged_rings_kept(self):
+        self.register_conductors()
+        ring1 = self.ring_manager['driver1']
+        ring2 = self.ring_manager['driver2']
+
+        self.dbapi.register_conductor({
+            'hostname': 'host3',
+            'drivers': ['driver1'],
+        })
+        self.ring_manager.reset()
+
+        new_ring1 = self.ring_manager['driver1']
+        self.assertIsNot(ring1, new_ring1)
+        self.assertEqual(sorted(['host1', 'host2', 'host3']),
+                         sorted(new_ring1.hosts))
+        self.assertIs(ring2, self.ring_manager['driver2'])
@@ -91,6 +91,24 @@ class HttpImageServiceTestCase(base.TestCase):
         self._test_show(mtime='Tue Nov 15 08:12:31 2014',
                         mtime_date=datetime.datetime(2014, 11, 15, 8, 12, 31))
 
+    @mock.patch.object(requests, 'head', autospec=True)
+    def test_show_cached(self, head_mock):
+        self.config(image_metadata_cache_ttl=60)
+        head_mock.return_value.status_code = http_client.OK
+        head_mock.return_value.headers = {'Content-Length': 100}
+        with mock.patch.object(image_service, 'METADATA_CACHE',
+                               image_service.ImageMetadataCache()):
+            result = self.service.show(self.href)
+            result['properties']['foo'] = 'bar'
+            self.assertEqual({'size': 100, 'updated_at': None,
+                              'properties': {}},
+                             self.service.show(self.href))
+            head_mock.assert_called_once_with(self.href)
+
+            image_service.METADATA_CACHE.invalidate(self.href)
+            self.service.show(self.href)
+            self.assertEqual(2, head_mock.call_count)
+
     @mock.patch.object(requests, 'head', autospec=True)
     def test_show_no_content_length(self, head_mock):
         head_mock.return_value.status_code = http_client.OK
@@ -133,6 +151,49 @@ class HttpImageServiceTestCase(base.TestCase):
         req_get_mock.assert_called_once_with(self.href, stream=True)
 
 
+@mock.patch.object(image_service.time, 'time', autospec=True)
+class ImageMetadataCacheTestCase(base.TestCase):
+    def setUp(self):
+        super(ImageMetadataCacheTestCase, self).setUp()
+        self.cache = image_service.ImageMetadataCache()
+        self.config(image_metadata_cache_ttl=60)
+
+    def test_get(self, time_mock):
+        time_mock.return_value = 1000
+        self.assertIsNone(self.cache.get('href'))
+        self.cache.set('href', {'checksum': 'fake'})
+        self.assertEqual({'checksum': 'fake'}, self.cache.get('href'))
+
+    def test_get_expired(self, time_mock):
+        time_mock.return_value = 1000
+        self.cache.set('href', {})
+        time_mock.return_value = 1061
+        self.assertIsNone(self.cache.get('href'))
+        self.assertNotIn('href', self.cache._entries)
+
+    def test_disabled(self, time_mock):
+        time_mock.return_value = 1000
+        self.config(image_metadata_cache_ttl=0)
+        self.cache.set('href', {})
+        self.assertIsNone(self.cache.get('href'))
+        self.assertEqual({}, self.cache._entries)
+
+    def test_invalidate(self, time_mock):
+        time_mock.return_value = 1000
+        self.cache.set('href', {})
+        self.cache.invalidate('href')
+        self.cache.invalidate('unknown')
+        self.assertIsNone(self.cache.get('href'))
+
+    @mock.patch.object(image_service, 'MAX_CACHED_METADATA', 2)
+    def test_set_evicts_oldest(self, time_mock):
+        time_mock.return_value = 1000
+        for href in ('a', 'b', 'c'):
+            self.cache.set(href, {})
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual({}, self.cache.get('c'))
+
+
 class FileImageServiceTestCase(base.TestCase):
     def setUp(self):
         super(FileImageServiceTestCase, self).setUp()
@@ -87,6 +87,27 @@ class IronicImagesTestCase(base.TestCase):
         image_service_mock.return_value.download.assert_called_once_with(
             'image_href', 'file')
 
+    @mock.patch.object(image_service, 'get_image_service', autospec=True)
+    @mock.patch.object(__builtin__, 'open', autospec=True)
+    def test_fetch_image_service_progress(self, open_mock,
+                                          image_service_mock):
+        mock_file_handle = mock.MagicMock(spec=file)
+        image_file = mock_file_handle.__enter__.return_value
+        open_mock.return_value = mock_file_handle
+        progress = mock.Mock()
+
+        def _download(image_href, image_file):
+            image_file.write(b'chunk')
+            image_file.flush()
+
+        image_service_mock.return_value.download.side_effect = _download
+
+        images.fetch('context', 'image_href', 'path', progress=progress)
+
+        progress.assert_called_once_with(5)
+        image_file.write.assert_called_once_with(b'chunk')
+        image_file.flush.assert_called_once_with()
+
     @mock.patch.object(image_service, 'get_image_service', autospec=True)
     @mock.patch.object(images, 'image_to_raw', autospec=True)
     @mock.patch.object(__builtin__, 'open', autospec=True)
@@ -0,0 +1,39 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from ironic.common import stats
+from ironic.tests import base
+
+
+class StatsTestCase(base.TestCase):
+
+    def setUp(self):
+        super(StatsTestCase, self).setUp()
+        providers_patch = mock.patch.dict(stats._providers, clear=True)
+        providers_patch.start()
+        self.addCleanup(providers_patch.stop)
+
+    def test_get_stats(self):
+        stats.register('b', lambda: {'count': 2})
+        stats.register('a', lambda: {'count': 1})
+        self.assertEqual([('a', {'count': 1}), ('b', {'count': 2})],
+                         stats.get_stats())
+
+    def test_register_replaces(self):
+        stats.register('a', lambda: 1)
+        stats.register('a', lambda: 2)
+        self.assertEqual([('a', 2)], stats.get_stats())
+
+    def test_get_stats_none_registered(self):
+        self.assertEqual([], stats.get_stats())
@@ -21,6 +21,7 @@
 import datetime
 
 import eventlet
+from eventlet import greenpool
 import mock
 from oslo_config import cfg
 from oslo_db import exception as db_exception
@@ -33,6 +34,7 @@ from ironic.common import driver_factory
 from ironic.common import exception
 from ironic.common import images
 from ironic.common import states
+from ironic.common import stats
 from ironic.common import swift
 from ironic.conductor import manager
 from ironic.conductor import task_manager
@@ -82,6 +84,16 @@ class _CommonMixIn(object):
             nodes = [nodes]
         return [tuple(getattr(n, c) for c in self.columns) for n in nodes]
 
+    def _mock_uuid_hash_ranges(self):
+        """Mock the node uuid hash ranges of the service.
+
+        :returns: the uuid_hash_ranges filter expected in node queries.
+        """
+        hash_ranges = {'fake': [(0, 2 ** 31 - 1)]}
+        self.service._get_uuid_hash_ranges = mock.Mock(
+            return_value=hash_ranges)
+        return hash_ranges
+
     def _get_acquire_side_effect(self, task_infos):
         """Helper method to generate a task_manager.acquire() side effect.
 
@@ -2151,6 +2163,28 @@ class MiscTestCase(_ServiceSetUpMixin, _CommonMixIn, tests_db_base.DbTestCase):
 
                                                                 'otherdriver'))
 
+    @mock.patch.object(stats, 'get_stats', autospec=True)
+    @mock.patch.object(manager, 'LOG', autospec=True)
+    def test__log_stats(self, log_mock, stats_mock):
+        self.config(log_stats_interval=60, group='conductor')
+        self._start_service()
+        stats_mock.return_value = [
+            ('image_downloads', {'completed': 1}),
+            ('power_transition_latencies', {states.POWER_ON: {1: 2}})]
+        self.service._log_stats(self.context)
+        self.assertEqual(
+            [mock.call(mock.ANY, {'name': 'image_downloads',
+                                  'stats': {'completed': 1}}),
+             mock.call(mock.ANY, {'name': 'power_transition_latencies',
+                                  'stats': {states.POWER_ON: {1: 2}}})],
+            log_mock.debug.call_args_list)
+
+    @mock.patch.object(stats, 'get_stats', autospec=True)
+    def test__log_stats_disabled(self, stats_mock):
+        self._start_service()
+        self.service._log_stats(self.context)
+        self.assertFalse(stats_mock.called)
+
     @mock.patch.object(images, 'is_whole_disk_image')
     def test_validate_driver_interfaces(self, mock_iwdi):
         mock_iwdi.return_value = False
@@ -2197,12 +2231,17 @@ class MiscTestCase(_ServiceSetUpMixin, _CommonMixIn, tests_db_base.DbTestCase):
         mock_nodeinfo_list.return_value = self._get_nodeinfo_list_response(
             nodes)
         mock_mapped.side_effect = [True, False]
+        filters = {'reserved': False}
 
         result = list(self.service.iter_nodes(fields=['id'],
-                                              filters=mock.sentinel.filters))
+                                              filters=filters))
         self.assertEqual([(nodes[0].uuid, 'fake', 0)], result)
         mock_nodeinfo_list.assert_called_once_with(
-            columns=self.columns, filters=mock.sentinel.filters)
+            columns=self.columns,
+            filters={'reserved': False,
+                     'uuid_hash_ranges': {'fake': [(0, 2 ** 31 - 1)]}})
+        # the filters of the caller are left untouched
+        self.assertEqual({'reserved': False}, filters)
         mock_fail_if_state.assert_called_once_with(
             mock.ANY, mock.ANY,
             {'provision_state': 'deploying', 'reserved': False},
@@ -2620,6 +2659,120 @@ class UpdatePortTestCase(_ServiceSetUpMixin, tests_db_base.DbTestCase):
         self.assertFalse(get_sensors_data_mock.called)
         self.assertFalse(validate_mock.called)
 
+    @mock.patch.object(manager.ConductorManager, '_get_sensor_data_message',
+                       autospec=True)
+    @mock.patch.object(manager.ConductorManager, 'iter_nodes', autospec=True)
+    def test___send_sensor_data_parallel(self, iter_nodes_mock,
+                                         get_message_mock):
+        self._start_service()
+        CONF.set_override('send_sensor_data', True, group='conductor')
+        self.config(send_sensor_data_workers=3, group='conductor')
+        nodes = [('uuid%d' % i, 'fake', 'instance%d' % i) for i in range(5)]
+        iter_nodes_mock.return_value = nodes
+        get_message_mock.side_effect = (
+            lambda self, context, node_uuid, driver, instance_uuid:
+            {'node_uuid': node_uuid, 'payload': {}})
+
+        with mock.patch.object(greenpool, 'GreenPool',
+                               wraps=greenpool.GreenPool) as pool_mock:
+            with mock.patch.object(self.service,
+                                   'notifier') as notifier_mock:
+                self.service._send_sensor_data(self.context)
+        pool_mock.assert_called_once_with(size=3)
+
+        get_message_mock.assert_has_calls(
+            [mock.call(self.service, self.context, *n) for n in nodes],
+            any_order=True)
+        self.assertEqual(
+            [mock.call(self.context, 'hardware.ipmi.metrics',
+                       {'node_uuid': n[0], 'payload': {}}) for n in nodes],
+            notifier_mock.info.call_args_list)
+
+    @mock.patch.object(manager.ConductorManager, '_get_sensor_data_message',
+                       autospec=True)
+    @mock.patch.object(manager.ConductorManager, 'iter_nodes', autospec=True)
+    def test___send_sensor_data_batch(self, iter_nodes_mock,
+                                      get_message_mock):
+        self._start_service()
+        CONF.set_override('send_sensor_data', True, group='conductor')
+        self.config(send_sensor_data_batch_size=2, group='conductor')
+        iter_nodes_mock.return_value = [
+            ('uuid%d' % i, 'fake', 'instance%d' % i) for i in range(3)]
+        messages = [{'node_uuid': 'uuid%d' % i, 'payload': {}}
+                    for i in range(3)]
+        get_message_mock.side_effect = messages
+
+        with mock.patch.object(self.service, 'notifier') as notifier_mock:
+            self.service._send_sensor_data(self.context)
+
+        self.assertEqual(2, notifier_mock.info.call_count)
+        payloads = [c[0][2]['payload']
+                    for c in notifier_mock.info.call_args_list]
+        self.assertEqual([messages[:2], messages[2:]], payloads)
+        for call in notifier_mock.info.call_args_list:
+            self.assertEqual('hardware.ipmi.metrics.update',
+                             call[0][2]['event_type'])
+
+    @mock.patch.object(manager.ConductorManager, '_get_sensor_data_message',
+                       autospec=True)
+    @mock.patch.object(manager.ConductorManager, 'iter_nodes', autospec=True)
+    def test___send_sensor_data_skip_unchanged(self, iter_nodes_mock,
+                                               get_message_mock):
+        self._start_service()
+        CONF.set_override('send_sensor_data', True, group='conductor')
+        self.config(send_sensor_data_skip_unchanged=True, group='conductor')
+        iter_nodes_mock.return_value = [('uuid1', 'fake', 'instance1'),
+                                        ('uuid2', 'fake', 'instance2')]
+        get_message_mock.side_effect = [
+            {'node_uuid': 'uuid1', 'payload': {'t1': {'f1': 'v1'}}},
+            {'node_uuid': 'uuid2', 'payload': {'t1': {'f1': 'v1'}}},
+            {'node_uuid': 'uuid1', 'payload': {'t1': {'f1': 'v1'}}},
+            {'node_uuid': 'uuid2', 'payload': {'t1': {'f1': 'v2'}}},
+        ]
+
+        with mock.patch.object(self.service, 'notifier') as notifier_mock:
+            self.service._send_sensor_data(self.context)
+            self.assertEqual(2, notifier_mock.info.call_count)
+            notifier_mock.info.reset_mock()
+
+            self.service._send_sensor_data(self.context)
+            notifier_mock.info.assert_called_once_with(
+                self.context, 'hardware.ipmi.metrics',
+                {'node_uuid': 'uuid2', 'payload': {'t1': {'f1': 'v2'}}})
+        self.assertEqual(['uuid1', 'uuid2'],
+                         sorted(self.service.sensor_data_sent))
+
+    @mock.patch.object(task_manager, 'acquire', autospec=True)
+    def test__get_sensor_data_message(self, acquire_mock):
+        acquire_mock.return_value.__enter__.return_value.driver = self.driver
+        with mock.patch.object(self.driver.management, 'get_sensors_data',
+                               autospec=True) as get_sensors_data_mock:
+            with mock.patch.object(self.driver.management, 'validate',
+                                   autospec=True):
+                get_sensors_data_mock.return_value = {'t1': {'f1': 'v1'}}
+                message = self.service._get_sensor_data_message(
+                    self.context, 'fake_uuid1', 'fake', 'fake_uuid2')
+
+        self.assertEqual('fake_uuid1', message['node_uuid'])
+        self.assertEqual('fake_uuid2', message['instance_uuid'])
+        self.assertEqual({'t1': {'f1': 'v1'}}, message['payload'])
+
+    @mock.patch.object(task_manager, 'acquire', autospec=True)
+    def test__get_sensor_data_message_timeout(self, acquire_mock):
+        self.config(send_sensor_data_wait_timeout=1, group='conductor')
+        acquire_mock.return_value.__enter__.return_value.driver = self.driver
+
+        def slow_get_sensors_data(task):
+            eventlet.sleep(10)
+
+        with mock.patch.object(self.driver.management, 'get_sensors_data',
+                               autospec=True) as get_sensors_data_mock:
+            with mock.patch.object(self.driver.management, 'validate',
+                                   autospec=True):
+                get_sensors_data_mock.side_effect = slow_get_sensors_data
+                self.assertIsNone(self.service._get_sensor_data_message(
+                    self.context, 'fake_uuid1', 'fake', 'fake_uuid2'))
+
     def test_set_boot_device(self):
         node = obj_utils.create_test_node(self.context, driver='fake')
         with mock.patch.object(self.driver.management, 'validate') as mock_val:
@@ -2841,6 +2994,25 @@ class ManagerDoSyncPowerStateTestCase(tests_db_base.DbTestCase):
         self.assertEqual(1,
                          self.service.power_state_sync_count[self.node.uuid])
 
+    def test_queried_state(self, node_power_action):
+        self.node.power_state = states.POWER_ON
+        count = manager.do_sync_power_state(self.task, 0,
+                                            queried_state=states.POWER_ON)
+
+        self.assertEqual(0, count)
+        self.assertFalse(self.power.get_power_state.called)
+        self.assertFalse(self.task.upgrade_lock.called)
+
+    def test_queried_state_exception(self, node_power_action):
+        self.node.power_state = states.POWER_ON
+        count = manager.do_sync_power_state(
+            self.task, 0, queried_state=exception.IronicException('foo'))
+
+        self.assertEqual(1, count)
+        self.assertFalse(self.power.get_power_state.called)
+        self.assertFalse(self.node.save.called)
+        self.assertFalse(node_power_action.called)
+
     def test_get_power_state_error(self, node_power_action):
         self._do_sync_power_state('fake', states.ERROR)
         self.assertFalse(self.power.validate.called)
@@ -3014,7 +3186,8 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self.service = manager.ConductorManager('hostname', 'test-topic')
         self.service.dbapi = self.dbapi
         self.node = self._create_node()
-        self.filters = {'reserved': False, 'maintenance': False}
+        self.filters = {'reserved': False, 'maintenance': False,
+                        'uuid_hash_ranges': self._mock_uuid_hash_ranges()}
         self.columns = ['uuid', 'driver', 'id']
 
     def test_node_not_mapped(self, get_nodeinfo_mock,
@@ -3044,83 +3217,18 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
             columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_in_deploywait_on_acquire(self, get_nodeinfo_mock,
-                                           mapped_mock, acquire_mock,
-                                           sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        mapped_mock.return_value = True
-        task = self._create_task(
-            node_attrs=dict(provision_state=states.DEPLOYWAIT,
-                            target_provision_state=states.ACTIVE,
-                            uuid=self.node.uuid))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_in_enroll_on_acquire(self, get_nodeinfo_mock, mapped_mock,
-                                       acquire_mock, sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        mapped_mock.return_value = True
-        task = self._create_task(
-            node_attrs=dict(provision_state=states.ENROLL,
-                            target_provision_state=states.NOSTATE,
-                            uuid=self.node.uuid))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
+        acquire_mock.assert_called_once_with(
+            self.context, self.node.uuid, purpose=mock.ANY, shared=True,
+            filters=manager.SYNC_POWER_STATE_FILTERS)
         self.assertFalse(sync_mock.called)
 
-    def test_node_in_power_transition_on_acquire(self, get_nodeinfo_mock,
+    def test_node_filters_not_matched_on_acquire(self, get_nodeinfo_mock,
                                                  mapped_mock, acquire_mock,
                                                  sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
         mapped_mock.return_value = True
-        task = self._create_task(
-            node_attrs=dict(target_power_state=states.POWER_ON,
-                            uuid=self.node.uuid))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
-
-        self.service._sync_power_states(self.context)
-
-        get_nodeinfo_mock.assert_called_once_with(
-            columns=self.columns, filters=self.filters)
-        mapped_mock.assert_called_once_with(self.node.uuid,
-                                            self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
-        self.assertFalse(sync_mock.called)
-
-    def test_node_in_maintenance_on_acquire(self, get_nodeinfo_mock,
-                                            mapped_mock, acquire_mock,
-                                            sync_mock):
-        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
-        mapped_mock.return_value = True
-        task = self._create_task(
-            node_attrs=dict(maintenance=True, uuid=self.node.uuid))
-        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        acquire_mock.side_effect = exception.NodeFiltersNotMatched(
+            node=self.node.uuid, filters=manager.SYNC_POWER_STATE_FILTERS)
 
         self.service._sync_power_states(self.context)
 
@@ -3128,9 +3236,9 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
             columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
+        acquire_mock.assert_called_once_with(
+            self.context, self.node.uuid, purpose=mock.ANY, shared=True,
+            filters=manager.SYNC_POWER_STATE_FILTERS)
         self.assertFalse(sync_mock.called)
 
     def test_node_disappears_on_acquire(self, get_nodeinfo_mock,
@@ -3146,9 +3254,9 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
             columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
+        acquire_mock.assert_called_once_with(
+            self.context, self.node.uuid, purpose=mock.ANY, shared=True,
+            filters=manager.SYNC_POWER_STATE_FILTERS)
         self.assertFalse(sync_mock.called)
 
     def test_single_node(self, get_nodeinfo_mock,
@@ -3164,9 +3272,9 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
             columns=self.columns, filters=self.filters)
         mapped_mock.assert_called_once_with(self.node.uuid,
                                             self.node.driver)
-        acquire_mock.assert_called_once_with(self.context, self.node.uuid,
-                                             purpose=mock.ANY,
-                                             shared=True)
+        acquire_mock.assert_called_once_with(
+            self.context, self.node.uuid, purpose=mock.ANY, shared=True,
+            filters=manager.SYNC_POWER_STATE_FILTERS)
         sync_mock.assert_called_once_with(task, mock.ANY)
 
     def test__sync_power_state_multiple_nodes(self, get_nodeinfo_mock,
@@ -3175,9 +3283,9 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         # Create 8 nodes:
         # 1st node: Should acquire and try to sync
         # 2nd node: Not mapped to this conductor
-        # 3rd node: In DEPLOYWAIT provision_state
-        # 4th node: In maintenance mode
-        # 5th node: Is in power transition
+        # 3rd node: In DEPLOYWAIT provision_state, filtered out on acquire
+        # 4th node: In maintenance mode, filtered out on acquire
+        # 5th node: Is in power transition, filtered out on acquire
         # 6th node: Disappears after getting nodeinfo list
         # 7th node: Should acquire and try to sync
         # 8th node: do_sync_power_state raises NodeLocked
@@ -3202,6 +3310,11 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
         tasks = [self._create_task(node_attrs=node_attrs[x.uuid])
                  for x in nodes if x.id != 2]
+        # filtered out during acquire (1-3 = indexes of Node3-5 after
+        # removing Node2)
+        for i in range(1, 4):
+            tasks[i] = exception.NodeFiltersNotMatched(
+                node=i + 2, filters=manager.SYNC_POWER_STATE_FILTERS)
         # not found during acquire (4 = index of Node6 after removing Node2)
         tasks[4] = exception.NodeNotFound(node=6)
         sync_results = [0] * 7 + [exception.NodeLocked(node=8, host='')]
@@ -3224,7 +3337,8 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
         self.assertEqual(mapped_calls, mapped_mock.call_args_list)
         acquire_calls = [mock.call(self.context, x.uuid,
                                    purpose=mock.ANY,
-                                   shared=True)
+                                   shared=True,
+                                   filters=manager.SYNC_POWER_STATE_FILTERS)
                          for x in nodes if x.id != 2]
         self.assertEqual(acquire_calls, acquire_mock.call_args_list)
         # Nodes 1 and 7 (5 = index of Node7 after removing Node2)
@@ -3232,6 +3346,259 @@ class ManagerSyncPowerStatesTestCase(_CommonMixIn, tests_db_base.DbTestCase):
                       mock.call(tasks[5], mock.ANY)]
         self.assertEqual(sync_calls, sync_mock.call_args_list)
 
+    def test_parallel_multiple_nodes(self, get_nodeinfo_mock,
+                                     mapped_mock, acquire_mock, sync_mock):
+        self.config(sync_power_state_workers=3, group='conductor')
+        nodes = [self._create_node(id=i, uuid=uuidutils.generate_uuid())
+                 for i in range(1, 6)]
+        tasks = [self._create_task(node=n) for n in nodes]
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(nodes))
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+        sync_mock.return_value = 0
+
+        with mock.patch.object(greenpool, 'GreenPool',
+                               wraps=greenpool.GreenPool) as pool_mock:
+            self.service._sync_power_states(self.context)
+            pool_mock.assert_called_once_with(size=3)
+
+        acquire_calls = [mock.call(self.context, x.uuid,
+                                   purpose=mock.ANY,
+                                   shared=True,
+                                   filters=manager.SYNC_POWER_STATE_FILTERS)
+                         for x in nodes]
+        self.assertEqual(acquire_calls, acquire_mock.call_args_list)
+        sync_calls = [mock.call(t, mock.ANY) for t in tasks]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
+
+    def test_parallel_unexpected_error(self, get_nodeinfo_mock,
+                                       mapped_mock, acquire_mock, sync_mock):
+        self.config(sync_power_state_workers=2, group='conductor')
+        nodes = [self._create_node(id=i, uuid=uuidutils.generate_uuid())
+                 for i in range(1, 3)]
+        tasks = [self._create_task(node=n) for n in nodes]
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(nodes))
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+        sync_mock.side_effect = [RuntimeError('boom'), 0]
+
+        self.service._sync_power_states(self.context)
+
+        # A failure on one node does not prevent syncing the others
+        sync_calls = [mock.call(t, mock.ANY) for t in tasks]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
+
+    def test_serial_unexpected_error(self, get_nodeinfo_mock,
+                                     mapped_mock, acquire_mock, sync_mock):
+        self.config(sync_power_state_workers=1, group='conductor')
+        nodes = [self._create_node(id=i, uuid=uuidutils.generate_uuid())
+                 for i in range(1, 3)]
+        tasks = [self._create_task(node=n) for n in nodes]
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(nodes))
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(tasks)
+        sync_mock.side_effect = [RuntimeError('boom'), 0]
+
+        self.service._sync_power_states(self.context)
+
+        # A failure on one node does not abort the sync of the others
+        sync_calls = [mock.call(t, mock.ANY) for t in tasks]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
+
+    @mock.patch.object(manager, 'time')
+    def test_timeout_exceeded(self, time_mock, get_nodeinfo_mock,
+                              mapped_mock, acquire_mock, sync_mock):
+        self.config(sync_power_state_timeout=10, group='conductor')
+        nodes = [self._create_node(id=i, uuid=uuidutils.generate_uuid())
+                 for i in range(1, 4)]
+        task = self._create_task(node=nodes[0])
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(nodes))
+        mapped_mock.return_value = True
+        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        # deadline is set at 0, then each node is checked against it
+        time_mock.time.side_effect = [0, 5, 11, 12]
+
+        self.service._sync_power_states(self.context)
+
+        acquire_mock.assert_called_once_with(
+            self.context, nodes[0].uuid, purpose=mock.ANY, shared=True,
+            filters=manager.SYNC_POWER_STATE_FILTERS)
+        sync_mock.assert_called_once_with(task, mock.ANY)
+
+
+@mock.patch.object(manager, 'do_sync_power_state')
+@mock.patch.object(task_manager, 'acquire_many')
+@mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
+@mock.patch.object(dbapi.IMPL, 'get_nodeinfo_list')
+class ManagerSyncPowerStatesBatchTestCase(_CommonMixIn,
+                                          tests_db_base.DbTestCase):
+    def setUp(self):
+        super(ManagerSyncPowerStatesBatchTestCase, self).setUp()
+        self.service = manager.ConductorManager('hostname', 'test-topic')
+        self.service.dbapi = self.dbapi
+        self._mock_uuid_hash_ranges()
+        self.columns = ['uuid', 'driver', 'id']
+        self.config(sync_power_state_batch_size=2, group='conductor')
+        self.power = mock.Mock(spec_set=['get_power_state_many', 'validate'])
+        self.service._get_driver = mock.Mock(
+            return_value=mock.Mock(power=self.power))
+        self.nodes = [self._create_node(id=i, driver='fake',
+                                        uuid=uuidutils.generate_uuid())
+                      for i in range(1, 4)]
+        self.tasks = []
+        for node in self.nodes:
+            task = mock.Mock(spec_set=['node', 'driver', 'upgrade_lock'])
+            task.node = node
+            task.driver.power = self.power
+            self.tasks.append(task)
+
+    def _acquire_many(self, tasks):
+        tasks = dict((task.node.uuid, task) for task in tasks)
+
+        def _acquire(context, node_ids, **kwargs):
+            task_mgr = mock.MagicMock()
+            task_mgr.__enter__.return_value = [tasks[node_id]
+                                               for node_id in node_ids
+                                               if node_id in tasks]
+            return task_mgr
+        return _acquire
+
+    def test_batches(self, get_nodeinfo_mock, mapped_mock,
+                     acquire_many_mock, sync_mock):
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(self.nodes))
+        mapped_mock.return_value = True
+        acquire_many_mock.side_effect = self._acquire_many(self.tasks)
+        self.power.get_power_state_many.side_effect = [
+            {self.nodes[0].uuid: states.POWER_ON,
+             self.nodes[1].uuid: states.POWER_OFF},
+            {self.nodes[2].uuid: states.POWER_ON}]
+        sync_mock.return_value = 0
+
+        self.service._sync_power_states(self.context)
+
+        acquire_calls = [
+            mock.call(self.context, [self.nodes[0].uuid, self.nodes[1].uuid],
+                      purpose=mock.ANY, shared=True,
+                      filters=manager.SYNC_POWER_STATE_FILTERS),
+            mock.call(self.context, [self.nodes[2].uuid],
+                      purpose=mock.ANY, shared=True,
+                      filters=manager.SYNC_POWER_STATE_FILTERS)]
+        self.assertEqual(acquire_calls, acquire_many_mock.call_args_list)
+        self.assertEqual(
+            [mock.call(self.tasks[:2]), mock.call(self.tasks[2:])],
+            self.power.get_power_state_many.call_args_list)
+        sync_calls = [
+            mock.call(self.tasks[0], 0, queried_state=states.POWER_ON),
+            mock.call(self.tasks[1], 0, queried_state=states.POWER_OFF),
+            mock.call(self.tasks[2], 0, queried_state=states.POWER_ON)]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
+
+    def test_no_bulk_support(self, get_nodeinfo_mock, mapped_mock,
+                             acquire_many_mock, sync_mock):
+        self.service._get_driver.return_value = mock.Mock(
+            power=mock.Mock(spec_set=['get_power_state']))
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(self.nodes[0]))
+        mapped_mock.return_value = True
+        task = self._create_task(node=self.nodes[0])
+        sync_mock.return_value = 0
+
+        with mock.patch.object(task_manager, 'acquire',
+                               autospec=True) as acquire_mock:
+            acquire_mock.side_effect = self._get_acquire_side_effect(task)
+            self.service._sync_power_states(self.context)
+            self.assertEqual(1, acquire_mock.call_count)
+
+        self.assertFalse(acquire_many_mock.called)
+        sync_mock.assert_called_once_with(task, 0)
+
+    def test_invalid_node_not_queried(self, get_nodeinfo_mock, mapped_mock,
+                                      acquire_many_mock, sync_mock):
+        self.config(sync_power_state_batch_size=3, group='conductor')
+        self.nodes[0].power_state = None
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(self.nodes))
+        mapped_mock.return_value = True
+        # The last node was locked or deleted meanwhile
+        acquire_many_mock.side_effect = self._acquire_many(self.tasks[:2])
+        self.power.validate.side_effect = exception.InvalidParameterValue('x')
+        self.power.get_power_state_many.return_value = {
+            self.nodes[1].uuid: states.POWER_ON}
+        sync_mock.return_value = 0
+
+        self.service._sync_power_states(self.context)
+
+        self.power.validate.assert_called_once_with(self.tasks[0])
+        self.power.get_power_state_many.assert_called_once_with(
+            [self.tasks[1]])
+        sync_calls = [
+            mock.call(self.tasks[0], 0, queried_state=None),
+            mock.call(self.tasks[1], 0, queried_state=states.POWER_ON)]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
+
+    def test_sync_failures(self, get_nodeinfo_mock, mapped_mock,
+                           acquire_many_mock, sync_mock):
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(self.nodes[:2]))
+        mapped_mock.return_value = True
+        acquire_many_mock.side_effect = self._acquire_many(self.tasks)
+        self.power.get_power_state_many.return_value = {}
+        sync_mock.side_effect = [exception.NodeLocked(node='x', host='y'), 2]
+
+        self.service._sync_power_states(self.context)
+
+        self.assertEqual(2, sync_mock.call_count)
+        self.assertEqual({self.nodes[1].uuid: 2},
+                         dict(self.service.power_state_sync_count))
+
+    def test_bulk_query_error(self, get_nodeinfo_mock, mapped_mock,
+                              acquire_many_mock, sync_mock):
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(self.nodes[:2]))
+        mapped_mock.return_value = True
+        acquire_many_mock.side_effect = self._acquire_many(self.tasks)
+        error = RuntimeError('boom')
+        self.power.get_power_state_many.side_effect = error
+        sync_mock.side_effect = [1, 3]
+
+        self.service._sync_power_states(self.context)
+
+        sync_calls = [mock.call(task, 0, queried_state=error)
+                      for task in self.tasks[:2]]
+        self.assertEqual(sync_calls, sync_mock.call_args_list)
+        self.assertEqual({self.nodes[0].uuid: 1, self.nodes[1].uuid: 3},
+                         dict(self.service.power_state_sync_count))
+
+    @mock.patch.object(manager, 'time')
+    def test_timeout_exceeded_partial_batch(self, time_mock,
+                                            get_nodeinfo_mock, mapped_mock,
+                                            acquire_many_mock, sync_mock):
+        self.config(sync_power_state_timeout=10, group='conductor')
+        get_nodeinfo_mock.return_value = (
+            self._get_nodeinfo_list_response(self.nodes))
+        mapped_mock.return_value = True
+        acquire_many_mock.side_effect = self._acquire_many(self.tasks)
+        self.power.get_power_state_many.return_value = {}
+        sync_mock.return_value = 0
+        # deadline is set at 0, then each node and the partial batch left
+        # after the loop are checked against it
+        time_mock.time.side_effect = [0, 1, 2, 3, 11]
+
+        with mock.patch.object(manager, 'LOG', autospec=True) as log_mock:
+            self.service._sync_power_states(self.context)
+
+        acquire_many_mock.assert_called_once_with(
+            self.context, [self.nodes[0].uuid, self.nodes[1].uuid],
+            purpose=mock.ANY, shared=True,
+            filters=manager.SYNC_POWER_STATE_FILTERS)
+        self.assertEqual(2, sync_mock.call_count)
+        self.assertEqual(1, log_mock.warning.call_args[0][1]['count'])
+
 
 @mock.patch.object(task_manager, 'acquire')
 @mock.patch.object(manager.ConductorManager, '_mapped_to_this_conductor')
@@ -3254,7 +3621,8 @@ class ManagerCheckDeployTimeoutsTestCase(_CommonMixIn,
 
         self.filters = {'reserved': False, 'maintenance': False,
                         'provisioned_before': 300,
-                        'provision_state': states.DEPLOYWAIT}
+                        'provision_state': states.DEPLOYWAIT,
+                        'uuid_hash_ranges': self._mock_uuid_hash_ranges()}
         self.columns = ['uuid', 'driver']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
@@ -3618,7 +3986,8 @@ class ManagerSyncLocalStateTestCase(_CommonMixIn, tests_db_base.DbTestCase):
 
         self.filters = {'reserved': False,
                         'maintenance': False,
-                        'provision_state': states.ACTIVE}
+                        'provision_state': states.ACTIVE,
+                        'uuid_hash_ranges': self._mock_uuid_hash_ranges()}
         self.columns = ['uuid', 'driver', 'id', 'conductor_affinity']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
@@ -3955,7 +4324,8 @@ class ManagerCheckInspectTimeoutsTestCase(_CommonMixIn,
 
         self.filters = {'reserved': False,
                         'inspection_started_before': 300,
-                        'provision_state': states.INSPECTING}
+                        'provision_state': states.INSPECTING,
+                        'uuid_hash_ranges': self._mock_uuid_hash_ranges()}
         self.columns = ['uuid', 'driver']
 
     def _assert_get_nodeinfo_args(self, get_nodeinfo_mock):
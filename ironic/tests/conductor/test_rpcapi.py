@@ -91,6 +91,20 @@ class RPCAPITestCase(base.DbTestCase):
         self.assertEqual(expected_topic,
                          rpcapi.get_topic_for(self.fake_node_obj))
 
+    def test_get_topic_for_uses_cached_rings(self):
+        CONF.set_override('host', 'fake-host')
+        self.dbapi.register_conductor({'hostname': 'fake-host',
+                                       'drivers': ['fake-driver']})
+
+        rpcapi = conductor_rpcapi.ConductorAPI(topic='fake-topic')
+        with mock.patch.object(self.dbapi, 'get_active_driver_dict',
+                               wraps=self.dbapi.get_active_driver_dict
+                               ) as mock_get_dict:
+            for i in range(3):
+                self.assertEqual('fake-topic.fake-host',
+                                 rpcapi.get_topic_for(self.fake_node_obj))
+            self.assertEqual(1, mock_get_dict.call_count)
+
     def test_get_topic_for_driver_known_driver(self):
         CONF.set_override('host', 'fake-host')
         self.dbapi.register_conductor({
@@ -169,6 +169,42 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         self.assertFalse(release_mock.called)
         self.assertFalse(node_get_mock.called)
 
+    def test_excl_lock_with_filters(self, get_ports_mock, get_driver_mock,
+                                    reserve_mock, release_mock,
+                                    node_get_mock):
+        reserve_mock.return_value = self.node
+        filters = {'maintenance': False}
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      filters=filters) as task:
+            self.assertEqual(self.node, task.node)
+            self.assertFalse(task.shared)
+
+        reserve_mock.assert_called_once_with(self.context, self.host,
+                                             'fake-node-id', filters=filters)
+        release_mock.assert_called_once_with(self.context, self.host,
+                                             self.node.id)
+        self.assertFalse(node_get_mock.called)
+
+    def test_excl_lock_filters_not_matched(self, get_ports_mock,
+                                           get_driver_mock, reserve_mock,
+                                           release_mock, node_get_mock):
+        self.config(node_locked_retry_attempts=3, group='conductor')
+        filters = {'maintenance': False}
+        reserve_mock.side_effect = exception.NodeFiltersNotMatched(
+            node='fake-node-id', filters=filters)
+
+        self.assertRaises(exception.NodeFiltersNotMatched,
+                          task_manager.TaskManager,
+                          self.context,
+                          'fake-node-id',
+                          filters=filters)
+
+        # not retried, unlike NodeLocked
+        reserve_mock.assert_called_once_with(self.context, self.host,
+                                             'fake-node-id', filters=filters)
+        self.assertFalse(get_ports_mock.called)
+        self.assertFalse(release_mock.called)
+
     def test_excl_lock_get_ports_exception(self, get_ports_mock,
                                            get_driver_mock, reserve_mock,
                                            release_mock, node_get_mock):
@@ -225,6 +261,21 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         get_ports_mock.assert_called_once_with(self.context, self.node.id)
         get_driver_mock.assert_called_once_with(self.node.driver)
 
+    def test_shared_lock_with_filters(self, get_ports_mock, get_driver_mock,
+                                      reserve_mock, release_mock,
+                                      node_get_mock):
+        node_get_mock.return_value = self.node
+        filters = {'maintenance': False}
+        with task_manager.TaskManager(self.context, 'fake-node-id',
+                                      shared=True, filters=filters) as task:
+            self.assertEqual(self.node, task.node)
+            self.assertTrue(task.shared)
+
+        self.assertFalse(reserve_mock.called)
+        self.assertFalse(release_mock.called)
+        node_get_mock.assert_called_once_with(self.context, 'fake-node-id',
+                                              filters=filters)
+
     def test_shared_lock_with_driver(self, get_ports_mock, get_driver_mock,
                                      reserve_mock, release_mock,
                                      node_get_mock):
@@ -465,6 +516,159 @@ class TaskManagerTestCase(tests_db_base.DbTestCase):
         m.initialize.assert_called_once_with(self.node.provision_state)
 
 
+@mock.patch.object(objects.Node, 'get_many')
+@mock.patch.object(objects.Node, 'release_many')
+@mock.patch.object(objects.Node, 'reserve_many')
+@mock.patch.object(driver_factory, 'get_driver')
+@mock.patch.object(objects.Port, 'list_by_node_ids')
+class MultiNodeTaskManagerTestCase(tests_db_base.DbTestCase):
+    def setUp(self):
+        super(MultiNodeTaskManagerTestCase, self).setUp()
+        self.host = 'test-host'
+        self.config(host=self.host)
+        self.node = obj_utils.create_test_node(self.context)
+        self.node2 = obj_utils.create_test_node(
+            self.context, id=2, uuid=uuidutils.generate_uuid())
+
+    def test_excl_locks(self, get_ports_mock, get_driver_mock,
+                        reserve_mock, release_mock, node_get_mock):
+        reserve_mock.return_value = ([self.node, self.node2],
+                                     set(['locked-id']))
+        port = obj_utils.get_test_port(self.context, node_id=self.node2.id)
+        get_ports_mock.return_value = [port]
+        node_ids = [self.node.uuid, self.node2.uuid, 'locked-id']
+        with task_manager.acquire_many(self.context, node_ids,
+                                       filters={'maintenance': False}
+                                       ) as tasks:
+            self.assertEqual(2, len(tasks))
+            self.assertEqual([self.node, self.node2],
+                             [task.node for task in tasks])
+            self.assertEqual([[], [port]], [task.ports for task in tasks])
+            self.assertTrue(all(not task.shared for task in tasks))
+            self.assertEqual(set(['locked-id']), tasks.locked)
+
+        reserve_mock.assert_called_once_with(
+            self.context, self.host, node_ids,
+            filters={'maintenance': False})
+        release_mock.assert_called_once_with(
+            self.context, self.host, [self.node.id, self.node2.id])
+        self.assertEqual([None, None], [task.node for task in tasks])
+        self.assertFalse(node_get_mock.called)
+        get_ports_mock.assert_called_once_with(
+            self.context, [self.node.id, self.node2.id])
+
+    def test_excl_locks_ports_fail(self, get_ports_mock, get_driver_mock,
+                                   reserve_mock, release_mock,
+                                   node_get_mock):
+        reserve_mock.return_value = ([self.node, self.node2], set())
+        get_ports_mock.side_effect = exception.IronicException('foo')
+
+        self.assertRaises(exception.IronicException,
+                          task_manager.acquire_many, self.context,
+                          [self.node.id, self.node2.id])
+        release_mock.assert_called_once_with(
+            self.context, self.host, [self.node.id, self.node2.id])
+        self.assertFalse(get_driver_mock.called)
+
+    def test_excl_locks_task_fails(self, get_ports_mock, get_driver_mock,
+                                   reserve_mock, release_mock,
+                                   node_get_mock):
+        reserve_mock.return_value = ([self.node, self.node2], set())
+        get_driver_mock.side_effect = [
+            exception.DriverNotFound(driver_name='foo'),
+            get_driver_mock.return_value]
+
+        with mock.patch.object(objects.Node, 'release') as release_one_mock:
+            with task_manager.acquire_many(
+                    self.context, [self.node.id, self.node2.id]) as tasks:
+                self.assertEqual([self.node2],
+                                 [task.node for task in tasks])
+            # the node of the failed task was released on its own
+            release_one_mock.assert_called_once_with(
+                self.context, self.host, self.node.id)
+
+        release_mock.assert_called_once_with(self.context, self.host,
+                                             [self.node2.id])
+
+    def test_excl_locks_none_acquired(self, get_ports_mock, get_driver_mock,
+                                      reserve_mock, release_mock,
+                                      node_get_mock):
+        reserve_mock.return_value = ([], set([self.node.id]))
+        with task_manager.acquire_many(self.context,
+                                       [self.node.id]) as tasks:
+            self.assertEqual(0, len(tasks))
+            self.assertEqual(set([self.node.id]), tasks.locked)
+        self.assertFalse(release_mock.called)
+        self.assertFalse(get_ports_mock.called)
+
+    def test_shared_locks(self, get_ports_mock, get_driver_mock,
+                          reserve_mock, release_mock, node_get_mock):
+        node_get_mock.return_value = [self.node]
+        get_ports_mock.return_value = []
+        with task_manager.acquire_many(self.context,
+                                       [self.node.id, 'missing'],
+                                       shared=True) as tasks:
+            self.assertEqual([self.node], [task.node for task in tasks])
+            self.assertTrue(tasks.tasks[0].shared)
+
+        node_get_mock.assert_called_once_with(
+            self.context, [self.node.id, 'missing'], filters=None)
+        get_ports_mock.assert_called_once_with(self.context, [self.node.id])
+        self.assertFalse(reserve_mock.called)
+        self.assertFalse(release_mock.called)
+
+    def test_shared_locks_upgraded(self, get_ports_mock, get_driver_mock,
+                                   reserve_mock, release_mock,
+                                   node_get_mock):
+        node_get_mock.return_value = [self.node, self.node2]
+        with mock.patch.object(objects.Node, 'reserve') as node_reserve_mock:
+            node_reserve_mock.return_value = self.node2
+            with task_manager.acquire_many(self.context,
+                                           [self.node.id, self.node2.id],
+                                           shared=True) as tasks:
+                tasks.tasks[1].upgrade_lock()
+
+        # only the node whose lock was upgraded is released
+        release_mock.assert_called_once_with(self.context, self.host,
+                                             [self.node2.id])
+
+    def test_spawn_after(self, get_ports_mock, get_driver_mock,
+                         reserve_mock, release_mock, node_get_mock):
+        thread_mock = mock.Mock(spec_set=['link', 'cancel'])
+        spawn_mock = mock.Mock(return_value=thread_mock)
+        reserve_mock.return_value = ([self.node, self.node2], set())
+
+        with task_manager.acquire_many(
+                self.context, [self.node.id, self.node2.id]) as tasks:
+            tasks.tasks[0].spawn_after(spawn_mock, 1, foo='bar')
+
+        spawn_mock.assert_called_once_with(1, foo='bar')
+        thread_mock.link.assert_called_once_with(
+            tasks.tasks[0]._thread_release_resources)
+        # the node of the spawned task is released by its thread
+        release_mock.assert_called_once_with(self.context, self.host,
+                                             [self.node2.id])
+        self.assertEqual(self.node, tasks.tasks[0].node)
+
+    def test_spawn_after_spawn_fails(self, get_ports_mock, get_driver_mock,
+                                     reserve_mock, release_mock,
+                                     node_get_mock):
+        spawn_mock = mock.Mock(side_effect=exception.IronicException('foo'))
+        reserve_mock.return_value = ([self.node, self.node2], set())
+
+        with mock.patch.object(objects.Node, 'release') as release_one_mock:
+            def _test_it():
+                with task_manager.acquire_many(
+                        self.context, [self.node.id, self.node2.id]) as tasks:
+                    tasks.tasks[0].spawn_after(spawn_mock)
+
+            self.assertRaises(exception.IronicException, _test_it)
+            release_one_mock.assert_called_once_with(
+                self.context, self.host, self.node.id)
+        release_mock.assert_called_once_with(self.context, self.host,
+                                             [self.node2.id])
+
+
 class TaskManagerStateModelTestCases(tests_base.TestCase):
     def setUp(self):
         super(TaskManagerStateModelTestCases, self).setUp()
@@ -21,6 +21,7 @@ from ironic.common import config
 
 CONF = cfg.CONF
 CONF.import_opt('host', 'ironic.common.service')
+CONF.import_opt('image_metadata_cache_ttl', 'ironic.common.image_service')
 
 
 class ConfFixture(fixtures.Fixture):
@@ -36,5 +37,8 @@ class ConfFixture(fixtures.Fixture):
         self.conf.set_default('connection', "sqlite://", group='database')
         self.conf.set_default('sqlite_synchronous', False, group='database')
         self.conf.set_default('verbose', True)
+        # NOTE: tests enable the image metadata cache explicitly, so that
+        # the metadata cached by a test is not returned to the next ones
+        self.conf.set_default('image_metadata_cache_ttl', 0)
         config.parse_args([], default_config_files=[])
         self.addCleanup(self.conf.reset)
@@ -48,6 +48,7 @@ from oslo_utils import uuidutils
 import sqlalchemy
 import sqlalchemy.exc
 
+from ironic.common import hash_ring
 from ironic.common.i18n import _LE
 from ironic.db.sqlalchemy import migration
 from ironic.db.sqlalchemy import models
@@ -393,6 +394,35 @@ class MigrationCheckersMixin(object):
         node = nodes.select(nodes.c.uuid == uuid).execute().first()
         self.assertEqual(bigstring, node['driver'])
 
+    def _pre_upgrade_3d86a077a3f2(self, engine):
+        nodes = db_utils.get_table(engine, 'nodes')
+        data = {'uuid': uuidutils.generate_uuid()}
+        nodes.insert().execute(data)
+        return data
+
+    def _check_3d86a077a3f2(self, engine, data):
+        nodes = db_utils.get_table(engine, 'nodes')
+        col_names = [column.name for column in nodes.c]
+        self.assertIn('uuid_hash', col_names)
+        self.assertIsInstance(nodes.c.uuid_hash.type,
+                              sqlalchemy.types.Integer)
+        node = nodes.select(nodes.c.uuid == data['uuid']).execute().first()
+        self.assertEqual(hash_ring.get_uuid_hash(data['uuid']),
+                         node['uuid_hash'])
+
+    def _check_1a59178ebdf6(self, engine, data):
+        indexes = dict((index['name'], index['column_names']) for index in
+                       sqlalchemy.inspect(engine).get_indexes('nodes'))
+        self.assertEqual(['driver', 'reservation', 'maintenance'],
+                         indexes['nodes_driver_reservation_idx'])
+        self.assertEqual(['provision_state', 'reservation', 'maintenance',
+                          'provision_updated_at'],
+                         indexes['nodes_provision_state_idx'])
+        self.assertEqual(['provision_state', 'reservation',
+                          'inspection_started_at'],
+                         indexes['nodes_inspection_started_at_idx'])
+        self.assertEqual(['reservation'], indexes['nodes_reservation_idx'])
+
     def test_upgrade_and_version(self):
         with patch_with_engine(self.engine):
             self.migration_api.upgrade('head')
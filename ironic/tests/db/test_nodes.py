@@ -23,6 +23,7 @@ from oslo_utils import uuidutils
 import six
 
 from ironic.common import exception
+from ironic.common import hash_ring
 from ironic.common import states
 from ironic.tests.db import base
 from ironic.tests.db import utils
@@ -72,6 +73,42 @@ class DbNodeTestCase(base.DbTestCase):
         self.assertEqual(node.uuid, res.uuid)
         self.assertEqual(node.name, res.name)
 
+    def test_get_node_with_filters(self):
+        node = utils.create_test_node()
+        res = self.dbapi.get_node(node.uuid, filters={'maintenance': False})
+        self.assertEqual(node.id, res.id)
+        res = self.dbapi.get_node(node.id)
+        self.assertEqual(node.uuid, res.uuid)
+
+    def test_get_node_filters_not_matched(self):
+        node = utils.create_test_node(maintenance=True)
+        self.assertRaises(exception.NodeFiltersNotMatched,
+                          self.dbapi.get_node, node.uuid,
+                          filters={'maintenance': False})
+
+    def test_get_node_with_filters_not_found(self):
+        self.assertRaises(exception.NodeNotFound,
+                          self.dbapi.get_node,
+                          '12345678-9999-0000-aaaa-123456789012',
+                          filters={'maintenance': False})
+
+    def test_get_nodes(self):
+        node = utils.create_test_node(uuid=uuidutils.generate_uuid())
+        node2 = utils.create_test_node(uuid=uuidutils.generate_uuid())
+        filtered = utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                          maintenance=True)
+        missing = uuidutils.generate_uuid()
+
+        res = self.dbapi.get_nodes([node.id, node2.uuid, filtered.uuid,
+                                    missing],
+                                   filters={'maintenance': False})
+        self.assertEqual(sorted([node.id, node2.id]),
+                         sorted(r.id for r in res))
+
+    def test_get_nodes_invalid_identity(self):
+        self.assertRaises(exception.InvalidIdentity,
+                          self.dbapi.get_nodes, ['not-an-identity'])
+
     def test_get_node_that_does_not_exist(self):
         self.assertRaises(exception.NodeNotFound,
                           self.dbapi.get_node_by_id, 99)
@@ -177,6 +214,56 @@ class DbNodeTestCase(base.DbTestCase):
                                                     states.DEPLOYWAIT})
         self.assertEqual([node2.id], [r[0] for r in res])
 
+    def test_get_nodeinfo_list_provision_state_not_in(self):
+        node1 = utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                       provision_state=states.ACTIVE)
+        utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                               provision_state=states.DEPLOYWAIT)
+        node3 = utils.create_test_node(uuid=uuidutils.generate_uuid())
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'provision_state_not_in': [states.DEPLOYWAIT,
+                                                states.CLEANWAIT]})
+        self.assertEqual(sorted([node1.id, node3.id]),
+                         sorted([r[0] for r in res]))
+
+    def test_get_nodeinfo_list_in_power_transition(self):
+        node1 = utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                       target_power_state=states.POWER_ON)
+        node2 = utils.create_test_node(uuid=uuidutils.generate_uuid())
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'in_power_transition': True})
+        self.assertEqual([node1.id], [r[0] for r in res])
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'in_power_transition': False})
+        self.assertEqual([node2.id], [r[0] for r in res])
+
+    def test_get_nodeinfo_list_uuid_hash_ranges(self):
+        nodes = [utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                        driver=driver)
+                 for driver in ('fake', 'fake', 'other')]
+        nodes.sort(key=lambda node: (node.driver, node.uuid_hash))
+        for node in nodes:
+            self.assertEqual(hash_ring.get_uuid_hash(node.uuid),
+                             node.uuid_hash)
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'uuid_hash_ranges': {
+                'fake': [(nodes[0].uuid_hash, nodes[0].uuid_hash)],
+                'other': [(0, 2 ** 31 - 1)]}})
+        self.assertEqual(sorted([nodes[0].id, nodes[2].id]),
+                         sorted([r[0] for r in res]))
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'uuid_hash_ranges': {'fake': [(0, 0)]}})
+        self.assertEqual([], res)
+
+        res = self.dbapi.get_nodeinfo_list(
+            filters={'uuid_hash_ranges': {}})
+        self.assertEqual([], res)
+
     @mock.patch.object(timeutils, 'utcnow', autospec=True)
     def test_get_nodeinfo_list_inspection(self, mock_utcnow):
         past = datetime.datetime(2000, 1, 1, 0, 0)
@@ -212,6 +299,24 @@ class DbNodeTestCase(base.DbTestCase):
         res_uuids = [r.uuid for r in res]
         six.assertCountEqual(self, uuids, res_uuids)
 
+    def test_get_node_list_fields(self):
+        node = utils.create_test_node()
+        res = self.dbapi.get_node_list(fields=['id', 'uuid', 'driver'])
+        self.assertEqual(1, len(res))
+        self.assertEqual(node.uuid, res[0].uuid)
+        self.assertEqual(node.driver, res[0].driver)
+        self.assertNotIn('driver_info', res[0].__dict__)
+        self.assertNotIn('properties', res[0].__dict__)
+
+    def test_get_node_list_stream(self):
+        uuids = []
+        for i in range(1, 6):
+            node = utils.create_test_node(uuid=uuidutils.generate_uuid())
+            uuids.append(six.text_type(node['uuid']))
+        res = self.dbapi.get_node_list(limit=4, stream=True)
+        self.assertNotIsInstance(res, list)
+        self.assertEqual(uuids[:4], [r.uuid for r in res])
+
     def test_get_node_list_with_filters(self):
         ch1 = utils.create_test_chassis(uuid=uuidutils.generate_uuid())
         ch2 = utils.create_test_chassis(uuid=uuidutils.generate_uuid())
@@ -433,6 +538,36 @@ class DbNodeTestCase(base.DbTestCase):
         res = self.dbapi.get_node_by_uuid(uuid)
         self.assertEqual(r1, res.reservation)
 
+    def test_reserve_node_with_filters(self):
+        node = utils.create_test_node(provision_state=states.ACTIVE)
+
+        self.dbapi.reserve_node('fake-reservation', node.uuid,
+                                filters={'maintenance': False,
+                                         'provision_state_not_in':
+                                             [states.DEPLOYWAIT]})
+
+        res = self.dbapi.get_node_by_uuid(node.uuid)
+        self.assertEqual('fake-reservation', res.reservation)
+
+    def test_reserve_node_filters_not_matched(self):
+        node = utils.create_test_node(provision_state=states.DEPLOYWAIT)
+
+        self.assertRaises(exception.NodeFiltersNotMatched,
+                          self.dbapi.reserve_node, 'fake-reservation',
+                          node.uuid,
+                          filters={'provision_state_not_in':
+                                   [states.DEPLOYWAIT]})
+
+        res = self.dbapi.get_node_by_uuid(node.uuid)
+        self.assertIsNone(res.reservation)
+
+    def test_reserve_node_with_filters_already_locked(self):
+        node = utils.create_test_node(reservation='another')
+
+        self.assertRaises(exception.NodeLocked,
+                          self.dbapi.reserve_node, 'fake-reservation',
+                          node.uuid, filters={'maintenance': False})
+
     def test_release_reservation(self):
         node = utils.create_test_node()
         uuid = node.uuid
@@ -516,6 +651,59 @@ class DbNodeTestCase(base.DbTestCase):
         self.assertRaises(exception.NodeNotLocked,
                           self.dbapi.release_node, 'fake', node.uuid)
 
+    def test_reserve_nodes(self):
+        free = utils.create_test_node(uuid=uuidutils.generate_uuid())
+        locked = utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                        reservation='another')
+        filtered = utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                          maintenance=True)
+        missing = uuidutils.generate_uuid()
+
+        nodes, already_locked = self.dbapi.reserve_nodes(
+            'fake-reservation',
+            [free.uuid, str(locked.id), filtered.uuid, missing],
+            filters={'maintenance': False})
+
+        self.assertEqual([free.id], [node.id for node in nodes])
+        self.assertEqual('fake-reservation', nodes[0].reservation)
+        self.assertEqual(set([str(locked.id)]), already_locked)
+        res = self.dbapi.get_node_by_id(locked.id)
+        self.assertEqual('another', res.reservation)
+        res = self.dbapi.get_node_by_id(filtered.id)
+        self.assertIsNone(res.reservation)
+
+    def test_reserve_nodes_already_reserved_by_tag(self):
+        node = utils.create_test_node(reservation='fake-reservation')
+
+        nodes, locked = self.dbapi.reserve_nodes('fake-reservation',
+                                                 [node.id])
+        self.assertEqual([], nodes)
+        self.assertEqual(set([node.id]), locked)
+
+    def test_reserve_nodes_invalid_identity(self):
+        self.assertRaises(exception.InvalidIdentity,
+                          self.dbapi.reserve_nodes, 'fake-reservation',
+                          ['not-an-id'])
+
+    def test_release_nodes(self):
+        mine = [utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                       reservation='fake-reservation')
+                for i in range(2)]
+        other = utils.create_test_node(uuid=uuidutils.generate_uuid(),
+                                       reservation='another')
+        free = utils.create_test_node(uuid=uuidutils.generate_uuid())
+
+        count = self.dbapi.release_nodes(
+            'fake-reservation',
+            [mine[0].id, mine[1].uuid, other.uuid, free.uuid])
+
+        self.assertEqual(2, count)
+        for node in mine:
+            res = self.dbapi.get_node_by_id(node.id)
+            self.assertIsNone(res.reservation)
+        res = self.dbapi.get_node_by_id(other.id)
+        self.assertEqual('another', res.reservation)
+
     @mock.patch.object(timeutils, 'utcnow', autospec=True)
     def test_touch_node_provisioning(self, mock_utcnow):
         test_time = datetime.datetime(2000, 1, 1, 0, 0)
@@ -78,6 +78,18 @@ class DbPortTestCase(base.DbTestCase):
     def test_get_ports_by_node_id_that_does_not_exist(self):
         self.assertEqual([], self.dbapi.get_ports_by_node_id(99))
 
+    def test_get_ports_by_node_ids(self):
+        node2 = db_utils.create_test_node(uuid=uuidutils.generate_uuid())
+        port2 = db_utils.create_test_port(node_id=node2.id,
+                                          uuid=uuidutils.generate_uuid(),
+                                          address='aa:bb:cc:dd:ee:ff')
+        res = self.dbapi.get_ports_by_node_ids([self.node.id, node2.id, 99])
+        self.assertEqual(sorted([self.port.id, port2.id]),
+                         sorted(r.id for r in res))
+
+    def test_get_ports_by_node_ids_empty(self):
+        self.assertEqual([], self.dbapi.get_ports_by_node_ids([]))
+
     def test_destroy_port(self):
         self.dbapi.destroy_port(self.port.id)
         self.assertRaises(exception.PortNotFound,
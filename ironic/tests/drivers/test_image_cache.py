@@ -17,18 +17,22 @@
 """Tests for ImageCache class and helper functions."""
 
 import datetime
+import hashlib
 import os
 import tempfile
 import time
 import uuid
 
+import eventlet
 import mock
+from oslo_utils import units
 from oslo_utils import uuidutils
 import six
 
 from ironic.common import exception
 from ironic.common import image_service
 from ironic.common import images
+from ironic.common import stats
 from ironic.common import utils
 from ironic.drivers.modules import image_cache
 from ironic.tests import base
@@ -48,6 +52,15 @@ class TestImageCacheFetch(base.TestCase):
         self.dest_path = os.path.join(self.dest_dir, 'dest')
         self.uuid = uuidutils.generate_uuid()
         self.master_path = os.path.join(self.master_dir, self.uuid)
+        for name in ('_indexes', '_lrus'):
+            master_dirs_patch = mock.patch.object(image_cache, name, {})
+            master_dirs_patch.start()
+            self.addCleanup(master_dirs_patch.stop)
+        service_patch = mock.patch.object(image_service, 'get_image_service',
+                                          autospec=True)
+        self.mock_service = service_patch.start()
+        self.addCleanup(service_patch.stop)
+        self.mock_service.return_value.show.return_value = {}
 
     @mock.patch.object(image_cache, '_fetch', autospec=True)
     @mock.patch.object(image_cache.ImageCache, 'clean_up', autospec=True)
@@ -75,7 +88,8 @@ class TestImageCacheFetch(base.TestCase):
             mock_clean_up):
         self.cache.fetch_image(self.uuid, self.dest_path)
         mock_cache_upd.assert_called_once_with(self.master_path, self.uuid,
-                                               None)
+                                               None, fetched_at=None,
+                                               shared=False)
         mock_dest_upd.assert_called_once_with(self.master_path, self.dest_path)
         self.assertFalse(mock_link.called)
         self.assertFalse(mock_download.called)
@@ -94,7 +108,8 @@ class TestImageCacheFetch(base.TestCase):
             mock_clean_up):
         self.cache.fetch_image(self.uuid, self.dest_path)
         mock_cache_upd.assert_called_once_with(self.master_path, self.uuid,
-                                               None)
+                                               None, fetched_at=None,
+                                               shared=False)
         mock_dest_upd.assert_called_once_with(self.master_path, self.dest_path)
         mock_link.assert_called_once_with(self.master_path, self.dest_path)
         self.assertFalse(mock_download.called)
@@ -113,7 +128,8 @@ class TestImageCacheFetch(base.TestCase):
             mock_clean_up):
         self.cache.fetch_image(self.uuid, self.dest_path)
         mock_cache_upd.assert_called_once_with(self.master_path, self.uuid,
-                                               None)
+                                               None, fetched_at=None,
+                                               shared=False)
         mock_dest_upd.assert_called_once_with(self.master_path, self.dest_path)
         self.assertFalse(mock_link.called)
         mock_download.assert_called_once_with(
@@ -134,7 +150,8 @@ class TestImageCacheFetch(base.TestCase):
             mock_clean_up):
         self.cache.fetch_image(self.uuid, self.dest_path)
         mock_cache_upd.assert_called_once_with(self.master_path, self.uuid,
-                                               None)
+                                               None, fetched_at=None,
+                                               shared=False)
         mock_dest_upd.assert_called_once_with(self.master_path, self.dest_path)
         self.assertFalse(mock_link.called)
         mock_download.assert_called_once_with(
@@ -167,12 +184,297 @@ class TestImageCacheFetch(base.TestCase):
 
         mock_fetch.side_effect = _fake_fetch
         self.cache._download_image(self.uuid, self.master_path, self.dest_path)
+        digest = hashlib.sha1(b"TEST").hexdigest()
+        content_path = os.path.join(self.master_dir, digest)
         self.assertTrue(os.path.isfile(self.dest_path))
-        self.assertTrue(os.path.isfile(self.master_path))
+        self.assertTrue(os.path.isfile(content_path))
+        self.assertFalse(os.path.exists(self.master_path))
         self.assertEqual(os.stat(self.dest_path).st_ino,
-                         os.stat(self.master_path).st_ino)
+                         os.stat(content_path).st_ino)
         with open(self.dest_path) as fp:
             self.assertEqual("TEST", fp.read())
+        self.assertEqual(digest, self.cache._index.get_digest(self.uuid))
+        self.assertEqual(4, self.cache._lru.total_size)
+
+    @mock.patch.object(image_cache, '_fetch', autospec=True)
+    def test__download_image_same_content(self, mock_fetch):
+        def _fake_fetch(ctx, uuid, tmp_path, *args):
+            with open(tmp_path, 'w') as fp:
+                fp.write("TEST")
+
+        mock_fetch.side_effect = _fake_fetch
+        other_uuid = uuidutils.generate_uuid()
+        other_dest_path = os.path.join(self.dest_dir, 'other')
+        self.cache._download_image(self.uuid, self.master_path, self.dest_path)
+        self.cache._download_image(
+            other_uuid, os.path.join(self.master_dir, other_uuid),
+            other_dest_path)
+        digest = hashlib.sha1(b"TEST").hexdigest()
+        self.assertEqual([digest], [name for name in
+                                    os.listdir(self.master_dir)
+                                    if name != image_cache.INDEX_FILE_NAME])
+        self.assertEqual(os.stat(self.dest_path).st_ino,
+                         os.stat(other_dest_path).st_ino)
+        self.assertEqual(digest, self.cache._index.get_digest(other_uuid))
+        self.assertEqual(4, self.cache._lru.total_size)
+
+    @mock.patch.object(image_cache.ImageCache, 'clean_up', autospec=True)
+    @mock.patch.object(image_cache.ImageCache, '_download_image',
+                       autospec=True)
+    @mock.patch.object(image_cache, '_delete_dest_path_if_stale',
+                       return_value=False, autospec=True)
+    @mock.patch.object(image_cache, '_delete_master_path_if_stale',
+                       return_value=True, autospec=True)
+    def test_fetch_image_indexed(self, mock_cache_upd, mock_dest_upd,
+                                 mock_download, mock_clean_up):
+        content_path = os.path.join(self.master_dir, 'digest')
+        touch(content_path)
+        self.cache._index.add(self.uuid, 'digest', 0)
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        mock_cache_upd.assert_called_once_with(content_path, self.uuid, None,
+                                               fetched_at=mock.ANY,
+                                               shared=False)
+        mock_dest_upd.assert_called_once_with(content_path, self.dest_path)
+        self.assertEqual(os.stat(content_path).st_ino,
+                         os.stat(self.dest_path).st_ino)
+        self.assertFalse(mock_download.called)
+        self.assertFalse(self.mock_service.called)
+
+    @mock.patch.object(image_cache.ImageCache, 'clean_up', autospec=True)
+    @mock.patch.object(image_cache.ImageCache, '_download_image',
+                       autospec=True)
+    def test_fetch_image_shared_out_of_date(self, mock_download,
+                                            mock_clean_up):
+        href = 'http://abc.com/ubuntu.qcow2'
+        master_file_name = str(uuid.uuid5(uuid.NAMESPACE_URL, href))
+        content_path = os.path.join(self.master_dir, 'digest')
+        touch(content_path)
+        with mock.patch.object(time, 'time', autospec=True) as mock_time:
+            mock_time.return_value = 1000
+            self.cache._index.add(master_file_name, 'digest', 0)
+            self.cache._index.add('other', 'digest', 0)
+        # The shared file was fetched again for the other href later on
+        os.utime(content_path, (3000, 3000))
+        self.mock_service.return_value.show.return_value = {
+            'updated_at': datetime.datetime.utcfromtimestamp(2000)}
+
+        self.cache.fetch_image(href, self.dest_path)
+
+        mock_download.assert_called_once_with(
+            self.cache, href, os.path.join(self.master_dir, master_file_name),
+            self.dest_path, ctx=None, force_raw=True)
+        self.assertTrue(os.path.exists(content_path))
+        self.assertIsNone(self.cache._index.get_digest(master_file_name))
+        self.assertEqual('digest', self.cache._index.get_digest('other'))
+
+    @mock.patch.object(image_cache.ImageCache, 'clean_up', autospec=True)
+    @mock.patch.object(image_cache.ImageCache, '_download_image',
+                       autospec=True)
+    def test_fetch_image_same_checksum(self, mock_download, mock_clean_up):
+        self.mock_service.return_value.show.return_value = {
+            'checksum': 'fake-checksum'}
+        content_path = os.path.join(self.master_dir, 'digest')
+        touch(content_path)
+        other_uuid = uuidutils.generate_uuid()
+        self.cache._index.add(other_uuid, 'digest', 0)
+        self.cache._index.set_source(other_uuid, 'fake-checksum.raw')
+
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        self.assertEqual(os.stat(content_path).st_ino,
+                         os.stat(self.dest_path).st_ino)
+        self.assertFalse(mock_download.called)
+        self.assertEqual('digest', self.cache._index.get_digest(self.uuid))
+        self.mock_service.return_value.show.assert_called_once_with(self.uuid)
+
+    @mock.patch.object(image_cache.ImageCache, 'clean_up', autospec=True)
+    @mock.patch.object(image_cache.ImageCache, '_download_image',
+                       autospec=True)
+    def test_fetch_image_same_checksum_not_raw(self, mock_download,
+                                               mock_clean_up):
+        self.mock_service.return_value.show.return_value = {
+            'checksum': 'fake-checksum'}
+        touch(os.path.join(self.master_dir, 'digest'))
+        other_uuid = uuidutils.generate_uuid()
+        self.cache._index.add(other_uuid, 'digest', 0)
+        self.cache._index.set_source(other_uuid, 'fake-checksum.raw')
+
+        self.cache.fetch_image(self.uuid, self.dest_path, force_raw=False)
+        mock_download.assert_called_once_with(
+            self.cache, self.uuid, self.master_path, self.dest_path,
+            ctx=None, force_raw=False)
+
+    @mock.patch.object(image_cache.ImageCache, 'clean_up', autospec=True)
+    @mock.patch.object(image_cache.ImageCache, '_download_image',
+                       autospec=True)
+    def test_fetch_image_checksum_failed(self, mock_download, mock_clean_up):
+        self.mock_service.return_value.show.side_effect = (
+            exception.ImageNotFound(image_id=self.uuid))
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        mock_download.assert_called_once_with(
+            self.cache, self.uuid, self.master_path, self.dest_path,
+            ctx=None, force_raw=True)
+
+
+class TestMasterIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestMasterIndex, self).setUp()
+        self.master_dir = tempfile.mkdtemp()
+        self.index = image_cache._MasterIndex(self.master_dir)
+
+    def test_add(self):
+        self.index.add('href1', 'digest', 10)
+        self.index.add('href2', 'digest')
+        self.assertEqual('digest', self.index.get_digest('href1'))
+        self.assertEqual('digest', self.index.get_digest('href2'))
+        self.assertEqual(2, self.index._masters['digest']['refcount'])
+        self.assertEqual(10, self.index._masters['digest']['size'])
+
+    def test_add_replaces(self):
+        self.index.add('href', 'old')
+        self.index.add('href', 'new')
+        self.assertEqual('new', self.index.get_digest('href'))
+        self.assertEqual(0, self.index._masters['old']['refcount'])
+        self.assertEqual(1, self.index._masters['new']['refcount'])
+
+    def test_persistent(self):
+        self.index.add('href', 'digest', 10)
+        self.index.set_source('href', 'checksum')
+        index = image_cache._MasterIndex(self.master_dir)
+        self.assertEqual('digest', index.get_digest('href'))
+        self.assertEqual('digest', index.find_source('checksum'))
+        self.assertFalse(os.path.exists(index.path + '.tmp'))
+
+    @mock.patch.object(image_cache.LOG, 'warn', autospec=True)
+    def test_corrupted(self, mock_log):
+        with open(self.index.path, 'w') as index_file:
+            index_file.write('corrupted')
+        index = image_cache._MasterIndex(self.master_dir)
+        self.assertIsNone(index.get_digest('href'))
+        self.assertTrue(mock_log.called)
+
+    def test_find_source_not_downloaded(self):
+        self.index.set_source('href', 'checksum')
+        self.assertIsNone(self.index.get_digest('href'))
+        self.assertIsNone(self.index.find_source('checksum'))
+
+    def test_get_fetched_at_and_refcount(self):
+        with mock.patch.object(time, 'time', autospec=True) as mock_time:
+            mock_time.return_value = 1000
+            self.index.add('href1', 'digest')
+            mock_time.return_value = 2000
+            self.index.add('href2', 'digest')
+        self.assertEqual(1000, self.index.get_fetched_at('href1'))
+        self.assertEqual(2000, self.index.get_fetched_at('href2'))
+        self.assertIsNone(self.index.get_fetched_at('href3'))
+        self.assertEqual(2, self.index.get_refcount('digest'))
+        self.assertEqual(0, self.index.get_refcount('other'))
+
+    def test_forget(self):
+        self.index.add('href', 'digest')
+        self.index.forget('href')
+        self.assertIsNone(self.index.get_digest('href'))
+        self.assertEqual(0, self.index._masters['digest']['refcount'])
+
+    def test_prune(self):
+        self.index.add('href1', 'kept')
+        self.index.add('href2', 'gone')
+        self.index.prune(['gone', 'legacy'])
+        self.assertEqual('kept', self.index.get_digest('href1'))
+        self.assertIsNone(self.index.get_digest('href2'))
+        self.assertNotIn('gone', self.index._masters)
+
+    def test_get_index(self):
+        with mock.patch.object(image_cache, '_indexes', {}):
+            index = image_cache._get_index(self.master_dir)
+            self.assertIs(index, image_cache._get_index(self.master_dir))
+
+
+class TestMasterLRU(base.TestCase):
+
+    def setUp(self):
+        super(TestMasterLRU, self).setUp()
+        self.master_dir = tempfile.mkdtemp()
+        self.lru = image_cache._MasterLRU(self.master_dir)
+
+    def _write(self, file_name, content, last_used=None):
+        path = os.path.join(self.master_dir, file_name)
+        with open(path, 'w') as fp:
+            fp.write(content)
+        if last_used is not None:
+            os.utime(path, (last_used, last_used))
+        return path
+
+    def _candidates(self):
+        return [os.path.basename(path)
+                for path, last_used, stat in self.lru.candidates()]
+
+    def test_load(self):
+        now = time.time()
+        self._write('new', '12', now + 200)
+        self._write('old', '123', now + 100)
+        self._write(image_cache.INDEX_FILE_NAME, '{}')
+        os.mkdir(os.path.join(self.master_dir, 'tmpdir'))
+        self.lru.load()
+        self.assertEqual(5, self.lru.total_size)
+        self.assertEqual(['old', 'new'], self._candidates())
+
+    @mock.patch.object(os, 'listdir', autospec=True)
+    def test_load_once(self, mock_listdir):
+        mock_listdir.return_value = []
+        self.lru.load()
+        self.lru.load()
+        mock_listdir.assert_called_once_with(self.master_dir)
+
+    def test_load_keeps_recorded(self):
+        self._write('recorded', '1')
+        self._write('listed', '12', time.time() + 100)
+        self.lru.add('recorded', 1)
+        self.lru.load()
+        self.assertEqual(3, self.lru.total_size)
+        self.assertEqual(['listed', 'recorded'], self._candidates())
+
+    def test_add_touch(self):
+        for file_name in ('a', 'b'):
+            self._write(file_name, '12')
+            self.lru.add(file_name, 2)
+        self.lru.touch('a')
+        self.assertEqual(['b', 'a'], self._candidates())
+        self.assertEqual(4, self.lru.total_size)
+
+    def test_touch_unknown(self):
+        self._write('a', '123')
+        self.lru.touch('a')
+        self.lru.touch('missing')
+        self.assertEqual(['a'], self._candidates())
+        self.assertEqual(3, self.lru.total_size)
+
+    def test_remove(self):
+        self.lru.add('a', 2)
+        self.lru.add('b', 3)
+        self.lru.remove('a')
+        self.lru.remove('missing')
+        self.assertEqual(3, self.lru.total_size)
+        self.assertEqual(set(['a']), self.lru.pop_removed())
+        self.assertEqual(set(), self.lru.pop_removed())
+
+    def test_remove_added_again(self):
+        self.lru.add('a', 2)
+        self.lru.remove('a')
+        self.lru.add('a', 2)
+        self.assertEqual(set(), self.lru.pop_removed())
+
+    def test_candidates(self):
+        path = self._write('linked', '1')
+        os.link(path, os.path.join(tempfile.mkdtemp(), 'dest'))
+        self._write('unlinked', '1')
+        self.lru.add('linked', 1)
+        self.lru.add('unlinked', 1)
+        self.lru.add('deleted', 1)
+        self.assertEqual(['unlinked'], self._candidates())
+        self.assertEqual(set(['deleted']), self.lru.pop_removed())
+        # NOTE: the files in use were recorded as used now
+        self.assertEqual(['unlinked', 'linked'], list(self.lru._entries))
 
 
 @mock.patch.object(os, 'unlink', autospec=True)
@@ -243,8 +545,11 @@ class TestUpdateImages(base.TestCase):
         self.assertFalse(mock_unlink.called)
         self.assertTrue(res)
 
+    @mock.patch.object(image_service.METADATA_CACHE, 'invalidate',
+                       autospec=True)
     @mock.patch.object(image_service, 'get_image_service', autospec=True)
     def test__delete_master_path_if_stale_out_of_date(self, mock_gis,
+                                                      mock_invalidate,
                                                       mock_unlink):
         touch(self.master_path)
         href = 'http://awesomefreeimages.al/img999'
@@ -256,6 +561,25 @@ class TestUpdateImages(base.TestCase):
                                                        None)
         mock_gis.assert_called_once_with(href, context=None)
         mock_unlink.assert_called_once_with(self.master_path)
+        mock_invalidate.assert_called_once_with(href)
+        self.assertFalse(res)
+
+    @mock.patch.object(image_service.METADATA_CACHE, 'invalidate',
+                       autospec=True)
+    @mock.patch.object(image_service, 'get_image_service', autospec=True)
+    def test__delete_master_path_if_stale_fetched_at(self, mock_gis,
+                                                     mock_invalidate,
+                                                     mock_unlink):
+        touch(self.master_path)
+        href = 'http://awesomefreeimages.al/img999'
+        mock_gis.return_value.show.return_value = {
+            'updated_at': datetime.datetime(1999, 11, 15, 8, 12, 31)
+        }
+        fetched_at = time.mktime((1999, 1, 1, 0, 0, 0, 0, 0, 0))
+        res = image_cache._delete_master_path_if_stale(
+            self.master_path, href, None, fetched_at=fetched_at, shared=True)
+        self.assertFalse(mock_unlink.called)
+        mock_invalidate.assert_called_once_with(href)
         self.assertFalse(res)
 
     def test__delete_dest_path_if_stale_no_dest(self, mock_unlink):
@@ -312,7 +636,7 @@ class TestImageCacheCleanUp(base.TestCase):
             self.cache.clean_up()
 
         mock_clean_size.assert_called_once_with(self.cache, mock.ANY, None)
-        survived = mock_clean_size.call_args[0][1]
+        survived = list(mock_clean_size.call_args[0][1])
         self.assertEqual(1, len(survived))
         self.assertEqual(files[0], survived[0][0])
         # NOTE(dtantsur): do not compare milliseconds
@@ -320,6 +644,30 @@ class TestImageCacheCleanUp(base.TestCase):
         self.assertEqual(int(new_current_time - 100),
                          int(survived[0][2].st_mtime))
 
+    @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size',
+                       autospec=True)
+    def test_clean_up_old_out_of_order(self, mock_clean_size):
+        mock_clean_size.return_value = None
+        files = [os.path.join(self.master_dir, str(i))
+                 for i in range(3)]
+        for filename in files:
+            touch(filename)
+        lru = self.cache._lru
+        lru.load()
+        for filename in files[1:]:
+            lru.touch(os.path.basename(filename))
+        # The least recently used file in memory has the most recent atime
+        new_current_time = time.time() + 900
+        os.utime(files[0], (new_current_time - 100, new_current_time - 100))
+        with mock.patch.object(time, 'time', lambda: new_current_time):
+            self.cache.clean_up()
+
+        self.assertTrue(os.path.exists(files[0]))
+        for filename in files[1:]:
+            self.assertFalse(os.path.exists(filename))
+        survived = list(mock_clean_size.call_args[0][1])
+        self.assertEqual([files[0]], [entry[0] for entry in survived])
+
     @mock.patch.object(image_cache.ImageCache, '_clean_up_ensure_cache_size',
                        autospec=True)
     def test_clean_up_old_with_amount(self, mock_clean_size):
@@ -352,7 +700,8 @@ class TestImageCacheCleanUp(base.TestCase):
 
         for filename in files:
             self.assertTrue(os.path.exists(filename))
-        mock_clean_size.assert_called_once_with(mock.ANY, [], None)
+        mock_clean_size.assert_called_once_with(mock.ANY, mock.ANY, None)
+        self.assertEqual([], list(mock_clean_size.call_args[0][1]))
 
     @mock.patch.object(image_cache.ImageCache, '_clean_up_too_old',
                        autospec=True)
@@ -465,6 +814,20 @@ class TestImageCacheCleanUp(base.TestCase):
         self.cache.clean_up(amount=15)
         self.assertTrue(mock_log.called)
 
+    def test_clean_up_lists_once(self):
+        files = [os.path.join(self.master_dir, str(i))
+                 for i in range(2)]
+        for filename in files:
+            with open(filename, 'w') as fp:
+                fp.write('123456')
+        with mock.patch.object(os, 'listdir',
+                               side_effect=os.listdir) as mock_listdir:
+            self.cache.clean_up()
+            self.cache.clean_up()
+        mock_listdir.assert_called_once_with(self.master_dir)
+        self.assertEqual(1, len([f for f in files if os.path.exists(f)]))
+        self.assertEqual(6, self.cache._lru.total_size)
+
     def test_cleanup_ordering(self):
 
         class ParentCache(image_cache.ImageCache):
@@ -675,7 +1038,110 @@ class TestFetchCleanup(base.TestCase):
         mock_size.return_value = 100
         image_cache._fetch('fake', 'fake-uuid', '/foo/bar', force_raw=True)
         mock_fetch.assert_called_once_with('fake', 'fake-uuid',
-                                           '/foo/bar.part', force_raw=False)
+                                           '/foo/bar.part', force_raw=False,
+                                           progress=mock.ANY)
         mock_clean.assert_called_once_with('/foo', 100)
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
                                          '/foo/bar.part')
+
+
+class TestDownloadCoordinator(base.TestCase):
+
+    def setUp(self):
+        super(TestDownloadCoordinator, self).setUp()
+        self.coordinator = image_cache._DownloadCoordinator()
+
+    def test_single_flight(self):
+        calls = []
+
+        def _request(name):
+            with self.coordinator.single_flight('key'):
+                calls.append(name)
+
+        with self.coordinator.single_flight('key'):
+            thread = eventlet.spawn(_request, 'second')
+            eventlet.sleep(0)
+            self.assertEqual([], calls)
+            self.assertEqual(1, self.coordinator.get_stats()['waiting'])
+            with self.coordinator.single_flight('other'):
+                pass
+        thread.wait()
+        self.assertEqual(['second'], calls)
+        self.assertEqual({}, self.coordinator._flights)
+
+    def test_download_serialized(self):
+        self.config(parallel_image_downloads=False)
+
+        def _download():
+            with self.coordinator.download('other') as progress:
+                progress(10)
+
+        with self.coordinator.download('href') as progress:
+            progress(5)
+            thread = eventlet.spawn(_download)
+            eventlet.sleep(0)
+            stats = self.coordinator.get_stats()
+            self.assertEqual(1, stats['queued'])
+            self.assertEqual([('href', 5)],
+                             [(download['href'], download['bytes'])
+                              for download in stats['downloads']])
+        thread.wait()
+        stats = self.coordinator.get_stats()
+        self.assertEqual(0, stats['queued'])
+        self.assertEqual(2, stats['completed'])
+        self.assertEqual(15, stats['total_bytes'])
+        self.assertEqual([], stats['downloads'])
+
+    def test_download_parallel(self):
+        self.config(parallel_image_downloads=True,
+                    max_parallel_image_downloads=2)
+        with self.coordinator.download('href1'):
+            with self.coordinator.download('href2'):
+                self.assertEqual(
+                    2, len(self.coordinator.get_stats()['downloads']))
+                self.assertFalse(self.coordinator._get_slots().acquire(False))
+
+    def test_download_unlimited(self):
+        self.config(parallel_image_downloads=True,
+                    max_parallel_image_downloads=0)
+        self.assertIsNone(self.coordinator._get_slots())
+        with self.coordinator.download('href1'):
+            with self.coordinator.download('href2'):
+                self.assertEqual(
+                    2, len(self.coordinator.get_stats()['downloads']))
+
+    def test_download_failed(self):
+        def _download():
+            with self.coordinator.download('href'):
+                raise exception.ImageDownloadFailed(image_href='href',
+                                                    reason='fail')
+
+        self.assertRaises(exception.ImageDownloadFailed, _download)
+        self.assertEqual([], self.coordinator.get_stats()['downloads'])
+        self.assertTrue(self.coordinator._get_slots().acquire(False))
+
+    @mock.patch.object(time, 'sleep', autospec=True)
+    @mock.patch.object(time, 'time', autospec=True)
+    def test_progress_rate_limit(self, mock_time, mock_sleep):
+        self.config(image_download_rate_limit=2)
+        mock_time.return_value = 100
+        with self.coordinator.download('href') as progress:
+            progress(units.Mi)
+            progress(units.Mi)
+        self.assertEqual([mock.call(0.5), mock.call(1.0)],
+                         mock_sleep.call_args_list)
+
+    @mock.patch.object(time, 'sleep', autospec=True)
+    def test_progress_no_rate_limit(self, mock_sleep):
+        with self.coordinator.download('href') as progress:
+            progress(units.Mi)
+        self.assertFalse(mock_sleep.called)
+
+    def test_get_download_stats(self):
+        with mock.patch.object(image_cache, '_downloads', self.coordinator):
+            self.assertEqual(self.coordinator.get_stats(),
+                             image_cache.get_download_stats())
+
+    def test_download_stats_registered(self):
+        self.assertIs(image_cache.get_download_stats,
+                      stats._providers['image_downloads'])
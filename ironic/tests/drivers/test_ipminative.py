@@ -19,6 +19,8 @@
 Test class for Native IPMI power driver module.
 """
 
+import time
+
 import mock
 from oslo_utils import uuidutils
 from pyghmi import exceptions as pyghmi_exception
@@ -30,6 +32,8 @@ from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.drivers.modules import console_utils
 from ironic.drivers.modules import ipminative
+from ironic.drivers.modules import power_wait
+from ironic.tests import base
 from ironic.tests.conductor import utils as mgr_utils
 from ironic.tests.db import base as db_base
 from ironic.tests.db import utils as db_utils
@@ -47,6 +51,10 @@ class IPMINativePrivateMethodTestCase(db_base.DbTestCase):
                                                driver='fake_ipminative',
                                                driver_info=INFO_DICT)
         self.info = ipminative._parse_driver_info(self.node)
+        sessions_patch = mock.patch.object(ipminative, '_SESSIONS',
+                                           ipminative._SessionCache())
+        sessions_patch.start()
+        self.addCleanup(sessions_patch.stop)
 
     def test__parse_driver_info(self):
         # make sure we get back the expected things
@@ -98,7 +106,7 @@ class IPMINativePrivateMethodTestCase(db_base.DbTestCase):
 
         self.config(retry_timeout=400, group='ipmi')
         state = ipminative._power_on(self.info)
-        ipmicmd.set_power.assert_called_once_with('on', 400)
+        ipmicmd.set_power.assert_called_once_with('on')
         self.assertEqual(states.POWER_ON, state)
 
     @mock.patch('pyghmi.ipmi.command.Command', autospec=True)
@@ -108,7 +116,7 @@ class IPMINativePrivateMethodTestCase(db_base.DbTestCase):
 
         self.config(retry_timeout=500, group='ipmi')
         state = ipminative._power_off(self.info)
-        ipmicmd.set_power.assert_called_once_with('off', 500)
+        ipmicmd.set_power.assert_called_once_with('off')
         self.assertEqual(states.POWER_OFF, state)
 
     @mock.patch('pyghmi.ipmi.command.Command', autospec=True)
@@ -118,9 +126,39 @@ class IPMINativePrivateMethodTestCase(db_base.DbTestCase):
 
         self.config(retry_timeout=600, group='ipmi')
         state = ipminative._reboot(self.info)
-        ipmicmd.set_power.assert_called_once_with('boot', 600)
+        ipmicmd.set_power.assert_called_once_with('boot')
         self.assertEqual(states.POWER_ON, state)
 
+    @mock.patch('eventlet.greenthread.sleep', autospec=True)
+    @mock.patch('pyghmi.ipmi.command.Command', autospec=True)
+    def test__power_on_pending(self, ipmi_mock, sleep_mock):
+        ipmicmd = ipmi_mock.return_value
+        ipmicmd.set_power.return_value = {'pendingpowerstate': 'on'}
+        ipmicmd.get_power.side_effect = [{'powerstate': 'off'},
+                                         {'powerstate': 'on'}]
+
+        with mock.patch.object(power_wait, 'LATENCIES',
+                               power_wait.TransitionLatencies()):
+            state = ipminative._power_on(self.info)
+            self.assertIsNotNone(power_wait.LATENCIES.expected(
+                self.info['address'], states.POWER_ON))
+        ipmicmd.set_power.assert_called_once_with('on')
+        self.assertEqual(2, ipmicmd.get_power.call_count)
+        self.assertEqual(states.POWER_ON, state)
+
+    @mock.patch('eventlet.greenthread.sleep', autospec=True)
+    @mock.patch('pyghmi.ipmi.command.Command', autospec=True)
+    def test__power_off_pending_timeout(self, ipmi_mock, sleep_mock):
+        ipmicmd = ipmi_mock.return_value
+        ipmicmd.set_power.return_value = {'pendingpowerstate': 'off'}
+        ipmicmd.get_power.return_value = {'powerstate': 'on'}
+
+        self.config(retry_timeout=3, group='ipmi')
+        self.assertRaises(exception.PowerStateFailure,
+                          ipminative._power_off, self.info)
+        ipmicmd.set_power.assert_called_once_with('off')
+        self.assertEqual(3, ipmicmd.get_power.call_count)
+
     def _create_sensor_object(self, value, type_, name, states=None,
                               units='fake_units', health=0):
         if states is None:
@@ -202,6 +240,110 @@ class IPMINativePrivateMethodTestCase(db_base.DbTestCase):
         self.assertEqual(expected, ret)
 
 
+@mock.patch('pyghmi.ipmi.command.Command', autospec=True)
+class IPMINativeSessionCacheTestCase(base.TestCase):
+    """Test cases for the cache of the pyghmi sessions."""
+
+    def setUp(self):
+        super(IPMINativeSessionCacheTestCase, self).setUp()
+        self.cache = ipminative._SessionCache()
+        self.info = {'address': '1.2.3.4', 'username': 'admin',
+                     'password': 'fake', 'uuid': 'fake-uuid'}
+
+    def _command(self):
+        ipmicmd = mock.Mock()
+        ipmicmd.ipmi_session.broken = False
+        ipmicmd.ipmi_session.logged = 1
+        return ipmicmd
+
+    def test_session_reused(self, ipmi_mock):
+        ipmi_mock.return_value.get_power.return_value = {'powerstate': 'on'}
+        self.cache.run(self.info, 'get_power')
+        self.cache.run(self.info, 'set_bootdev', 'network', persist=False)
+
+        ipmi_mock.assert_called_once_with(bmc='1.2.3.4', userid='admin',
+                                          password='fake')
+        ipmi_mock.return_value.set_bootdev.assert_called_once_with(
+            'network', persist=False)
+
+    def test_other_credentials_not_reused(self, ipmi_mock):
+        self.cache.run(self.info, 'get_power')
+        self.info['password'] = 'other'
+        self.cache.run(self.info, 'get_power')
+        self.assertEqual(2, ipmi_mock.call_count)
+
+    def test_idle_session_closed(self, ipmi_mock):
+        self.config(native_session_idle_timeout=30, group='ipmi')
+        with mock.patch.object(time, 'time', autospec=True) as time_mock:
+            time_mock.return_value = 100
+            self.cache.run(self.info, 'get_power')
+            time_mock.return_value = 131
+            self.cache.run(self.info, 'get_power')
+        self.assertEqual(2, ipmi_mock.call_count)
+
+    def test_unhealthy_session_closed(self, ipmi_mock):
+        first, second = self._command(), self._command()
+        ipmi_mock.side_effect = [first, second]
+        self.cache.run(self.info, 'get_power')
+        first.ipmi_session.logged = 0
+        self.cache.run(self.info, 'get_power')
+
+        self.assertEqual(2, ipmi_mock.call_count)
+        first.ipmi_session.logout.assert_called_once_with()
+        second.get_power.assert_called_once_with()
+
+    def test_reused_session_failure_retried(self, ipmi_mock):
+        first, second = self._command(), self._command()
+        ipmi_mock.side_effect = [first, second]
+        second.get_power.return_value = {'powerstate': 'off'}
+        self.cache.run(self.info, 'get_power')
+        first.get_power.side_effect = pyghmi_exception.IpmiException('lost')
+
+        ret = self.cache.run(self.info, 'get_power')
+
+        self.assertEqual({'powerstate': 'off'}, ret)
+        self.assertEqual(2, ipmi_mock.call_count)
+
+    def test_reused_session_write_failure_not_retried(self, ipmi_mock):
+        first, second = self._command(), self._command()
+        ipmi_mock.side_effect = [first, second]
+        self.cache.run(self.info, 'get_power')
+        first.set_power.side_effect = pyghmi_exception.IpmiException('lost')
+
+        self.assertRaises(pyghmi_exception.IpmiException,
+                          self.cache.run, self.info, 'set_power', 'boot')
+
+        first.set_power.assert_called_once_with('boot')
+        self.assertFalse(second.set_power.called)
+        first.ipmi_session.logout.assert_called_once_with()
+
+    def test_reused_session_expired_before_write(self, ipmi_mock):
+        first, second = self._command(), self._command()
+        ipmi_mock.side_effect = [first, second]
+        self.cache.run(self.info, 'get_power')
+        first.get_power.side_effect = pyghmi_exception.IpmiException('lost')
+
+        self.cache.run(self.info, 'set_power', 'boot')
+
+        self.assertFalse(first.set_power.called)
+        second.set_power.assert_called_once_with('boot')
+        self.assertFalse(second.get_power.called)
+        first.ipmi_session.logout.assert_called_once_with()
+
+    def test_new_session_failure_raised(self, ipmi_mock):
+        ipmi_mock.return_value.get_power.side_effect = (
+            pyghmi_exception.IpmiException('failed'))
+        self.assertRaises(pyghmi_exception.IpmiException,
+                          self.cache.run, self.info, 'get_power')
+        self.assertEqual(1, ipmi_mock.call_count)
+
+    def test_cache_disabled(self, ipmi_mock):
+        self.config(native_session_idle_timeout=0, group='ipmi')
+        self.cache.run(self.info, 'get_power')
+        self.cache.run(self.info, 'get_power')
+        self.assertEqual(2, ipmi_mock.call_count)
+
+
 class IPMINativeDriverTestCase(db_base.DbTestCase):
     """Test cases for ipminative.NativeIPMIPower class functions."""
 
@@ -214,6 +356,10 @@ class IPMINativeDriverTestCase(db_base.DbTestCase):
                                                driver='fake_ipminative',
                                                driver_info=INFO_DICT)
         self.info = ipminative._parse_driver_info(self.node)
+        sessions_patch = mock.patch.object(ipminative, '_SESSIONS',
+                                           ipminative._SessionCache())
+        sessions_patch.start()
+        self.addCleanup(sessions_patch.stop)
 
     def test_get_properties(self):
         expected = ipminative.COMMON_PROPERTIES
@@ -285,7 +431,7 @@ class IPMINativeDriverTestCase(db_base.DbTestCase):
                               self.driver.power.set_power_state,
                               task,
                               states.POWER_ON)
-        ipmicmd.set_power.assert_called_once_with('on', 500)
+        ipmicmd.set_power.assert_called_once_with('on')
 
     @mock.patch('pyghmi.ipmi.command.Command', autospec=True)
     def test_set_boot_device_ok(self, ipmi_mock):
@@ -325,7 +471,7 @@ class IPMINativeDriverTestCase(db_base.DbTestCase):
             self.assertRaises(exception.PowerStateFailure,
                               self.driver.power.reboot,
                               task)
-        ipmicmd.set_power.assert_called_once_with('boot', 500)
+        ipmicmd.set_power.assert_called_once_with('boot')
 
     def test_management_interface_get_supported_boot_devices(self):
         with task_manager.acquire(self.context, self.node.uuid) as task:
@@ -27,6 +27,7 @@ import tempfile
 import time
 import types
 
+import eventlet
 import mock
 from oslo_concurrency import processutils
 from oslo_config import cfg
@@ -36,10 +37,14 @@ from ironic.common import boot_devices
 from ironic.common import driver_factory
 from ironic.common import exception
 from ironic.common import states
+from ironic.common import stats
 from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.drivers.modules import console_utils
 from ironic.drivers.modules import ipmitool as ipmi
+from ironic.drivers.modules import ipmitool_scheduler
+from ironic.drivers.modules import ipmitool_sessions
+from ironic.drivers.modules import power_wait
 from ironic.tests import base
 from ironic.tests.conductor import utils as mgr_utils
 from ironic.tests.db import base as db_base
@@ -51,6 +56,9 @@ CONF = cfg.CONF
 CONF.import_opt('min_command_interval',
                 'ironic.drivers.modules.ipminative',
                 group='ipmi')
+CONF.import_opt('send_sensor_data_types',
+                'ironic.conductor.manager',
+                group='conductor')
 
 INFO_DICT = db_utils.get_test_ipmi_info()
 
@@ -319,6 +327,14 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
             driver='fake_ipmitool',
             driver_info=INFO_DICT)
         self.info = ipmi._parse_driver_info(self.node)
+        scheduler_patch = mock.patch.object(
+            ipmi, 'SCHEDULER', ipmitool_scheduler.CommandScheduler())
+        scheduler_patch.start()
+        self.addCleanup(scheduler_patch.stop)
+        latencies_patch = mock.patch.object(
+            power_wait, 'LATENCIES', power_wait.TransitionLatencies())
+        latencies_patch.start()
+        self.addCleanup(latencies_patch.stop)
 
     def _test__make_password_file(self, mock_sleep, input_password,
                                   exception_to_raise=None):
@@ -595,7 +611,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_first_call_to_address(self, mock_exec, mock_pwf,
                                                   mock_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle = tempfile.NamedTemporaryFile()
         pw_file = pw_file_handle.name
         file_handle = open(pw_file, "w")
@@ -620,12 +635,158 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
         mock_exec.assert_called_once_with(*args)
         self.assertFalse(mock_sleep.called)
 
+    @mock.patch.object(ipmi, '_is_option_supported', autospec=True)
+    @mock.patch.object(ipmi, '_make_password_file', autospec=True)
+    @mock.patch.object(utils, 'execute', autospec=True)
+    def test__exec_ipmitool_scheduler_stats(self, mock_exec, mock_pwf,
+                                            mock_support, mock_sleep):
+        mock_support.return_value = False
+        mock_exec.return_value = (None, None)
+
+        ipmi._exec_ipmitool(self.info, 'A B C')
+
+        scheduler_stats = stats._providers['ipmitool_scheduler']()
+        self.assertEqual(ipmi.SCHEDULER.get_stats(), scheduler_stats)
+        self.assertEqual(1, scheduler_stats['commands'])
+
+    @mock.patch.object(ipmi, '_is_option_supported', autospec=True)
+    @mock.patch.object(ipmi, '_make_password_file', autospec=True)
+    @mock.patch.object(ipmitool_sessions, 'execute', autospec=True)
+    @mock.patch.object(utils, 'execute', autospec=True)
+    def test__exec_ipmitool_session_pool(self, mock_exec, mock_session_exec,
+                                         mock_pwf, mock_support, mock_sleep):
+        self.config(session_pool=True, group='ipmi')
+        args = [
+            'ipmitool',
+            '-I', 'lanplus',
+            '-H', self.info['address'],
+            '-L', self.info['priv_level'],
+            '-U', self.info['username'],
+        ]
+
+        mock_support.return_value = False
+        mock_session_exec.return_value = ('out', 'err')
+
+        self.assertEqual(('out', 'err'),
+                         ipmi._exec_ipmitool(self.info, 'A B C'))
+
+        mock_session_exec.assert_called_once_with(
+            self.info['address'], args, self.info['password'], 'A B C')
+        self.assertFalse(mock_pwf.called)
+        self.assertFalse(mock_exec.called)
+
+    @mock.patch.object(ipmi, '_is_option_supported', autospec=True)
+    @mock.patch.object(ipmi, '_make_password_file', autospec=True)
+    @mock.patch.object(utils, 'execute', autospec=True)
+    def test__exec_ipmitool_sdr_cache_file(self, mock_exec, mock_pwf,
+                                           mock_support, mock_sleep):
+        mock_support.return_value = False
+        mock_pwf.return_value = '/path/to/pw'
+        mock_exec.return_value = (None, None)
+
+        ipmi._exec_ipmitool(self.info, 'sdr -v', sdr_cache_file='/path/sdr')
+
+        mock_exec.assert_called_once_with(
+            'ipmitool',
+            '-I', 'lanplus',
+            '-H', self.info['address'],
+            '-L', self.info['priv_level'],
+            '-U', self.info['username'],
+            '-S', '/path/sdr',
+            '-f', '/path/to/pw',
+            'sdr', '-v')
+
+    def _configure_sdr_cache(self):
+        sdr_cache_dir = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, sdr_cache_dir)
+        self.config(sdr_cache_dir=sdr_cache_dir, group='ipmi')
+        ipmi.SDR_CACHE_CHECKED.clear()
+        self.addCleanup(ipmi.SDR_CACHE_CHECKED.clear)
+        return sdr_cache_dir
+
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test__get_sdr_cache_file(self, mock_exec, mock_sleep):
+        sdr_cache_dir = self._configure_sdr_cache()
+        old_path = os.path.join(sdr_cache_dir, '%s-old.sdr' % self.node.uuid)
+        open(old_path, 'w').close()
+
+        def fake_exec(driver_info, command):
+            if command == 'sdr info':
+                return ('Record Count : 62\n'
+                        'Free Space : 9716 bytes\n'
+                        'Most recent Addition : 05/27/2015 09:04:39\n'), ''
+            open(command.split(' ')[2], 'w').close()
+            return '', ''
+
+        mock_exec.side_effect = fake_exec
+
+        path = ipmi._get_sdr_cache_file(self.info)
+
+        self.assertEqual(sdr_cache_dir, os.path.dirname(path))
+        self.assertTrue(os.path.basename(path).startswith(self.node.uuid))
+        self.assertTrue(os.path.isfile(path))
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual([path], ipmi._sdr_cache_files(self.node.uuid))
+        mock_exec.assert_has_calls([
+            mock.call(self.info, 'sdr info'),
+            mock.call(self.info, 'sdr dump %s.part' % path)])
+
+        # Checked recently, no need to ask the BMC again
+        mock_exec.reset_mock()
+        self.assertEqual(path, ipmi._get_sdr_cache_file(self.info))
+        self.assertFalse(mock_exec.called)
+
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test__get_sdr_cache_file_unchanged(self, mock_exec, mock_sleep):
+        sdr_cache_dir = self._configure_sdr_cache()
+        self.config(sdr_cache_check_interval=0, group='ipmi')
+        mock_exec.return_value = ('Most recent Erase : Not Supported\n', '')
+        path = os.path.join(sdr_cache_dir, '%s-%s.sdr' % (
+            self.node.uuid, ipmi._sdr_change_key(self.info)))
+        open(path, 'w').close()
+        mock_exec.reset_mock()
+
+        self.assertEqual(path, ipmi._get_sdr_cache_file(self.info))
+        mock_exec.assert_called_once_with(self.info, 'sdr info')
+
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test__get_sdr_cache_file_no_change_info(self, mock_exec, mock_sleep):
+        self._configure_sdr_cache()
+        mock_exec.return_value = ('SDR Version : 0x51\n', '')
+
+        self.assertIsNone(ipmi._get_sdr_cache_file(self.info))
+        mock_exec.assert_called_once_with(self.info, 'sdr info')
+
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test__get_sdr_cache_file_dump_fail(self, mock_exec, mock_sleep):
+        sdr_cache_dir = self._configure_sdr_cache()
+        mock_exec.side_effect = iter([
+            ('Record Count : 62\n', ''),
+            processutils.ProcessExecutionError()])
+
+        self.assertRaises(processutils.ProcessExecutionError,
+                          ipmi._get_sdr_cache_file, self.info)
+        self.assertEqual([], os.listdir(sdr_cache_dir))
+        self.assertEqual({}, ipmi.SDR_CACHE_CHECKED)
+
+    def test__clear_sdr_cache(self, mock_sleep):
+        sdr_cache_dir = self._configure_sdr_cache()
+        path = os.path.join(sdr_cache_dir, '%s-key.sdr' % self.node.uuid)
+        other_path = os.path.join(sdr_cache_dir, 'other-key.sdr')
+        for p in (path, other_path):
+            open(p, 'w').close()
+        ipmi.SDR_CACHE_CHECKED[self.node.uuid] = (time.time(), path)
+
+        ipmi._clear_sdr_cache(self.node.uuid)
+
+        self.assertEqual(['other-key.sdr'], os.listdir(sdr_cache_dir))
+        self.assertEqual({}, ipmi.SDR_CACHE_CHECKED)
+
     @mock.patch.object(ipmi, '_is_option_supported', autospec=True)
     @mock.patch.object(ipmi, '_make_password_file', autospec=True)
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_second_call_to_address_sleep(
             self, mock_exec, mock_pwf, mock_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -669,7 +830,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_second_call_to_address_no_sleep(
             self, mock_exec, mock_pwf, mock_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -703,7 +863,7 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
         ipmi._exec_ipmitool(self.info, 'A B C')
         mock_exec.assert_called_with(*args[0])
         # act like enough time has passed
-        ipmi.LAST_CMD_TIME[self.info['address']] = (
+        ipmi.SCHEDULER._states[self.info['address']].last_end = (
             time.time() - CONF.ipmi.min_command_interval)
         ipmi._exec_ipmitool(self.info, 'D E F')
         self.assertFalse(mock_sleep.called)
@@ -715,7 +875,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     @mock.patch.object(utils, 'execute', autospec=True)
     def test__exec_ipmitool_two_calls_to_diff_address(
             self, mock_exec, mock_pwf, mock_support, mock_sleep):
-        ipmi.LAST_CMD_TIME = {}
         pw_file_handle1 = tempfile.NamedTemporaryFile()
         pw_file1 = pw_file_handle1.name
         file_handle1 = open(pw_file1, "w")
@@ -958,7 +1117,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     def test__exec_ipmitool_exception_retry(
             self, mock_exec, mock_support, mock_sleep):
 
-        ipmi.LAST_CMD_TIME = {}
         mock_support.return_value = False
         mock_exec.side_effect = iter([
             processutils.ProcessExecutionError(
@@ -982,7 +1140,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     def test__exec_ipmitool_exception_retries_exceeded(
             self, mock_exec, mock_support, mock_sleep):
 
-        ipmi.LAST_CMD_TIME = {}
         mock_support.return_value = False
 
         mock_exec.side_effect = iter([processutils.ProcessExecutionError(
@@ -1005,7 +1162,6 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
     def test__exec_ipmitool_exception_non_retryable_failure(
             self, mock_exec, mock_support, mock_sleep):
 
-        ipmi.LAST_CMD_TIME = {}
         mock_support.return_value = False
 
         # Return a retryable error, then an error that cannot
@@ -1032,6 +1188,36 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
         mock_support.assert_called_once_with('timing')
         self.assertEqual(2, mock_exec.call_count)
 
+    @mock.patch.object(ipmi, '_is_option_supported', autospec=True)
+    @mock.patch.object(ipmi, '_run_ipmitool', autospec=True)
+    def test__exec_ipmitool_after_timed_out_command(
+            self, mock_run, mock_support, mock_sleep):
+        mock_support.return_value = False
+        done = eventlet.event.Event()
+
+        def run(driver_info, args, command):
+            if command == 'power status':
+                done.wait()
+            return command, ''
+
+        mock_run.side_effect = run
+        running = eventlet.spawn(ipmi._exec_ipmitool, self.info,
+                                 'power status')
+        eventlet.sleep(0)
+        # The sensor data is read after the running command, give up on it
+        with eventlet.Timeout(0.1, False):
+            ipmi._exec_ipmitool(self.info, 'sdr -v')
+            self.fail('The sensor data was read')
+        done.send()
+        self.assertEqual(('power status', ''), running.wait())
+
+        with eventlet.Timeout(1):
+            self.assertEqual(('chassis bootdev pxe', ''),
+                             ipmi._exec_ipmitool(self.info,
+                                                 'chassis bootdev pxe'))
+        self.assertEqual(['power status', 'chassis bootdev pxe'],
+                         [c[0][2] for c in mock_run.call_args_list])
+
     @mock.patch.object(ipmi, '_is_option_supported', autospec=True)
     @mock.patch.object(ipmi, '_make_password_file', autospec=True)
     @mock.patch.object(utils, 'execute', autospec=True)
@@ -1113,6 +1299,22 @@ class IPMIToolPrivateMethodTestCase(db_base.DbTestCase):
         self.assertEqual(mock_exec.call_args_list, expected)
         self.assertEqual(states.ERROR, state)
 
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    @mock.patch('eventlet.greenthread.sleep', autospec=True)
+    def test__power_off_learns_latency(self, sleep_mock, mock_exec,
+                                       mock_sleep):
+        self.config(retry_timeout=10, group='ipmi')
+        mock_exec.side_effect = [(None, None),
+                                 ["Chassis Power is on\n", None],
+                                 ["Chassis Power is off\n", None]]
+
+        state = ipmi._power_off(self.info)
+
+        self.assertEqual(states.POWER_OFF, state)
+        self.assertEqual(3, mock_exec.call_count)
+        self.assertEqual(2, power_wait.LATENCIES.expected(
+            self.info['address'], states.POWER_OFF))
+
 
 class IPMIToolDriverTestCase(db_base.DbTestCase):
 
@@ -1125,6 +1327,14 @@ class IPMIToolDriverTestCase(db_base.DbTestCase):
                                                driver='fake_ipmitool',
                                                driver_info=INFO_DICT)
         self.info = ipmi._parse_driver_info(self.node)
+        scheduler_patch = mock.patch.object(
+            ipmi, 'SCHEDULER', ipmitool_scheduler.CommandScheduler())
+        scheduler_patch.start()
+        self.addCleanup(scheduler_patch.stop)
+        latencies_patch = mock.patch.object(
+            power_wait, 'LATENCIES', power_wait.TransitionLatencies())
+        latencies_patch.start()
+        self.addCleanup(latencies_patch.stop)
 
     @mock.patch.object(ipmi, "_parse_driver_info", autospec=True)
     def test_power_validate(self, mock_parse):
@@ -1178,6 +1388,25 @@ class IPMIToolDriverTestCase(db_base.DbTestCase):
                               task)
         mock_exec.assert_called_once_with(self.info, "power status")
 
+    @mock.patch.object(ipmi, '_power_status', autospec=True)
+    def test_get_power_state_many(self, mock_status):
+        node2 = obj_utils.create_test_node(self.context,
+                                           driver='fake_ipmitool',
+                                           driver_info=INFO_DICT, id=2,
+                                           uuid=uuidutils.generate_uuid())
+        error = exception.IPMIFailure(cmd='power status')
+        mock_status.side_effect = [states.POWER_ON, error]
+
+        with task_manager.acquire_many(self.context,
+                                       [self.node.uuid, node2.uuid],
+                                       shared=True) as tasks:
+            power_states = self.driver.power.get_power_state_many(
+                list(tasks))
+
+        self.assertEqual({self.node.uuid: states.POWER_ON,
+                          node2.uuid: error}, power_states)
+        self.assertEqual(2, mock_status.call_count)
+
     @mock.patch.object(ipmi, '_power_on', autospec=True)
     @mock.patch.object(ipmi, '_power_off', autospec=True)
     def test_set_power_on_ok(self, mock_off, mock_on):
@@ -1274,6 +1503,96 @@ class IPMIToolDriverTestCase(db_base.DbTestCase):
 
         mock_exec.assert_called_once_with(self.info, 'bmc reset cold')
 
+    @mock.patch.object(ipmitool_sessions, 'close_sessions', autospec=True)
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test__bmc_reset_session_pool(self, mock_exec, mock_close):
+        self.config(session_pool=True, group='ipmi')
+        mock_exec.return_value = [None, None]
+
+        with task_manager.acquire(self.context,
+                                  self.node['uuid']) as task:
+            self.driver.vendor.bmc_reset(task, 'POST')
+
+        mock_exec.assert_called_once_with(self.info, 'bmc reset warm')
+        mock_close.assert_called_once_with(self.info['address'])
+
+    @mock.patch.object(ipmi, '_clear_sdr_cache', autospec=True)
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test__bmc_reset_sdr_cache(self, mock_exec, mock_clear):
+        self.config(sdr_cache=True, group='ipmi')
+        mock_exec.return_value = [None, None]
+
+        with task_manager.acquire(self.context,
+                                  self.node['uuid']) as task:
+            self.driver.vendor.bmc_reset(task, 'POST')
+
+        mock_exec.assert_called_once_with(self.info, 'bmc reset warm')
+        mock_clear.assert_called_once_with(self.node['uuid'])
+
+    @mock.patch.object(ipmi, '_parse_ipmi_sensors_data', autospec=True)
+    @mock.patch.object(ipmi, '_get_sdr_cache_file', autospec=True)
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test_get_sensors_data_sdr_cache(self, mock_exec, mock_sdr,
+                                        mock_parse):
+        self.config(sdr_cache=True, group='ipmi')
+        mock_sdr.return_value = '/path/to/sdr'
+        mock_exec.return_value = ('out', '')
+        mock_parse.return_value = {'Temperature': {}}
+
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            node = task.node
+            self.assertEqual({'Temperature': {}},
+                             task.driver.management.get_sensors_data(task))
+
+        mock_sdr.assert_called_once_with(self.info)
+        mock_exec.assert_called_once_with(self.info, 'sdr -v',
+                                          sdr_cache_file='/path/to/sdr')
+        mock_parse.assert_called_once_with(node, 'out', None)
+
+    @mock.patch.object(ipmi, '_parse_ipmi_sensors_data', autospec=True)
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test_get_sensors_data_sensor_types(self, mock_exec, mock_parse):
+        self.config(send_sensor_data_types=['Fan', 'Temperature'],
+                    group='conductor')
+        mock_exec.return_value = ('out', '')
+
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            node = task.node
+            task.driver.management.get_sensors_data(task)
+
+        mock_parse.assert_called_once_with(node, 'out',
+                                           set(['fan', 'temperature']))
+
+    @mock.patch.object(ipmi, '_clear_sdr_cache', autospec=True)
+    @mock.patch.object(ipmi, '_get_sdr_cache_file', autospec=True)
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test_get_sensors_data_sdr_cache_fail(self, mock_exec, mock_sdr,
+                                             mock_clear):
+        self.config(sdr_cache=True, group='ipmi')
+        mock_sdr.return_value = '/path/to/sdr'
+        mock_exec.side_effect = processutils.ProcessExecutionError()
+
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            self.assertRaises(exception.FailedToGetSensorData,
+                              task.driver.management.get_sensors_data, task)
+
+        mock_clear.assert_called_once_with(self.node.uuid)
+
+    @mock.patch.object(ipmi, '_parse_ipmi_sensors_data', autospec=True)
+    @mock.patch.object(ipmi, '_get_sdr_cache_file', autospec=True)
+    @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
+    def test_get_sensors_data_sdr_cache_not_available(self, mock_exec,
+                                                      mock_sdr, mock_parse):
+        self.config(sdr_cache=True, group='ipmi')
+        mock_sdr.side_effect = processutils.ProcessExecutionError()
+        mock_exec.return_value = ('out', '')
+
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            task.driver.management.get_sensors_data(task)
+
+        mock_exec.assert_called_once_with(self.info, 'sdr -v',
+                                          sdr_cache_file=None)
+
     @mock.patch.object(ipmi, '_exec_ipmitool', autospec=True)
     def test__bmc_reset_fail(self, mock_exec):
         mock_exec.side_effect = iter([processutils.ProcessExecutionError()])
@@ -1813,6 +2132,49 @@ class IPMIToolDriverTestCase(db_base.DbTestCase):
 
         self.assertEqual(expected_return, ret)
 
+    def test__parse_ipmi_sensor_data_sensor_types(self):
+        fake_sensors_data = """
+                            Sensor ID              : Temp (0x1)
+                             Entity ID             : 3.1 (Processor)
+                             Sensor Type (Analog)  : Temperature
+                             Sensor Reading        : 50 (+/- 1) degrees C
+                             Status                : ok
+
+                            Sensor ID              : FAN MOD 1A RPM (0x30)
+                             Entity ID             : 7.1 (System Board)
+                             Sensor Type (Analog)  : Fan
+                             Sensor Reading        : 8400 (+/- 75) RPM
+                             Status                : ok
+                             """
+        expected_return = {
+            'Fan': {
+                'FAN MOD 1A RPM (0x30)': {
+                    'Status': 'ok',
+                    'Sensor Reading': '8400 (+/- 75) RPM',
+                    'Entity ID': '7.1 (System Board)',
+                    'Sensor Type (Analog)': 'Fan',
+                    'Sensor ID': 'FAN MOD 1A RPM (0x30)',
+                }
+            }
+        }
+        with mock.patch.object(ipmi, '_process_sensor',
+                               wraps=ipmi._process_sensor) as process_mock:
+            ret = ipmi._parse_ipmi_sensors_data(self.node, fake_sensors_data,
+                                                set(['fan']))
+
+        self.assertEqual(expected_return, ret)
+        # The temperature sensor was skipped before being parsed
+        self.assertEqual(1, process_mock.call_count)
+
+    def test__parse_ipmi_sensor_data_sensor_types_none_left(self):
+        fake_sensors_data = """
+                            Sensor ID              : Temp (0x1)
+                             Sensor Type (Analog)  : Temperature
+                             Sensor Reading        : 50 (+/- 1) degrees C
+                             """
+        self.assertEqual({}, ipmi._parse_ipmi_sensors_data(
+            self.node, fake_sensors_data, set(['fan'])))
+
     def test__parse_ipmi_sensor_data_failed(self):
         fake_sensors_data = "abcdef"
         self.assertRaises(exception.FailedToParseSensorData,
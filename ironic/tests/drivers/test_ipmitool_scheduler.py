@@ -0,0 +1,119 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the scheduling of the ipmitool commands."""
+
+import time
+
+import eventlet
+import mock
+from oslo_concurrency import processutils
+
+from ironic.drivers.modules import ipmitool_scheduler
+from ironic.tests import base
+
+
+@mock.patch.object(time, 'sleep', autospec=True)
+class CommandSchedulerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(CommandSchedulerTestCase, self).setUp()
+        self.config(min_command_interval=5, group='ipmi')
+        self.scheduler = ipmitool_scheduler.CommandScheduler()
+
+    def test_first_command_not_delayed(self, mock_sleep):
+        with self.scheduler.command_slot('address'):
+            pass
+        self.assertFalse(mock_sleep.called)
+        self.assertEqual(1, self.scheduler.get_stats()['commands'])
+
+    def test_next_command_delayed(self, mock_sleep):
+        with self.scheduler.command_slot('address'):
+            pass
+        with self.scheduler.command_slot('address'):
+            pass
+        self.assertEqual(1, mock_sleep.call_count)
+        self.assertTrue(0 < mock_sleep.call_args[0][0] <= 5)
+
+    def test_other_address_not_delayed(self, mock_sleep):
+        with self.scheduler.command_slot('address'):
+            pass
+        with self.scheduler.command_slot('other'):
+            pass
+        self.assertFalse(mock_sleep.called)
+
+    def test_idle_state_pruned(self, mock_sleep):
+        self.config(min_command_interval=0, group='ipmi')
+        with self.scheduler.command_slot('address'):
+            pass
+        with self.scheduler.command_slot('other'):
+            self.assertEqual(['other'], list(self.scheduler._states))
+
+    def test_cancelled_while_queued(self, mock_sleep):
+        self.config(min_command_interval=0, group='ipmi')
+
+        def command():
+            with self.scheduler.command_slot('address'):
+                self.fail('The command was not cancelled')
+
+        with self.scheduler.command_slot('address'):
+            thread = eventlet.spawn(command)
+            eventlet.sleep(0)
+            thread.kill()
+            self.assertEqual({}, self.scheduler.get_stats()['queue_depth'])
+        with self.scheduler.command_slot('address'):
+            pass
+        self.assertEqual(2, self.scheduler.get_stats()['commands'])
+
+    def test_cancelled_while_delayed(self, mock_sleep):
+        mock_sleep.side_effect = eventlet.Timeout()
+        with self.scheduler.command_slot('address'):
+            pass
+        self.assertRaises(eventlet.Timeout, self.scheduler._acquire,
+                          'address')
+        self.assertFalse(self.scheduler._states['address'].busy)
+
+    def test_queued_timeout(self, mock_sleep):
+        self.config(retry_timeout=0, min_command_interval=0, group='ipmi')
+        with self.scheduler.command_slot('address'):
+            self.assertRaises(processutils.ProcessExecutionError,
+                              self.scheduler._acquire, 'address')
+            self.assertEqual({}, self.scheduler.get_stats()['queue_depth'])
+        with self.scheduler.command_slot('address'):
+            pass
+
+    def test_commands_run_in_order(self, mock_sleep):
+        self.config(min_command_interval=0, group='ipmi')
+        order = []
+
+        def command(name):
+            with self.scheduler.command_slot('address'):
+                order.append(name)
+
+        with self.scheduler.command_slot('address'):
+            threads = [eventlet.spawn(command, name)
+                       for name in ('first', 'second', 'third')]
+            # Let them all queue up behind the running command
+            eventlet.sleep(0)
+            stats = self.scheduler.get_stats()
+            self.assertEqual({'address': 3}, stats['queue_depth'])
+            self.assertEqual(3, stats['max_queue_depth'])
+            order.append('running')
+        for thread in threads:
+            thread.wait()
+
+        self.assertEqual(['running', 'first', 'second', 'third'], order)
+        stats = self.scheduler.get_stats()
+        self.assertEqual({}, stats['queue_depth'])
+        self.assertEqual(4, stats['commands'])
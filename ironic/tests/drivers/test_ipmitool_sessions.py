@@ -0,0 +1,228 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the pool of ipmitool sessions."""
+
+import sys
+
+import eventlet
+import mock
+from oslo_concurrency import processutils
+
+from ironic.drivers.modules import ipmitool_sessions
+from ironic.tests import base
+
+# Mimics "ipmitool shell", the password file and "shell" arguments are
+# ignored.
+FAKE_SHELL = """
+import sys
+import time
+sys.stdout.write('ipmitool> ')
+sys.stdout.flush()
+for line in iter(sys.stdin.readline, ''):
+    command = line.strip()
+    if command == 'exit':
+        break
+    elif command == 'power status':
+        sys.stdout.write('Chassis Power is on\\n')
+    elif command == 'power on':
+        sys.stdout.write('Chassis Power Control: Up/On\\n')
+    elif command == 'fail':
+        sys.stderr.write('Error: Invalid command\\n')
+    elif command in ('lost', 'sdr lost'):
+        sys.stderr.write('Error: Unable to establish IPMI v2 / RMCP+ '
+                         'session\\n')
+    elif command == 'die':
+        sys.exit(1)
+    elif command in ('slow', 'bmc reset warm'):
+        time.sleep(2)
+        sys.stdout.write('Chassis Power is off\\n')
+    sys.stderr.flush()
+    sys.stdout.write('ipmitool> ')
+    sys.stdout.flush()
+"""
+
+ARGS = [sys.executable, '-c', FAKE_SHELL]
+
+
+class SessionTestCase(base.TestCase):
+
+    def setUp(self):
+        super(SessionTestCase, self).setUp()
+        self.session = ipmitool_sessions.Session(ARGS, 'password')
+        self.session.start()
+        self.addCleanup(self.session.close)
+
+    def test_execute(self):
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         self.session.execute('power status'))
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         self.session.execute('power status'))
+
+    def test_execute_failed(self):
+        exc = self.assertRaises(processutils.ProcessExecutionError,
+                                self.session.execute, 'fail')
+        self.assertEqual('Error: Invalid command\n', exc.stderr)
+        # The session is still usable
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         self.session.execute('power status'))
+
+    def test_execute_died(self):
+        self.assertRaises(ipmitool_sessions.SessionError,
+                          self.session.execute, 'die')
+        self.assertFalse(self.session.is_alive())
+
+    def test_close(self):
+        self.session.close()
+        self.assertTrue(self.session.closed)
+        self.assertFalse(self.session.is_alive())
+        self.assertEqual(0, self.session.process.returncode)
+
+
+class SessionPoolTestCase(base.TestCase):
+
+    def setUp(self):
+        super(SessionPoolTestCase, self).setUp()
+        self.pool = ipmitool_sessions.SessionPool()
+        self.addCleanup(self.pool.close_sessions, 'address')
+
+    def _session(self):
+        return self.pool._sessions[('address', tuple(ARGS), 'password')]
+
+    def test_execute_reuses_session(self):
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         self.pool.execute('address', ARGS, 'password',
+                                           'power status'))
+        session = self._session()
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        self.assertIs(session, self._session())
+        self.assertTrue(session.is_alive())
+
+    def test_execute_restarts_dead_session(self):
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        session = self._session()
+        session.process.kill()
+        session.process.wait()
+
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         self.pool.execute('address', ARGS, 'password',
+                                           'power status'))
+        self.assertIsNot(session, self._session())
+
+    def test_execute_session_died_during_command(self):
+        self.assertRaises(processutils.ProcessExecutionError,
+                          self.pool.execute, 'address', ARGS, 'password',
+                          'die')
+        self.assertEqual({}, self.pool._sessions)
+
+    def test_execute_lost_session_retried(self):
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        session = self._session()
+
+        # Run once in the existing session, then once in a new one
+        self.assertRaises(processutils.ProcessExecutionError,
+                          self.pool.execute, 'address', ARGS, 'password',
+                          'sdr lost')
+        self.assertTrue(session.closed)
+        self.assertIsNot(session, self._session())
+
+    def test_execute_lost_session_write_not_retried(self):
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        session = self._session()
+
+        with mock.patch.object(ipmitool_sessions.Session, 'start',
+                               autospec=True) as start_mock:
+            self.assertRaises(processutils.ProcessExecutionError,
+                              self.pool.execute, 'address', ARGS,
+                              'password', 'lost')
+        self.assertFalse(start_mock.called)
+        self.assertTrue(session.closed)
+        self.assertEqual({}, self.pool._sessions)
+
+    def test_execute_not_sent_retried(self):
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        session = self._session()
+        stdin = session.process.stdin
+
+        def write(data):
+            if data != b'exit\n':
+                raise IOError('Broken pipe')
+            stdin.write(data)
+
+        session.process.stdin = mock.Mock(spec=['write', 'flush'])
+        session.process.stdin.write.side_effect = write
+        session.process.stdin.flush.side_effect = stdin.flush
+
+        self.assertEqual(('Chassis Power Control: Up/On\n', ''),
+                         self.pool.execute('address', ARGS, 'password',
+                                           'power on'))
+        self.assertIsNot(session, self._session())
+
+    @mock.patch.object(ipmitool_sessions, 'COMMAND_TIMEOUT_MARGIN', 0.5)
+    def test_execute_timed_out_not_retried(self):
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        self.config(retry_timeout=0, group='ipmi')
+        session = self._session()
+
+        execute = ipmitool_sessions.Session.execute
+        with mock.patch.object(ipmitool_sessions.Session, 'execute',
+                               autospec=True,
+                               side_effect=execute) as execute_mock:
+            self.assertRaises(processutils.ProcessExecutionError,
+                              self.pool.execute, 'address', ARGS,
+                              'password', 'bmc reset warm')
+        # The reset was sent once, and not again in a new session
+        execute_mock.assert_called_once_with(session, 'bmc reset warm')
+        self.assertTrue(session.closed)
+        self.assertEqual({}, self.pool._sessions)
+
+    def test_execute_failed_not_retried(self):
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        session = self._session()
+        self.assertRaises(processutils.ProcessExecutionError,
+                          self.pool.execute, 'address', ARGS, 'password',
+                          'fail')
+        self.assertIs(session, self._session())
+
+    def test_execute_interrupted(self):
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        session = self._session()
+        with eventlet.Timeout(0.2, False):
+            self.pool.execute('address', ARGS, 'password', 'slow')
+            self.fail('The command was not interrupted')
+        self.assertTrue(session.closed)
+        self.assertEqual({}, self.pool._sessions)
+        # The next command does not read the output of the interrupted one
+        self.assertEqual(('Chassis Power is on\n', ''),
+                         self.pool.execute('address', ARGS, 'password',
+                                           'power status'))
+
+    def test_execute_evicts_idle_sessions(self):
+        self.config(session_idle_timeout=0, group='ipmi')
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        session = self._session()
+        self.pool.execute('other', ARGS, 'password', 'power status')
+        self.addCleanup(self.pool.close_sessions, 'other')
+
+        self.assertTrue(session.closed)
+        self.assertEqual([('other', tuple(ARGS), 'password')],
+                         list(self.pool._sessions))
+
+    def test_close_sessions(self):
+        self.pool.execute('address', ARGS, 'password', 'power status')
+        session = self._session()
+        self.pool.close_sessions('address')
+        self.assertTrue(session.closed)
+        self.assertFalse(session.is_alive())
+        self.assertEqual({}, self.pool._sessions)
@@ -0,0 +1,134 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the waiting of the power state transitions."""
+
+import mock
+
+from ironic.common import states
+from ironic.common import stats
+from ironic.drivers.modules import power_wait
+from ironic.tests import base
+
+
+class NextPollDelayTestCase(base.TestCase):
+
+    def test_unknown_latency(self):
+        self.assertEqual(1, power_wait.next_poll_delay(0))
+        self.assertEqual(1, power_wait.next_poll_delay(3))
+
+    def test_before_expected(self):
+        self.assertEqual(7, power_wait.next_poll_delay(2, expected=10))
+
+    def test_around_expected(self):
+        self.assertEqual(1, power_wait.next_poll_delay(9, expected=10))
+        self.assertEqual(1, power_wait.next_poll_delay(14, expected=10))
+
+    def test_backoff(self):
+        self.assertEqual(4, power_wait.next_poll_delay(16, expected=10))
+        self.assertEqual(power_wait.MAX_POLL_INTERVAL,
+                         power_wait.next_poll_delay(100, expected=10))
+
+
+class TransitionLatenciesTestCase(base.TestCase):
+
+    def setUp(self):
+        super(TransitionLatenciesTestCase, self).setUp()
+        self.latencies = power_wait.TransitionLatencies()
+
+    def test_expected_unknown(self):
+        self.assertIsNone(self.latencies.expected('bmc', states.POWER_ON))
+
+    def test_record(self):
+        self.latencies.record('bmc', states.POWER_ON, 10)
+        self.assertEqual(10, self.latencies.expected('bmc', states.POWER_ON))
+        self.latencies.record('bmc', states.POWER_ON, 20)
+        self.assertEqual(13, self.latencies.expected('bmc', states.POWER_ON))
+        self.assertIsNone(self.latencies.expected('bmc', states.POWER_OFF))
+
+    def test_record_evicts_oldest(self):
+        with mock.patch.object(power_wait, 'MAX_LATENCIES', 2):
+            for key in ('a', 'b', 'c'):
+                self.latencies.record(key, states.POWER_ON, 1)
+        self.assertIsNone(self.latencies.expected('a', states.POWER_ON))
+        self.assertEqual(1, self.latencies.expected('c', states.POWER_ON))
+
+    def test_get_histogram(self):
+        self.latencies.record('a', states.POWER_ON, 3)
+        self.latencies.record('b', states.POWER_ON, 4)
+        self.latencies.record('c', states.POWER_ON, 500)
+        histogram = self.latencies.get_histogram()[states.POWER_ON]
+        self.assertEqual(2, histogram[5])
+        self.assertEqual(1, histogram[None])
+        self.assertEqual(0, histogram[1])
+
+    def test_get_histogram_registered(self):
+        self.latencies.record('bmc', states.POWER_ON, 1)
+        with mock.patch.object(power_wait, 'LATENCIES', self.latencies):
+            histogram = stats._providers['power_transition_latencies']()
+        self.assertEqual(self.latencies.get_histogram(), histogram)
+
+
+@mock.patch('eventlet.greenthread.sleep', autospec=True)
+class WaitForPowerStateTestCase(base.TestCase):
+
+    def setUp(self):
+        super(WaitForPowerStateTestCase, self).setUp()
+        latencies_patch = mock.patch.object(
+            power_wait, 'LATENCIES', power_wait.TransitionLatencies())
+        latencies_patch.start()
+        self.addCleanup(latencies_patch.stop)
+
+    def test_reached(self, mock_sleep):
+        get_power_state = mock.Mock(side_effect=[states.POWER_OFF,
+                                                 states.POWER_ON])
+        state = power_wait.wait_for_power_state('bmc', states.POWER_ON,
+                                                get_power_state, 10)
+        self.assertEqual(states.POWER_ON, state)
+        self.assertEqual(2, get_power_state.call_count)
+        self.assertEqual(
+            2, power_wait.LATENCIES.expected('bmc', states.POWER_ON))
+
+    def test_timeout(self, mock_sleep):
+        get_power_state = mock.Mock(return_value=None)
+        state = power_wait.wait_for_power_state('bmc', states.POWER_ON,
+                                                get_power_state, 3)
+        self.assertEqual(states.ERROR, state)
+        self.assertEqual(3, get_power_state.call_count)
+        self.assertIsNone(power_wait.LATENCIES.expected('bmc',
+                                                        states.POWER_ON))
+
+    def test_timeout_zero(self, mock_sleep):
+        get_power_state = mock.Mock(return_value=states.POWER_OFF)
+        state = power_wait.wait_for_power_state('bmc', states.POWER_ON,
+                                                get_power_state, 0)
+        self.assertEqual(states.ERROR, state)
+        get_power_state.assert_called_once_with()
+
+    def test_sleeps_until_expected(self, mock_sleep):
+        power_wait.LATENCIES.record('bmc', states.POWER_ON, 20)
+        get_power_state = mock.Mock(return_value=states.POWER_ON)
+        state = power_wait.wait_for_power_state('bmc', states.POWER_ON,
+                                                get_power_state, 60)
+        self.assertEqual(states.POWER_ON, state)
+        get_power_state.assert_called_once_with()
+        mock_sleep.assert_any_call(19)
+
+    def test_default_latency(self, mock_sleep):
+        get_power_state = mock.Mock(return_value=states.POWER_ON)
+        power_wait.wait_for_power_state('pdu', states.POWER_ON,
+                                        get_power_state, 10,
+                                        default_latency=0)
+        get_power_state.assert_called_once_with()
+        self.assertFalse([c for c in mock_sleep.call_args_list if c[0][0]])
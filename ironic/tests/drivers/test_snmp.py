@@ -22,12 +22,14 @@
 
 import mock
 from oslo_config import cfg
+from oslo_utils import uuidutils
 from pysnmp.entity.rfc3413.oneliner import cmdgen
 from pysnmp import error as snmp_error
 
 from ironic.common import exception
 from ironic.common import states
 from ironic.conductor import task_manager
+from ironic.drivers.modules import power_wait
 from ironic.drivers.modules import snmp as snmp
 from ironic.tests import base
 from ironic.tests.conductor import utils as mgr_utils
@@ -160,6 +162,87 @@ class SNMPClientTestCase(base.TestCase):
         mock_cmdgenerator.setCmd.assert_called_once_with(mock.ANY, mock.ANY,
                                                          var_bind)
 
+    @mock.patch.object(snmp.SNMPClient, '_get_transport', autospec=True)
+    @mock.patch.object(snmp.SNMPClient, '_get_auth', autospec=True)
+    def test_get_reuses_target(self, mock_auth, mock_transport, mock_cmdgen):
+        var_bind = (self.oid, self.value)
+        mock_cmdgenerator = mock_cmdgen.return_value
+        mock_cmdgenerator.getCmd.return_value = ("", None, 0, [var_bind])
+        client = snmp.SNMPClient(self.address, self.port, snmp.SNMP_V3)
+        client.get(self.oid)
+        client.get(self.oid)
+        mock_auth.assert_called_once_with(client)
+        mock_transport.assert_called_once_with(client)
+        mock_cmdgenerator.getCmd.assert_called_with(
+            mock_auth.return_value, mock_transport.return_value, self.oid)
+
+    @mock.patch.object(snmp.SNMPClient, '_get_transport', autospec=True)
+    @mock.patch.object(snmp.SNMPClient, '_get_auth', autospec=True)
+    def test_get_table(self, mock_auth, mock_transport, mock_cmdgen):
+        table_oid = (1, 2, 3)
+        var_binds = [[((1, 2, 3, 1), 1)], [((1, 2, 3, 2), 2)],
+                     [((1, 2, 4, 1), 3)]]
+        mock_cmdgenerator = mock_cmdgen.return_value
+        mock_cmdgenerator.bulkCmd.return_value = ("", None, 0, var_binds)
+        client = snmp.SNMPClient(self.address, self.port, snmp.SNMP_V2C)
+        table = client.get_table(table_oid)
+        self.assertEqual({(1, 2, 3, 1): 1, (1, 2, 3, 2): 2}, table)
+        mock_cmdgenerator.bulkCmd.assert_called_once_with(
+            mock.ANY, mock.ANY, 0, snmp.SNMP_BULK_REPETITIONS, table_oid)
+
+    @mock.patch.object(snmp.SNMPClient, '_get_transport', autospec=True)
+    @mock.patch.object(snmp.SNMPClient, '_get_auth', autospec=True)
+    def test_get_table_v1(self, mock_auth, mock_transport, mock_cmdgen):
+        table_oid = (1, 2, 3)
+        mock_cmdgenerator = mock_cmdgen.return_value
+        mock_cmdgenerator.nextCmd.return_value = (
+            "", None, 0, [[((1, 2, 3, 1), 1)]])
+        client = snmp.SNMPClient(self.address, self.port, snmp.SNMP_V1)
+        self.assertEqual({(1, 2, 3, 1): 1}, client.get_table(table_oid))
+        mock_cmdgenerator.nextCmd.assert_called_once_with(mock.ANY, mock.ANY,
+                                                          table_oid)
+        self.assertFalse(mock_cmdgenerator.bulkCmd.called)
+
+    @mock.patch.object(snmp.SNMPClient, '_get_transport', autospec=True)
+    @mock.patch.object(snmp.SNMPClient, '_get_auth', autospec=True)
+    def test_get_table_max_age(self, mock_auth, mock_transport, mock_cmdgen):
+        table_oid = (1, 2, 3)
+        mock_cmdgenerator = mock_cmdgen.return_value
+        mock_cmdgenerator.bulkCmd.return_value = (
+            "", None, 0, [[((1, 2, 3, 1), 1)]])
+        mock_cmdgenerator.setCmd.return_value = ("", None, 0, [])
+        client = snmp.SNMPClient(self.address, self.port, snmp.SNMP_V2C)
+        client.get_table(table_oid, max_age=60)
+        client.get_table(table_oid, max_age=60)
+        self.assertEqual(1, mock_cmdgenerator.bulkCmd.call_count)
+        # A SET invalidates the objects read
+        client.set(self.oid, self.value)
+        client.get_table(table_oid, max_age=60)
+        self.assertEqual(2, mock_cmdgenerator.bulkCmd.call_count)
+        # The objects are read again without max_age
+        client.get_table(table_oid)
+        self.assertEqual(3, mock_cmdgenerator.bulkCmd.call_count)
+
+    @mock.patch.object(snmp.SNMPClient, '_get_transport', autospec=True)
+    @mock.patch.object(snmp.SNMPClient, '_get_auth', autospec=True)
+    def test_get_table_err_engine(self, mock_auth, mock_transport,
+                                  mock_cmdgen):
+        mock_cmdgenerator = mock_cmdgen.return_value
+        mock_cmdgenerator.bulkCmd.return_value = ("engine error", None, 0,
+                                                  [])
+        client = snmp.SNMPClient(self.address, self.port, snmp.SNMP_V2C)
+        self.assertRaises(exception.SNMPFailure, client.get_table, (1, 2))
+
+    def test__get_client_reused(self, mock_cmdgen):
+        with mock.patch.dict(snmp._CLIENTS, clear=True):
+            info = {'address': self.address, 'port': self.port,
+                    'version': snmp.SNMP_V1, 'community': 'public'}
+            client = snmp._get_client(info)
+            self.assertIs(client, snmp._get_client(dict(info)))
+            self.assertIsNot(client,
+                             snmp._get_client(dict(info, community='other')))
+        self.assertEqual(2, mock_cmdgen.call_count)
+
 
 class SNMPValidateParametersTestCase(db_base.DbTestCase):
 
@@ -385,6 +468,9 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
             self.context,
             driver='fake_snmp',
             driver_info=INFO_DICT)
+        # NOTE: the outlets are read one at a time, except in the tests of
+        # the shared reading of the outlets of a PDU.
+        self.config(outlet_states_ttl=0, group='snmp')
 
     def _update_driver_info(self, **kwargs):
         self.node["driver_info"].update(**kwargs)
@@ -432,6 +518,45 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
                           driver.power_state)
         mock_client.get.assert_called_once_with(driver._snmp_oid())
 
+    def test_power_state_shared(self, mock_get_client):
+        # Ensure the power state is read from the outlets of the PDU
+        self.config(outlet_states_ttl=1, group='snmp')
+        mock_client = mock_get_client.return_value
+        driver = snmp._get_driver(self.node)
+        table_oid = driver.oid_enterprise + driver.oid_device
+        mock_client.get_table.return_value = {
+            driver._snmp_oid(): driver.value_power_on}
+        pstate = driver.power_state(shared=True)
+        mock_client.get_table.assert_called_once_with(table_oid, max_age=1)
+        self.assertFalse(mock_client.get.called)
+        self.assertEqual(states.POWER_ON, pstate)
+
+    def test_power_state_shared_outlet_missing(self, mock_get_client):
+        # Ensure the outlet is read alone if missing from the PDU outlets
+        self.config(outlet_states_ttl=1, group='snmp')
+        mock_client = mock_get_client.return_value
+        driver = snmp._get_driver(self.node)
+        mock_client.get_table.return_value = {}
+        mock_client.get.return_value = driver.value_power_off
+        pstate = driver.power_state(shared=True)
+        mock_client.get.assert_called_once_with(driver._snmp_oid())
+        self.assertEqual(states.POWER_OFF, pstate)
+
+    @mock.patch("eventlet.greenthread.sleep", autospec=True)
+    def test_power_on_delay_shared(self, mock_sleep, mock_get_client):
+        # Ensure the wait polls the shared reading of the PDU outlets
+        self.config(outlet_states_ttl=1, group='snmp')
+        mock_client = mock_get_client.return_value
+        driver = snmp._get_driver(self.node)
+        oid = driver._snmp_oid()
+        mock_client.get_table.side_effect = [
+            {oid: driver.value_power_off}, {oid: driver.value_power_on}]
+        pstate = driver.power_on()
+        mock_client.set.assert_called_once_with(oid, driver.value_power_on)
+        self.assertEqual(2, mock_client.get_table.call_count)
+        self.assertFalse(mock_client.get.called)
+        self.assertEqual(states.POWER_ON, pstate)
+
     def test_power_on(self, mock_get_client):
         # Ensure the device is powered on correctly
         mock_client = mock_get_client.return_value
@@ -492,7 +617,7 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
         pstate = driver.power_on()
         mock_client.set.assert_called_once_with(driver._snmp_oid(),
                                                 driver.value_power_on)
-        attempts = CONF.snmp.power_timeout // driver.retry_interval
+        attempts = CONF.snmp.power_timeout // power_wait.POLL_INTERVAL
         calls = [mock.call(driver._snmp_oid())] * attempts
         mock_client.get.assert_has_calls(calls)
         self.assertEqual(states.ERROR, pstate)
@@ -507,7 +632,7 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
         pstate = driver.power_off()
         mock_client.set.assert_called_once_with(driver._snmp_oid(),
                                                 driver.value_power_off)
-        attempts = CONF.snmp.power_timeout // driver.retry_interval
+        attempts = CONF.snmp.power_timeout // power_wait.POLL_INTERVAL
         calls = [mock.call(driver._snmp_oid())] * attempts
         mock_client.get.assert_has_calls(calls)
         self.assertEqual(states.ERROR, pstate)
@@ -567,7 +692,7 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
         pstate = driver.power_on()
         mock_client.set.assert_called_once_with(driver._snmp_oid(),
                                                 driver.value_power_on)
-        attempts = CONF.snmp.power_timeout // driver.retry_interval
+        attempts = CONF.snmp.power_timeout // power_wait.POLL_INTERVAL
         calls = [mock.call(driver._snmp_oid())] * attempts
         mock_client.get.assert_has_calls(calls)
         self.assertEqual(states.ERROR, pstate)
@@ -582,7 +707,7 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
         pstate = driver.power_off()
         mock_client.set.assert_called_once_with(driver._snmp_oid(),
                                                 driver.value_power_off)
-        attempts = CONF.snmp.power_timeout // driver.retry_interval
+        attempts = CONF.snmp.power_timeout // power_wait.POLL_INTERVAL
         calls = [mock.call(driver._snmp_oid())] * attempts
         mock_client.get.assert_has_calls(calls)
         self.assertEqual(states.ERROR, pstate)
@@ -662,7 +787,7 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
         pstate = driver.power_reset()
         mock_client.set.assert_called_once_with(driver._snmp_oid(),
                                                 driver.value_power_off)
-        attempts = CONF.snmp.power_timeout // driver.retry_interval
+        attempts = CONF.snmp.power_timeout // power_wait.POLL_INTERVAL
         calls = [mock.call(driver._snmp_oid())] * attempts
         mock_client.get.assert_has_calls(calls)
         self.assertEqual(states.ERROR, pstate)
@@ -673,7 +798,7 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
         # power on during a reset
         mock_client = mock_get_client.return_value
         driver = snmp._get_driver(self.node)
-        attempts = CONF.snmp.power_timeout // driver.retry_interval
+        attempts = CONF.snmp.power_timeout // power_wait.POLL_INTERVAL
         mock_client.get.side_effect = ([driver.value_power_off] +
                                        [42] * attempts)
         pstate = driver.power_reset()
@@ -694,7 +819,7 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
         pstate = driver.power_reset()
         mock_client.set.assert_called_once_with(driver._snmp_oid(),
                                                 driver.value_power_off)
-        attempts = CONF.snmp.power_timeout // driver.retry_interval
+        attempts = CONF.snmp.power_timeout // power_wait.POLL_INTERVAL
         calls = [mock.call(driver._snmp_oid())] * attempts
         mock_client.get.assert_has_calls(calls)
         self.assertEqual(states.ERROR, pstate)
@@ -705,7 +830,7 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
         # causes an error
         mock_client = mock_get_client.return_value
         driver = snmp._get_driver(self.node)
-        attempts = CONF.snmp.power_timeout // driver.retry_interval
+        attempts = CONF.snmp.power_timeout // power_wait.POLL_INTERVAL
         mock_client.get.side_effect = ([driver.value_power_off] *
                                        (1 + attempts))
         pstate = driver.power_reset()
@@ -1082,6 +1207,19 @@ class SNMPDeviceDriverTestCase(db_base.DbTestCase):
             driver._snmp_oid(driver.oid_status))
         self.assertEqual(states.POWER_OFF, pstate)
 
+    def test_eaton_power_power_state_shared(self, mock_get_client):
+        # Ensure the Eaton Power driver reads the outlet statuses at once
+        self.config(outlet_states_ttl=1, group='snmp')
+        mock_client = mock_get_client.return_value
+        self._set_snmp_driver("eatonpower")
+        driver = snmp._get_driver(self.node)
+        mock_client.get_table.return_value = {
+            driver._snmp_oid(driver.oid_status): driver.status_pending_off}
+        pstate = driver.power_state(shared=True)
+        mock_client.get_table.assert_called_once_with(
+            driver.oid_base + driver.oid_status, max_age=1)
+        self.assertEqual(states.POWER_ON, pstate)
+
     def test_eaton_power_power_on(self, mock_get_client):
         # Ensure the Eaton Power driver powers on correctly
         mock_client = mock_get_client.return_value
@@ -1183,6 +1321,23 @@ class SNMPDriverTestCase(db_base.DbTestCase):
                               task.driver.power.get_power_state, task)
         mock_driver.power_state.assert_called_once_with()
 
+    def test_get_power_state_many(self, mock_get_driver):
+        mock_driver = mock_get_driver.return_value
+        mock_driver.power_state.side_effect = [states.POWER_ON,
+                                               self._get_snmp_failure()]
+        node2 = obj_utils.create_test_node(self.context,
+                                           uuid=uuidutils.generate_uuid(),
+                                           driver='fake_snmp',
+                                           driver_info=INFO_DICT)
+        with task_manager.acquire_many(self.context,
+                                       [self.node.uuid, node2.uuid],
+                                       shared=True) as tasks:
+            result = tasks.tasks[0].driver.power.get_power_state_many(
+                tasks.tasks)
+        self.assertEqual(states.POWER_ON, result[self.node.uuid])
+        self.assertIsInstance(result[node2.uuid], exception.SNMPFailure)
+        mock_driver.power_state.assert_called_with(shared=True)
+
     def test_set_power_state_on(self, mock_get_driver):
         mock_driver = mock_get_driver.return_value
         mock_driver.power_on.return_value = states.POWER_ON
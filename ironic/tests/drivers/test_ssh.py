@@ -30,6 +30,7 @@ from ironic.common import states
 from ironic.common import utils
 from ironic.conductor import task_manager
 from ironic.drivers.modules import ssh
+from ironic.drivers.modules import ssh_pool
 from ironic.drivers import utils as driver_utils
 from ironic.tests.conductor import utils as mgr_utils
 from ironic.tests.db import base as db_base
@@ -200,9 +201,29 @@ class SSHPrivateMethodsTestCase(db_base.DbTestCase):
             driver='fake_ssh',
             driver_info=db_utils.get_test_ssh_info())
         self.sshclient = paramiko.SSHClient()
+        pool_patch = mock.patch.object(ssh_pool, '_POOL',
+                                       ssh_pool.ConnectionPool())
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+        index_patch = mock.patch.object(ssh, '_VM_INDEX', ssh._VMIndex())
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
 
     @mock.patch.object(utils, 'ssh_connect', autospec=True)
     def test__get_connection_client(self, ssh_connect_mock):
+        client = mock.Mock(spec=paramiko.SSHClient)
+        client.get_transport.return_value.is_active.return_value = True
+        ssh_connect_mock.return_value = client
+        conn = ssh._get_connection(self.node)
+        self.assertIsInstance(conn, ssh_pool.Connection)
+        self.assertEqual(client, conn.get_client())
+        self.assertIs(conn, ssh._get_connection(self.node))
+        driver_info = ssh._parse_driver_info(self.node)
+        ssh_connect_mock.assert_called_once_with(driver_info)
+
+    @mock.patch.object(utils, 'ssh_connect', autospec=True)
+    def test__get_connection_client_no_pool(self, ssh_connect_mock):
+        self.config(connection_idle_timeout=0, group='ssh')
         ssh_connect_mock.return_value = self.sshclient
         client = ssh._get_connection(self.node)
         self.assertEqual(self.sshclient, client)
@@ -295,8 +316,7 @@ class SSHPrivateMethodsTestCase(db_base.DbTestCase):
                           ssh._get_power_status,
                           self.sshclient,
                           info)
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_all'])
+        ssh_cmd = ssh._get_list_macs_cmd(info)
         exec_ssh_mock.assert_called_once_with(
             self.sshclient, ssh_cmd)
 
@@ -314,68 +334,168 @@ class SSHPrivateMethodsTestCase(db_base.DbTestCase):
         self.assertEqual(states.POWER_OFF, pstate)
 
     @mock.patch.object(processutils, 'ssh_execute', autospec=True)
-    def test__get_hosts_name_for_node_match(self, exec_ssh_mock):
+    def test__get_power_statuses(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
-        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        info2 = dict(info, uuid='other', macs=["52:54:00:cf:2d:32"])
+        info3 = dict(info, uuid='missing', macs=["52:54:00:cf:2d:33"])
+        exec_ssh_mock.side_effect = iter([
+            ('vm-name: NodeName\n52:54:00:cf:2d:31\n'
+             'vm-name: NodeName2\n52:54:00:cf:2d:32\n', ''),
+            ('"NodeName2" {b43c4982-110c-4c29-9325-d5f41b053513}\n', '')])
+
+        result = ssh._get_power_statuses(self.sshclient,
+                                         [info, info2, info3])
+
+        self.assertEqual(states.POWER_OFF, result[info['uuid']])
+        self.assertEqual(states.POWER_ON, result['other'])
+        self.assertIsInstance(result['missing'], exception.NodeNotFound)
         ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_all'])
+                             info['cmd_set']['list_running'])
+        # The VMs are listed once for all the nodes
+        expected = [mock.call(self.sshclient, ssh._get_list_macs_cmd(info)),
+                    mock.call(self.sshclient, ssh_cmd)]
+        self.assertEqual(expected, exec_ssh_mock.call_args_list)
 
-        cmd_to_exec = "%s %s" % (info['cmd_set']['base_cmd'],
-                                 info['cmd_set']['get_node_macs'])
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', 'NodeName')
-        exec_ssh_mock.side_effect = iter([('NodeName', ''),
-                                          ('52:54:00:cf:2d:31', '')])
-        expected = [mock.call(self.sshclient, ssh_cmd),
-                    mock.call(self.sshclient, cmd_to_exec)]
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test__get_power_statuses_listed_again(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        info2 = dict(info, uuid='other', macs=["52:54:00:cf:2d:32"])
+        exec_ssh_mock.side_effect = iter([
+            ('vm-name: NodeName\n52:54:00:cf:2d:31\n', ''),
+            ('vm-name: NodeName\n52:54:00:cf:2d:31\n'
+             'vm-name: NodeName2\n52:54:00:cf:2d:32\n', ''),
+            ('"NodeName2" {b43c4982-110c-4c29-9325-d5f41b053513}\n', '')])
+        ssh._VM_INDEX.refresh(self.sshclient, info)
+
+        result = ssh._get_power_statuses(self.sshclient, [info, info2])
+
+        self.assertEqual(states.POWER_OFF, result[info['uuid']])
+        self.assertEqual(states.POWER_ON, result['other'])
+        # The VMs are listed again once, as one node was not found
+        self.assertEqual(3, exec_ssh_mock.call_count)
+
+    def test__get_list_macs_cmd(self):
+        info = ssh._parse_driver_info(self.node)
+        cmd = ssh._get_list_macs_cmd(info)
+        base_cmd = info['cmd_set']['base_cmd']
+        self.assertTrue(cmd.startswith(
+            "%s %s | while read -r name" % (base_cmd,
+                                            info['cmd_set']['list_all'])))
+        self.assertIn('echo "vm-name: $name"', cmd)
+        self.assertIn('%s showvminfo --machinereadable "$name" |' % base_cmd,
+                      cmd)
+
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test__ssh_execute_for_vm_failed(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        exec_ssh_mock.side_effect = iter([
+            ('vm-name: NodeName\n52:54:00:cf:2d:31\n', ''),
+            processutils.ProcessExecutionError,
+            ('vm-name: NewName\n52:54:00:cf:2d:31\n', '')])
+        self.assertEqual('NodeName',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+
+        self.assertRaises(exception.SSHCommandFailed,
+                          ssh._ssh_execute_for_vm, self.sshclient, info,
+                          'start NodeName')
+
+        # The VMs are listed again, the VM may have been renamed
+        self.assertEqual('NewName',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+
+    def test__get_list_macs_cmd_quoted(self):
+        info = ssh._parse_driver_info(self.node)
+        info['cmd_set'] = ssh._get_command_sets('parallels')
+        cmd = ssh._get_list_macs_cmd(info)
+        self.assertIn('list -j -i "$name" |', cmd)
+        self.assertNotIn('""', cmd)
+
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test__get_hosts_name_for_node_match(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
+        exec_ssh_mock.return_value = (
+            'vm-name: OtherName\n52:54:00:cf:2d:30\n'
+            'vm-name: NodeName\n525400cf2d31\n', '')
 
         found_name = ssh._get_hosts_name_for_node(self.sshclient, info)
 
         self.assertEqual('NodeName', found_name)
-        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+        exec_ssh_mock.assert_called_once_with(self.sshclient,
+                                              ssh._get_list_macs_cmd(info))
 
     @mock.patch.object(processutils, 'ssh_execute', autospec=True)
     def test__get_hosts_name_for_node_no_match(self, exec_ssh_mock):
         info = ssh._parse_driver_info(self.node)
         info['macs'] = ["11:11:11:11:11:11", "22:22:22:22:22:22"]
-        exec_ssh_mock.side_effect = iter([('NodeName', ''),
-                                          ('52:54:00:cf:2d:31', '')])
+        exec_ssh_mock.return_value = (
+            'vm-name: NodeName\n52:54:00:cf:2d:31\n', '')
 
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_all'])
+        found_name = ssh._get_hosts_name_for_node(self.sshclient, info)
 
-        cmd_to_exec = "%s %s" % (info['cmd_set']['base_cmd'],
-                                 info['cmd_set']['get_node_macs'])
+        self.assertIsNone(found_name)
+        exec_ssh_mock.assert_called_once_with(self.sshclient,
+                                              ssh._get_list_macs_cmd(info))
 
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', 'NodeName')
-        expected = [mock.call(self.sshclient, ssh_cmd),
-                    mock.call(self.sshclient, cmd_to_exec)]
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test__get_hosts_name_for_node_reuses_index(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        info2 = dict(info, uuid='other', macs=["52:54:00:cf:2d:32"])
+        exec_ssh_mock.return_value = (
+            'vm-name: NodeName\n52:54:00:cf:2d:31\n'
+            'vm-name: NodeName2\n52:54:00:cf:2d:32\n', '')
 
-        found_name = ssh._get_hosts_name_for_node(self.sshclient, info)
+        self.assertEqual('NodeName',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+        self.assertEqual('NodeName2',
+                         ssh._get_hosts_name_for_node(self.sshclient, info2))
+        exec_ssh_mock.assert_called_once_with(self.sshclient,
+                                              ssh._get_list_macs_cmd(info))
 
-        self.assertIsNone(found_name)
-        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test__get_hosts_name_for_node_refresh_on_miss(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        info2 = dict(info, uuid='other', macs=["52:54:00:cf:2d:32"])
+        exec_ssh_mock.side_effect = iter([
+            ('vm-name: NodeName\n52:54:00:cf:2d:31\n', ''),
+            ('vm-name: NodeName\n52:54:00:cf:2d:31\n'
+             'vm-name: NodeName2\n52:54:00:cf:2d:32\n', '')])
+
+        self.assertEqual('NodeName',
+                         ssh._get_hosts_name_for_node(self.sshclient, info))
+        self.assertEqual('NodeName2',
+                         ssh._get_hosts_name_for_node(self.sshclient, info2))
+        self.assertEqual(2, exec_ssh_mock.call_count)
 
     @mock.patch.object(processutils, 'ssh_execute', autospec=True)
-    def test__get_hosts_name_for_node_exception(self, exec_ssh_mock):
+    def test__get_hosts_name_for_node_ttl(self, exec_ssh_mock):
+        self.config(vm_index_ttl=0, group='ssh')
         info = ssh._parse_driver_info(self.node)
-        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
-        ssh_cmd = "%s %s" % (info['cmd_set']['base_cmd'],
-                             info['cmd_set']['list_all'])
+        info['macs'] = ["52:54:00:cf:2d:31"]
+        exec_ssh_mock.return_value = (
+            'vm-name: NodeName\n52:54:00:cf:2d:31\n', '')
 
-        cmd_to_exec = "%s %s" % (info['cmd_set']['base_cmd'],
-                                 info['cmd_set']['get_node_macs'])
-        cmd_to_exec = cmd_to_exec.replace('{_NodeName_}', 'NodeName')
+        ssh._get_hosts_name_for_node(self.sshclient, info)
+        ssh._get_hosts_name_for_node(self.sshclient, info)
+        self.assertEqual(2, exec_ssh_mock.call_count)
 
-        exec_ssh_mock.side_effect = iter(
-            [('NodeName', ''), processutils.ProcessExecutionError])
-        expected = [mock.call(self.sshclient, ssh_cmd),
-                    mock.call(self.sshclient, cmd_to_exec)]
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test__get_hosts_name_for_node_exception(self, exec_ssh_mock):
+        info = ssh._parse_driver_info(self.node)
+        info['macs'] = ["11:11:11:11:11:11", "52:54:00:cf:2d:31"]
+        exec_ssh_mock.side_effect = processutils.ProcessExecutionError
 
         self.assertRaises(exception.SSHCommandFailed,
                           ssh._get_hosts_name_for_node,
                           self.sshclient,
                           info)
-        self.assertEqual(expected, exec_ssh_mock.call_args_list)
+        exec_ssh_mock.assert_called_once_with(self.sshclient,
+                                              ssh._get_list_macs_cmd(info))
 
     @mock.patch.object(processutils, 'ssh_execute', autospec=True)
     @mock.patch.object(ssh, '_get_power_status', autospec=True)
@@ -584,6 +704,13 @@ class SSHDriverTestCase(db_base.DbTestCase):
         self.port = obj_utils.create_test_port(self.context,
                                                node_id=self.node.id)
         self.sshclient = paramiko.SSHClient()
+        pool_patch = mock.patch.object(ssh_pool, '_POOL',
+                                       ssh_pool.ConnectionPool())
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+        index_patch = mock.patch.object(ssh, '_VM_INDEX', ssh._VMIndex())
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
 
     @mock.patch.object(utils, 'ssh_connect', autospec=True)
     def test__validate_info_ssh_connect_failed(self, ssh_connect_mock):
@@ -944,6 +1071,38 @@ class SSHDriverTestCase(db_base.DbTestCase):
                         "echo '\"%(node)s\"' || true") % {'node': nodename}
         mock_exc.assert_called_once_with(mock.ANY, expected_cmd)
 
+    @mock.patch.object(ssh, '_get_connection', autospec=True)
+    @mock.patch.object(ssh, '_get_power_statuses', autospec=True)
+    def test_get_power_state_many(self, get_statuses_mock, get_conn_mock):
+        node2 = obj_utils.create_test_node(
+            self.context, uuid=uuidutils.generate_uuid(), driver='fake_ssh',
+            driver_info=dict(db_utils.get_test_ssh_info(),
+                             ssh_address='other-host'))
+        get_conn_mock.return_value = self.sshclient
+        get_statuses_mock.side_effect = (
+            lambda ssh_obj, infos: dict((info['uuid'], states.POWER_ON)
+                                        for info in infos))
+        with task_manager.acquire_many(self.context,
+                                       [self.node.uuid, node2.uuid],
+                                       shared=True) as tasks:
+            result = self.driver.power.get_power_state_many(tasks.tasks)
+
+        self.assertEqual({self.node.uuid: states.POWER_ON,
+                          node2.uuid: states.POWER_ON}, result)
+        # One connection and one query per host
+        self.assertEqual(2, get_conn_mock.call_count)
+        self.assertEqual(2, get_statuses_mock.call_count)
+
+    @mock.patch.object(ssh, '_get_connection', autospec=True)
+    def test_get_power_state_many_connect_failed(self, get_conn_mock):
+        get_conn_mock.side_effect = exception.SSHConnectFailed(host='fake')
+        with task_manager.acquire_many(self.context, [self.node.uuid],
+                                       shared=True) as tasks:
+            result = self.driver.power.get_power_state_many(tasks.tasks)
+
+        self.assertIsInstance(result[self.node.uuid],
+                              exception.SSHConnectFailed)
+
     def test_management_interface_validate_good(self):
         with task_manager.acquire(self.context, self.node.uuid) as task:
             task.driver.management.validate(task)
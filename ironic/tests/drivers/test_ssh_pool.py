@@ -0,0 +1,126 @@
+# coding=utf-8
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Test class for the pool of the SSH connections of the SSH driver."""
+
+import time
+
+import mock
+from oslo_concurrency import processutils
+import paramiko
+
+from ironic.common import exception
+from ironic.common import utils
+from ironic.drivers.modules import ssh_pool
+from ironic.tests import base
+
+INFO = {'host': '10.0.0.1', 'port': 22, 'username': 'admin',
+        'password': 'fake'}
+
+
+def _client(active=True):
+    client = mock.Mock(spec=paramiko.SSHClient)
+    client.get_transport.return_value.is_active.return_value = active
+    return client
+
+
+@mock.patch.object(utils, 'ssh_connect', autospec=True)
+class ConnectionPoolTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ConnectionPoolTestCase, self).setUp()
+        self.pool = ssh_pool.ConnectionPool()
+
+    def test_get_reuses_connection(self, ssh_connect_mock):
+        ssh_connect_mock.return_value = _client()
+        conn = self.pool.get(INFO)
+        self.assertIs(conn, self.pool.get(dict(INFO)))
+        ssh_connect_mock.assert_called_once_with(INFO)
+
+    def test_get_per_credentials(self, ssh_connect_mock):
+        ssh_connect_mock.side_effect = lambda info: _client()
+        conn = self.pool.get(INFO)
+        other = self.pool.get(dict(INFO, password='other'))
+        self.assertIsNot(conn, other)
+        self.assertIsNot(conn, self.pool.get(dict(INFO, port=2222)))
+        self.assertEqual(3, ssh_connect_mock.call_count)
+
+    def test_get_connect_failed(self, ssh_connect_mock):
+        ssh_connect_mock.side_effect = exception.SSHConnectFailed(host='h')
+        self.assertRaises(exception.SSHConnectFailed, self.pool.get, INFO)
+
+    def test_get_reconnects_lost_connection(self, ssh_connect_mock):
+        lost = _client(active=False)
+        new = _client()
+        ssh_connect_mock.side_effect = [lost, new]
+        conn = self.pool.get(INFO)
+        self.assertIs(conn, self.pool.get(INFO))
+        lost.close.assert_called_once_with()
+        self.assertEqual(new, conn.get_client())
+
+    def test_get_evicts_idle(self, ssh_connect_mock):
+        client = _client()
+        ssh_connect_mock.side_effect = [client, _client()]
+        conn = self.pool.get(INFO)
+        conn.last_used = time.time() - 3600
+        self.assertIsNot(conn, self.pool.get(INFO))
+        client.close.assert_called_once_with()
+
+    def test_get_keeps_busy(self, ssh_connect_mock):
+        client = _client()
+        ssh_connect_mock.return_value = client
+        conn = self.pool.get(INFO)
+        conn.last_used = time.time() - 3600
+        conn.busy = 1
+        self.assertIs(conn, self.pool.get(INFO))
+        self.assertFalse(client.close.called)
+
+
+@mock.patch.object(utils, 'ssh_connect', autospec=True)
+class ConnectionTestCase(base.TestCase):
+
+    def test_exec_command(self, ssh_connect_mock):
+        client = _client()
+        ssh_connect_mock.return_value = client
+        conn = ssh_pool.Connection(INFO)
+        self.assertEqual(client.exec_command.return_value,
+                         conn.exec_command('ls'))
+        client.exec_command.assert_called_once_with('ls')
+
+    def test_exec_command_reconnects(self, ssh_connect_mock):
+        broken = _client()
+        broken.exec_command.side_effect = paramiko.SSHException()
+        client = _client()
+        ssh_connect_mock.side_effect = [broken, client]
+        conn = ssh_pool.Connection(INFO)
+        self.assertEqual(client.exec_command.return_value,
+                         conn.exec_command('ls'))
+        broken.close.assert_called_once_with()
+        client.exec_command.assert_called_once_with('ls')
+
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test_execute(self, ssh_execute_mock, ssh_connect_mock):
+        ssh_execute_mock.return_value = ('out', '')
+        conn = ssh_pool.Connection(INFO)
+        conn.last_used = 0
+        self.assertEqual(('out', ''), ssh_pool.execute(conn, 'ls'))
+        ssh_execute_mock.assert_called_once_with(conn, 'ls')
+        self.assertEqual(0, conn.busy)
+        self.assertNotEqual(0, conn.last_used)
+
+    @mock.patch.object(processutils, 'ssh_execute', autospec=True)
+    def test_execute_client(self, ssh_execute_mock, ssh_connect_mock):
+        client = _client()
+        ssh_pool.execute(client, 'ls')
+        ssh_execute_mock.assert_called_once_with(client, 'ls')
@@ -14,9 +14,11 @@
 #    under the License.
 
 import mock
+from oslo_utils import uuidutils
 
 from ironic.common import driver_factory
 from ironic.common import exception
+from ironic.common import states
 from ironic.conductor import task_manager
 from ironic.drivers.modules import fake
 from ironic.drivers import utils as driver_utils
@@ -114,3 +116,21 @@ class UtilsTestCase(db_base.DbTestCase):
             driver_utils.add_node_capability(task, 'a', 'b')
             self.assertEqual('a:b,c:d,a:b',
                              task.node.properties['capabilities'])
+
+    def test_get_power_state_many(self):
+        node2 = obj_utils.create_test_node(self.context, id=2,
+                                           uuid=uuidutils.generate_uuid())
+        error = exception.IPMIFailure(cmd='power status')
+
+        def get_power_state(task):
+            if task.node.uuid == node2.uuid:
+                raise error
+            return states.POWER_ON
+
+        with task_manager.acquire_many(self.context,
+                                       [self.node.uuid, node2.uuid],
+                                       shared=True) as tasks:
+            power_states = driver_utils.get_power_state_many(
+                list(tasks), get_power_state, 2)
+        self.assertEqual({self.node.uuid: states.POWER_ON,
+                          node2.uuid: error}, power_states)
@@ -50,6 +50,18 @@ class TestNodeObject(base.DbTestCase):
             mock_get_node.assert_called_once_with(uuid)
             self.assertEqual(self.context, node._context)
 
+    def test_get_with_filters(self):
+        uuid = self.fake_node['uuid']
+        filters = {'maintenance': False}
+        with mock.patch.object(self.dbapi, 'get_node',
+                               autospec=True) as mock_get_node:
+            mock_get_node.return_value = self.fake_node
+
+            node = objects.Node.get(self.context, uuid, filters=filters)
+
+            mock_get_node.assert_called_once_with(uuid, filters=filters)
+            self.assertEqual(self.context, node._context)
+
     def test_get_bad_id_and_uuid(self):
         self.assertRaises(exception.InvalidIdentity,
                           objects.Node.get, self.context, 'not-a-uuid')
@@ -101,6 +113,34 @@ class TestNodeObject(base.DbTestCase):
             self.assertIsInstance(nodes[0], objects.Node)
             self.assertEqual(self.context, nodes[0]._context)
 
+    def test_list_fields(self):
+        with mock.patch.object(self.dbapi, 'get_node_list',
+                               autospec=True) as mock_get_list:
+            mock_get_list.return_value = [self.fake_node]
+            nodes = objects.Node.list(self.context, fields=['uuid'])
+            mock_get_list.assert_called_once_with(
+                filters=None, limit=None, marker=None, sort_key=None,
+                sort_dir=None, fields={'id', 'uuid'})
+            self.assertThat(nodes, HasLength(1))
+            self.assertTrue(nodes[0].obj_attr_is_set('uuid'))
+            self.assertFalse(nodes[0].obj_attr_is_set('driver'))
+            self.assertEqual({'id': self.fake_node['id'],
+                              'uuid': self.fake_node['uuid']},
+                             nodes[0].as_dict())
+
+    def test_list_fields_lazy_load(self):
+        with mock.patch.object(self.dbapi, 'get_node_list',
+                               autospec=True) as mock_get_list:
+            mock_get_list.return_value = [self.fake_node]
+            node = objects.Node.list(self.context, fields=['uuid'])[0]
+        with mock.patch.object(self.dbapi, 'get_node_by_id',
+                               autospec=True) as mock_get_node:
+            mock_get_node.return_value = self.fake_node
+            self.assertEqual(self.fake_node['driver'], node.driver)
+            self.assertEqual(self.fake_node['extra'], node.extra)
+            mock_get_node.assert_called_once_with(self.fake_node['id'])
+            self.assertEqual({}, node.obj_get_changes())
+
     def test_reserve(self):
         with mock.patch.object(self.dbapi, 'reserve_node',
                                autospec=True) as mock_reserve:
@@ -109,9 +149,22 @@ class TestNodeObject(base.DbTestCase):
             fake_tag = 'fake-tag'
             node = objects.Node.reserve(self.context, fake_tag, node_id)
             self.assertIsInstance(node, objects.Node)
-            mock_reserve.assert_called_once_with(fake_tag, node_id)
+            mock_reserve.assert_called_once_with(fake_tag, node_id,
+                                                 filters=None)
             self.assertEqual(self.context, node._context)
 
+    def test_reserve_with_filters(self):
+        with mock.patch.object(self.dbapi, 'reserve_node',
+                               autospec=True) as mock_reserve:
+            mock_reserve.return_value = self.fake_node
+            node_id = self.fake_node['id']
+            filters = {'maintenance': False}
+            node = objects.Node.reserve(self.context, 'fake-tag', node_id,
+                                        filters=filters)
+            self.assertIsInstance(node, objects.Node)
+            mock_reserve.assert_called_once_with('fake-tag', node_id,
+                                                 filters=filters)
+
     def test_reserve_node_not_found(self):
         with mock.patch.object(self.dbapi, 'reserve_node',
                                autospec=True) as mock_reserve:
@@ -140,6 +193,44 @@ class TestNodeObject(base.DbTestCase):
                               objects.Node.release, self.context,
                               'fake-tag', node_id)
 
+    def test_reserve_many(self):
+        with mock.patch.object(self.dbapi, 'reserve_nodes',
+                               autospec=True) as mock_reserve:
+            mock_reserve.return_value = ([self.fake_node], set(['fake-id']))
+            node_ids = [self.fake_node['id'], 'fake-id']
+            filters = {'maintenance': False}
+            nodes, locked = objects.Node.reserve_many(
+                self.context, 'fake-tag', node_ids, filters=filters)
+            self.assertEqual(1, len(nodes))
+            self.assertIsInstance(nodes[0], objects.Node)
+            self.assertEqual(self.context, nodes[0]._context)
+            self.assertEqual(set(['fake-id']), locked)
+            mock_reserve.assert_called_once_with('fake-tag', node_ids,
+                                                 filters=filters)
+
+    def test_get_many(self):
+        with mock.patch.object(self.dbapi, 'get_nodes',
+                               autospec=True) as mock_get_nodes:
+            mock_get_nodes.return_value = [self.fake_node]
+            node_ids = [self.fake_node['id'], 'fake-id']
+            filters = {'maintenance': False}
+            nodes = objects.Node.get_many(self.context, node_ids,
+                                          filters=filters)
+            self.assertEqual(1, len(nodes))
+            self.assertIsInstance(nodes[0], objects.Node)
+            self.assertEqual(self.context, nodes[0]._context)
+            mock_get_nodes.assert_called_once_with(node_ids,
+                                                   filters=filters)
+
+    def test_release_many(self):
+        with mock.patch.object(self.dbapi, 'release_nodes',
+                               autospec=True) as mock_release:
+            mock_release.return_value = 1
+            node_ids = [self.fake_node['id']]
+            self.assertEqual(1, objects.Node.release_many(
+                self.context, 'fake-tag', node_ids))
+            mock_release.assert_called_once_with('fake-tag', node_ids)
+
     def test_touch_provisioning(self):
         with mock.patch.object(self.dbapi, 'get_node_by_uuid',
                                autospec=True) as mock_get_node:
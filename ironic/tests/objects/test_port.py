@@ -104,6 +104,16 @@ class TestPortObject(base.DbTestCase):
             self.assertEqual(expected, mock_get_port.call_args_list)
             self.assertEqual(self.context, p._context)
 
+    def test_list_by_node_ids(self):
+        with mock.patch.object(self.dbapi, 'get_ports_by_node_ids',
+                               autospec=True) as mock_get_list:
+            mock_get_list.return_value = [self.fake_port]
+            ports = objects.Port.list_by_node_ids(self.context, [1, 2])
+            self.assertThat(ports, HasLength(1))
+            self.assertIsInstance(ports[0], objects.Port)
+            self.assertEqual(self.context, ports[0]._context)
+            mock_get_list.assert_called_once_with([1, 2])
+
     def test_list(self):
         with mock.patch.object(self.dbapi, 'get_port_list',
                                autospec=True) as mock_get_list:
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Time the parsing of the sensor data of the ipmitool drivers.
+
+Parses the output of 'ipmitool sdr -v' for a node with many sensors, with
+all the sensor types sent and with only some of them, and prints how long
+it takes. The output is read from the given files, or built from sample
+records in the formats of several BMC vendors if no file is given:
+
+    tools/benchmark_sensor_parsing.py
+    tools/benchmark_sensor_parsing.py --types fan,temperature sdr1.txt
+"""
+
+import optparse
+import os
+import sys
+import time
+
+top_dir = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir))
+sys.path.insert(0, top_dir)
+
+import mock
+
+from ironic.drivers.modules import ipmitool
+
+# One record per vendor style: threshold sensors with and without
+# hysteresis, discrete sensors and sensors with no reading.
+SAMPLE_RECORDS = [
+    """Sensor ID              : Temp (0x%(id)x)
+ Entity ID             : 3.%(id)d (Processor)
+ Sensor Type (Threshold)  : Temperature (0x01)
+ Sensor Reading        : 45 (+/- 1) degrees C
+ Status                : ok
+ Nominal Reading       : 50.000
+ Normal Minimum        : 11.000
+ Normal Maximum        : 69.000
+ Upper critical        : 90.000
+ Upper non-critical    : 85.000
+ Positive Hysteresis   : 1.000
+ Negative Hysteresis   : 1.000
+ Minimum sensor range  : Unspecified
+ Maximum sensor range  : Unspecified
+ Event Message Control : Per-threshold
+ Readable Thresholds   : ucr unc
+ Settable Thresholds   : ucr unc
+ Threshold Read Mask   : ucr unc
+ Assertions Enabled    : unc+ ucr+
+ Deassertions Enabled  : unc+ ucr+""",
+    """Sensor ID              : FAN MOD %(id)dA RPM (0x%(id)x)
+ Entity ID             : 7.1 (System Board)
+ Sensor Type (Analog)  : Fan
+ Sensor Reading        : 8400 (+/- 75) RPM
+ Status                : ok
+ Nominal Reading       : 5325.000
+ Normal Minimum        : 10425.000
+ Normal Maximum        : 14775.000
+ Lower critical        : 4275.000
+ Positive Hysteresis   : 375.000
+ Negative Hysteresis   : 375.000""",
+    """Sensor ID              : PS%(id)d Status (0x%(id)x)
+ Entity ID             : 10.%(id)d (Power Supply)
+ Sensor Type (Discrete): Power Supply (0x08)
+ Sensor Reading        : 0h
+ Event Message Control : Per-threshold
+ States Asserted       : Power Supply
+                         [Presence detected]
+ Assertion Events      : Power Supply
+                         [Presence detected]
+ Assertions Enabled    : Power Supply
+                         [Failure detected]
+                         [Power Supply AC lost]
+ OEM                   : 0""",
+    """Sensor ID              : Voltage %(id)d (0x%(id)x)
+ Entity ID             : 20.%(id)d (Power Module)
+ Sensor Type (Threshold)  : Voltage (0x02)
+ Sensor Reading        : 12.152 (+/- 0) Volts
+ Status                : ok
+ Lower Non-Recoverable : na
+ Lower Critical        : 10.800
+ Lower Non-Critical    : 11.400
+ Upper Non-Critical    : 12.600
+ Upper Critical        : 13.200
+ Upper Non-Recoverable : na""",
+    """Sensor ID              : Intrusion (0x%(id)x)
+ Entity ID             : 23.1 (System Chassis)
+ Sensor Type (Discrete): Physical Security (0x05)
+ States Asserted       : Physical Security
+                         [General Chassis intrusion]""",
+]
+
+
+def build_sensors_data(count):
+    records = [SAMPLE_RECORDS[i % len(SAMPLE_RECORDS)] % {'id': i}
+               for i in range(count)]
+    return '\n\n'.join(records)
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] [file ...]")
+    parser.add_option("-s", "--sensors", dest="sensors", type="int",
+                      help="number of sensors when no file is given "
+                           "(default: 250)",
+                      default=250)
+    parser.add_option("-t", "--types", dest="types",
+                      help="comma separated sensor types to keep "
+                           "(default: temperature,fan)",
+                      default="temperature,fan")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int",
+                      help="number of runs of each parsing (default: 200)",
+                      default=200)
+    (options, args) = parser.parse_args()
+
+    if args:
+        outputs = []
+        for path in args:
+            with open(path) as f:
+                outputs.append((os.path.basename(path), f.read()))
+    else:
+        outputs = [('%d sample sensors' % options.sensors,
+                    build_sensors_data(options.sensors))]
+
+    node = mock.Mock(uuid='benchmark')
+    types = set(t.strip().lower() for t in options.types.split(','))
+    print("%-26s %-8s %10s %10s" % ('output', 'types', 'min (ms)',
+                                    'avg (ms)'))
+    for name, sensors_data in outputs:
+        for label, sensor_types in (('all', None), ('some', types)):
+            timings = []
+            for i in range(options.repeat):
+                start = time.time()
+                ipmitool._parse_ipmi_sensors_data(node, sensors_data,
+                                                  sensor_types)
+                timings.append((time.time() - start) * 1000)
+            print("%-26s %-8s %10.3f %10.3f" % (name[:26], label,
+                                                min(timings),
+                                                sum(timings) / len(timings)))
+
+
+if __name__ == '__main__':
+    main()